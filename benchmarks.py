@@ -0,0 +1,1633 @@
+# benchmarks.py
+# Local benchmarks for the agent helpers, run against the stand-ins in local_standins.py
+#
+# Usage: python benchmarks.py <name> [options]
+
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from build_graph import build_steps, critical_path, serial_length
+from build_tracker import BuildTracker, GitHubHeads
+from deploy_scheduler import DeployScheduler, patch_deployment
+from http_pool import ConnectionPool
+from llm_cache import PromptCache, cached_predict
+from pipeline_replay import add_arguments as add_replay_arguments, replay
+from local_standins import FakeBigQuery, FakeCloudBuild, FakeGitHub, FakeGKE, FakePubSub, FakeRTDB, FakeSendGrid, FakeTextBison
+from pubsub_ingest import PubSubPuller
+from repo_snapshot import RepoSnapshotCache, timed_workspace
+from report_digest import REPORTER_SOURCES, DigestWindow, bq_batches, digest_email, insert_all
+from rollout_watch import RolloutWatcher, rollout_state
+from rtdb_bulk import BulkWriter
+from rtdb_stream import ChangeFeed
+
+
+def bench_pubsub(args):
+    # Compare the original one-message-per-cycle loop (maxMessages=1 followed by
+    # the wait step) with batched pulls that only wait once the backlog is empty.
+    # The wait is scaled down so the baseline finishes in reasonable time.
+    results = {}
+    for mode, max_messages in (("one_per_cycle", 1), ("batched", args.batch_size)):
+        with FakePubSub() as pubsub:
+            for i in range(args.messages):
+                pubsub.publish({"podName": f"demo-{i % 5}", "error": "RuntimeError: Triggered failure for demo"})
+            puller = PubSubPuller(
+                f"{pubsub.url}/v1/projects/demo/subscriptions/pod-errors-sub",
+                max_messages=max_messages,
+                idle_wait=args.wait,
+            )
+            sleep = time.sleep if mode == "one_per_cycle" else (lambda s: None)
+            handled = 0
+
+            def handler(msgs):
+                nonlocal handled
+                handled += len(msgs)
+                if mode == "one_per_cycle":
+                    sleep(args.wait)
+
+            start = time.perf_counter()
+            puller.run(handler, should_stop=lambda: handled >= args.messages, sleep=sleep)
+            elapsed = time.perf_counter() - start
+            results[mode] = {
+                "messages": handled,
+                "seconds": round(elapsed, 4),
+                "messages_per_second": round(handled / elapsed, 1),
+                "pull_calls": puller.pull_calls,
+                "ack_calls": puller.ack_calls,
+            }
+    return results
+
+
+def bench_rtdb_bulk(args):
+    # One PUT per error (the original write_error) vs the Error Analyzer's
+    # BulkWriter, against an RTDB stand-in with injected per-request latency.
+    # Errors arrive at --rate per second in pulls of --batch; the writer's
+    # clock is simulated, so --flush-interval is measured in arrival time.
+    # Reports round trips and wall time per 1,000 errors, how many records
+    # survived (same-second PUTs overwrite each other) and how long an error
+    # waited in the buffer.
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    records = [{"service": f"demo-{i % 5}", "errorMessage": "RuntimeError: Triggered failure for demo",
+                "timestamp": stamp} for i in range(args.errors)]
+    results = {}
+    with FakeRTDB(latency=args.latency) as rtdb:
+        pool = ConnectionPool()
+        start = time.perf_counter()
+        for record in records:
+            pool.request("PUT", f"{rtdb.url}/errors/{record['service']}/{record['timestamp']}.json",
+                         body=json.dumps(record))
+        elapsed = time.perf_counter() - start
+        stored = sum(len(v) for v in rtdb.get(["errors"]).values())
+        results["put_per_error"] = {"round_trips": rtdb.calls, "seconds": round(elapsed, 4), "stored": stored}
+
+    with FakeRTDB(latency=args.latency) as rtdb:
+        now = [0.0]
+        writer = BulkWriter(rtdb.url, flush_size=args.flush_size, flush_interval=args.flush_interval,
+                            pool=ConnectionPool(), clock=lambda: now[0])
+        added, waits, acked = {}, [], 0
+        start = time.perf_counter()
+        for first in range(0, len(records), args.batch):
+            now[0] = first / args.rate
+            pulled = range(first, min(first + args.batch, len(records)))
+            for i in pulled:
+                writer.append("errors", records[i]["service"], records[i], acks=[i])
+                added[i] = now[0]
+            released = writer.flush(force=False)
+            acked += len(released)
+            waits += [now[0] - added[i] for i in released]
+        now[0] = len(records) / args.rate
+        released = writer.flush()
+        acked += len(released)
+        waits += [now[0] - added[i] for i in released]
+        elapsed = time.perf_counter() - start
+        stored = sum(len(v) for v in rtdb.get(["errors"]).values())
+        results["bulk_writer"] = {"round_trips": writer.stats["round_trips"], "seconds": round(elapsed, 4),
+                                  "stored": stored, "acked": acked, "max_buffered_s": round(max(waits), 3)}
+    for result in results.values():
+        result["seconds_per_1000"] = round(result["seconds"] * 1000 / args.errors, 4)
+        result["round_trips_per_1000"] = round(result["round_trips"] * 1000 / args.errors, 1)
+    return results
+
+
+def bench_llm_cache(args):
+    # Replay an error trace where a few distinct errors repeat (crash loops)
+    # through generate_patch with and without the prompt cache.
+    rng = random.Random(7)
+    distinct = [f"RuntimeError: failure {i} in handler_{i}" for i in range(args.distinct)]
+    trace = [rng.choice(distinct) for _ in range(args.errors)]
+    results = {}
+    with FakeTextBison(latency=args.latency) as llm:
+        url = f"{llm.url}/v1/projects/demo/locations/global/models/text-bison:predict"
+        start = time.perf_counter()
+        for error in trace:
+            req = urllib.request.Request(
+                url, data=json.dumps({"instances": [{"prompt": f"Error: {error}\nContext: Service demo"}]}).encode(),
+                headers={"Content-Type": "application/json"}, method="POST")
+            urllib.request.urlopen(req).read()
+        results["uncached"] = {"predict_calls": llm.predicts, "seconds": round(time.perf_counter() - start, 4)}
+
+    with FakeTextBison(latency=args.latency) as llm, tempfile.TemporaryDirectory() as cache_dir:
+        url = f"{llm.url}/v1/projects/demo/locations/global/models/text-bison:predict"
+        cache = PromptCache(cache_dir, max_entries=args.memory_entries)
+        start = time.perf_counter()
+        for error in trace:
+            cached_predict(cache, url, f"Error:  {error}\nContext: Service demo")
+        results["cached"] = {"predict_calls": llm.predicts, "seconds": round(time.perf_counter() - start, 4), **cache.stats}
+
+    results["calls_avoided"] = results["uncached"]["predict_calls"] - results["cached"]["predict_calls"]
+    results["latency_saved_seconds"] = round(results["uncached"]["seconds"] - results["cached"]["seconds"], 4)
+    return results
+
+
+def bench_repo_snapshot(args):
+    # Time-to-workspace and bytes transferred for a cold fetch, a warm fetch
+    # where main has not moved, and a fetch after main moved by one file.
+    rng = random.Random(11)
+    files = {f"src/module_{i}.py": bytes(rng.getrandbits(8) for _ in range(args.file_size)) for i in range(args.files)}
+    results = {}
+    with FakeGitHub(latency=args.latency) as github, tempfile.TemporaryDirectory() as root:
+        github.commit("acme", "monorepo", files)
+        cache = RepoSnapshotCache(root, api_url=github.url)
+        for label in ("cold", "warm_no_change", "changed"):
+            if label == "changed":
+                files["src/module_0.py"] = b"# patched\n" + files["src/module_0.py"]
+                github.commit("acme", "monorepo", files)
+            ws, seconds, transferred = timed_workspace(cache, "acme", "monorepo")
+            results[label] = {
+                "sha": ws.sha[:12],
+                "fetched_archive": ws.fetched,
+                "bytes_transferred": transferred,
+                "seconds": round(seconds, 4),
+            }
+        results["zipball_per_attempt_bytes"] = github.bytes_sent // max(cache.stats["archives"], 1)
+        results["stats"] = cache.stats
+    return results
+
+
+def latest_url(db_url, path):
+    # The original Reporter / Build & Test read: newest record only
+    return f'{db_url.rstrip("/")}/{path}.json?orderBy="timestamp"&limitToLast=1'
+
+
+def bench_change_feed(args):
+    # Records written to /builds at a steady rate, consumed by the original
+    # limitToLast=1 poll on a fixed interval and by the SSE change feed.
+    # Reports records seen/skipped and detection latency.
+    def write_records(rtdb):
+        written = {}
+        for i in range(args.records):
+            key = f"b{i:05d}"
+            written[key] = time.monotonic()
+            with rtdb.lock:
+                rtdb.set(["builds", key], {"id": key, "status": "SUCCESS",
+                                           "timestamp": f"2025-06-22T00:00:{i:05d}Z"})
+            time.sleep(args.write_interval)
+        return written
+
+    results = {}
+    with FakeRTDB() as rtdb:
+        pool = ConnectionPool()
+        seen = {}
+        writer = ThreadPoolExecutor(1).submit(write_records, rtdb)
+        url = latest_url(rtdb.url, "builds")
+        while not writer.done() or not seen:
+            body = json.loads(pool.request("GET", url)[2] or b"null") or {}
+            for key in body:
+                seen.setdefault(key, time.monotonic())
+            time.sleep(args.poll_interval)
+        written = writer.result()
+        latencies = [seen[k] - written[k] for k in seen]
+        results["poll_limit_to_last"] = {
+            "seen": len(seen), "skipped": len(written) - len(seen), "requests": rtdb.calls,
+            "mean_latency_ms": round(1000 * sum(latencies) / len(latencies), 1),
+        }
+
+    with FakeRTDB() as rtdb:
+        feed = ChangeFeed(rtdb.url, "builds").start()
+        writer = ThreadPoolExecutor(1).submit(write_records, rtdb)
+        seen = {}
+        while len(seen) < args.records and not (writer.done() and feed.events.empty() and seen):
+            for event in feed.poll(timeout=0.5):
+                seen.setdefault(event["key"], time.monotonic())
+        written = writer.result()
+        for event in feed.poll(timeout=0.5):
+            seen.setdefault(event["key"], time.monotonic())
+        feed.stop()
+        latencies = [seen[k] - written[k] for k in seen]
+        results["change_feed"] = {
+            "seen": len(seen), "skipped": len(written) - len(seen), "requests": rtdb.calls,
+            "mean_latency_ms": round(1000 * sum(latencies) / len(latencies), 1),
+        }
+    return results
+
+
+def bench_reporter_fetch(args):
+    # The Reporter's five sources on an RTDB stand-in where every path has its
+    # own latency and --slow-path a much larger one. The original workflow
+    # read them in five fetch steps one after another, so each cycle took the
+    # sum of the round trips and the slow source held up the others.
+    # fetch_events polls one change feed per source: each feed catches up and
+    # streams on its own thread, so the reads overlap (max, not sum) and a
+    # cycle never waits on the network. A slow or failing source only delays
+    # its own events, which arrive in a later cycle (partial results, as a
+    # per-source timeout of zero would give), and no event is lost.
+    latencies = {path: round(args.latency * (i + 1), 3) for i, path in enumerate(REPORTER_SOURCES.values())}
+    latencies[args.slow_path] = args.slow_latency
+
+    def write_cycle(rtdb, c):
+        with rtdb.lock:
+            for path in REPORTER_SOURCES.values():
+                for i in range(args.records):
+                    record = {"service": "svc", "status": "SUCCESS", "timestamp": f"2025-06-22T00:{c:02d}:{i:02d}Z"}
+                    rtdb.set([path, "svc", f"c{c}-{i}"] if path == "errors" else [path, f"c{c}-{i}"], record)
+
+    results = {"path_latency_s": latencies}
+    with FakeRTDB(path_latency=latencies) as rtdb:
+        pool = ConnectionPool()
+        cycles = []
+        for c in range(args.cycles):
+            write_cycle(rtdb, c)
+            start = time.perf_counter()
+            for path in REPORTER_SOURCES.values():
+                pool.request("GET", latest_url(rtdb.url, path))
+            cycles.append(time.perf_counter() - start)
+        results["sequential_reads"] = {"mean_cycle_ms": round(1000 * sum(cycles) / len(cycles), 1),
+                                       "requests": rtdb.calls}
+
+    with FakeRTDB(path_latency=latencies) as rtdb:
+        started = time.perf_counter()
+        feeds = {path: ChangeFeed(rtdb.url, path, depth=2 if path == "errors" else 1).start()
+                 for path in REPORTER_SOURCES.values()}
+        cycles, first, counts = [], {}, dict.fromkeys(feeds, 0)
+        for c in range(args.cycles):
+            write_cycle(rtdb, c)
+            time.sleep(args.interval)
+            start = time.perf_counter()
+            for path, feed in feeds.items():
+                events = feed.poll(max_events=10000)
+                counts[path] += len(events)
+                if events and path not in first:
+                    first[path] = round(time.perf_counter() - started, 3)
+            cycles.append(time.perf_counter() - start)
+        deadline = time.monotonic() + args.slow_latency * 4 + 5
+        while sum(counts.values()) < len(feeds) * args.records * args.cycles and time.monotonic() < deadline:
+            for path, feed in feeds.items():
+                counts[path] += len(feed.poll(max_events=10000, timeout=0.05))
+        for feed in feeds.values():
+            feed.stop()
+        results["change_feeds"] = {
+            "mean_cycle_ms": round(1000 * sum(cycles) / len(cycles), 3),
+            "first_events_s": first,
+            "events": counts,
+            "lost": len(feeds) * args.records * args.cycles - sum(counts.values()),
+        }
+    return results
+
+
+def bench_digest(args):
+    # Reporter over a simulated run of --cycles 60s cycles with --events-per-cycle
+    # new events each: the original newest-only email + single-row insert per
+    # cycle vs a digest email per --window seconds and batched insertAll.
+    rng = random.Random(3)
+    types = list(REPORTER_SOURCES)
+    cycles = [
+        [{"type": rng.choice(types), "key": f"c{c}-e{i}",
+          "data": {"service": f"svc-{rng.randrange(args.services)}", "status": "SUCCESS",
+                   "timestamp": f"2025-06-22T{c // 60:02d}:{c % 60:02d}:{i % 60:02d}Z"}}
+         for i in range(args.events_per_cycle)]
+        for c in range(args.cycles)
+    ]
+    total = args.cycles * args.events_per_cycle
+    results = {"events": total}
+    with FakeSendGrid() as sendgrid, FakeBigQuery() as bq:
+        pool = ConnectionPool()
+        bq_url = f"{bq.url}/bigquery/v2/projects/demo/datasets/remediation/tables/remediation_log/insertAll"
+        for events in cycles:
+            newest = max(events, key=lambda e: e["data"]["timestamp"])
+            pool.request("POST", f"{sendgrid.url}/v3/mail/send", body=json.dumps({"subject": "update"}))
+            pool.request("POST", bq_url, body=json.dumps({"rows": [{"json": newest["data"]}]}))
+        results["newest_per_cycle"] = {"api_calls": sendgrid.calls + bq.calls, "emails": len(sendgrid.sent),
+                                       "rows_logged": len(bq.rows), "events_lost": total - len(bq.rows)}
+
+    with FakeSendGrid() as sendgrid, FakeBigQuery() as bq:
+        pool = ConnectionPool()
+        bq_url = f"{bq.url}/bigquery/v2/projects/demo/datasets/remediation/tables/remediation_log/insertAll"
+        window = DigestWindow(args.window)
+        for c, events in enumerate(cycles):
+            now = c * 60.0
+            insert_all(bq_url, bq_batches(events), pool=pool)
+            window.extend(events, now=now)
+            if window.due(now=now + 60):
+                start, end, groups = window.drain(now=now + 60)
+                pool.request("POST", f"{sendgrid.url}/v3/mail/send", body=json.dumps(digest_email(groups, start, end)))
+        if window.events:
+            start, end, groups = window.drain()
+            pool.request("POST", f"{sendgrid.url}/v3/mail/send", body=json.dumps(digest_email(groups, start, end)))
+        # Replaying the first cycle must not duplicate rows
+        insert_all(bq_url, bq_batches(cycles[0]), pool=pool)
+        results["digest_batched"] = {"api_calls": sendgrid.calls + bq.calls, "emails": len(sendgrid.sent),
+                                     "rows_logged": len(bq.rows), "events_lost": total - len(bq.rows)}
+    results["api_calls_per_event"] = {
+        "newest_per_cycle": round(results["newest_per_cycle"]["api_calls"] / results["newest_per_cycle"]["rows_logged"], 3),
+        "digest_batched": round(results["digest_batched"]["api_calls"] / results["digest_batched"]["rows_logged"], 4),
+    }
+    return results
+
+
+def bench_memory_trends(args):
+    # Synthetic memory curves for --series pods over an hour of 60s points.
+    # A --leak-fraction of them leak the way demo_app's /leak does (1 MB per
+    # call, calls arriving at random), the rest are flat with GC noise and
+    # spikes. Reports vectorized analysis time and detection accuracy next to
+    # the original first-vs-last "end / start >= 1.2" rule.
+    import numpy as np
+    from memory_trends import analyze, parse_quantity
+
+    rng = np.random.default_rng(args.seed)
+    n, p = args.series, args.points
+    times = np.arange(p) * 60.0
+    limit = parse_quantity("256Mi")
+    leaking = rng.random(n) < args.leak_fraction
+    base = rng.uniform(60e6, 140e6, (n, 1))
+    # leak rates chosen so leaking pods hit the limit within 1-20 hours
+    true_rate = np.where(leaking, (limit - base[:, 0]) / rng.uniform(3600, 20 * 3600, n), 0.0)
+    calls = rng.poisson(np.repeat((true_rate * 60 / 1e6)[:, None], p, axis=1)).cumsum(axis=1)
+    noise = rng.normal(0, args.noise_mb * 1e6, (n, p))
+    spikes = (rng.random((n, p)) < 0.02) * rng.uniform(10e6, 40e6, (n, p))
+    values = base + calls * 1e6 + noise + spikes
+    values[rng.random((n, p)) < args.missing] = np.nan
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        result = analyze(times, values, limit)
+    elapsed = (time.perf_counter() - start) / args.repeat
+
+    def scores(flagged):
+        tp = int((flagged & leaking).sum())
+        return {"flagged": int(flagged.sum()), "true_positives": tp,
+                "precision": round(tp / max(int(flagged.sum()), 1), 3),
+                "recall": round(tp / max(int(leaking.sum()), 1), 3)}
+
+    first = values[:, 0]
+    last = values[:, -1]
+    with np.errstate(invalid="ignore"):
+        naive = last / first >= 1.2
+    rel_err = np.abs(result["robust_slope"][leaking] - true_rate[leaking]) / true_rate[leaking]
+    return {
+        "series": n,
+        "points": p,
+        "analysis_ms": round(elapsed * 1000, 2),
+        "vectorized": scores(result["leak"]),
+        "first_vs_last": scores(naive),
+        "leak_rate_median_rel_error": round(float(np.nanmedian(rel_err)), 3),
+    }
+
+
+def bench_metric_windows(args):
+    # --cycles Risk Mitigation cycles --interval seconds apart over --series
+    # synthetic pods (the memory-trends generator, extended in time). Compares
+    # re-querying and re-analyzing the full hour every cycle with ring-buffered
+    # windows that query only new points and fully analyze only series whose
+    # running slope is positive. --late of the points are only reported once
+    # the next minute is in (Monitoring delivering out of order), so a query
+    # sees them missing and the following one fills them in. Also checks the
+    # running slopes against a from-scratch fit of the buffered window and
+    # counts reported points missing from it.
+    import numpy as np
+    from memory_trends import analyze, parse_quantity
+    from metric_windows import MetricWindows
+
+    rng = np.random.default_rng(args.seed)
+    n, window, step = args.series, 60, 60
+    total = window + args.cycles * args.interval // step
+    limit = parse_quantity("256Mi")
+    horizon = 24 * 3600
+    leaking = rng.random(n) < 0.1
+    base = rng.uniform(60e6, 140e6, (n, 1))
+    rate = np.where(leaking, (limit - base[:, 0]) / rng.uniform(3 * 3600, 40 * 3600, n), 0.0)
+    calls = rng.poisson(np.repeat((rate * step / 1e6)[:, None], total, axis=1)).cumsum(axis=1)
+    values = base + calls * 1e6 + rng.normal(0, 3e6, (n, total))
+    values[rng.random((n, total)) < 0.02] = np.nan
+    t0 = 1_700_000_000 // step * step
+    times = t0 + np.arange(total) * float(step)
+    labels = [{"pod_name": f"pod-{i}", "container_name": f"svc-{i % 50}"} for i in range(n)]
+    late = rng.random((n, total)) < args.late
+
+    def query(lo, end):
+        # What Monitoring returns for [lo, end): late points of the second
+        # newest minute are not in yet
+        out = values[:, lo:end].copy()
+        if end - 2 >= lo:
+            out[late[:, end - 2], end - 2 - lo] = np.nan
+        return out
+
+    full = {"points": 0, "seconds": 0.0}
+    inc = {"points": 0, "seconds": 0.0, "analyzed": 0, "missed": 0, "dropped": 0}
+    windows = MetricWindows(window, step)
+    max_err = 0.0
+    for cycle in range(args.cycles + 1):
+        end = window + cycle * args.interval // step
+        now = times[end - 1] + 1
+
+        lo = end - window
+        reported = query(lo, end)
+        full["points"] += int((~np.isnan(reported)).sum())
+        start = time.perf_counter()
+        full_leaks = set(np.nonzero(analyze(times[lo:end], reported, limit, horizon)["leak"])[0])
+        full["seconds"] += time.perf_counter() - start
+
+        lo = max(end - windows.span_minutes(now) * 60 // step, 0)
+        fetched = query(lo, end)
+        inc["points"] += int((~np.isnan(fetched)).sum())
+        start = time.perf_counter()
+        windows.ingest(labels, times[lo:end], fetched)
+        rows = windows.candidates(limit, horizon)
+        _, wt, wv = windows.matrix(rows)
+        inc_leaks = set(rows[analyze(wt, wv, limit, horizon)["leak"]])
+        inc["seconds"] += time.perf_counter() - start
+        inc["analyzed"] += len(rows)
+        inc["missed"] += len(full_leaks - inc_leaks)
+
+        _, wt, wv = windows.matrix()
+        inc["dropped"] += int((~np.isnan(reported) & np.isnan(wv)).sum())
+        trend = windows.trend()
+        exact = analyze(wt, wv, limit)["slope"]
+        ok = ~np.isnan(exact) & (np.abs(exact) > 0)
+        max_err = max(max_err, float(np.max(np.abs(trend["slope"][ok] - exact[ok]) / np.abs(exact[ok]))))
+
+    cycles = args.cycles + 1
+    return {
+        "series": n,
+        "cycles": cycles,
+        "interval_s": args.interval,
+        "full_refetch": {"points_per_cycle": full["points"] // cycles,
+                         "analysis_ms_per_cycle": round(full["seconds"] / cycles * 1000, 2)},
+        "ring_buffer": {"points_per_cycle": inc["points"] // cycles,
+                        "analysis_ms_per_cycle": round(inc["seconds"] / cycles * 1000, 2),
+                        "series_fully_analyzed_per_cycle": inc["analyzed"] // cycles,
+                        "leaks_missed_vs_full": inc["missed"],
+                        "reported_points_dropped": inc["dropped"]},
+        "running_slope_max_rel_error": max_err,
+    }
+
+
+def bench_build_tracker(args):
+    # --commits merges to main, --commit-interval seconds apart, against a
+    # Cloud Build stand-in whose builds take --build-seconds on --runners
+    # workers. Times are the real ones scaled down by --scale (30s loop ->
+    # 1s). Compares the original loop (trigger a build every cycle, read its
+    # status once, count WORKING as success) with BuildTracker polling, and
+    # with BuildTracker on build notifications.
+    scale = args.scale
+    duration = args.commits * args.commit_interval
+
+    def merge_commits(github, stop):
+        for i in range(args.commits):
+            github.commit("org", "app", {"app.py": f"v{i}".encode()})
+            if stop.wait(args.commit_interval):
+                return
+
+    def request(ref, sha):
+        return {"source": {"repoSource": {"repoName": "app", "commitSha": sha}}, "steps": []}
+
+    results = {}
+    # original loop
+    with FakeGitHub() as github, FakeCloudBuild(args.build_seconds, args.runners) as cloudbuild:
+        github.commit("org", "app", {"app.py": b"v0"})
+        pool = ConnectionPool()
+        builds_url = f"{cloudbuild.url}/v1/projects/p/builds"
+        stop = threading.Event()
+        writer = ThreadPoolExecutor(1).submit(merge_commits, github, stop)
+        reported = {}
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            _, _, body = pool.request("POST", builds_url, body=json.dumps(request("main", None)))
+            build_id = json.loads(body)["metadata"]["build"]["id"]
+            status = json.loads(pool.request("GET", f"{builds_url}/{build_id}")[2])["status"]
+            reported[status] = reported.get(status, 0) + 1
+            time.sleep(30 * scale)
+        stop.set()
+        writer.result()
+        time.sleep(args.build_seconds * 2)
+        results["poll_and_retrigger"] = {
+            "builds": cloudbuild.created,
+            "builds_per_commit": round(cloudbuild.created / args.commits, 2),
+            "cloud_build_calls_per_commit": round(cloudbuild.calls / args.commits, 2),
+            "runner_seconds": round(cloudbuild.runner_seconds, 2),
+            "statuses_reported": reported,
+            "completions_noticed": 0,
+        }
+
+    for mode in ("tracker_polling", "tracker_notifications"):
+        with FakeGitHub() as github, FakePubSub() as pubsub, \
+                FakeCloudBuild(args.build_seconds, args.runners,
+                               notify=pubsub if mode == "tracker_notifications" else None) as cloudbuild:
+            github.commit("org", "app", {"app.py": b"v0"})
+            pool = ConnectionPool()
+            notifications = None
+            if mode == "tracker_notifications":
+                notifications = PubSubPuller(f"{pubsub.url}/v1/projects/p/subscriptions/cloud-builds",
+                                             max_messages=100, idle_wait=0.05)
+            heads = GitHubHeads("org", "app", branches=["main"], pulls=True, api_url=github.url, pool=pool)
+            tracker = BuildTracker(f"{cloudbuild.url}/v1/projects/p/builds", request, heads,
+                                   notifications=notifications, pool=pool,
+                                   min_interval=2 * scale, max_interval=(60 if notifications else 15) * scale,
+                                   head_interval=15 * scale).start()
+            stop = threading.Event()
+            writer = ThreadPoolExecutor(1).submit(merge_commits, github, stop)
+            events = []
+            deadline = time.monotonic() + duration + args.build_seconds * args.commits + 5
+            while time.monotonic() < deadline:
+                events.extend((time.time(), e) for e in tracker.poll(timeout=0.1))
+                if writer.done() and not tracker.inflight and tracker.stats["head_checks"] > 1 and \
+                        time.monotonic() > tracker._next_heads:
+                    break
+            tracker.stop()
+            writer.result()
+            lags = sorted(seen - cloudbuild.builds[e["id"]]["_finished"] for seen, e in events)
+            statuses = {}
+            for _, e in events:
+                statuses[e["status"]] = statuses.get(e["status"], 0) + 1
+            results[mode] = {
+                "builds": cloudbuild.created,
+                "builds_per_commit": round(cloudbuild.created / args.commits, 2),
+                "cloud_build_calls_per_commit": round(cloudbuild.calls / args.commits, 2),
+                "github_calls": github.calls,
+                "github_not_modified": github.not_modified,
+                "pubsub_calls": pubsub.calls,
+                "runner_seconds": round(cloudbuild.runner_seconds, 2),
+                "completions_noticed": statuses,
+                "notice_lag_p50_s": round(lags[len(lags) // 2], 3) if lags else None,
+                "notice_lag_max_s": round(lags[-1], 3) if lags else None,
+                "tracker": tracker.stats,
+            }
+    return results
+
+
+def bench_build_graph(args):
+    # Expected Cloud Build wall time (billed build minutes) of the original
+    # serial build -> push -> deploy chain, always a cold build, next to the
+    # generated step graph with a warm and a cold layer cache. Uses
+    # DEFAULT_DURATIONS, overridable with --duration id=seconds.
+    durations = dict(d.split("=") for d in args.duration)
+    durations = {k: float(v) for k, v in durations.items()}
+    original = [{"id": "build-cold", "name": "gcr.io/cloud-builders/docker"},
+                {"id": "push", "name": "gcr.io/cloud-builders/docker"},
+                {"id": "deploy", "name": "gcr.io/cloud-builders/gcloud"}]
+    results = {}
+    seconds, path = critical_path(original, durations)
+    results["original_serial"] = {"critical_path_s": seconds, "path": path, "tested": False}
+    for cache in ("docker", "kaniko"):
+        steps = build_steps("p", "demo-app", ref="pull/7/head", context="demo_app", cache=cache)
+        for warm in (True, False):
+            measured = dict(durations)
+            if not warm:
+                measured["build"] = measured.get("build-cold", 150.0)
+            seconds, path = critical_path(steps, measured)
+            results[f"{cache}_{'warm' if warm else 'cold'}"] = {
+                "critical_path_s": seconds,
+                "path": path,
+                "serial_s": serial_length(steps, measured),
+                "tested": True,
+            }
+    return results
+
+
+def bench_deploy_scheduler(args):
+    # Simulated --hours of successful builds for --services services, arriving
+    # in bursts (merge trains of 1-4 builds a few minutes apart), deployed to
+    # the GKE stand-in once per build (original) or through DeployScheduler
+    # with --min-interval spacing. The clock is simulated; patches are real
+    # HTTP calls. Reports rollouts per service-hour and time-to-latest-image:
+    # for each build, how long until its service runs it or a newer one.
+    rng = random.Random(args.seed)
+    horizon = args.hours * 3600
+    builds = []
+    for s in range(args.services):
+        t = rng.expovariate(args.trains_per_hour / 3600)
+        while t < horizon:
+            for _ in range(rng.randint(1, 4)):
+                builds.append((t, f"svc-{s}"))
+                t += rng.uniform(60, 300)
+            t += rng.expovariate(args.trains_per_hour / 3600)
+    builds.sort()
+    builds = [(t, service, i) for i, (t, service) in enumerate(builds)]
+
+    def lags(rollouts):
+        # rollouts: [(time, service, build index)]
+        by_service = {}
+        for t, service, i in sorted(rollouts):
+            by_service.setdefault(service, []).append((t, i))
+        out = []
+        for t, service, i in builds:
+            done = [rt for rt, ri in by_service.get(service, []) if ri >= i and rt >= t]
+            out.append((min(done) if done else horizon) - t)
+        out.sort()
+        return {"time_to_latest_p50_s": round(out[len(out) // 2], 1),
+                "time_to_latest_p95_s": round(out[int(len(out) * 0.95)], 1),
+                "time_to_latest_max_s": round(out[-1], 1)}
+
+    results = {"builds": len(builds), "services": args.services, "hours": args.hours}
+    for mode in ("per_build", "scheduler"):
+        now = [0.0]
+        with FakeGKE(clock=lambda: now[0]) as gke:
+            pool = ConnectionPool()
+
+            def rollout(service, build):
+                patch_deployment(f"{gke.url}/v1/namespaces/default/deployments/{service}", service,
+                                 f"gcr.io/p/{service}:{build['id']}", pool=pool)
+
+            if mode == "per_build":
+                for t, service, i in builds:
+                    now[0] = t
+                    rollout(service, {"id": f"{i:06d}"})
+            else:
+                scheduler = DeployScheduler(rollout, min_interval=args.min_interval,
+                                            max_concurrency=args.concurrency, clock=lambda: now[0])
+                pending = list(builds)
+                while pending or scheduler.pending:
+                    wait = scheduler.next_due()
+                    next_build = pending[0][0] if pending else None
+                    if next_build is not None and (wait is None or next_build <= now[0] + wait):
+                        now[0] = max(now[0], next_build)
+                        t, service, i = pending.pop(0)
+                        scheduler.offer(service, {"id": f"{i:06d}", "timestamp": t})
+                    else:
+                        now[0] += wait
+                    scheduler.dispatch()
+            rollouts = [(t, name, int(image.rsplit(":", 1)[1])) for t, name, image in gke.rollouts]
+        results[mode] = {
+            "rollouts": len(rollouts),
+            "rollouts_per_service_hour": round(len(rollouts) / (args.services * args.hours), 2),
+            **lags(rollouts),
+        }
+        if mode == "scheduler":
+            results[mode]["scheduler"] = scheduler.stats
+    return results
+
+
+def bench_rollout_watch(args):
+    # One service on the GKE stand-in receives a good image, an image whose
+    # pods never become ready, an image that is ready but logs errors, and a
+    # good image again. The original step patches and forgets, so each bad
+    # image stays live until the next build; RolloutWatcher follows the watch
+    # stream and rolls back. A second watcher, started from the first one's
+    # state file as after a restart, then rolls out a bad image and still
+    # rolls back. Times are scaled down (pods ready in --pod-ready seconds).
+    images = [("good-1", None), ("crashloop", "bad"), ("good-2", None), ("noisy", "noisy"), ("good-3", None)]
+    results = {}
+    state_dir = tempfile.mkdtemp(prefix="rollout-state-")
+    state_path = f"{state_dir}/known-good.json"
+    with FakeGKE(replicas=3, pod_ready=args.pod_ready, progress_deadline=args.deadline) as gke:
+        gke.bad_images.add("gcr.io/p/svc:crashloop")
+        gke.noisy_images["gcr.io/p/svc:noisy"] = args.error_rate
+        base = f"{gke.url}/v1/namespaces/default/deployments"
+        watcher = RolloutWatcher(base, deadline=args.deadline * 2, bake=args.bake, max_errors=args.max_errors,
+                                 error_count=gke.error_count, check_interval=0.05, state_path=state_path)
+        watcher.roll_out("svc", "gcr.io/p/svc:good-0")
+        rollouts = []
+        for tag, kind in images:
+            result = watcher.roll_out("svc", f"gcr.io/p/svc:{tag}")
+            rollouts.append({k: v for k, v in result.items() if k != "service"})
+        results["watched"] = {
+            "rollouts": rollouts,
+            "running_image": gke.image("svc"),
+            "bad_image_live_s": round(sum(r.get("detect_latency", 0) + (r.get("rollback_latency") or 0)
+                                          for r in rollouts if r["health"] != "HEALTHY"), 3),
+        }
+        restarted = RolloutWatcher(base, deadline=args.deadline * 2, bake=args.bake, max_errors=args.max_errors,
+                                   error_count=gke.error_count, check_interval=0.05, state_path=state_path)
+        result = restarted.roll_out("svc", "gcr.io/p/svc:crashloop")
+        results["after_restart"] = {"health": result["health"], "rolled_back_to": result.get("rolled_back_to"),
+                                    "running_image": gke.image("svc")}
+        # Original deploy step: PATCH and move on
+        patch_deployment(f"{base}/svc", "svc", "gcr.io/p/svc:crashloop")
+        time.sleep(args.deadline * 2)
+        deployment = json.loads(urllib.request.urlopen(f"{base}/svc").read())
+        results["patch_and_forget"] = {
+            "running_image_after_s": args.deadline * 2,
+            "running_image": gke.image("svc"),
+            "rollout_state": rollout_state(deployment),
+        }
+    shutil.rmtree(state_dir, ignore_errors=True)
+    return results
+
+
+def bench_templates(args):
+    # Per-step cost of the agents' own templates and `when` expressions,
+    # compiled once (step_templates) vs substituted with regexes on every
+    # render, with the response body re-parsed on every reference. Cases: the
+    # Error Analyzer's fetch_fingerprints condition and write_error body over
+    # a --messages Pub/Sub pull, the Risk Mitigation PR body, and a condition
+    # reading a Cloud Build list through responseBody.values()[0].
+    import re
+    from local_runtime import compile_agent, load_definitions
+    from step_templates import StepResult, Template, compile_condition
+
+    agents = {a.display_name: a for a in load_definitions()}
+    pull = json.dumps({"receivedMessages": [
+        {"ackId": f"ack-{i}", "message": {"messageId": str(i), "data": "x" * 400, "publishTime": "2024-01-01T00:00:00Z"}}
+        for i in range(args.messages)]})
+    payload = json.dumps({f"errors/svc/{i}": {"errorMessage": "OOMKilled " * 20, "service": "svc"}
+                          for i in range(args.messages)})
+    builds = json.dumps({b: {"id": b, "status": "SUCCESS" if j else "WORKING"} for j, b in enumerate(["b1", "b2", "b3"])})
+    results = {
+        "fetch_error": StepResult(responseBody=pull),
+        "analyze_error": StepResult(result={"error_payload": payload}),
+        "generate_risk_patch": StepResult(result={"predictions": [{"content": "--- a/app.py\n+++ b/app.py\n" * 20}]}),
+        "fetch_build": StepResult(responseBody=builds),
+    }
+    env = {"FIREBASE_DB_URL": "https://db", "ORG": "o", "REPO": "r", "GITHUB_TOKEN": "t"}
+
+    def tool_body(agent, tool):
+        return next(t for t in agents[agent].tools if t.name == tool).http_request.body.strip()
+
+    def when(agent, step):
+        return next(s for s in agents[agent].workflow.steps if s.name == step).when
+
+    cases = [
+        ("error_analyzer.fetch_fingerprints.when", "when", when("Error Analyzer Agent", "fetch_fingerprints"), None),
+        ("error_analyzer.write_error.body", "body", tool_body("Error Analyzer Agent", "write_error"),
+         {"error_payload": "{{analyze_error.result.error_payload}}"}),
+        ("risk_mitigation.create_pr.body", "body", tool_body("Risk Mitigation Agent", "create_pr"), None),
+        ("cloud_build.status.when", "when", "fetch_build.responseBody.values()[1].status == 'SUCCESS'", None),
+    ]
+
+    # Naive baseline: regex substitution per render, JSON parsed per reference
+    def naive_lookup(path, results):
+        tokens = re.findall(r"[A-Za-z_]\w*\(\)|[A-Za-z_]\w*|\[\d+\]", path)
+        value = results.get(tokens[0])
+        for token in tokens[1:]:
+            if value is None:
+                return None
+            if isinstance(value, StepResult):
+                if token in ("response", "responseBody") and token != tokens[-1]:
+                    value = json.loads(value.responseBody) if value.responseBody else None
+                else:
+                    value = getattr(value, token, None)
+            elif token.startswith("["):
+                i = int(token[1:-1])
+                value = value[i] if isinstance(value, list) and i < len(value) else None
+            elif token.endswith("()"):
+                value = list(getattr(value, token[:-2])())
+            else:
+                value = value.get(token) if isinstance(value, dict) else None
+        return value
+
+    def naive_render(text, arguments, results):
+        def value(v):
+            return "" if v is None else json.dumps(v) if isinstance(v, (dict, list)) else str(v)
+        out = re.sub(r"\$\{(\w+)\}", lambda m: value((arguments or {}).get(m.group(1), env.get(m.group(1)))), text)
+        return re.sub(r"\{\{\s*([^{}]+?)\s*\}\}", lambda m: value(naive_lookup(m.group(1), results)), out)
+
+    def naive_when(text, results):
+        m = re.match(r"^\s*(.+?)\s*(==|!=)\s*(null|'[^']*')\s*$", text)
+        literal = None if m.group(3) == "null" else m.group(3)[1:-1]
+        return (naive_lookup(m.group(1), results) == literal) == (m.group(2) == "==")
+
+    def per_call(fn, n):
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - start) / n * 1e6
+
+    steps = set(results)
+    out = {}
+    for name, kind, text, arguments in cases:
+        start = time.perf_counter()
+        if kind == "when":
+            compiled = compile_condition(text, steps)[0]
+            # results' responses are parsed by the first read and then cached
+            fresh = lambda: compiled(results)
+            first = lambda: compiled({k: StepResult(responseBody=v.responseBody, result=v.result)
+                                      for k, v in results.items()})
+            naive = lambda: naive_when(text, results)
+        else:
+            template = Template(text, steps, json_body=True)
+            args_t = {k: Template(v, steps) for k, v in (arguments or {}).items()}
+            fresh = lambda: template.render(env, {k: t.render(env, None, results) for k, t in args_t.items()}, results)
+            naive = lambda: naive_render(text, {k: naive_render(v, None, results) for k, v in (arguments or {}).items()},
+                                         results)
+            first = None
+        compile_us = (time.perf_counter() - start) * 1e6
+        # Only the compiled bodies escape values inside JSON strings
+        assert kind == "body" or fresh() == naive(), name
+        out[name] = {
+            "compile_once_us": round(compile_us, 1),
+            "compiled_us": round(per_call(fresh, args.iterations), 2),
+            "naive_us": round(per_call(naive, args.iterations), 2),
+        }
+        if first is not None:
+            out[name]["compiled_first_read_us"] = round(per_call(first, args.iterations), 2)
+        out[name]["speedup"] = round(out[name]["naive_us"] / out[name]["compiled_us"], 1)
+    # A cycle reads one response from several places (a condition, a run
+    # block, templates): parsed once with the cached StepResult.response
+    reads = args.reads
+    out["pull_response_read_x%d" % reads] = {
+        "cached_us": round(per_call(lambda: [r.response for r in [StepResult(responseBody=pull)] * reads], 20), 1),
+        "reparsed_us": round(per_call(lambda: [json.loads(pull) for _ in range(reads)], 20), 1),
+    }
+    start = time.perf_counter()
+    for agent in agents.values():
+        compile_agent(agent)
+    out["compile_all_agents_ms"] = round((time.perf_counter() - start) * 1e3, 2)
+    return out
+
+
+def bench_http_policy(args):
+    # --pulls PR creations and --reads commit reads against the GitHub
+    # stand-in, which allows --limit mutations per second (429 + Retry-After
+    # beyond that) and fails --error-rate of all requests with a 503. The
+    # original tools send each request once over a fresh connection; the
+    # pooled variants keep connections alive, throttle mutations with a token
+    # bucket just under the limit and retry 429s / failed reads with jittered
+    # backoff (scaled down with --backoff).
+    import asyncio
+    import urllib.error
+    from http_pool import AsyncExecutor, Policy
+
+    def run(github, send):
+        github.rate_limit(args.limit, 1.0, method="POST")
+        github.error_rate = args.error_rate
+        base = f"{github.url}/repos/o/r"
+        jobs = [("POST", f"{base}/pulls", json.dumps({"title": f"fix {i}", "head": f"auto-fix/{i}", "base": "main"}))
+                for i in range(args.pulls)]
+        jobs += [("GET", f"{base}/commits/main", None)] * args.reads
+        random.Random(args.seed).shuffle(jobs)
+        start = time.perf_counter()
+        outcomes = send(jobs)
+        return {
+            "seconds": round(time.perf_counter() - start, 2),
+            "pulls_created": len(github.created_pulls),
+            "reads_ok": sum(1 for (m, _, _), ok in zip(jobs, outcomes) if ok and m == "GET"),
+            "failed": sum(1 for ok in outcomes if not ok),
+            "server_rejected": dict(sorted(github.rejected.items())),
+            "server_requests": github.calls,
+        }
+
+    def policy():
+        # One policy per API: mutations bucketed just under the limit
+        return {"POST": Policy(rate=args.limit * 0.9, burst=args.limit, methods={"POST"},
+                               backoff=args.backoff, retries=6),
+                "GET": Policy(backoff=args.backoff, retries=6)}
+
+    def fresh_repo(github):
+        github.commit("o", "r", {"app.py": b"print('ok')\n"})
+        return github
+
+    def bare(jobs):
+        def one(job):
+            method, url, body = job
+            req = urllib.request.Request(url, data=body.encode() if body else None, method=method,
+                                         headers={"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(req, timeout=10).read()
+                return True
+            except (urllib.error.URLError, OSError):
+                return False
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            return list(executor.map(one, jobs))
+
+    def pooled(jobs):
+        pool, policies = ConnectionPool(), policy()
+
+        def one(job):
+            method, url, body = job
+            try:
+                pool.request(method, url, body=body, headers={"Content-Type": "application/json"},
+                             policy=policies[method])
+                return True
+            except Exception:
+                return False
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            outcomes = list(executor.map(one, jobs))
+        results["pooled_pool"] = dict(pool.stats, throttled_s=round(pool.stats["throttled_s"], 2))
+        return outcomes
+
+    def async_executor(jobs):
+        async def main():
+            pool, policies = ConnectionPool(max_per_host=args.workers), policy()
+            executor = AsyncExecutor(pool)
+            limit = asyncio.Semaphore(args.workers)
+
+            async def one(job):
+                method, url, body = job
+                async with limit:
+                    try:
+                        await executor.request(method, url, body=body, headers={"Content-Type": "application/json"},
+                                               policy=policies[method])
+                        return True
+                    except Exception:
+                        return False
+            try:
+                return await asyncio.gather(*(one(job) for job in jobs))
+            finally:
+                results["async_executor_stats"] = dict(executor.stats,
+                                                       throttled_s=round(executor.stats["throttled_s"], 2),
+                                                       transport="httpx" if executor.client else "pool")
+                await executor.aclose()
+        return asyncio.run(main())
+
+    results = {}
+    for name, send in (("original", bare), ("pooled", pooled), ("async_executor", async_executor)):
+        with FakeGitHub() as github:
+            results[name] = run(fresh_repo(github), send)
+    return results
+
+
+def bench_tracing(args):
+    # --incidents synthetic incidents, each hop's duration drawn from a
+    # lognormal around its --hop-median (one slow tail hop per --slow
+    # incidents), recorded through Tracer into an OTLP/JSON file the way the
+    # agents do, plus --steps step spans per incident. Reports the per-span
+    # recording cost and tracing.report over the file.
+    from tracing import Tracer, FileExporter, correlation_id, read_spans, report
+
+    medians = dict(zip(["detect", "fix", "build", "deploy", "report"], args.hop_median))
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/spans.jsonl"
+        tracers = {hop: Tracer(hop, FileExporter(path)) for hop in medians}
+        spans, start = 0, time.perf_counter()
+        for i in range(args.incidents):
+            incident, t = correlation_id(i), 1_700_000_000.0 + i * 60
+            slow = rng.choice(list(medians)) if args.slow and i % args.slow == 0 else None
+            for hop, median in medians.items():
+                seconds = median * rng.lognormvariate(0, 0.4) * (10 if hop == slow else 1)
+                tracers[hop].hop(incident, hop, t, t + seconds)
+                for n in range(args.steps):
+                    tracers[hop].record(f"step{n}", t, t + seconds / args.steps)
+                spans += 1 + args.steps
+                t += seconds
+        for t in tracers.values():
+            t.flush()
+        elapsed = time.perf_counter() - start
+        out = report(read_spans([path]))
+    out.pop("steps_s")
+    return {"spans": spans, "record_us_per_span": round(elapsed / spans * 1e6, 2),
+            "hop_medians_s": medians, **out}
+
+
+def bench_pipeline(args):
+    # All six workflows against every stand-in, replaying a synthetic
+    # scenario or a recorded trace (see pipeline_replay.py for the format
+    # and for comparing two --output results)
+    return replay(args)
+
+
+def bench_fix_scheduler(args):
+    # A backlog of --noisy errors from one service followed by --quiet
+    # errors from each of --services other services (one of them OOMKilled),
+    # each fixed with a text-bison predict and a PR against the stand-ins.
+    # The original loop fixes one error at a time in arrival order; the
+    # scheduler runs --workers at once, at most --per-service per service,
+    # most severe / frequent / critical first. The shed variant bounds the
+    # queue at --queue and parks the least urgent errors until there is room.
+    from fix_scheduler import FixScheduler, parse_criticality
+    from tracing import percentiles
+
+    errors = [{"id": f"n{i}", "service": "noisy", "fingerprint": f"n{i % 3}",
+               "errorMessage": f"RuntimeError: upstream timeout #{i}"} for i in range(args.noisy)]
+    for s in range(args.services):
+        for i in range(args.quiet):
+            message = "OOMKilled: container exceeded its memory limit" if s == 0 and i == 0 else \
+                f"KeyError: 'field{i}' in handler"
+            errors.append({"id": f"s{s}-{i}", "service": f"svc{s}", "fingerprint": f"s{s}-{i}",
+                           "errorMessage": message})
+
+    def run(schedule):
+        with FakeTextBison(latency=args.llm_latency) as llm, FakeGitHub(latency=args.github_latency) as github:
+            github.commit("o", "r", {"app.py": b"print('ok')\n"})
+            pool = ConnectionPool(max_per_host=args.workers)
+
+            def fix(error):
+                _, _, body = pool.request("POST", f"{llm.url}/v1/models/text-bison:predict",
+                                          body=json.dumps({"instances": [{"prompt": error["errorMessage"]}]}),
+                                          headers={"Content-Type": "application/json"})
+                patch = json.loads(body)["predictions"][0]["content"]
+                pool.request("POST", f"{github.url}/repos/o/r/pulls",
+                             body=json.dumps({"title": error["id"], "head": f"auto-fix/{error['id']}",
+                                              "base": "main", "body": patch}),
+                             headers={"Content-Type": "application/json"})
+                return {"status": "PR_OPENED"}
+
+            start = time.perf_counter()
+            done, extra = schedule(fix)
+            elapsed = time.perf_counter() - start
+        by_service = {}
+        for error_id, finished in done.items():
+            service = "noisy" if error_id.startswith("n") else "others"
+            by_service.setdefault(service, []).append(finished - start)
+        return {"seconds": round(elapsed, 2), "prs": len(github.created_pulls),
+                "time_to_pr_s": {s: percentiles(v) for s, v in sorted(by_service.items())},
+                "first_oom_pr_s": round(done["s0-0"] - start, 2) if "s0-0" in done else None, **extra}
+
+    def serial(fix):
+        done = {}
+        for error in errors:
+            fix(error)
+            done[error["id"]] = time.perf_counter()
+        return done, {}
+
+    def scheduled(overflow, max_queue):
+        def schedule(fix):
+            done = {}
+            scheduler = FixScheduler(fix, workers=args.workers, max_queue=max_queue, per_service=args.per_service,
+                                     criticality=parse_criticality(args.criticality), overflow=overflow)
+            outcomes = {}
+            for error in errors:
+                outcome = scheduler.offer(error)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            pending = len(errors)
+            while pending:
+                for r in scheduler.results(timeout=1.0):
+                    pending -= 1
+                    done[r["id"]] = time.perf_counter()
+            metrics = scheduler.metrics()
+            scheduler.close()
+            return done, {"offers": outcomes,
+                          "scheduler": {k: metrics[k] for k in ("wait_s", "handle_s", "completed", "shed")}}
+        return schedule
+
+    return {
+        "errors": len(errors),
+        "original": run(serial),
+        "scheduler": run(scheduled("block", len(errors))),
+        "scheduler_shed": run(scheduled("shed", args.queue)),
+    }
+
+
+def bench_preflight(args):
+    # Candidate patches against a small workspace (a module, its tests and a
+    # Deployment manifest): one in --bad-every is good, the rest cycle
+    # through a stale context, a syntax error, a manifest without a name, a
+    # failing test and a response without a diff. Checked one patch at a
+    # time, then --workers patches at once; each rejected patch is a remote
+    # build of --build-seconds that never runs.
+    from patch_preflight import Preflight
+    from tracing import percentiles
+
+    workspace = tempfile.mkdtemp(prefix="preflight-ws-")
+    files = {
+        "app.py": "def add(a, b):\n    return a + b\n",
+        "test_app.py": "from app import add\n\n\ndef test_add():\n    assert add(2, 3) == 5\n",
+        "deploy.yaml": "apiVersion: apps/v1\nkind: Deployment\nmetadata:\n  name: demo\nspec:\n  replicas: 1\n",
+    }
+    for name, text in files.items():
+        with open(f"{workspace}/{name}", "w") as f:
+            f.write(text)
+    candidates = {
+        "good": "```diff\n--- a/app.py\n+++ b/app.py\n@@ -1,2 +1,3 @@\n def add(a, b):\n"
+                "+    # ints only\n     return a + b\n```",
+        "stale_context": "--- a/app.py\n+++ b/app.py\n@@ -1,2 +1,2 @@\n def plus(a, b):\n"
+                         "-    return a + b\n+    return b + a\n",
+        "syntax_error": "--- a/app.py\n+++ b/app.py\n@@ -1,2 +1,2 @@\n def add(a, b):\n"
+                        "-    return a + b\n+    return a +\n",
+        "bad_manifest": "--- a/deploy.yaml\n+++ b/deploy.yaml\n@@ -3,2 +3,2 @@\n metadata:\n"
+                        "-  name: demo\n+  labels: {}\n",
+        "failing_test": "--- a/app.py\n+++ b/app.py\n@@ -1,2 +1,2 @@\n def add(a, b):\n"
+                        "-    return a + b\n+    return a - b\n",
+        "no_diff": "Increase the memory limit of the deployment to 512Mi.",
+    }
+    bad = [name for name in candidates if name != "good"]
+    mix = ["good" if i % args.bad_every == 0 else bad[i % len(bad)] for i in range(args.patches)]
+
+    def run(concurrency):
+        checker = Preflight(max_workers=args.workers)
+        checker.check(workspace, candidates["good"])  # start the pool processes
+        seconds = {}
+
+        def one(kind):
+            report = checker.check(workspace, candidates[kind])
+            seconds.setdefault(kind, []).append(report["seconds"])
+            return kind, report["ok"]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            outcomes = list(ex.map(one, mix))
+        elapsed = time.perf_counter() - start
+        checker.close()
+        wrong = [kind for kind, ok in outcomes if ok != (kind == "good")]
+        return {"seconds": round(elapsed, 2), "patches_per_s": round(len(mix) / elapsed, 2),
+                "misclassified": len(wrong),
+                "seconds_per_patch": {kind: percentiles(v) for kind, v in sorted(seconds.items())}}
+
+    try:
+        serial, pooled = run(1), run(args.workers)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    rejected = sum(1 for kind in mix if kind != "good")
+    return {
+        "patches": len(mix),
+        "serial": serial,
+        "pool": pooled,
+        "builds_avoided": rejected,
+        "build_minutes_avoided": round(rejected * args.build_seconds / 60, 1),
+    }
+
+
+def bench_event_log(args):
+    # --records handoff records (errors, pr-requests, builds with three
+    # status versions each, deploys, risk-mitigations) across --services
+    # services appended to the event log in --batch transactions, then the
+    # agents' reads: newest record (orderBy="timestamp"&limitToLast=1),
+    # records since a recent timestamp, a service's newest records, one
+    # incident's records, and a consumer reading through the log. The same
+    # limitToLast=1 read over HTTP is timed against LogRTDB and against the
+    # in-memory RTDB stand-in holding --rtdb-records records, which sorts
+    # every child per read.
+    from datetime import datetime, timezone
+
+    from event_log import EventLog
+    from local_standins import LogRTDB
+    from tracing import percentiles
+
+    rng = random.Random(args.seed)
+    types = ["errors", "pr-requests", "builds", "builds", "builds", "deploys", "risk-mitigations"]
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+
+    def record(i):
+        type_ = types[i % len(types)]
+        service = f"svc{i % args.services}"
+        incident = f"inc-{i // len(types):016x}"
+        key = f"b{i // len(types)}" if type_ == "builds" else f"{service}/{i}" if type_ == "errors" else f"r{i}"
+        ts = datetime.fromtimestamp(base + i * 0.01, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        return type_, key, {"service": service, "timestamp": ts, "correlationId": incident,
+                            "status": "SUCCESS", "message": f"event {i}"}
+
+    def timed(fn, n):
+        samples = []
+        for _ in range(n):
+            t = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t) * 1000)
+        return percentiles(samples)
+
+    scratch = tempfile.mkdtemp(prefix="event-log-")
+    try:
+        log = EventLog(f"{scratch}/events.db")
+        start = time.perf_counter()
+        for first in range(0, args.records, args.batch):
+            log.append_many([record(i) for i in range(first, min(first + args.batch, args.records))])
+        append_s = time.perf_counter() - start
+        recent = record(args.records - args.records // 100)[2]["timestamp"]
+        queries_ms = {
+            "latest_per_type": timed(lambda: log.query(rng.choice(types), limit=1, last=True), args.queries),
+            "since_recent_ts": timed(lambda: log.query("deploys", since=recent), max(args.queries // 10, 1)),
+            "service_latest_10": timed(lambda: log.query(service=f"svc{rng.randrange(args.services)}",
+                                                         limit=10, last=True), args.queries),
+            "incident": timed(lambda: log.incident(f"inc-{rng.randrange(args.records // len(types)):016x}"),
+                              args.queries),
+        }
+        consumer, read, start = log.consumer("bench"), 0, time.perf_counter()
+        while read < args.consume and (events := consumer.poll(max_events=1000)):
+            read += len(events)
+        consume_s = time.perf_counter() - start
+        size = log.size()
+
+        pool = ConnectionPool()
+        with LogRTDB(log) as server:
+            url = latest_url(server.url, "builds")
+            http_log = timed(lambda: pool.request("GET", url), args.queries)
+        with FakeRTDB() as rtdb:
+            rtdb.root["builds"] = {f"b{i}": record(i * len(types) + 2)[2] for i in range(args.rtdb_records)}
+            url = latest_url(rtdb.url, "builds")
+            http_rtdb = timed(lambda: pool.request("GET", url), max(args.queries // 10, 1))
+
+        start = time.perf_counter()
+        compacted = log.compact()
+        compact_s = time.perf_counter() - start
+        after = log.size()
+        log.close()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return {
+        "records": args.records,
+        "append_per_s": round(args.records / append_s),
+        "db_mb": round(size["bytes"] / 2 ** 20, 1),
+        "queries_ms": queries_ms,
+        "consume_per_s": round(read / consume_s) if consume_s else None,
+        "latest_build_http_ms": {"event_log": http_log, f"rtdb_{args.rtdb_records}_records": http_rtdb},
+        "compaction": {"seconds": round(compact_s, 2), **compacted,
+                       "db_mb_after": round(after["bytes"] / 2 ** 20, 1)},
+    }
+
+
+def bench_log_parser(args):
+    # --lines pod log lines from --streams pods, interleaved line by line:
+    # access-log chatter with Python tracebacks, Java stacks (with a cause)
+    # and Go panics of 3-30 frames (and now and then a 2000-frame recursion)
+    # mixed in. Reports lines/s through the reassembler, whether every trace
+    # came out whole with the right exception type, and the parser's peak
+    # memory and buffered lines after a tenth of --lines and after four
+    # tenths; buffers are capped at --max-lines per stream, whatever the
+    # volume. The original analyzer makes every trace line that reaches it a
+    # separate one-line error record.
+    import tracemalloc
+
+    from log_parser import LogReassembler
+
+    def python(rng, depth):
+        lines = ["Traceback (most recent call last):"]
+        for d in range(depth):
+            lines += [f'  File "/app/mod{d}.py", line {rng.randrange(1, 500)}, in fn{d}', f"    step{d}()"]
+        return "ValueError", lines + [f"ValueError: bad value {rng.randrange(1000)}"]
+
+    def java(rng, depth):
+        lines = [f"java.lang.IllegalStateException: state {rng.randrange(1000)}"]
+        lines += [f"\tat com.acme.C{d}.m{d}(C{d}.java:{rng.randrange(1, 500)})" for d in range(depth)]
+        lines += ["Caused by: java.io.IOException: disk", "\tat com.acme.Io.read(Io.java:7)", "\t... 3 more"]
+        return "java.lang.IllegalStateException", lines
+
+    def go(rng, depth):
+        lines = [f"panic: runtime error: index out of range [{rng.randrange(9)}]", "", "goroutine 1 [running]:"]
+        for d in range(depth):
+            lines += [f"main.f{d}(0xc000{d:04x})", f"\t/src/app/f{d}.go:{rng.randrange(1, 500)} +0x1d"]
+        return "panic", lines + ["exit status 2"]
+
+    def generate(n_lines, seed, finish=True):
+        rng = random.Random(seed)
+        queues = [deque() for _ in range(args.streams)]
+        out, expected = [], []
+        while len(out) < n_lines:
+            i = rng.randrange(args.streams)
+            q = queues[i]
+            if not q:
+                if rng.random() < args.trace_ratio:
+                    kind = rng.choice((python, java, go))
+                    depth = 2000 if rng.random() < 0.01 else rng.randint(3, 30)
+                    exception, lines = kind(rng, depth)
+                    expected.append(exception)
+                    q.extend(lines)
+                q.append(f'10.0.{i % 255}.{rng.randrange(255)} - - "GET /api HTTP/1.1" 200 {rng.randrange(9999)}')
+            out.append((("default", f"pod-{i}", "app"), q.popleft()))
+        # Past n_lines no new traces start; the open ones finish round-robin
+        while finish and any(queues):
+            for i, q in enumerate(queues):
+                if q:
+                    out.append((("default", f"pod-{i}", "app"), q.popleft()))
+        return out, expected
+
+    def run(lines):
+        parser = LogReassembler(max_lines=args.max_lines)
+        events = []
+        start = time.perf_counter()
+        for stream, line in lines:
+            events += parser.feed(stream, line, now=0.0)
+        events += parser.flush(force=True)
+        return events, time.perf_counter() - start, parser
+
+    lines, expected = generate(args.lines, args.seed)
+    events, seconds, parser = run(lines)
+
+    def peak(n):
+        sample, _ = generate(n, args.seed + 1, finish=False)
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        parser = LogReassembler(max_lines=args.max_lines)
+        for stream, line in sample:
+            # Events are dropped right away, as the analyzer writes them out
+            parser.feed(stream, line, now=0.0)
+        peak_bytes = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        return {"peak_kb": round(peak_bytes / 1024),
+                "buffered_lines": sum(len(s.lines) for s in parser.streams.values())}
+
+    small = max(args.lines // 10, 1000)
+    return {
+        "lines": len(lines),
+        "streams": args.streams,
+        "traces": len(expected),
+        "lines_per_s": round(len(lines) / seconds),
+        "events": len(events),
+        "exception_types_match": sorted(e["exception"] or "" for e in events) == sorted(expected),
+        "events_without_frames": sum(1 for e in events if not e["frames"]),
+        "truncated": parser.stats["truncated"],
+        "original_fragment_records": sum(1 for _, line in lines if not line.startswith("10.0.")),
+        "memory": {f"{small}_lines": peak(small), f"{small * 4}_lines": peak(small * 4),
+                   "buffered_lines_bound": args.streams * args.max_lines},
+    }
+
+
+def bench_loop_scheduler(args):
+    # --hours of simulated time through the six agent loops, with --bursts
+    # error bursts (--burst-size errors over 30s each) and --leaks memory
+    # leaks at random times. Every cycle costs the API calls its agent makes
+    # (one poll per cycle, the writes only when there is work). "fixed" is
+    # the original pacing: Error Analyzer 60s once drained, Fix Generator
+    # 5s, Build & Test and Deploy 30s, Risk Mitigation 600s, Reporter 60s;
+    # "adaptive" is loop_scheduler with its LOOPS defaults, and "budgeted"
+    # the same under a --budget requests/hour cap and the --api-budget caps
+    # (APIs: poll, rtdb, llm, github, cloudbuild, gke, bigquery, sendgrid,
+    # monitoring). Reports API calls per hour
+    # overall and per loop, detection latency (failure -> Error Analyzer
+    # cycle that pulls it), time to deploy and to report, and leak detection.
+    from loop_scheduler import LOOPS, LoopScheduler, parse_budgets
+    from tracing import percentiles
+
+    fixed = {"error_analyzer": 60, "fix_generator": 5, "risk_mitigation_agent": 600,
+             "build_and_test_agent": 30, "deploy_agent": 30, "reporter_agent": 60}
+    names = list(fixed)
+    rng = random.Random(args.seed)
+    horizon = args.hours * 3600.0
+    errors = sorted(start + rng.uniform(0, 30) for start in (rng.uniform(0, horizon) for _ in range(args.bursts))
+                    for _ in range(args.burst_size))
+    leaks = sorted(rng.uniform(0, horizon) for _ in range(args.leaks))
+
+    def simulate(mode, budget=0, api_budgets=None):
+        now = [0.0]
+        scheduler = LoopScheduler(budget=budget, api_budgets=api_budgets, clock=lambda: now[0])
+        for name in names:
+            low, high = LOOPS[name]["interval"]
+            scheduler.add(name, low, fixed[name] if name in ("error_analyzer", "risk_mitigation_agent",
+                                                             "reporter_agent") else high,
+                          LOOPS[name].get("wakes", ()) if mode != "fixed" else ())
+        due = dict.fromkeys(names, 0.0)
+        # work waiting for each stage: (ready at, failure time)
+        fixes, builds, seen_leaks = [], [], 0
+        pending = {"fix": [], "build": [], "deploy": []}
+        next_error = 0
+        detect, deployed, report, leak_found, unreported = [], [], [], [], []
+
+        def ready(items, t):
+            out = [item for item in items if item[0] <= t]
+            items[:] = [item for item in items if item[0] > t]
+            return out
+
+        while True:
+            name = min(names, key=lambda n: (due[n] if mode == "fixed" else scheduler.next_at(n)))
+            t = due[name] if mode == "fixed" else scheduler.next_at(name)
+            if t >= horizon:
+                break
+            now[0] = t
+            calls = [("poll", 1)]
+            if name == "error_analyzer":
+                batch = []
+                while next_error < len(errors) and errors[next_error] <= t and len(batch) < 100:
+                    batch.append(errors[next_error])
+                    next_error += 1
+                for failed in batch:
+                    detect.append(t - failed)
+                    scheduler.detected(t - failed)
+                    pending["fix"].append((t, failed))
+                active = bool(batch)
+                calls += [("rtdb", 3)] if active else []
+            elif name == "fix_generator":
+                offered = ready(pending["fix"], t)
+                fixes.extend((t + args.fix_seconds, failed) for _, failed in offered)
+                done = ready(fixes, t)
+                pending["build"].extend((t, failed) for _, failed in done)
+                active = bool(done)
+                calls += [("rtdb", 1)] if done else []
+                # The fix workers' predict and PR calls, charged as the fixes
+                # finish: budgets only hold back the cycles that hand out
+                # more work, not requests already under way
+                calls += [("llm", len(done)), ("github", len(done))]
+            elif name == "build_and_test_agent":
+                started = ready(pending["build"], t)
+                builds.extend((t + args.build_seconds, failed) for _, failed in started)
+                done = ready(builds, t)
+                pending["deploy"].extend((t, failed) for _, failed in done)
+                active = bool(done or started)
+                calls += [("cloudbuild", len(started)), ("rtdb", 1 if done else 0)]
+            elif name == "deploy_agent":
+                done = ready(pending["deploy"], t)
+                for _, failed in done:
+                    deployed.append(t - failed)
+                    unreported.append(failed)
+                active = bool(done)
+                calls += [("gke", 2 * len(done)), ("rtdb", 1 if done else 0)]
+            elif name == "reporter_agent":
+                active = bool(unreported)
+                report.extend(t - failed for failed in unreported)
+                unreported.clear()
+                calls += [("bigquery", 1), ("sendgrid", 1)] if active else []
+            else:
+                new = [onset for onset in leaks[seen_leaks:] if onset <= t]
+                seen_leaks += len(new)
+                leak_found.extend(t - onset for onset in new)
+                active = bool(new)
+                calls = [("monitoring", 2)] + ([("llm", 1), ("github", 1)] if active else [])
+            for api, n in calls:
+                if n:
+                    scheduler.charge(api, name, n)
+            # A cycle takes a moment; the next one starts after it
+            now[0] = t + args.cycle_seconds
+            scheduler.done(name, active)
+            if mode == "fixed":
+                due[name] = now[0] + (0 if active and name == "error_analyzer" else fixed[name])
+        stats = scheduler.stats()
+        return {
+            "calls_per_hour": stats["calls_per_hour"],
+            "calls_per_hour_by_loop": {n: loop["calls_per_hour"] for n, loop in stats["loops"].items()},
+            "calls_per_hour_by_api": {api: entry["per_hour"] for api, entry in stats["apis"].items()},
+            "cycles": {n: loop["cycles"] for n, loop in stats["loops"].items()},
+            "budget_wait_s": round(sum(loop["budget_s"] for loop in stats["loops"].values()), 1),
+            "detection_s": percentiles(detect),
+            "failure_to_deploy_s": percentiles(deployed),
+            "failure_to_report_s": percentiles(report),
+            "leak_detection_s": percentiles(leak_found),
+        }
+
+    results = {"fixed": simulate("fixed"), "adaptive": simulate("adaptive")}
+    api_budgets = parse_budgets(",".join(args.api_budget))
+    if args.budget or api_budgets:
+        results["budgeted"] = simulate("adaptive", args.budget, api_budgets)
+    return {"hours": args.hours, "errors": len(errors), "bursts": args.bursts, "leaks": len(leaks),
+            "budget_per_hour": args.budget, "api_budgets_per_hour": api_budgets, **results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local agent benchmarks")
+    sub = parser.add_subparsers(dest="name", required=True)
+
+    p = sub.add_parser("pubsub", help="Error Analyzer Pub/Sub ingestion throughput")
+    p.add_argument("--messages", type=int, default=200)
+    p.add_argument("--batch-size", type=int, default=100)
+    p.add_argument("--wait", type=float, default=0.01, help="scaled-down idle wait in seconds")
+    p.set_defaults(func=bench_pubsub)
+
+    p = sub.add_parser("rtdb-bulk", help="Error Analyzer RTDB writes: PUT per error vs bulk PATCH")
+    p.add_argument("--errors", type=int, default=1000)
+    p.add_argument("--latency", type=float, default=0.002, help="injected RTDB latency in seconds")
+    p.add_argument("--batch", type=int, default=20, help="errors per Pub/Sub pull")
+    p.add_argument("--rate", type=float, default=200.0, help="errors arriving per second")
+    p.add_argument("--flush-size", type=int, default=500, help="RTDB_FLUSH_SIZE")
+    p.add_argument("--flush-interval", type=float, default=1.0, help="RTDB_FLUSH_INTERVAL in seconds")
+    p.set_defaults(func=bench_rtdb_bulk)
+
+    p = sub.add_parser("llm-cache", help="generate_patch predict calls with and without the prompt cache")
+    p.add_argument("--errors", type=int, default=200)
+    p.add_argument("--distinct", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.05, help="injected predict latency in seconds")
+    p.add_argument("--memory-entries", type=int, default=4)
+    p.set_defaults(func=bench_llm_cache)
+
+    p = sub.add_parser("repo-snapshot", help="Fix Generator repo snapshot cache: cold / warm / changed")
+    p.add_argument("--files", type=int, default=500)
+    p.add_argument("--file-size", type=int, default=8192)
+    p.add_argument("--latency", type=float, default=0.02, help="injected GitHub latency in seconds")
+    p.set_defaults(func=bench_repo_snapshot)
+
+    p = sub.add_parser("change-feed", help="limitToLast=1 polling vs SSE change feed on /builds")
+    p.add_argument("--records", type=int, default=100)
+    p.add_argument("--write-interval", type=float, default=0.01)
+    p.add_argument("--poll-interval", type=float, default=0.3, help="scaled-down fixed poll sleep")
+    p.set_defaults(func=bench_change_feed)
+
+    p = sub.add_parser("reporter-fetch", help="Reporter sources read one after another vs one change feed each")
+    p.add_argument("--cycles", type=int, default=5)
+    p.add_argument("--records", type=int, default=20, help="new records per source and cycle")
+    p.add_argument("--latency", type=float, default=0.05, help="RTDB latency of the first path, each next one adds as much")
+    p.add_argument("--slow-path", default="risk-mitigations")
+    p.add_argument("--slow-latency", type=float, default=1.0)
+    p.add_argument("--interval", type=float, default=0.3, help="scaled-down time between cycles")
+    p.set_defaults(func=bench_reporter_fetch)
+
+    p = sub.add_parser("digest", help="Reporter newest-only updates vs windowed digests and batched inserts")
+    p.add_argument("--cycles", type=int, default=60)
+    p.add_argument("--events-per-cycle", type=int, default=200)
+    p.add_argument("--services", type=int, default=8)
+    p.add_argument("--window", type=float, default=900)
+    p.set_defaults(func=bench_digest)
+
+    p = sub.add_parser("memory-trends", help="Risk Mitigation vectorized leak detection speed and accuracy")
+    p.add_argument("--series", type=int, default=5000)
+    p.add_argument("--points", type=int, default=60)
+    p.add_argument("--leak-fraction", type=float, default=0.1)
+    p.add_argument("--noise-mb", type=float, default=3.0)
+    p.add_argument("--missing", type=float, default=0.03, help="fraction of missing points")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_memory_trends)
+
+    p = sub.add_parser("metric-windows", help="Risk Mitigation incremental windows vs full-hour refetch")
+    p.add_argument("--series", type=int, default=5000)
+    p.add_argument("--cycles", type=int, default=30)
+    p.add_argument("--interval", type=int, default=120)
+    p.add_argument("--late", type=float, default=0.05, help="fraction of points reported a minute late")
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_metric_windows)
+
+    p = sub.add_parser("build-tracker", help="Build & Test commit-driven tracking vs poll-and-retrigger")
+    p.add_argument("--commits", type=int, default=6)
+    p.add_argument("--commit-interval", type=float, default=4.0)
+    p.add_argument("--build-seconds", type=float, default=1.5)
+    p.add_argument("--runners", type=int, default=2)
+    p.add_argument("--scale", type=float, default=1 / 30)
+    p.set_defaults(func=bench_build_tracker)
+
+    p = sub.add_parser("build-graph", help="Build & Test step graph critical path vs the serial build chain")
+    p.add_argument("--duration", action="append", default=[], metavar="ID=SECONDS")
+    p.set_defaults(func=bench_build_graph)
+
+    p = sub.add_parser("deploy-scheduler", help="Deploy Agent coalesced rollouts vs one rollout per build")
+    p.add_argument("--services", type=int, default=8)
+    p.add_argument("--hours", type=int, default=24)
+    p.add_argument("--trains-per-hour", type=float, default=1.5)
+    p.add_argument("--min-interval", type=float, default=600)
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_deploy_scheduler)
+
+    p = sub.add_parser("rollout-watch", help="Deploy Agent health-gated rollouts with automatic rollback")
+    p.add_argument("--pod-ready", type=float, default=0.1)
+    p.add_argument("--deadline", type=float, default=1.0)
+    p.add_argument("--bake", type=float, default=0.5)
+    p.add_argument("--max-errors", type=int, default=3)
+    p.add_argument("--error-rate", type=float, default=20.0)
+    p.set_defaults(func=bench_rollout_watch)
+
+    p = sub.add_parser("templates", help="compiled step templates / when expressions vs per-render substitution")
+    p.add_argument("--messages", type=int, default=100, help="messages in the simulated Pub/Sub pull")
+    p.add_argument("--iterations", type=int, default=2000)
+    p.add_argument("--reads", type=int, default=3, help="references to one response per cycle")
+    p.set_defaults(func=bench_templates)
+
+    p = sub.add_parser("http-policy", help="GitHub calls under rate limits and 503s: single-shot vs pooled with policies")
+    p.add_argument("--pulls", type=int, default=30)
+    p.add_argument("--reads", type=int, default=200)
+    p.add_argument("--limit", type=int, default=10, help="mutations per second the stand-in allows")
+    p.add_argument("--error-rate", type=float, default=0.05)
+    p.add_argument("--backoff", type=float, default=0.05)
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_http_policy)
+
+    p = sub.add_parser("tracing", help="incident hop spans: recording cost and the p50/p95/p99 / MTTR report")
+    p.add_argument("--incidents", type=int, default=2000)
+    p.add_argument("--hop-median", type=float, nargs=5, default=[2.0, 45.0, 240.0, 180.0, 900.0],
+                   metavar=("DETECT", "FIX", "BUILD", "DEPLOY", "REPORT"))
+    p.add_argument("--steps", type=int, default=4, help="step spans per hop")
+    p.add_argument("--slow", type=int, default=20, help="one incident in N has a 10x slower hop")
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_tracing)
+
+    p = sub.add_parser("fix-scheduler", help="Fix Generator one-at-a-time loop vs prioritized worker pool")
+    p.add_argument("--noisy", type=int, default=60, help="backlog from one noisy service")
+    p.add_argument("--services", type=int, default=4)
+    p.add_argument("--quiet", type=int, default=3, help="errors per other service")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--per-service", type=int, default=2)
+    p.add_argument("--queue", type=int, default=30, help="queue bound of the shed variant")
+    p.add_argument("--criticality", default="svc1=2")
+    p.add_argument("--llm-latency", type=float, default=0.2)
+    p.add_argument("--github-latency", type=float, default=0.05)
+    p.set_defaults(func=bench_fix_scheduler)
+
+    p = sub.add_parser("preflight", help="Fix Generator local patch checks: rejected patches and builds avoided")
+    p.add_argument("--patches", type=int, default=60)
+    p.add_argument("--bad-every", type=int, default=3, help="one patch in N is good")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--build-seconds", type=float, default=240, help="cost of one remote build")
+    p.set_defaults(func=bench_preflight)
+
+    p = sub.add_parser("event-log", help="event log appends and indexed reads at scale vs the RTDB limitToLast pattern")
+    p.add_argument("--records", type=int, default=1_000_000)
+    p.add_argument("--batch", type=int, default=1000, help="records per append transaction")
+    p.add_argument("--services", type=int, default=50)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--consume", type=int, default=200_000, help="events a consumer reads through")
+    p.add_argument("--rtdb-records", type=int, default=100_000, help="/builds children in the RTDB stand-in")
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_event_log)
+
+    p = sub.add_parser("log-parser", help="Error Analyzer multi-line exception reassembly on interleaved pod logs")
+    p.add_argument("--lines", type=int, default=500_000)
+    p.add_argument("--streams", type=int, default=200)
+    p.add_argument("--trace-ratio", type=float, default=0.05, help="chance a stream starts a trace")
+    p.add_argument("--max-lines", type=int, default=256)
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_log_parser)
+
+    p = sub.add_parser("loop-scheduler", help="fixed agent loop waits vs the adaptive loop scheduler on a simulated clock")
+    p.add_argument("--hours", type=float, default=24)
+    p.add_argument("--bursts", type=int, default=20, help="error bursts over the run")
+    p.add_argument("--burst-size", type=int, default=5)
+    p.add_argument("--leaks", type=int, default=10)
+    p.add_argument("--fix-seconds", type=float, default=20.0, help="LLM call, pre-flight and PR per fix")
+    p.add_argument("--build-seconds", type=float, default=120.0)
+    p.add_argument("--cycle-seconds", type=float, default=0.2, help="time one loop cycle takes")
+    p.add_argument("--budget", type=float, default=400, help="requests/hour for the budgeted run (0: none)")
+    p.add_argument("--api-budget", action="append", default=[], metavar="API=REQUESTS",
+                   help="requests/hour of one API for the budgeted run")
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_loop_scheduler)
+
+    p = sub.add_parser("pipeline", help="replay incidents through all six agents: events/s, queue depth, API calls, MTTR")
+    add_replay_arguments(p)
+    p.set_defaults(func=bench_pipeline)
+
+    args = parser.parse_args()
+    print(json.dumps(args.func(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
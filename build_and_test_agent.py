@@ -10,85 +10,103 @@ from google.cloud.aiplatform.agent import (
 aiplatform.init(project="YOUR_PROJECT_ID", location="us-central1")
 client = AgentClient()
 
-# Tool: trigger_build - invoke Cloud Build for a given branch or PR
-trigger_build = Tool(
-    name="trigger_build",
-    description="Trigger a Cloud Build job for the specified branch or PR.",
+# Tool: record_builds - write finished builds for the Deploy Agent and Reporter
+record_builds = Tool(
+    name="record_builds",
+    description="Write finished builds under /builds/{buildId} in Firebase RTDB with a single PATCH",
     http_request=HttpRequestToolConfig(
-        method="POST",
-        url="https://cloudbuild.googleapis.com/v1/projects/${PROJECT_ID}/builds",
-        headers={"Content-Type": "application/json"},
-        body="""
-{
-  "source": {
-    "repoSource": {
-      "projectId": "${PROJECT_ID}",
-      "repoName": "${REPO}",
-      "branchName": "${BRANCH_NAME}"
-    }
-  },
-  "steps": [
-    { "name": "gcr.io/cloud-builders/docker", "args": ["build", "-t", "gcr.io/${PROJECT_ID}/${SERVICE}:${BRANCH_NAME}", "."] },
-    { "name": "gcr.io/cloud-builders/docker", "args": ["push", "gcr.io/${PROJECT_ID}/${SERVICE}:${BRANCH_NAME}"] },
-    { "name": "gcr.io/cloud-builders/gcloud", "args": ["beta", "run", "deploy", "${SERVICE}", "--image", "gcr.io/${PROJECT_ID}/${SERVICE}:${BRANCH_NAME}"] }
-  ],
-  "timeout": "1200s"
-}
-"""
-    )
-)
-
-# Tool: check_build_status - get Cloud Build job status
-check_build = Tool(
-    name="check_build_status",
-    description="Poll the Cloud Build API for job status.",
-    http_request=HttpRequestToolConfig(
-        method="GET",
-        url="https://cloudbuild.googleapis.com/v1/projects/${PROJECT_ID}/builds/${BUILD_ID}"
+        method="PATCH",
+        url="${FIREBASE_DB_URL}/.json",
+        body="${build_payload}"
     )
 )
 
 # Step definitions
-step_trigger = Step(
-    name="trigger_build",
-    tool_name="trigger_build",
-    arguments={"BRANCH_NAME": "${BRANCH_NAME}", "SERVICE": "${SERVICE}"}
+# track_builds - a process-wide tracker triggers one Cloud Build per new head of
+# a watched branch or open PR, follows the builds it started (cloud-builds
+# notifications, with backed-off polling as the fallback) and hands back the
+# ones that finished, waiting up to 30s for the next (replaces trigger, single
+# status read and fixed wait). The tracker keeps each finished build until
+# commit_builds confirms it is recorded.
+step_track = Step(
+    name="track_builds",
+    run="""
+import json
+from build_graph import build_request
+from build_tracker import BuildTracker, GitHubHeads, build_tracker
+from pubsub_ingest import PubSubPuller
+from tracing import tracer
+
+def request(ref, sha):
+    # Layer-cached image build and tests in parallel, deploy once both pass
+    return build_request("${PROJECT_ID}", "${REPO}", sha, "${SERVICE}", ref=ref,
+                         context="${BUILD_CONTEXT}", cache="${BUILD_CACHE}",
+                         test_command="${BUILD_TEST_COMMAND}")
+
+def factory():
+    auth = {"Authorization": "Bearer ${ACCESS_TOKEN}"}
+    notifications = None
+    if '${BUILD_NOTIFICATIONS_SUB}':
+        notifications = PubSubPuller(
+            "https://pubsub.googleapis.com/v1/projects/${PROJECT_ID}/subscriptions/${BUILD_NOTIFICATIONS_SUB}",
+            idle_wait=1.0, headers=auth)
+    return BuildTracker(
+        "https://cloudbuild.googleapis.com/v1/projects/${PROJECT_ID}/builds",
+        request,
+        GitHubHeads('${ORG}', '${REPO}', branches='${BUILD_BRANCHES}'.split(','), token='${GITHUB_TOKEN}'),
+        state_path='${FEED_CURSOR_DIR}/build-tracker-${SERVICE}.json',
+        notifications=notifications,
+        headers=auth)
+
+tracker = build_tracker('${SERVICE}', factory)
+events = tracker.poll(max_events=50, timeout=30 * float('${TIME_SCALE}'))
+if not events:
+    return None
+trace = tracer('build-and-test', '${TRACE_EXPORT}')
+for e in events:
+    # Builds of fix PRs close the incident's build hop (PR opened -> build finished)
+    trace.hop(e.get('correlationId'), 'build', start=e.get('openedAt') or e.get('startTime'), end=e.get('finishTime'),
+              attributes={'service': '${SERVICE}', 'build': e['id'], 'status': e['status']},
+              error=None if e['status'] == 'SUCCESS' else e['status'])
+updates = {f"builds/{e['id']}": dict(e, service='${SERVICE}') for e in events}
+return {'count': len(events), 'ids': [e['id'] for e in events], 'build_payload': json.dumps(updates)}
+"""
 )
 
-step_wait_build = Step(
-    name="wait_for_build",
-    tool_name="check_build_status",
-    when="trigger_build.response.name != null",
-    arguments={"BUILD_ID": "{{trigger_build.response.metadata.build.id}}"}
+step_record = Step(
+    name="record_builds",
+    tool_name="record_builds",
+    when="track_builds.result != null",
+    arguments={"build_payload": "{{track_builds.result.build_payload}}"}
 )
 
-step_evaluate = Step(
-    name="evaluate_build",
+# commit_builds - once /builds holds them, the tracker forgets the finished
+# builds; if the write failed they are handed out again next cycle
+step_commit = Step(
+    name="commit_builds",
+    when="track_builds.result != null",
     run="""
-import json
-status = json.loads(wait_for_build.responseBody).get('status')
-if status in ('SUCCESS', 'WORKING'): return {'status': status}
-return {'status': 'FAILURE'}
+from build_tracker import build_tracker
+tracker = build_tracker('${SERVICE}', None)
+if record_builds.error:
+    tracker.retry(track_builds.result['ids'])
+    return None
+return {'committed': tracker.ack(track_builds.result['ids'])}
 """
 )
 
-step_wait = Step(
-    name="wait",
-    run="wait 30s"
-)
-
 # Workflow
 demo_wf = Workflow(
     display_name="Build & Test Workflow",
-    steps=[step_trigger, step_wait_build, step_evaluate, step_wait],
-    repeat_step_name="trigger_build"
+    steps=[step_track, step_record, step_commit],
+    repeat_step_name="track_builds"
 )
 
 # Create Agent
 agent = client.create_agent(
     display_name="Build & Test Agent",
-    description="Triggers Cloud Build for new branches/PRs and monitors the build status.",
-    tools=[trigger_build, check_build],
+    description="Triggers Cloud Build for new commits on branches/PRs and records finished builds.",
+    tools=[record_builds],
     workflow=demo_wf
 )
 print(f"Created agent: {agent.name}")
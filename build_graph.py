@@ -0,0 +1,190 @@
+# build_graph.py
+# Cloud Build step graph for the Build & Test Agent: layer-cached image builds, tests
+# alongside the build, and the expected critical path
+
+import posixpath
+
+DOCKER = "gcr.io/cloud-builders/docker"
+GCLOUD = "gcr.io/cloud-builders/gcloud"
+KANIKO = "gcr.io/kaniko-project/executor:latest"
+# Where Cloud Build checks the source out for every step
+WORKSPACE = "/workspace"
+# Default test step: only byte-compiles the sources. Services with a test
+# suite pass their runner (BUILD_TEST_COMMAND), e.g. "python -m pytest -q".
+DEFAULT_TEST_COMMAND = "python -m compileall -q ."
+
+# Rough step durations in seconds, used for the critical-path estimate when
+# no measured durations are passed in
+DEFAULT_DURATIONS = {
+    "pull-cache": 15,
+    "test": 60,
+    "build": 45,
+    "build-cold": 150,
+    "push": 25,
+    "deploy": 40,
+}
+
+
+def cache_tag(ref):
+    # Registry tag holding the latest image of a ref, which later builds of
+    # the same ref pull their layers from ("pull/7/head" -> "cache-pull-7-head")
+    return "cache-" + "".join(c if c.isalnum() or c in "-_." else "-" for c in ref)[:120]
+
+
+def build_steps(project_id, service, ref="main", context=".", cache="docker",
+                test_image="python:3.10-slim", test_command=DEFAULT_TEST_COMMAND,
+                base_ref="main", region="us-central1"):
+    # Cloud Build steps as a DAG. Every step names its dependencies in
+    # waitFor ("-" means start immediately), so tests run next to the image
+    # build and only deploy waits for both. cache is "docker" (pull the ref's
+    # and base_ref's cache images, build with --cache-from and BuildKit inline
+    # cache metadata) or "kaniko" (layer cache in a registry repo, image
+    # pushed by the executor itself). The executor ignores the step's dir, so
+    # its build context and Dockerfile are passed as flags.
+    image = f"gcr.io/{project_id}/{service}"
+    tags = [cache_tag(ref)] + ([cache_tag(base_ref)] if base_ref and base_ref != ref else [])
+    steps = [{
+        "id": "test",
+        "name": test_image,
+        "dir": context,
+        "entrypoint": "bash",
+        "args": ["-c", f"pip install -q -r requirements.txt && {test_command}"],
+        "waitFor": ["-"],
+    }]
+    if cache == "kaniko":
+        source = posixpath.normpath(posixpath.join(WORKSPACE, context))
+        steps.append({
+            "id": "build",
+            "name": KANIKO,
+            "args": [
+                f"--context=dir://{source}",
+                f"--dockerfile={source}/Dockerfile",
+                f"--destination={image}:$BUILD_ID",
+                f"--destination={image}:{tags[0]}",
+                "--cache=true",
+                f"--cache-repo={image}/cache",
+                "--cache-ttl=168h",
+            ],
+            "waitFor": ["-"],
+        })
+        pushed = "build"
+    elif cache == "docker":
+        pulls = " ; ".join(f"docker pull {image}:{tag} || true" for tag in tags)
+        steps.append({
+            "id": "pull-cache",
+            "name": DOCKER,
+            "entrypoint": "bash",
+            "args": ["-c", pulls],
+            "waitFor": ["-"],
+        })
+        args = ["build", "-t", f"{image}:$BUILD_ID", "-t", f"{image}:{tags[0]}",
+                "--build-arg", "BUILDKIT_INLINE_CACHE=1"]
+        for tag in tags:
+            args += ["--cache-from", f"{image}:{tag}"]
+        steps.append({
+            "id": "build",
+            "name": DOCKER,
+            "dir": context,
+            "env": ["DOCKER_BUILDKIT=1"],
+            "args": args + ["."],
+            "waitFor": ["pull-cache"],
+        })
+        steps.append({
+            "id": "push",
+            "name": DOCKER,
+            "args": ["push", "--all-tags", image],
+            "waitFor": ["build"],
+        })
+        pushed = "push"
+    else:
+        raise ValueError(f"unknown cache mode: {cache!r}")
+    steps.append({
+        "id": "deploy",
+        "name": GCLOUD,
+        "args": ["run", "deploy", service, "--image", f"{image}:$BUILD_ID", "--region", region],
+        "waitFor": [pushed, "test"],
+    })
+    validate(steps)
+    return steps
+
+
+def build_request(project_id, repo, sha, service, ref="main", **options):
+    # Full builds.create body for one commit
+    return {
+        "source": {"repoSource": {"projectId": project_id, "repoName": repo, "commitSha": sha}},
+        "steps": build_steps(project_id, service, ref, **options),
+        "tags": [cache_tag(ref)],
+        "timeout": "1200s",
+    }
+
+
+def dependencies(steps):
+    # {step id: [ids it waits for]} with Cloud Build's rules: no waitFor
+    # means "after every earlier step", ["-"] means "at build start"
+    deps, seen = {}, []
+    for i, step in enumerate(steps):
+        step_id = step.get("id", str(i))
+        wait_for = step.get("waitFor")
+        if wait_for is None:
+            deps[step_id] = list(seen)
+        else:
+            deps[step_id] = [w for w in wait_for if w != "-"]
+        seen.append(step_id)
+    return deps
+
+
+def validate(steps):
+    # Raises ValueError for duplicate ids, unknown waitFor ids or cycles
+    ids = [step.get("id", str(i)) for i, step in enumerate(steps)]
+    if len(set(ids)) != len(ids):
+        raise ValueError("duplicate step ids")
+    deps = dependencies(steps)
+    for step_id, waits in deps.items():
+        unknown = [w for w in waits if w not in deps]
+        if unknown:
+            raise ValueError(f"step {step_id!r} waits for unknown steps {unknown}")
+    state = {}
+
+    def visit(step_id, path):
+        if state.get(step_id) == "done":
+            return
+        if state.get(step_id) == "active":
+            raise ValueError(f"cycle: {' -> '.join(path + [step_id])}")
+        state[step_id] = "active"
+        for w in deps[step_id]:
+            visit(w, path + [step_id])
+        state[step_id] = "done"
+
+    for step_id in deps:
+        visit(step_id, [])
+
+
+def critical_path(steps, durations=None):
+    # (expected seconds, [step ids]) of the longest dependency chain, i.e.
+    # the build's wall-clock time with unlimited parallelism. durations maps
+    # step id -> seconds (DEFAULT_DURATIONS otherwise, 0 for unknown ids).
+    durations = {**DEFAULT_DURATIONS, **(durations or {})}
+    deps = dependencies(steps)
+    finish, via = {}, {}
+
+    def end(step_id):
+        if step_id not in finish:
+            start, prev = 0.0, None
+            for w in deps[step_id]:
+                if end(w) > start:
+                    start, prev = end(w), w
+            finish[step_id] = start + durations.get(step_id, 0.0)
+            via[step_id] = prev
+        return finish[step_id]
+
+    last = max(deps, key=end)
+    path = [last]
+    while via[path[-1]] is not None:
+        path.append(via[path[-1]])
+    return finish[last], path[::-1]
+
+
+def serial_length(steps, durations=None):
+    # Expected seconds if the same steps ran one after another
+    durations = {**DEFAULT_DURATIONS, **(durations or {})}
+    return float(sum(durations.get(step.get("id", str(i)), 0.0) for i, step in enumerate(steps)))
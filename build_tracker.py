@@ -0,0 +1,401 @@
+# build_tracker.py
+# Commit-driven Cloud Build triggering and completion tracking for the Build & Test Agent
+
+import contextvars
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+
+from http_pool import shared_pool
+from repo_snapshot import GITHUB_API
+from tracing import correlation_in
+
+# Cloud Build statuses after which a build never changes again
+TERMINAL = {"SUCCESS", "FAILURE", "INTERNAL_ERROR", "TIMEOUT", "CANCELLED", "EXPIRED"}
+
+
+class GitHubHeads:
+    # Current head sha of each watched branch and, optionally, of every open
+    # PR ("pull/{number}/head"). Every read is conditional on the last ETag,
+    # so an unchanged repo costs 304s, which GitHub does not count against
+    # the rate limit.
+    def __init__(self, org, repo, branches=("main",), pulls=True, token=None, api_url=GITHUB_API, pool=None):
+        self.base = f"{api_url.rstrip('/')}/repos/{org}/{repo}"
+        self.branches = list(branches)
+        self.pulls = pulls
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.pool = pool or shared_pool()
+        self.etags = {}
+        self.cached = {}
+        self.pull_info = {}
+        self.stats = {"requests": 0, "not_modified": 0}
+
+    def _get(self, url, accept):
+        headers = {**self.headers, "Accept": accept}
+        if url in self.etags:
+            headers["If-None-Match"] = self.etags[url]
+        self.stats["requests"] += 1
+        status, resp_headers, body = self.pool.request("GET", url, headers=headers)
+        if status == 304:
+            self.stats["not_modified"] += 1
+            return self.cached[url]
+        self.etags[url] = resp_headers.get("ETag") or resp_headers.get("Etag")
+        self.cached[url] = body
+        return body
+
+    def heads(self):
+        # {ref: sha}; pull_info keeps each open PR's branch and creation time
+        found = {}
+        for branch in self.branches:
+            sha = self._get(f"{self.base}/commits/{branch}", "application/vnd.github.sha").decode().strip()
+            if sha.startswith("{"):
+                sha = json.loads(sha)["sha"]
+            found[branch] = sha
+        if self.pulls:
+            body = self._get(f"{self.base}/pulls?state=open&per_page=100", "application/vnd.github+json")
+            for pr in json.loads(body or b"[]"):
+                found[f"pull/{pr['number']}/head"] = pr["head"]["sha"]
+                self.pull_info[f"pull/{pr['number']}/head"] = {"branch": pr["head"].get("ref"),
+                                                                "opened": pr.get("created_at")}
+        return found
+
+
+class BuildTracker:
+    # Triggers one Cloud Build per new head sha and tracks the builds it
+    # started until they finish:
+    #   built      {ref: sha} last head a build was started for; a ref is only
+    #              built again when its head moves
+    #   inflight   {build id: {ref, sha, status, interval, next_poll}}, plus the
+    #              incident correlationId and openedAt of fix PRs
+    #   finished   {build id: completion event} until the caller has recorded
+    #              it and calls ack(); retry() hands events out again
+    # In-flight builds are polled individually: the first poll comes when
+    # builds usually finish (median of recent durations), then every
+    # min_interval seconds doubling up to max_interval. With a
+    # `notifications` puller (a PubSubPuller on the cloud-builds topic) status
+    # changes arrive within a pull cycle and builds are only polled every
+    # max_interval as a safety net. The topic carries every build in the
+    # project, so trackers of several services can share one subscription:
+    # a tracker acks only notifications of builds it started (in flight or
+    # recently finished) and nacks the rest for the tracker that owns them;
+    # a notification nobody claims for foreign_ttl seconds is acked.
+    # A build whose ref has moved on is cancelled (cancel_superseded).
+    # Finished builds become events on the queue handed out by poll(); all
+    # three tables are persisted to state_path so a restart neither
+    # re-triggers nor loses builds (unacknowledged events are handed out
+    # again).
+    def __init__(self, builds_url, build_request, heads, state_path=None, notifications=None,
+                 headers=None, min_interval=2.0, max_interval=15.0, head_interval=15.0,
+                 cancel_superseded=True, foreign_ttl=600.0, pool=None, clock=time.monotonic):
+        self.builds_url = builds_url.rstrip("/")
+        self.build_request = build_request
+        self.heads = heads
+        self.state_path = state_path
+        self.notifications = notifications
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.head_interval = head_interval
+        self.cancel_superseded = cancel_superseded
+        self.foreign_ttl = foreign_ttl
+        self.pool = pool or shared_pool()
+        self.clock = clock
+        self.events = queue.Queue()
+        self.stats = {"head_checks": 0, "triggered": 0, "status_polls": 0, "notifications": 0,
+                      "nacked": 0, "cancelled": 0, "completed": 0}
+        self.built = {}
+        self.inflight = {}
+        self.finished = {}
+        self.durations = deque(maxlen=20)
+        # Ids of builds that finished lately, whose late notifications are
+        # still ours, and {messageId: first seen} of other trackers' ones
+        self.recent = deque(maxlen=500)
+        self._foreign = {}
+        self._next_heads = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            self.built = state.get("built", {})
+            for build_id, entry in state.get("inflight", {}).items():
+                self.inflight[build_id] = dict(entry, interval=min_interval, next_poll=0.0, created=None)
+            self.finished = state.get("finished", {})
+            for event in self.finished.values():
+                self.events.put(event)
+
+    def _first_interval(self):
+        return self.max_interval if self.notifications is not None else self.min_interval
+
+    def _first_poll(self):
+        if self.notifications is not None or not self.durations:
+            return self._first_interval()
+        return max(sorted(self.durations)[len(self.durations) // 2], self.min_interval)
+
+    def _save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            state = {"built": dict(self.built),
+                     "inflight": {k: {f: v.get(f) for f in ("ref", "sha", "status", "correlationId", "openedAt")}
+                                 for k, v in self.inflight.items()},
+                     "finished": dict(self.finished)}
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    # --- triggering ----------------------------------------------------------
+
+    def _trigger(self, ref, sha):
+        _, _, body = self.pool.request("POST", self.builds_url, body=json.dumps(self.build_request(ref, sha)),
+                                       headers=self.headers)
+        build = json.loads(body)["metadata"]["build"]
+        pull = getattr(self.heads, "pull_info", {}).get(ref, {})
+        now = self.clock()
+        with self._lock:
+            self.inflight[build["id"]] = {"ref": ref, "sha": sha, "status": build.get("status", "QUEUED"),
+                                          "interval": self._first_interval(), "next_poll": now + self._first_poll(),
+                                          "created": now, "correlationId": correlation_in(pull.get("branch")),
+                                          "openedAt": pull.get("opened")}
+        self.stats["triggered"] += 1
+        return build["id"]
+
+    def _cancel(self, build_id):
+        try:
+            self.pool.request("POST", f"{self.builds_url}/{build_id}:cancel", body="{}", headers=self.headers)
+            self.stats["cancelled"] += 1
+        except Exception:
+            # Already finished; the next poll reports the real outcome
+            pass
+
+    def check_heads(self):
+        # Start builds for refs whose head moved. Returns the new build ids.
+        self.stats["head_checks"] += 1
+        heads = self.heads.heads()
+        started, changed = [], False
+        try:
+            for ref, sha in sorted(heads.items()):
+                if self.built.get(ref) == sha:
+                    continue
+                if self.cancel_superseded:
+                    with self._lock:
+                        stale = [b for b, e in self.inflight.items() if e["ref"] == ref and e["sha"] != sha]
+                    for build_id in stale:
+                        self._cancel(build_id)
+                started.append(self._trigger(ref, sha))
+                self.built[ref] = sha
+            for ref in [r for r in self.built if r not in heads and r.startswith("pull/")]:
+                # Closed or merged PR
+                del self.built[ref]
+                changed = True
+        finally:
+            # Also when a trigger failed part-way, so the builds already
+            # started are neither lost nor triggered again after a restart
+            if started or changed:
+                self._save()
+        return started
+
+    # --- completion ----------------------------------------------------------
+
+    def observe(self, build):
+        # Apply a Build resource (from a status poll or a notification).
+        # Returns the completion event when this moved the build to a
+        # terminal status, else None.
+        build_id = build.get("id")
+        status = build.get("status")
+        with self._lock:
+            entry = self.inflight.get(build_id)
+            if entry is None:
+                return None
+            if status not in TERMINAL:
+                if status != entry["status"]:
+                    # Progress resets the backoff; WORKING builds end soonest
+                    entry["interval"] = self._first_interval()
+                entry["status"] = status
+                return None
+            del self.inflight[build_id]
+            if status == "SUCCESS" and entry["created"] is not None:
+                self.durations.append(self.clock() - entry["created"])
+            event = {
+                "id": build_id,
+                "ref": entry["ref"],
+                "sha": entry["sha"],
+                "status": status,
+                "startTime": build.get("startTime"),
+                "finishTime": build.get("finishTime"),
+                "logUrl": build.get("logUrl"),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+            if entry.get("correlationId"):
+                event["correlationId"] = entry["correlationId"]
+                event["openedAt"] = entry.get("openedAt")
+            # Moved in one step, so a save never sees the build in neither table
+            self.finished[build_id] = event
+            self.recent.append(build_id)
+        self.stats["completed"] += 1
+        self.events.put(event)
+        self._save()
+        return event
+
+    def poll_builds(self):
+        # Poll every in-flight build that is due; returns completion events
+        now = self.clock()
+        with self._lock:
+            due = [b for b, e in self.inflight.items() if e["next_poll"] <= now]
+        done = []
+        for build_id in due:
+            self.stats["status_polls"] += 1
+            _, _, body = self.pool.request("GET", f"{self.builds_url}/{build_id}", headers=self.headers)
+            event = self.observe(json.loads(body))
+            if event:
+                done.append(event)
+                continue
+            with self._lock:
+                entry = self.inflight.get(build_id)
+                if entry:
+                    entry["next_poll"] = self.clock() + entry["interval"]
+                    entry["interval"] = min(entry["interval"] * 2, self.max_interval)
+        return done
+
+    def owns(self, build_id):
+        with self._lock:
+            return build_id in self.inflight or build_id in self.finished or build_id in self.recent
+
+    def drain_notifications(self):
+        # Cloud Build publishes every status change to the cloud-builds
+        # topic with buildId / status attributes
+        if self.notifications is None:
+            return []
+        msgs = self.notifications.pull()
+        now = self.clock()
+        done, acks, nacks = [], [], []
+        for received in msgs:
+            message = received["message"]
+            attributes = message.get("attributes", {})
+            build = {"id": attributes.get("buildId"), "status": attributes.get("status")}
+            if not self.owns(build["id"]):
+                first = self._foreign.setdefault(message.get("messageId"), now)
+                if now - first < self.foreign_ttl:
+                    nacks.append(received["ackId"])
+                else:
+                    self._foreign.pop(message.get("messageId"), None)
+                    acks.append(received["ackId"])
+                continue
+            self.stats["notifications"] += 1
+            acks.append(received["ackId"])
+            try:
+                data = json.loads(message.get("data") or "{}")
+                if isinstance(data, dict) and data.get("id") == build["id"]:
+                    build = data
+            except ValueError:
+                pass
+            event = self.observe(build)
+            if event:
+                done.append(event)
+        # Forget foreign messages another tracker has since acked
+        self._foreign = {k: t for k, t in self._foreign.items() if now - t < 2 * self.foreign_ttl}
+        if acks:
+            self.notifications.ack(acks)
+        if nacks:
+            self.stats["nacked"] += len(nacks)
+            self.notifications.nack(nacks)
+        return done
+
+    def tick(self):
+        # One round of work; returns the seconds until the next one is due
+        self.drain_notifications()
+        if self.clock() >= self._next_heads:
+            self.check_heads()
+            self._next_heads = self.clock() + self.head_interval
+        self.poll_builds()
+        now = self.clock()
+        with self._lock:
+            next_due = min([e["next_poll"] for e in self.inflight.values()] + [self._next_heads])
+        wait = max(next_due - now, 0.0)
+        if self.notifications is not None:
+            wait = min(wait, self.notifications.idle_wait)
+        return wait
+
+    # --- background loop -----------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            # In the caller's context, so its requests count for the caller's
+            # agent loop (loop_scheduler.current_loop)
+            self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,),
+                                            name="build-tracker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def refresh(self):
+        # Check heads now instead of at the next head_interval (e.g. from a
+        # push webhook)
+        self._next_heads = 0.0
+        self._wake.set()
+
+    def poll(self, max_events=100, timeout=0.0):
+        # Up to max_events completion events, waiting up to `timeout` seconds
+        # for the first one
+        events = []
+        try:
+            events.append(self.events.get(timeout=timeout) if timeout else self.events.get_nowait())
+            while len(events) < max_events:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+    def ack(self, build_ids):
+        # The completion events of these builds are recorded: forget them
+        with self._lock:
+            acked = [self.finished.pop(build_id) for build_id in build_ids if build_id in self.finished]
+        if acked:
+            self._save()
+        return len(acked)
+
+    def retry(self, build_ids):
+        # Recording these completion events failed: hand them out again
+        with self._lock:
+            events = [self.finished[build_id] for build_id in build_ids if build_id in self.finished]
+        for event in events:
+            self.events.put(event)
+        return len(events)
+
+    def _run(self):
+        backoff = 0.5
+        while not self._stop.is_set():
+            try:
+                wait = self.tick()
+                backoff = 0.5
+            except Exception:
+                wait = backoff
+                backoff = min(backoff * 2, self.max_interval)
+            self._wake.wait(wait)
+            self._wake.clear()
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def build_tracker(name, factory):
+    # Process-wide, started tracker per name; factory() builds it on first use
+    with _trackers_lock:
+        tracker = _trackers.get(name)
+        if tracker is None:
+            tracker = _trackers[name] = factory().start()
+        return tracker
+
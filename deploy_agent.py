@@ -10,74 +10,130 @@ from google.cloud.aiplatform.agent import (
 aiplatform.init(project="YOUR_PROJECT_ID", location="us-central1")
 client = AgentClient()
 
-# Tool: fetch_build - pull the latest build result from Firebase RTDB
-fetch_build = Tool(
-    name="fetch_build",
-    description="Fetch the most recent build result from Firebase RTDB.",
+# Tool: record_deploys - write finished rollouts for the Reporter
+record_deploys = Tool(
+    name="record_deploys",
+    description="Write rollouts under /deploys/{buildId} in Firebase RTDB with a single PATCH",
     http_request=HttpRequestToolConfig(
-        method="GET",
-        url="${FIREBASE_DB_URL}/builds.json?orderBy=\"timestamp\"&limitToLast=1"
+        method="PATCH",
+        url="${FIREBASE_DB_URL}/.json",
+        body="${deploy_payload}"
     )
 )
 
-# Tool: deploy_patch - patch the Kubernetes deployment via GKE API
-deploy_patch = Tool(
-    name="deploy_patch",
-    description="Apply the new image or patch to the Kubernetes deployment.",
-    http_request=HttpRequestToolConfig(
-        method="PATCH",
-        url="https://container.googleapis.com/v1/projects/${PROJECT_ID}/zones/${ZONE}/clusters/${CLUSTER}/namespaces/${NAMESPACE}/deployments/${SERVICE}",
-        headers={"Content-Type": "application/json"},
-        body="""
-{
-  "spec": {
-    "template": {
-      "spec": {
-        "containers": [{
-          "name": "${SERVICE}",
-          "image": "gcr.io/${PROJECT_ID}/${SERVICE}:${BUILD_ID}"
-        }]
-      }
-    }
-  }
-}
+# Step definitions
+# collect_builds - hand every new successful build from the /builds change feed
+# to the process-wide deploy scheduler, which keeps only the newest pending
+# build per service. Waits for the feed until the next rollout is allowed (at
+# most 30s) instead of a fixed wait. A build stays uncommitted on the feed
+# until the rollout covering it is recorded (commit_deploys), so one held back
+# by DEPLOY_MIN_INTERVAL is delivered again after a restart; failed builds and
+# builds dropped behind an earlier rollout are committed right away.
+step_collect = Step(
+    name="collect_builds",
+    run="""
+from deploy_scheduler import DeployScheduler, deploy_scheduler
+from rollout_watch import FingerprintErrorCounter, RolloutWatcher, rollout_watcher
+from rtdb_stream import change_feed
+
+def make_watcher():
+    # Error occurrences of the service during the bake, repeats of known errors included
+    return RolloutWatcher(
+        "https://container.googleapis.com/v1/projects/${PROJECT_ID}/zones/${ZONE}/clusters/${CLUSTER}/namespaces/${NAMESPACE}/deployments",
+        headers={"Authorization": "Bearer ${ACCESS_TOKEN}"},
+        deadline=float('${ROLLOUT_DEADLINE}') * float('${TIME_SCALE}'),
+        bake=float('${ROLLOUT_BAKE}') * float('${TIME_SCALE}'),
+        max_errors=int('${ROLLOUT_MAX_ERRORS}'),
+        error_count=FingerprintErrorCounter('${FIREBASE_DB_URL}'),
+        state_path='${FEED_CURSOR_DIR}/deploy-known-good.json')
+
+watcher = rollout_watcher('deploy', make_watcher)
+
+def rollout(service, build):
+    # Health-gated: rolls back to the last known-good image on its own
+    return watcher.roll_out(service, f"gcr.io/${PROJECT_ID}/{service}:{build['id']}")
+
+scheduler = deploy_scheduler('deploy', lambda: DeployScheduler(
+    rollout, min_interval=float('${DEPLOY_MIN_INTERVAL}') * float('${TIME_SCALE}'), max_concurrency=int('${DEPLOY_CONCURRENCY}')))
+feed = change_feed('${FIREBASE_DB_URL}', 'builds', cursor_path='${FEED_CURSOR_DIR}/deploy-builds.json',
+                   autocommit=False)
+wait = scheduler.next_due()
+longest = 30 * float('${TIME_SCALE}')
+offered, done = 0, []
+for event in feed.poll(max_events=100, timeout=longest if wait is None else min(wait, longest)):
+    build = event['data']
+    if build.get('status') == 'SUCCESS':
+        scheduler.offer(build.get('service') or '${SERVICE_NAME}', build, key=event['key'])
+        offered += 1
+    else:
+        done.append(event['key'])
+feed.ack(done + scheduler.settled())
+return {'offered': offered}
 """
-    )
 )
 
-# Step definitions
-step_fetch = Step(
-    name="fetch_build",
-    tool_name="fetch_build"
+# roll_out - patch every service whose rollout is due, several in parallel, and
+# follow each until it is healthy or rolled back; health, deploy latency and
+# rollback latency are recorded with the rollout
+step_rollout = Step(
+    name="roll_out",
+    run="""
+import json, time
+from deploy_scheduler import deploy_scheduler
+from tracing import tracer
+results = deploy_scheduler('deploy', None).dispatch()
+if not results:
+    return None
+ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+trace = tracer('deploy', '${TRACE_EXPORT}')
+for r in results:
+    # Deploy hop of every incident this rollout covers: build finished -> rollout done
+    failed = r['status'] != 'ROLLED_OUT' or r.get('health', 'HEALTHY') != 'HEALTHY'
+    for incident, finished in r['correlations'].items():
+        trace.hop(incident, 'deploy', start=finished, attributes={'service': r['service'], 'build': r['id']},
+                  error=(r.get('health') or r.get('error')) if failed else None)
+updates = {f"deploys/{r['id']}": dict({k: v for k, v in r.items() if k != 'keys'}, timestamp=ts) for r in results}
+# Feed keys of the builds now live; failed rollouts keep theirs pending in the scheduler
+keys = [key for r in results if r['status'] == 'ROLLED_OUT' for key in r['keys']]
+return {'count': len(results), 'keys': keys, 'deploy_payload': json.dumps(updates)}
+"""
 )
 
-step_deploy = Step(
-    name="deploy_patch",
-    tool_name="deploy_patch",
-    when="fetch_build.responseBody.values()[0].status == 'SUCCESS'",
-    arguments={
-        "BUILD_ID": "{{fetch_build.responseBody.values()[0].id}}",
-        "SERVICE": "${SERVICE_NAME}"  
-    }
+step_record = Step(
+    name="record_deploys",
+    tool_name="record_deploys",
+    when="roll_out.result != null",
+    arguments={"deploy_payload": "{{roll_out.result.deploy_payload}}"}
 )
 
-step_wait = Step(
-    name="wait",
-    run="wait 30s"
+# commit_deploys - move the /builds cursor past the builds whose rollout is now
+# in /deploys; if the write failed they come back after a restart
+step_commit = Step(
+    name="commit_deploys",
+    when="roll_out.result != null",
+    run="""
+from rtdb_stream import change_feed
+if record_deploys.error:
+    return None
+feed = change_feed('${FIREBASE_DB_URL}', 'builds', cursor_path='${FEED_CURSOR_DIR}/deploy-builds.json',
+                   autocommit=False)
+feed.ack(roll_out.result['keys'])
+return {'committed': len(roll_out.result['keys'])}
+"""
 )
 
 # Workflow
 demo_wf = Workflow(
     display_name="Deploy Workflow",
-    steps=[step_fetch, step_deploy, step_wait],
-    repeat_step_name="fetch_build"
+    steps=[step_collect, step_rollout, step_record, step_commit],
+    repeat_step_name="collect_builds"
 )
 
 # Create Agent
 agent = client.create_agent(
     display_name="Deploy Agent",
-    description="Fetches successful build results and applies deployment patches to GKE.",
-    tools=[fetch_build, deploy_patch],
+    description="Coalesces successful builds per service and rolls out the newest image to GKE.",
+    tools=[record_deploys],
     workflow=demo_wf
 )
 print(f"Created agent: {agent.name}")
@@ -37,25 +37,11 @@ gcloud auth application-default login
 gcloud config set project "\$PROJECT\_ID"
 gcloud config set ai/region us-central1
 
-# Deploy each agent
+# Deploy every agent whose definition changed, in parallel
 
-echo "Deploying Error Analyzer Agent..."
-python error\_analyzer\_agent.py
+# (state in .agents-deployed.json; pass --force to redeploy all)
 
-echo "Deploying Fix Generator Agent..."
-python fix\_generator\_agent.py
-
-echo "Deploying Risk Mitigation Agent..."
-python risk\_mitigation\_agent.py
-
-echo "Deploying Build & Test Agent..."
-python build\_test\_agent.py
-
-echo "Deploying Deploy Agent..."
-python deploy\_agent.py
-
-echo "Deploying Reporter Agent..."
-python reporter\_agent.py
+python local\_runtime.py deploy "\$@"
 
 # Completion message
 
@@ -0,0 +1,176 @@
+# deploy_scheduler.py
+# Per-service rollout coalescing, spacing and bounded-concurrency patching for the Deploy Agent
+
+import contextvars
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from http_pool import shared_pool
+from tracing import epoch
+
+
+def deployment_patch(service, image):
+    return {"spec": {"template": {"spec": {"containers": [{"name": service, "image": image}]}}}}
+
+
+def patch_deployment(url, service, image, headers=None, pool=None):
+    # PATCH one deployment to a new image; returns the response body
+    pool = pool or shared_pool()
+    _, _, body = pool.request("PATCH", url, body=json.dumps(deployment_patch(service, image)),
+                              headers={"Content-Type": "application/json", **(headers or {})})
+    return json.loads(body or b"{}")
+
+
+def build_order(build):
+    # Rollout order of a build in seconds: when Cloud Build finished it
+    # (finishTime), else when the tracker saw it finish (timestamp). Compared
+    # as numbers, since RFC 3339 strings with and without fractional seconds
+    # do not sort as text. Builds without either sort first.
+    for field in ("finishTime", "timestamp"):
+        value = epoch(build.get(field))
+        if value is not None:
+            return value
+    return float("-inf")
+
+
+class DeployScheduler:
+    # Successful builds are offered per service; only the newest pending one
+    # is kept, so a run of green builds becomes a single rollout of the
+    # latest image. A service is rolled out at most once per min_interval
+    # seconds (a failed patch is retried after retry_interval), and due
+    # services are patched in parallel, at most max_concurrency at a time.
+    #
+    # rollout(service, build) does the actual patch and raises on failure; a
+    # dict it returns (e.g. RolloutWatcher health and latencies) is merged
+    # into the rollout's result. Incidents (correlationId) of every build a
+    # rollout covers, coalesced ones included, are reported with it as
+    # {correlationId: build finishTime}. A build older (build_order) than the
+    # pending or last dispatched one is dropped, so a late offer never rolls a
+    # service back. In stats, "coalesced" counts builds superseded by a newer
+    # one and "stale" the dropped offers.
+    #
+    # Builds can be offered with the change-feed key they came from. A
+    # rollout result lists the keys of every build it covers ("keys"), and
+    # keys of builds dropped behind a rollout that already happened are handed
+    # back by settled(), so the caller commits a build only once the image
+    # it implies is live.
+    def __init__(self, rollout, min_interval=300.0, max_concurrency=4, retry_interval=30.0,
+                 order=build_order, clock=time.monotonic):
+        self.rollout = rollout
+        self.min_interval = min_interval
+        self.max_concurrency = max_concurrency
+        self.retry_interval = retry_interval
+        self.order = order
+        self.clock = clock
+        self.pending = {}
+        self.dispatched = {}
+        self.coalesced = {}
+        self.correlations = {}
+        self.keys = {}
+        self._settled = []
+        self.next_allowed = {}
+        self.stats = {"offered": 0, "coalesced": 0, "stale": 0, "rollouts": 0, "failures": 0}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="rollout")
+
+    def offer(self, service, build, key=None):
+        # Queue a successful build; one older than what is pending or was last
+        # dispatched is dropped. Returns True if it became the service's
+        # pending build.
+        with self._lock:
+            self.stats["offered"] += 1
+            if build.get("correlationId"):
+                self.correlations.setdefault(service, {})[build["correlationId"]] = \
+                    build.get("finishTime") or build.get("timestamp")
+            current = self.pending.get(service)
+            newest = current or self.dispatched.get(service)
+            if newest is not None and self.order(build) < self.order(newest):
+                # Covered by the newer pending or already dispatched build
+                self.stats["stale"] += 1
+                if key is not None:
+                    (self.keys.setdefault(service, []) if current is not None else self._settled).append(key)
+                return False
+            if key is not None:
+                self.keys.setdefault(service, []).append(key)
+            if current is not None:
+                self.stats["coalesced"] += 1
+                self.coalesced[service] = self.coalesced.get(service, 0) + 1
+            self.pending[service] = build
+            return True
+
+    def due(self):
+        now = self.clock()
+        with self._lock:
+            return sorted(s for s in self.pending if self.next_allowed.get(s, 0.0) <= now)
+
+    def settled(self):
+        # Feed keys of dropped builds whose newer build was already dispatched
+        with self._lock:
+            keys, self._settled = self._settled, []
+        return keys
+
+    def next_due(self):
+        # Seconds until the next pending rollout may start (None when idle)
+        now = self.clock()
+        with self._lock:
+            waits = [max(self.next_allowed.get(s, 0.0) - now, 0.0) for s in self.pending]
+        return min(waits) if waits else None
+
+    def _run(self, service, build, coalesced, correlations, keys):
+        covers = {"service": service, "id": build.get("id"), "coalesced": coalesced, "correlations": correlations,
+                  "keys": keys}
+        try:
+            outcome = self.rollout(service, build)
+        except Exception as e:
+            return {**covers, "status": "FAILED", "error": f"{type(e).__name__}: {e}"}
+        return {**(outcome or {}), **covers, "status": "ROLLED_OUT"}
+
+    def dispatch(self):
+        # Patch every due service (bounded by max_concurrency) and wait for
+        # the results, one dict per attempted rollout
+        now = self.clock()
+        with self._lock:
+            batch = []
+            for service in sorted(self.pending):
+                if self.next_allowed.get(service, 0.0) <= now:
+                    batch.append((service, self.pending.pop(service), self.coalesced.pop(service, 0),
+                                  self.correlations.pop(service, {}), self.keys.pop(service, [])))
+                    self.dispatched[service] = batch[-1][1]
+                    self.next_allowed[service] = now + self.min_interval
+        # Each rollout in a copy of the caller's context, so its requests count
+        # for the caller's agent loop (loop_scheduler.current_loop)
+        futures = [self._executor.submit(contextvars.copy_context().run, self._run, *job) for job in batch]
+        results = [f.result() for f in futures]
+        with self._lock:
+            for (service, build, coalesced, correlations, keys), result in zip(batch, results):
+                if result["status"] == "ROLLED_OUT":
+                    self.stats["rollouts"] += 1
+                    continue
+                self.stats["failures"] += 1
+                self.next_allowed[service] = self.clock() + self.retry_interval
+                # Retry unless a newer build arrived meanwhile, whose rollout
+                # then covers this one
+                if service not in self.pending:
+                    self.pending[service] = build
+                    self.coalesced[service] = coalesced
+                else:
+                    self.stats["coalesced"] += 1
+                    self.coalesced[service] = self.coalesced.get(service, 0) + coalesced + 1
+                self.correlations[service] = {**correlations, **self.correlations.get(service, {})}
+                self.keys[service] = keys + self.keys.get(service, [])
+        return results
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def deploy_scheduler(name, factory):
+    # Process-wide scheduler per name; factory() builds it on first use
+    with _schedulers_lock:
+        scheduler = _schedulers.get(name)
+        if scheduler is None:
+            scheduler = _schedulers[name] = factory()
+        return scheduler
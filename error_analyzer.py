@@ -8,10 +8,10 @@ from google.cloud.aiplatform.agent import AgentClient, Tool, HttpRequestToolConf
 aiplatform.init(project="YOUR_PROJECT_ID", location="us-central1")
 client = AgentClient()
 
-# Tool 1: fetch_error - pull latest pod error from Pub/Sub subscription endpoint (via HTTP pull)
+# Tool 1: fetch_error - pull a batch of pod errors from Pub/Sub subscription endpoint (via HTTP pull)
 fetch_error = Tool(
     name="fetch_error",
-    description="Fetch the most recent pod failure event from Pub/Sub subscription.",
+    description="Fetch up to PULL_BATCH_SIZE pending pod failure events from Pub/Sub subscription.",
     http_request=HttpRequestToolConfig(
         method="POST",
         url="https://pubsub.googleapis.com/v1/projects/YOUR_PROJECT_ID/subscriptions/pod-errors-sub:pull",
@@ -20,23 +20,47 @@ fetch_error = Tool(
         },
         body="""
 {
-  "maxMessages": 1
+  "maxMessages": ${PULL_BATCH_SIZE}
 }
 """
     )
 )
 
-# Tool 2: write_error - write structured error into Firebase RTDB
+# Tool 2: write_error - write a batch of structured errors and fingerprint counters into Firebase RTDB in one multi-location update
 write_error = Tool(
     name="write_error",
-    description="Write structured error record to Firebase RTDB under /errors/{service}/{timestamp}",
+    description="Write new structured errors under /errors/{service}/{messageId} and this analyzer's occurrence counters under /fingerprints/{service}/{fingerprint}/{analyzer} with a single PATCH",
     http_request=HttpRequestToolConfig(
-        method="PUT",
-        url="${FIREBASE_DB_URL}/errors/{service}/{errorTimestamp}.json",
+        method="PATCH",
+        url="${FIREBASE_DB_URL}/.json",
         body="${error_payload}"
     )
 )
 
+# Tool 3: ack_errors - acknowledge the whole pulled batch in one call
+ack_errors = Tool(
+    name="ack_errors",
+    description="Acknowledge processed pod failure events on the Pub/Sub subscription.",
+    http_request=HttpRequestToolConfig(
+        method="POST",
+        url="https://pubsub.googleapis.com/v1/projects/YOUR_PROJECT_ID/subscriptions/pod-errors-sub:acknowledge",
+        headers={
+            "Content-Type": "application/json"
+        },
+        body="${ack_payload}"
+    )
+)
+
+# Tool 4: fetch_fingerprints - load the occurrence index used to dedupe repeated errors
+fetch_fingerprints = Tool(
+    name="fetch_fingerprints",
+    description="Fetch the per-service error fingerprint occurrence index from Firebase RTDB.",
+    http_request=HttpRequestToolConfig(
+        method="GET",
+        url="${FIREBASE_DB_URL}/fingerprints.json"
+    )
+)
+
 # Parameter: none for this simple agent
 
 # Step 1: pull error
@@ -45,57 +69,199 @@ step_fetch = Step(
     tool_name="fetch_error"
 )
 
-# Step 2: analyze and structure
+# Step 2: load the fingerprint index when there is something to dedupe
+step_fingerprints = Step(
+    name="fetch_fingerprints",
+    tool_name="fetch_fingerprints",
+    when="fetch_error.response.receivedMessages != null"
+)
+
+# Step 3: analyze and structure every pulled message in one pass. Pod
+# failure events carry the whole error; pod log entries (textPayload / log)
+# go through a process-wide streaming parser that reassembles multi-line
+# Python / Java / Go exceptions per pod and container, and their messages
+# are acknowledged only once no open exception still needs them. Until then
+# their ack deadline is extended every cycle (a redelivery is dropped by
+# messageId anyway) and the loop keeps going without the wait step, so an
+# exception is emitted LOG_IDLE_TIMEOUT after its pod goes quiet.
+#
+# New errors and fingerprint counters go into a process-wide BulkWriter
+# together with the ack IDs of the messages they came from. A batch is
+# handed to write_error once RTDB_FLUSH_SIZE updates are buffered or the
+# oldest has waited RTDB_FLUSH_INTERVAL seconds, and whatever is buffered is
+# handed over as soon as the subscription is drained; its messages are
+# acknowledged only after the write succeeded (commit_batch).
 step_analyze = Step(
     name="analyze_error",
     run="""
 import json, time
+from error_fingerprint import FingerprintIndex, fingerprint, shard_id
+from http_pool import HttpError, shared_pool
+from log_parser import LogReassembler, log_reassembler
+from rtdb_bulk import BulkWriter, bulk_writer
+from tracing import correlation_id, epoch, tracer
 # Pub/Sub pull returns {receivedMessages: [...]}
-msgs = json.loads(fetch_error.responseBody).get('receivedMessages', [])
+msgs = (fetch_error.response or {}).get('receivedMessages', [])
+parser = log_reassembler('error-analyzer', lambda: LogReassembler(
+    idle_timeout=float('${LOG_IDLE_TIMEOUT}'), max_lines=int('${LOG_MAX_LINES}')))
+writer = bulk_writer('error-analyzer', lambda: BulkWriter(
+    '${FIREBASE_DB_URL}', flush_size=int('${RTDB_FLUSH_SIZE}'), flush_interval=float('${RTDB_FLUSH_INTERVAL}')))
+
+def handoff(batch, **result):
+    # The cycle's result, with the batch (if any) for write_error / commit_batch
+    return dict(result, batch=batch and batch['id'],
+                error_payload=json.dumps(batch['updates']) if batch and batch['updates'] else None)
+
 if not msgs:
-    return None
-# Extract data
-msg = msgs[0]['message']
-data = json.loads(msg['data'])
-service = data.get('metadata', {}).get('labels', {}).get('app') or data.get('podName', 'unknown')
-error_ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-# Build structured payload
-payload = {
-    'service': service,
-    'errorMessage': data.get('error', data.get('log', '')), 
-    'raw': data,
-    'timestamp': error_ts
-}
-return {
-    'service': service,
-    'errorTimestamp': error_ts,
-    'error_payload': json.dumps(payload)
-}
+    if not parser.pending():
+        # Drained: write out whatever is still buffered
+        batch = writer.take(force=True)
+        return handoff(batch, count=0, new_errors=0, held=0, detect_s=[]) if batch else None
+    # Let the open exceptions go quiet, then flush them below
+    time.sleep(parser.idle_timeout)
+trace = tracer('error-analyzer', '${TRACE_EXPORT}')
+now = time.time()
+recorded_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now))
+failures = []
+ack_ids = []
+log_tags = []
+for received in msgs:
+    msg = received['message']
+    data = json.loads(msg['data'])
+    error_ts = msg.get('publishTime') or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    if 'error' not in data and ('textPayload' in data or 'log' in data):
+        tag = (msg['messageId'], received['ackId'])
+        log_tags.append(tag)
+        for event in parser.feed_entry(data, timestamp=error_ts, tag=tag, key=msg['messageId']):
+            failures.append((event['tags'][0][0], event))
+        continue
+    ack_ids.append(received['ackId'])
+    failures.append((msg['messageId'], {
+        'service': data.get('metadata', {}).get('labels', {}).get('app') or data.get('podName', 'unknown'),
+        'text': data.get('error', data.get('log', '')), 'timestamp': error_ts, 'raw': data,
+        'correlationId': msg.get('attributes', {}).get('correlationId')}))
+for event in parser.flush():
+    failures.append((event['tags'][0][0] if event['tags'] else event['stream']['pod'], event))
+ack_ids += [ack_id for _, ack_id in parser.ackable(log_tags)]
+held = sorted(ack_id for _, ack_id in parser.pending_tags())
+if held:
+    try:
+        shared_pool().request(
+            "POST", "https://pubsub.googleapis.com/v1/projects/YOUR_PROJECT_ID/subscriptions/pod-errors-sub:modifyAckDeadline",
+            body=json.dumps({'ackIds': held, 'ackDeadlineSeconds': int('${LOG_ACK_DEADLINE}')}),
+            headers={"Content-Type": "application/json"})
+    except HttpError:
+        # Redelivered lines are dropped by messageId; only the ack IDs change
+        pass
+if not failures and not ack_ids:
+    # Non-null while exceptions are open, so the loop skips the wait step
+    return handoff(writer.take(), count=len(msgs), new_errors=0, held=len(held),
+                   detect_s=[]) if parser.pending() else None
+entries = fetch_fingerprints.response
+if entries is None and failures:
+    # Exceptions flushed in a cycle that pulled nothing
+    entries = json.loads(shared_pool().request("GET", "${FIREBASE_DB_URL}/fingerprints.json")[2] or b'null')
+# Counters this analyzer has buffered but not written yet count too
+entries = writer.overlay('fingerprints', entries)
+index = FingerprintIndex(ttl=int('${FINGERPRINT_TTL}'), entries=entries, shard=shard_id('${ANALYZER_ID}'))
+updates = {}
+new_errors = 0
+detect_s = []
+seen = {}
+for message_id, failure in failures:
+    service = failure['service']
+    error_message = failure['text']
+    fp = fingerprint(error_message)
+    # Only the first occurrence in the TTL window flows downstream; repeats just bump counters
+    if not index.observe(service, fp, now):
+        continue
+    new_errors += 1
+    # One message can end several exceptions; keys stay unique and stable
+    seen[message_id] = seen.get(message_id, -1) + 1
+    error_id = message_id if not seen[message_id] else f"{message_id}-{seen[message_id]}"
+    # The incident's correlation ID follows it through PR, build, deploy and report
+    incident = failure.get('correlationId') or correlation_id(error_id)
+    error_ts = failure.get('timestamp') or recorded_at
+    trace.hop(incident, 'detect', start=error_ts, end=now, attributes={'service': service})
+    if epoch(error_ts) is not None:
+        detect_s.append(round(now - epoch(error_ts), 3))
+    record = {
+        'service': service,
+        'errorMessage': error_message,
+        'fingerprint': fp,
+        'timestamp': error_ts,
+        'correlationId': incident,
+        'recordedAt': recorded_at
+    }
+    if 'raw' in failure:
+        record['raw'] = failure['raw']
+    else:
+        # Reassembled from the pod's log lines
+        record.update({k: failure[k] for k in ('language', 'exception', 'message', 'cause', 'frames',
+                                                'lines', 'truncated')}, raw=failure['stream'])
+    # Keyed by messageId so same-second errors don't collide
+    updates[f"errors/{service}/{error_id}"] = record
+index.expire(now)
+for key, entry in index.updates().items():
+    updates[f"fingerprints/{key}"] = entry
+writer.add(updates, ack_ids)
+# error_payload is null until a batch is due (or when it only acknowledges
+# messages, e.g. log lines of exceptions already written)
+return handoff(writer.take(), count=len(msgs), new_errors=new_errors, held=len(held),
+               # failure -> detected, per new error (the detect hop), for the loop scheduler
+               detect_s=detect_s)
 """
 )
 
-# Step 3: write to RTDB
+# Step 4: write the batch to RTDB
 step_write = Step(
     name="write_error",
     tool_name="write_error",
-    when="analyze_error.result != null",
+    when="analyze_error.result.error_payload != null",
     arguments={
-        'service': "{{analyze_error.result.service}}",
-        'errorTimestamp': "{{analyze_error.result.errorTimestamp}}",
         'error_payload': "{{analyze_error.result.error_payload}}"
     }
 )
 
-# Step 4: wait and loop
+# Step 5: release the batch's ack IDs once it is persisted; a failed write
+# puts the batch back in the writer, and its messages stay unacknowledged
+# until a later write succeeds
+step_commit = Step(
+    name="commit_batch",
+    when="analyze_error.result.batch != null",
+    run="""
+import json
+from rtdb_bulk import bulk_writer
+writer = bulk_writer('error-analyzer', None)
+if write_error.error:
+    writer.done(analyze_error.result['batch'], ok=False)
+    return None
+batch = writer.done(analyze_error.result['batch'])
+return {'ack_payload': json.dumps({'ackIds': batch['acks']}) if batch and batch['acks'] else None}
+"""
+)
+
+# Step 6: ack the batch once it is persisted
+step_ack = Step(
+    name="ack_errors",
+    tool_name="ack_errors",
+    when="commit_batch.result.ack_payload != null",
+    arguments={
+        'ack_payload': "{{commit_batch.result.ack_payload}}"
+    }
+)
+
+# Step 7: wait only when the subscription is drained, otherwise loop straight back
 step_wait = Step(
     name="wait",
-    run="wait 60s"
+    run="wait 60s",
+    when="analyze_error.result == null"
 )
 
 # Assemble workflow
 demo_wf = Workflow(
     display_name="Error Analyzer Workflow",
-    steps=[step_fetch, step_analyze, step_write, step_wait],
+    steps=[step_fetch, step_fingerprints, step_analyze, step_write, step_commit, step_ack, step_wait],
     repeat_step_name="fetch_error"
 )
 
@@ -103,7 +269,7 @@ demo_wf = Workflow(
 agent = client.create_agent(
     display_name="Error Analyzer Agent",
     description="Parses pod failure events and logs structured records to Firebase.",
-    tools=[fetch_error, write_error],
+    tools=[fetch_error, write_error, ack_errors, fetch_fingerprints],
     workflow=demo_wf
 )
 print(f"Created agent: {agent.name}")
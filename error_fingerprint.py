@@ -0,0 +1,105 @@
+# error_fingerprint.py
+# Error fingerprinting and TTL'd occurrence index used to dedupe errors ahead of the Fix Generator
+
+import hashlib
+import re
+import socket
+import time
+
+# Order matters: frame locations first, then volatile tokens inside messages
+_NORMALIZERS = [
+    # Python: File "/app/app.py", line 15, in error  ->  File "app.py", in error
+    (re.compile(r'File "(?:[^"]*/)?([^"/]+)", line \d+'), r'File "\1"'),
+    # Java: at com.acme.Foo.bar(Foo.java:123)  ->  at com.acme.Foo.bar(Foo.java)
+    (re.compile(r"\(([\w$.-]+\.(?:java|kt|scala)):\d+\)"), r"(\1)"),
+    # Go: /src/app/main.go:42 +0x1d  ->  main.go
+    (re.compile(r"(?:\S*/)?([\w.-]+\.go):\d+(?: \+0x[0-9a-f]+)?"), r"\1"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I), "<uuid>"),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<ts>"),
+    (re.compile(r"\b0x[0-9a-f]+\b", re.I), "<hex>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<ip>"),
+    (re.compile(r"\b\d+\b"), "<n>"),
+    (re.compile(r"[ \t]+"), " "),
+]
+
+
+def normalize(message):
+    text = message or ""
+    for pattern, repl in _NORMALIZERS:
+        text = pattern.sub(repl, text)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def fingerprint(message):
+    return hashlib.sha1(normalize(message).encode()).hexdigest()[:16]
+
+
+# Characters RTDB does not allow in a key
+_KEY_CHARS = re.compile(r"[.$#\[\]/]")
+
+
+def shard_id(name):
+    # An analyzer's name (its host name by default) as an RTDB key
+    return _KEY_CHARS.sub("-", name or socket.gethostname())
+
+
+def occurrences(entries):
+    # {(service, fingerprint): occurrences in the current windows, all shards}
+    return {(service, fp): sum(shard.get("count", 0) for shard in shards.values() if isinstance(shard, dict))
+            for service, fps in (entries or {}).items() for fp, shards in (fps or {}).items() if shards}
+
+
+class FingerprintIndex:
+    # Occurrence counts per (service, fingerprint). The first occurrence in a
+    # ttl-second window is reported as new; repeats only bump the counters.
+    # entries uses the RTDB layout {service: {fingerprint: {shard: entry}}} so
+    # the index can be loaded from and written back to /fingerprints. Each
+    # analyzer only writes its own shard, so analyzers running side by side
+    # never overwrite each other's counts; an occurrence is new only if no
+    # shard has a window open for it.
+    def __init__(self, ttl=3600, entries=None, shard="default"):
+        self.ttl = ttl
+        self.shard = shard
+        self.entries, self.others = {}, {}
+        for service, fps in (entries or {}).items():
+            for fp, shards in (fps or {}).items():
+                for name, entry in (shards or {}).items():
+                    if not isinstance(entry, dict):
+                        continue
+                    if name == shard:
+                        self.entries[(service, fp)] = dict(entry)
+                    else:
+                        self.others.setdefault((service, fp), []).append(entry)
+        self.dirty = set()
+
+    def observe(self, service, fp, now=None):
+        now = time.time() if now is None else now
+        key = (service, fp)
+        entry = self.entries.get(key)
+        open_elsewhere = any(now - other["firstSeen"] < self.ttl for other in self.others.get(key, ()))
+        self.dirty.add(key)
+        if entry is None or now - entry["firstSeen"] >= self.ttl:
+            self.entries[key] = {"count": 1, "suppressed": int(open_elsewhere), "firstSeen": now, "lastSeen": now}
+            return not open_elsewhere
+        entry["count"] += 1
+        entry["suppressed"] += 1
+        entry["lastSeen"] = now
+        return False
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        expired = [key for key, entry in self.entries.items()
+                   if entry is not None and now - entry["lastSeen"] >= self.ttl]
+        for key in expired:
+            self.entries[key] = None
+            self.dirty.add(key)
+        return len(expired)
+
+    def updates(self):
+        # Multi-location update for this shard's dirty entries
+        # ({"service/fp/shard": entry or None}). Expired entries are written as
+        # null so RTDB deletes them.
+        out = {f"{service}/{fp}/{self.shard}": self.entries[(service, fp)] for service, fp in self.dirty}
+        self.entries = {key: entry for key, entry in self.entries.items() if entry is not None}
+        self.dirty.clear()
+        return out
@@ -0,0 +1,379 @@
+# event_log.py
+# Embedded, durable event log (SQLite in WAL mode) for the agent handoffs on a single node or in tests
+#
+# Every write to a handoff collection (errors, pr-requests, builds, deploys,
+# risk-mitigations, ...) is appended as a new version of the record it names,
+# so the log is both the bus and the current state:
+#   events        seq, type (the collection), key ({id} or {service}/{id}),
+#                 service, ts (the record's timestamp as stored: numbers stay
+#                 numbers and sort before strings, as RTDB orders them), data
+#                 (JSON, NULL for a delete), appended (epoch seconds)
+#   correlations  correlation ID -> seq (correlationId, and the incidents of a
+#                 rollout's `correlations`)
+#   cursors       consumer -> last committed seq
+# with indexes on (type, ts), (service, ts), ts, (type, key, seq) and the
+# correlation ID. Consumers read everything after their cursor in append
+# order (at-least-once, like rtdb_stream.ChangeFeed); compact() drops
+# versions every consumer has moved past and records older than the
+# retention.
+#
+# LogRTDB in local_standins.py serves the RTDB REST subset the agents use
+# from a log, so pointing FIREBASE_DB_URL at it (or EVENT_LOG for the local
+# runtime) swaps RTDB out without touching the agents:
+#   python event_log.py serve --db /var/lib/agents-assemble/events.db --port 8765
+#   python event_log.py compact --db ... --retention 604800
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+EVENTS = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    service TEXT,
+    ts,
+    data TEXT,
+    appended REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_type_ts ON events(type, ts);
+CREATE INDEX IF NOT EXISTS events_service_ts ON events(service, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS events_type_key ON events(type, key, seq);
+"""
+SCHEMA = EVENTS + """
+CREATE TABLE IF NOT EXISTS correlations (
+    correlation TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (correlation, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cursors (
+    consumer TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+"""
+
+# A row is the current version of its record when no later row has the same
+# type and key (answered from events_type_key)
+_CURRENT = "NOT EXISTS (SELECT 1 FROM events n WHERE n.type = e.type AND n.key = e.key AND n.seq > e.seq)"
+
+
+def _sort_value(ts):
+    # A timestamp as the ts column keeps it: numbers and strings as they are
+    # (the column has no type affinity), anything else as JSON text
+    if ts is None or isinstance(ts, str) or (isinstance(ts, (int, float)) and not isinstance(ts, bool)):
+        return ts
+    return json.dumps(ts, separators=(",", ":"))
+
+
+def _migrate(db):
+    # Databases created with "ts TEXT" stored numeric timestamps as text,
+    # which sorts "1000" before "999": rebuild the table with the typed
+    # column, taking each timestamp back from its record, and keep the seq
+    # high-water mark
+    columns = {row[1]: row[2] for row in db.execute("PRAGMA table_info(events)")}
+    if columns.get("ts", "").upper() != "TEXT":
+        return
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        db.execute("ALTER TABLE events RENAME TO events_text_ts")
+        for index in ("events_type_ts", "events_service_ts", "events_ts", "events_type_key"):
+            db.execute(f"DROP INDEX IF EXISTS {index}")
+        for statement in EVENTS.split(";"):
+            if statement.strip():
+                db.execute(statement)
+        db.execute("INSERT INTO events (seq, type, key, service, ts, data, appended) "
+                   "SELECT seq, type, key, service, CASE WHEN json_type(data, '$.timestamp') IN ('integer', 'real') "
+                   "THEN json_extract(data, '$.timestamp') ELSE ts END, data, appended FROM events_text_ts")
+        db.execute("DROP TABLE events_text_ts")
+        if row:
+            db.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'events'", (row[0],))
+            db.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'events', ? "
+                       "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'events')", (row[0],))
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+
+def _correlations(record):
+    if not isinstance(record, dict):
+        return set()
+    found = {record["correlationId"]} if isinstance(record.get("correlationId"), str) else set()
+    if isinstance(record.get("correlations"), dict):
+        found.update(record["correlations"])
+    return found
+
+
+def _event(row):
+    seq, type_, key, data = row
+    return {"seq": seq, "path": type_, "key": key, "data": json.loads(data) if data is not None else None}
+
+
+class EventLog:
+    # One SQLite database; a connection per thread (WAL lets readers run
+    # while one writer appends). synchronous=NORMAL survives process crashes
+    # and may lose the last transactions on power loss; FULL does not.
+    def __init__(self, path, synchronous="NORMAL"):
+        self.path = path
+        self.synchronous = synchronous
+        self.write_lock = threading.Lock()
+        self.appended = threading.Condition()
+        self._local = threading.local()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._db()
+        # Only takes effect on a new database; lets compact() return the
+        # freed pages to the filesystem
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.executescript(SCHEMA)
+        _migrate(db)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(f"PRAGMA synchronous={self.synchronous}")
+            db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    # --- writes ----------------------------------------------------------------
+
+    def append(self, type_, key, data):
+        return self.append_many([(type_, key, data)])
+
+    def append_many(self, records):
+        # [(type, key, record or None)] in one transaction; returns the last seq
+        now = time.time()
+        rows, links = [], []
+        for type_, key, data in records:
+            service = data.get("service") if isinstance(data, dict) else None
+            ts = data.get("timestamp") if isinstance(data, dict) else None
+            rows.append((type_, key, service, _sort_value(ts),
+                         json.dumps(data, separators=(",", ":")) if data is not None else None, now))
+            links.append(_correlations(data))
+        if not rows:
+            return None
+        db = self._db()
+        with self.write_lock:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # sqlite_sequence keeps the high-water mark, so seqs are never
+                # reused after compaction, even of the newest rows
+                row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+                first = (row[0] if row else 0) + 1
+                db.executemany("INSERT INTO events (seq, type, key, service, ts, data, appended) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               [(first + i, *row) for i, row in enumerate(rows)])
+                db.executemany("INSERT OR IGNORE INTO correlations (correlation, seq) VALUES (?, ?)",
+                               [(c, first + i) for i, found in enumerate(links) for c in found])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        with self.appended:
+            self.appended.notify_all()
+        return first + len(rows) - 1
+
+    # --- current state ---------------------------------------------------------
+
+    def get(self, type_, key):
+        row = self._db().execute("SELECT data FROM events WHERE type = ? AND key = ? ORDER BY seq DESC LIMIT 1",
+                                 (type_, key)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def records(self, type_, prefix=None):
+        # {key: record} of every current record of a type (under key prefix/)
+        sql = f"SELECT key, data FROM events e WHERE type = ? AND {_CURRENT} AND data IS NOT NULL"
+        args = [type_]
+        if prefix:
+            sql += " AND key >= ? AND key < ?"
+            args += [prefix + "/", prefix + "/\uffff"]
+        return {key: json.loads(data) for key, data in self._db().execute(sql, args)}
+
+    def query(self, type_=None, service=None, since=None, until=None, limit=None, last=False, history=False):
+        # Records ordered by timestamp, filtered by type / service / timestamp
+        # range [since, until]; last=True returns the newest `limit` (RTDB
+        # orderBy="timestamp"&limitToLast). Only current versions unless
+        # history=True. Returns [(key, record)].
+        where, args = ["data IS NOT NULL"], []
+        if type_ is not None:
+            where.append("type = ?")
+            args.append(type_)
+        if service is not None:
+            where.append("service = ?")
+            args.append(service)
+        if since is not None:
+            where.append("ts >= ?")
+            args.append(_sort_value(since))
+        if until is not None:
+            where.append("ts <= ?")
+            args.append(_sort_value(until))
+        if not history:
+            where.append(_CURRENT)
+        sql = f"SELECT key, data, ts, seq FROM events e WHERE {' AND '.join(where)} " \
+              f"ORDER BY ts {'DESC' if last else 'ASC'}, seq {'DESC' if last else 'ASC'}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        rows = self._db().execute(sql, args).fetchall()
+        if last:
+            rows.reverse()
+        return [(key, json.loads(data)) for key, data, _, _ in rows]
+
+    def incident(self, correlation):
+        # Every version written for an incident, in append order
+        rows = self._db().execute(
+            "SELECT e.seq, e.type, e.key, e.data FROM correlations c JOIN events e ON e.seq = c.seq "
+            "WHERE c.correlation = ? ORDER BY e.seq", (correlation,)).fetchall()
+        return [_event(row) for row in rows]
+
+    # --- consumers -------------------------------------------------------------
+
+    def cursor(self, consumer):
+        row = self._db().execute("SELECT seq FROM cursors WHERE consumer = ?", (consumer,)).fetchone()
+        return row[0] if row else 0
+
+    def read(self, after, types=None, limit=1000):
+        # Events after seq `after` in append order, optionally of some types
+        sql, args = "SELECT seq, type, key, data FROM events WHERE seq > ?", [after]
+        if types:
+            sql += f" AND type IN ({','.join('?' * len(types))})"
+            args += list(types)
+        sql += f" ORDER BY seq LIMIT {int(limit)}"
+        return [_event(row) for row in self._db().execute(sql, args)]
+
+    def commit(self, consumer, seq):
+        with self.write_lock:
+            self._db().execute("INSERT INTO cursors (consumer, seq) VALUES (?, ?) "
+                               "ON CONFLICT(consumer) DO UPDATE SET seq = MAX(seq, excluded.seq)", (consumer, seq))
+
+    def consumer(self, name, types=None):
+        return Consumer(self, name, types)
+
+    def wait(self, after, timeout):
+        # Block until something is appended after seq `after` (this process
+        # only) or the timeout passes
+        with self.appended:
+            return self.appended.wait_for(lambda: self.last_seq() > after, timeout)
+
+    def last_seq(self):
+        row = self._db().execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        return row[0] if row else 0
+
+    # --- maintenance -----------------------------------------------------------
+
+    def compact(self, retention=None, now=None):
+        # Drop versions that a newer version replaced and deletes, once every
+        # consumer is past them, and anything appended more than `retention`
+        # seconds ago. Returns rows removed per reason.
+        now = time.time() if now is None else now
+        db = self._db()
+        with self.write_lock:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                floor = db.execute("SELECT MIN(seq) FROM cursors").fetchone()[0]
+                if floor is None:
+                    floor = self.last_seq()
+                superseded = db.execute(
+                    f"DELETE FROM events AS e WHERE seq <= ? AND (data IS NULL OR NOT {_CURRENT})",
+                    (floor,)).rowcount
+                expired = db.execute("DELETE FROM events WHERE appended < ?",
+                                     (now - retention,)).rowcount if retention else 0
+                db.execute("DELETE FROM correlations WHERE seq NOT IN (SELECT seq FROM events)")
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        db.execute("PRAGMA incremental_vacuum")
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"superseded": superseded, "expired": expired}
+
+    def size(self):
+        db = self._db()
+        return {"events": db.execute("SELECT COUNT(*) FROM events").fetchone()[0],
+                "bytes": sum(os.path.getsize(p) for p in (self.path, self.path + "-wal")
+                             if self.path != ":memory:" and os.path.exists(p))}
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+class Consumer:
+    # A named reader with a durable cursor. poll() hands out the events after
+    # the cursor and commits the previous batch on the next call, so a crash
+    # mid-processing replays them (same contract as ChangeFeed.poll).
+    def __init__(self, log, name, types=None):
+        self.log = log
+        self.name = name
+        self.types = list(types) if types else None
+        self.position = log.cursor(name)
+        self._uncommitted = None
+
+    def poll(self, max_events=100, timeout=0.0):
+        self.commit()
+        deadline = time.monotonic() + timeout
+        while True:
+            mark = self.log.last_seq()
+            events = self.log.read(self.position, self.types, max_events)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                break
+            self.log.wait(mark, remaining)
+        if events:
+            self.position = events[-1]["seq"]
+            self._uncommitted = self.position
+        return events
+
+    def commit(self):
+        if self._uncommitted is not None:
+            self.log.commit(self.name, self._uncommitted)
+            self._uncommitted = None
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def event_log(path):
+    # Process-wide log per database path
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = EventLog(path)
+        return log
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedded event log for the agent handoffs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="serve the RTDB REST subset the agents use from the log")
+    p.add_argument("--db", required=True)
+    p.add_argument("--port", type=int, default=8765)
+    p = sub.add_parser("compact", help="drop superseded versions and expired records")
+    p.add_argument("--db", required=True)
+    p.add_argument("--retention", type=float, default=None, help="seconds to keep records")
+    args = parser.parse_args()
+    if args.command == "compact":
+        log = EventLog(args.db)
+        print(json.dumps({**log.compact(args.retention), **log.size()}))
+        return
+    from local_standins import LogRTDB
+    server = LogRTDB(EventLog(args.db), port=args.port).start()
+    print(f"FIREBASE_DB_URL={server.url}", flush=True)
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,107 +10,198 @@ from google.cloud.aiplatform.agent import (
 aiplatform.init(project="YOUR_PROJECT_ID", location="us-central1")
 client = AgentClient()
 
-# Tool: fetch_structured_error - pull the latest structured error from RTDB
-fetch_structured_error = Tool(
-    name="fetch_structured_error",
-    description="Fetch the most recent structured error from Firebase RTDB.",
+# Tool: fetch_fingerprints - occurrence counts, which rank queued errors
+fetch_fingerprints = Tool(
+    name="fetch_fingerprints",
+    description="Fetch the per-service error fingerprint occurrence index from Firebase RTDB.",
     http_request=HttpRequestToolConfig(
         method="GET",
-        url="${FIREBASE_DB_URL}/errors.json?orderBy=\"timestamp\"&limitToLast=1"
+        url="${FIREBASE_DB_URL}/fingerprints.json"
     )
 )
 
-# Tool: clone_repo - clone the GitHub repo for the affected service
-clone_repo = Tool(
-    name="clone_repo",
-    description="Clone the service repository to workspace.",
+# Tool: record_fixes - write finished fix attempts for the Reporter
+record_fixes = Tool(
+    name="record_fixes",
+    description="Write fix attempts under /pr-requests/{errorId} and the scheduler metrics under /fix-scheduler with a single PATCH",
     http_request=HttpRequestToolConfig(
-        method="POST",
-        url="https://api.github.com/repos/${ORG}/${REPO}/zipball/main"
+        method="PATCH",
+        url="${FIREBASE_DB_URL}/.json",
+        body="${fix_payload}"
     )
 )
 
-# Tool: generate_patch - ask LLM to propose a diff based on error context
-generate_patch = Tool(
-    name="generate_patch",
-    description="Generate a code/config patch via LLM based on the error context.",
-    http_request=HttpRequestToolConfig(
-        method="POST",
-        url="https://text-bison.googleapis.com/v1/projects/${PROJECT}/locations/global/models/text-bison:predict",
-        headers={"Content-Type": "application/json"},
-        body="""
-{
-  "instances": [{
-    "prompt": "Error: {{structured_error.result.errorMessage}}\nContext: Service {{structured_error.result.service}}\nPropose a minimal patch or resource change to fix this issue."
-  }]
-}
-"""
-    )
+# Workflow steps
+step_fingerprints = Step(
+    name="fetch_fingerprints",
+    tool_name="fetch_fingerprints"
 )
 
-# Tool: create_branch_and_patch - create a new branch and apply the patch via GitHub API
-create_branch_and_patch = Tool(
-    name="create_branch_and_patch",
-    description="Create a new branch and apply the generated patch in the GitHub repo.",
-    http_request=HttpRequestToolConfig(
-        method="POST",
-        url="https://api.github.com/repos/${ORG}/${REPO}/pulls",
-        headers={
-            "Authorization": "Bearer ${GITHUB_TOKEN}",
-            "Content-Type": "application/json"
-        },
-        body="""
-{
-  "title": "Auto-fix for {{structured_error.result.service}}",
-  "head": "auto-fix/{{structured_error.result.service}}-{{structured_error.result.errorTimestamp}}",
-  "base": "main",
-  "body": "{{generate_patch.response.predictions[0].content}}"
-}
-"""
-    )
-)
+# schedule_fixes - new structured errors from the /errors change feed go into
+# a process-wide priority queue (severity, occurrences, service criticality)
+# drained by FIX_WORKERS concurrent workers, at most FIX_PER_SERVICE per
+# service. Each worker resolves the cached snapshot of main, asks the LLM for
+# a patch from the error and the code its stack frames point at, checks it
+# locally (patch_preflight: applies, compiles, manifests parse, targeted tests
+# pass; PREFLIGHT_FAILED otherwise) and only then opens the PR; the incident's correlation ID goes into the PR branch and title,
+# where the Build & Test Agent picks it up. With FIX_OVERFLOW=block only as
+# many errors are pulled as the queue has room for (the rest wait in RTDB);
+# with shed the least urgent queued error is parked until there is room.
+# Waits up to 5s for new errors or finished fixes instead of a fixed wait.
+# The /errors feed cursor only moves past an error once its outcome is
+# written (commit_errors), so a restart picks up every queued, parked and
+# running error again.
+step_schedule = Step(
+    name="schedule_fixes",
+    run="""
+import json, time
+from error_fingerprint import occurrences
+from fix_scheduler import FixScheduler, fix_scheduler, parse_criticality
+from rtdb_stream import change_feed
+from tracing import correlation_id
 
-# Workflow steps
-step_fetch = Step(
-    name="fetch_structured_error",
-    tool_name="fetch_structured_error"
-)
+def make_handler():
+    import threading
+    from error_fingerprint import normalize
+    from http_pool import HttpError, shared_pool
+    from llm_cache import PromptCache, cached_predict, prompt_cache
+    from patch_preflight import Preflight, preflight, summary
+    from repo_snapshot import RepoSnapshotCache
+    from source_index import SourceIndex, parse_frames
+    from tracing import tracer
+    snapshots = RepoSnapshotCache('${REPO_CACHE_DIR}', token='${GITHUB_TOKEN}')
+    # One process-wide cache with the Risk Mitigation Agent
+    llm = prompt_cache('llm', lambda: PromptCache('${LLM_CACHE_DIR}'))
+    trace = tracer('fix-generator', '${TRACE_EXPORT}')
+    checker = preflight('fix', lambda: Preflight(max_workers=int('${PREFLIGHT_WORKERS}'),
+                                                 timeouts={'tests': float('${PREFLIGHT_TEST_TIMEOUT}')}))
+    lock, current = threading.Lock(), {}
 
-step_clone = Step(
-    name="clone_repo",
-    tool_name="clone_repo",
-    when="fetch_structured_error.result != null"
-)
+    def workspace():
+        # One snapshot and source index per commit of main, shared by the workers
+        with lock:
+            ws = snapshots.workspace('${ORG}', '${REPO}', 'main')
+            if current.get('sha') != ws.sha:
+                current['index'] = SourceIndex.for_workspace(ws.path, state_path='${REPO_CACHE_DIR}/source-index.json')
+                current['sha'] = ws.sha
+            return ws, current['index']
+
+    def prompt(error, message, code):
+        text = f"Error: {message}\\nContext: Service {error['service']}\\n"
+        if code:
+            text += f"Relevant code:\\n{code}\\n"
+        return text + "Propose a minimal patch or resource change to fix this issue."
 
-step_patch = Step(
-    name="generate_patch",
-    tool_name="generate_patch",
-    when="clone_repo.status == 'OK'"
+    def fix(error):
+        ws, index = workspace()
+        code = index.context(parse_frames(error['errorMessage']), token_budget=int('${PROMPT_CONTEXT_TOKENS}'))
+        # Cached per commit of main and error signature: the key has the
+        # message normalized (line numbers, IDs, timestamps) and the code
+        # context as sent
+        patch = cached_predict(
+            llm,
+            "https://text-bison.googleapis.com/v1/projects/${PROJECT}/locations/global/models/text-bison:predict",
+            prompt(error, error['errorMessage'], code),
+            headers={"Authorization": "Bearer ${ACCESS_TOKEN}"},
+            key=f"fix {ws.sha}\\n" + prompt(error, normalize(error['errorMessage']), code)
+        )
+        content = ((patch or {}).get('predictions') or [{}])[0].get('content')
+        if not content:
+            return {'status': 'NO_PATCH', 'sha': ws.sha}
+        # Pre-flight against the snapshot: a patch that does not apply,
+        # compile, parse or pass its tests never becomes a PR or a build
+        report = checker.check(ws.path, content)
+        if not report['ok']:
+            reason = summary(report)
+            trace.hop(error['correlationId'], 'fix', start=error.get('recordedAt') or error.get('timestamp'),
+                      attributes={'service': error.get('service')}, error=f"preflight: {reason}")
+            return {'status': 'PREFLIGHT_FAILED', 'error': reason, 'checks': report['checks'],
+                    'preflight_s': report['seconds'], 'sha': ws.sha}
+        title = f"Auto-fix for {error['service']} ({error['correlationId']})"
+        head = f"auto-fix/{error['service']}-{error['correlationId']}"
+        pr, failure = {}, None
+        try:
+            _, _, body = shared_pool().request(
+                "POST", "https://api.github.com/repos/${ORG}/${REPO}/pulls",
+                body=json.dumps({'title': title, 'head': head, 'base': 'main', 'body': content}),
+                headers={"Authorization": "Bearer ${GITHUB_TOKEN}", "Content-Type": "application/json"})
+            pr = json.loads(body or b'{}')
+        except HttpError as e:
+            failure = str(e)
+        # The incident's fix hop: error recorded -> PR opened
+        trace.hop(error['correlationId'], 'fix', start=error.get('recordedAt') or error.get('timestamp'),
+                  attributes={'service': error.get('service'), 'pr': pr.get('number')}, error=failure)
+        if failure:
+            return {'status': 'FAILED', 'error': failure, 'title': title, 'head': head, 'sha': ws.sha,
+                    'preflight_s': report['seconds']}
+        return {'status': 'PR_OPENED', 'pr': pr.get('number'), 'title': title, 'head': head, 'sha': ws.sha,
+                'preflight_s': report['seconds']}
+    return fix
+
+scheduler = fix_scheduler('fix', lambda: FixScheduler(
+    make_handler(), workers=int('${FIX_WORKERS}'), max_queue=int('${FIX_QUEUE}'),
+    per_service=int('${FIX_PER_SERVICE}'), criticality=parse_criticality('${SERVICE_CRITICALITY}'),
+    overflow='${FIX_OVERFLOW}'))
+counts = occurrences(fetch_fingerprints.response)
+scheduler.update_occurrences(counts)
+feed = change_feed('${FIREBASE_DB_URL}', 'errors', depth=2, cursor_path='${FEED_CURSOR_DIR}/fix_generator-errors.json',
+                   autocommit=False)
+room = scheduler.room() if scheduler.overflow == 'block' else scheduler.max_queue
+idle_wait = 5 * float('${TIME_SCALE}')
+events = feed.poll(max_events=room, timeout=idle_wait if scheduler.idle() else 0) if room else []
+for event in events:
+    # keys are {service}/{id}
+    error_id = event['key'].split('/')[-1]
+    data = event['data']
+    error = dict(data, id=error_id, correlationId=data.get('correlationId') or correlation_id(error_id))
+    scheduler.offer(error, occurrences=counts.get((error.get('service'), error.get('fingerprint')), 1))
+done = scheduler.results(timeout=0 if events else idle_wait)
+if not done:
+    return None
+ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+updates = {f"pr-requests/{r['id']}": dict(r, timestamp=ts) for r in done}
+updates['fix-scheduler/metrics'] = dict(scheduler.metrics(), timestamp=ts)
+# feed keys are {service}/{id}, as the Error Analyzer writes them
+return {'count': len(done), 'fix_payload': json.dumps(updates), 'keys': [f"{r['service']}/{r['id']}" for r in done]}
+"""
 )
 
-step_pr = Step(
-    name="create_branch_and_patch",
-    tool_name="create_branch_and_patch",
-    when="generate_patch.response.predictions[0].content != null"
+step_record = Step(
+    name="record_fixes",
+    tool_name="record_fixes",
+    when="schedule_fixes.result != null",
+    arguments={"fix_payload": "{{schedule_fixes.result.fix_payload}}"}
 )
 
-step_wait = Step(
-    name="wait",
-    run="wait 5s"
+# commit_errors - move the /errors cursor past the errors whose outcome is
+# now in RTDB; if the write failed they stay uncommitted and come back after
+# a restart
+step_commit = Step(
+    name="commit_errors",
+    when="schedule_fixes.result != null",
+    run="""
+from rtdb_stream import change_feed
+if record_fixes.error:
+    return None
+feed = change_feed('${FIREBASE_DB_URL}', 'errors', depth=2, cursor_path='${FEED_CURSOR_DIR}/fix_generator-errors.json',
+                   autocommit=False)
+feed.ack(schedule_fixes.result['keys'])
+return {'committed': len(schedule_fixes.result['keys'])}
+"""
 )
 
 # Assemble workflow
 demo_wf = Workflow(
     display_name="Fix Generator Workflow",
-    steps=[step_fetch, step_clone, step_patch, step_pr, step_wait],
-    repeat_step_name="fetch_structured_error"
+    steps=[step_fingerprints, step_schedule, step_record, step_commit],
+    repeat_step_name="fetch_fingerprints"
 )
 
 # Create the agent
 agent = client.create_agent(
     display_name="Fix Generator Agent",
     description="Generates code or config patches for detected errors and opens a PR.",
-    tools=[fetch_structured_error, clone_repo, generate_patch, create_branch_and_patch],
+    tools=[fetch_fingerprints, record_fixes],
     workflow=demo_wf
 )
 print(f"Created agent: {agent.name}")
@@ -0,0 +1,273 @@
+# fix_scheduler.py
+# Bounded priority queue and worker pool for the Fix Generator
+
+import contextvars
+import heapq
+import re
+import threading
+import time
+from collections import deque
+
+from tracing import percentiles
+
+# Highest matching level wins; anything else is 1
+_SEVERITY = [
+    (3, re.compile(r"OOMKilled|Out of memory|MemoryError|OutOfMemoryError|CrashLoopBackOff|"
+                   r"^panic:|fatal error:|Segmentation fault|SIGSEGV|SIGKILL", re.I | re.M)),
+    (2, re.compile(r"Traceback \(most recent call last\)|Exception|\w+Error\b|^\s+at [\w.$]+\(", re.M)),
+]
+
+
+def severity(record):
+    # 3 crash / out of memory, 2 unhandled exception, 1 anything else; a
+    # numeric "severity" on the record wins
+    if isinstance(record.get("severity"), (int, float)):
+        return record["severity"]
+    message = str(record.get("errorMessage") or "")
+    for level, pattern in _SEVERITY:
+        if pattern.search(message):
+            return level
+    return 1
+
+
+def parse_criticality(text):
+    # "payments=3,checkout=2" -> {"payments": 3, "checkout": 2}; unlisted services are 1
+    out = {}
+    for item in (text or "").split(","):
+        name, sep, value = item.strip().partition("=")
+        if sep:
+            out[name.strip()] = float(value)
+    return out
+
+
+def _frequency(occurrences):
+    # Occurrence counts in doubling buckets (1, 2-3, 4-7, ...), so a few
+    # extra repeats do not outrank a more critical service
+    return max(int(occurrences or 1), 1).bit_length()
+
+
+class FixScheduler:
+    # Errors offered by the Fix Generator wait in a queue of at most
+    # max_queue, ordered by severity, then occurrence frequency, then service
+    # criticality (FIFO among equals). `workers` threads each take the most
+    # urgent error whose service has fewer than per_service fixes running, so
+    # one noisy service cannot hold every worker, and run handler(record);
+    # the dict it returns (or the exception) is reported through results().
+    #
+    # When the queue is full, overflow="block" makes offer() wait for room
+    # (callers can also pull only room() errors at a time), overflow="shed"
+    # moves the least urgent error, which may be the one being offered, out
+    # of the queue into a parked set. Parked errors go back into the queue,
+    # most urgent first, as fixes finish; only the least urgent beyond
+    # max_parked are forgotten (counted as dropped), so a caller that commits
+    # an error only once its result is in gets them again after a restart.
+    def __init__(self, handler, workers=4, max_queue=100, per_service=2, criticality=None, overflow="block",
+                 max_parked=None, clock=time.monotonic):
+        if overflow not in ("block", "shed"):
+            raise ValueError(f"overflow must be 'block' or 'shed', not {overflow!r}")
+        self.handler = handler
+        self.max_queue = max_queue
+        self.per_service = per_service
+        self.criticality = criticality or {}
+        self.overflow = overflow
+        self.max_parked = max_parked if max_parked is not None else 10 * max_queue
+        self.clock = clock
+        self.queue = []
+        self.parked = []
+        self.running = {}
+        self.known = set()
+        self.finished = []
+        self.waits = deque(maxlen=1000)
+        self.durations = deque(maxlen=1000)
+        self.completions = deque()
+        self.outcomes = {}
+        self.stats = {"offered": 0, "duplicates": 0, "completed": 0, "failed": 0, "shed": 0, "requeued": 0,
+                      "dropped": 0, "rejected": 0}
+        self._seq = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        # Workers run in the creator's context, so the requests a fix makes
+        # count for the creator's agent loop (loop_scheduler.current_loop)
+        self._threads = [threading.Thread(target=contextvars.copy_context().run, args=(self._work,),
+                                          name=f"fix-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _key(self, record, occurrences):
+        return (-severity(record), -_frequency(occurrences), -self.criticality.get(record.get("service"), 1.0))
+
+    def room(self):
+        with self._cond:
+            return max(self.max_queue - len(self.queue), 0)
+
+    def offer(self, record, occurrences=1, timeout=None):
+        # "queued", "duplicate" (already queued or running), "shed" (dropped
+        # to keep the queue bounded) or "rejected" (no room within timeout)
+        with self._cond:
+            self.stats["offered"] += 1
+            rid = record.get("id")
+            if rid is not None and rid in self.known:
+                self.stats["duplicates"] += 1
+                return "duplicate"
+            key = self._key(record, occurrences)
+            if len(self.queue) >= self.max_queue:
+                if self.overflow == "block":
+                    if not self._cond.wait_for(lambda: len(self.queue) < self.max_queue or self._closed, timeout) \
+                            or self._closed:
+                        self.stats["rejected"] += 1
+                        return "rejected"
+                else:
+                    self._seq += 1
+                    entry = [key, self._seq, record, occurrences, self.clock()]
+                    worst = max(self.queue)
+                    if worst[:2] <= entry[:2]:
+                        self._park(entry)
+                        if rid is not None:
+                            self.known.add(rid)
+                        return "shed"
+                    self.queue.remove(worst)
+                    heapq.heapify(self.queue)
+                    self._park(worst)
+            self._seq += 1
+            heapq.heappush(self.queue, [key, self._seq, record, occurrences, self.clock()])
+            if rid is not None:
+                self.known.add(rid)
+            self._cond.notify_all()
+            return "queued"
+
+    def _park(self, entry):
+        # Shed from the queue, kept for later; caller holds the lock. The
+        # parked heap is ordered like the queue, so the least urgent go first.
+        self.stats["shed"] += 1
+        heapq.heappush(self.parked, entry)
+        if len(self.parked) > self.max_parked:
+            worst = max(self.parked)
+            self.parked.remove(worst)
+            heapq.heapify(self.parked)
+            self.known.discard(worst[2].get("id"))
+            self.stats["dropped"] += 1
+
+    def _unpark(self):
+        # Refill the queue from the parked errors; caller holds the lock
+        while self.parked and len(self.queue) < self.max_queue:
+            heapq.heappush(self.queue, heapq.heappop(self.parked))
+            self.stats["requeued"] += 1
+
+    def update_occurrences(self, counts):
+        # New occurrence counts {(service, fingerprint): count} re-rank the
+        # queued errors they belong to
+        with self._cond:
+            changed = False
+            for entry in self.queue:
+                record = entry[2]
+                count = counts.get((record.get("service"), record.get("fingerprint")))
+                if count is not None and count != entry[3]:
+                    entry[3] = count
+                    entry[0] = self._key(record, count)
+                    changed = True
+            if changed:
+                heapq.heapify(self.queue)
+
+    def _take(self):
+        # Most urgent entry whose service is under its cap; caller holds the lock
+        skipped, entry = [], None
+        while self.queue:
+            candidate = heapq.heappop(self.queue)
+            if self.running.get(candidate[2].get("service"), 0) < self.per_service:
+                entry = candidate
+                break
+            skipped.append(candidate)
+        for item in skipped:
+            heapq.heappush(self.queue, item)
+        return entry
+
+    def _work(self):
+        while True:
+            with self._cond:
+                entry = None
+                while not self._closed and (entry := self._take()) is None:
+                    self._cond.wait()
+                if entry is None:
+                    return
+                _, _, record, _, queued_at = entry
+                service = record.get("service")
+                self.running[service] = self.running.get(service, 0) + 1
+                started = self.clock()
+                self.waits.append(started - queued_at)
+                # A slot opened up for parked errors and offer() callers waiting on room
+                self._unpark()
+                self._cond.notify_all()
+            try:
+                outcome = dict(self.handler(record) or {})
+                outcome.setdefault("status", "DONE")
+            except Exception as e:
+                outcome = {"status": "FAILED", "error": f"{type(e).__name__}: {e}"}
+            finished = self.clock()
+            with self._cond:
+                self.running[service] -= 1
+                self.known.discard(record.get("id"))
+                self.durations.append(finished - started)
+                self.completions.append(finished)
+                self.stats["failed" if outcome["status"] == "FAILED" else "completed"] += 1
+                self.outcomes[outcome["status"]] = self.outcomes.get(outcome["status"], 0) + 1
+                self.finished.append({"id": record.get("id"), "service": service,
+                                      "correlationId": record.get("correlationId"), **outcome,
+                                      "waited_s": round(started - queued_at, 3),
+                                      "took_s": round(finished - started, 3)})
+                self._cond.notify_all()
+
+    def results(self, timeout=0.0):
+        # Outcomes finished since the last call, waiting up to `timeout`
+        # seconds for the first one while fixes are queued or running
+        with self._cond:
+            if not self.finished and timeout:
+                self._cond.wait_for(lambda: self.finished or self._closed, timeout)
+            out, self.finished = self.finished, []
+            return out
+
+    def idle(self):
+        with self._cond:
+            return not self.queue and not self.parked and not any(self.running.values())
+
+    def metrics(self, window=300.0):
+        # Queue depth, running fixes, wait / handling time percentiles,
+        # completions per minute over the last `window` seconds and handler
+        # outcomes by status
+        now = self.clock()
+        with self._cond:
+            while self.completions and self.completions[0] < now - window:
+                self.completions.popleft()
+            queued = {}
+            for entry in self.queue:
+                service = entry[2].get("service")
+                queued[service] = queued.get(service, 0) + 1
+            return {
+                "depth": len(self.queue),
+                "parked": len(self.parked),
+                "queued_by_service": queued,
+                "running": {s: n for s, n in self.running.items() if n},
+                "wait_s": percentiles(self.waits),
+                "handle_s": percentiles(self.durations),
+                "throughput_per_min": round(len(self.completions) * 60.0 / window, 2),
+                "outcomes": dict(self.outcomes),
+                **self.stats,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def fix_scheduler(name, factory):
+    # Process-wide scheduler per name; factory() builds it on first use
+    with _schedulers_lock:
+        scheduler = _schedulers.get(name)
+        if scheduler is None:
+            scheduler = _schedulers[name] = factory()
+        return scheduler
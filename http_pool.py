@@ -0,0 +1,382 @@
+# http_pool.py
+# Keep-alive HTTP connection pool shared by the agent helpers and tool calls, with
+# per-API retry and rate-limit policies
+
+import asyncio
+import email.utils
+import http.client
+import queue
+import random
+import threading
+import time
+import urllib.parse
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# 429 means the request was not processed, so it is retried for any method;
+# 5xx and dropped connections only where repeating the request is harmless:
+# reads, and writes that set state (every PUT/PATCH/DELETE here is an RTDB
+# write or a deployment image). A POST creates something (a build, a PR, an
+# email) unless its API's Policy says otherwise.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+IDEMPOTENT_METHODS = SAFE_METHODS | {"PUT", "PATCH", "DELETE"}
+
+
+# URL prefix -> replacement, longest prefix first (see route())
+_routes = []
+_routes_lock = threading.Lock()
+
+
+def route(prefix, target):
+    # Send every request whose URL starts with `prefix` to `target` instead,
+    # e.g. route("https://pubsub.googleapis.com", standin.url) so tools and
+    # helpers can run against local stand-ins unchanged
+    with _routes_lock:
+        _routes[:] = sorted([(p, t) for p, t in _routes if p != prefix] + [(prefix, target.rstrip("/"))],
+                            key=lambda r: -len(r[0]))
+
+
+def clear_routes():
+    with _routes_lock:
+        _routes.clear()
+
+
+def resolve(url):
+    # `url` with the longest matching route applied
+    for prefix, target in _routes:
+        if url.startswith(prefix):
+            return target + url[len(prefix):]
+    return url
+
+
+# Callables told (method, url) of every request sent, before routing; see add_listener()
+_listeners = []
+
+
+def add_listener(listener):
+    # listener(method, url) is called for every attempt either client sends,
+    # on the sending thread, so it must be quick and thread-safe
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def _notify(method, url):
+    for listener in list(_listeners):
+        listener(method, url)
+
+
+class HttpError(Exception):
+    def __init__(self, status, body, url, headers=None):
+        super().__init__(f"HTTP {status} from {url}")
+        self.status = status
+        self.body = body
+        self.url = url
+        self.headers = headers or {}
+
+
+class TokenBucket:
+    # `rate` requests per second with bursts of up to `burst`. reserve()
+    # takes a token and returns how long the caller has to wait before
+    # sending, so waiting callers queue up in order instead of racing.
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds):
+        # The API asked us to back off (Retry-After): nobody sends for `seconds`
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+def retry_after(headers):
+    # Retry-After in seconds (delta-seconds or HTTP-date), None if absent
+    value = next((v for k, v in (headers or {}).items() if k.lower() == "retry-after"), None)
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class Policy:
+    # Retry and rate-limit rules for one API:
+    #   rate, burst   token bucket for requests whose method is in `methods`
+    #                 (all methods when None); a Retry-After pauses the bucket
+    #   retries       further attempts after a 429 / 5xx / dropped connection,
+    #                 with full-jitter exponential backoff from `backoff`
+    #                 seconds up to max_backoff, and never sooner than
+    #                 Retry-After; a Retry-After over max_retry_after gives up
+    #   idempotent    True for APIs whose POSTs are safe to repeat after a 5xx
+    #                 (queries, acks, deduplicated inserts); other POSTs only
+    #                 retry 429s, since a second attempt could act twice
+    def __init__(self, rate=None, burst=1, methods=None, retries=4, backoff=0.5, max_backoff=30.0,
+                 max_retry_after=120.0, idempotent=False):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.methods = set(methods) if methods else None
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.idempotent = idempotent
+
+    def limited(self, method):
+        return self.bucket is not None and (self.methods is None or method in self.methods)
+
+    def repeatable(self, method):
+        return self.idempotent or method in IDEMPOTENT_METHODS
+
+    def retry_delay(self, attempt, method, error):
+        # Seconds to wait before retry number `attempt` (1-based) after
+        # `error`, or None when it should be raised
+        if attempt > self.retries:
+            return None
+        if isinstance(error, HttpError):
+            after = retry_after(error.headers)
+            # GitHub reports secondary rate limits as 403 + Retry-After
+            limited = error.status == 429 or (error.status == 403 and after is not None)
+            if not limited and (error.status not in RETRY_STATUSES or not self.repeatable(method)):
+                return None
+        elif isinstance(error, TimeoutError) or not self.repeatable(method):
+            # A timeout is the caller's deadline, not a transient failure
+            return None
+        else:
+            after = None
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        if after is not None:
+            if after > self.max_retry_after:
+                return None
+            delay = max(delay, after)
+            if self.bucket is not None:
+                self.bucket.pause(after)
+        return delay
+
+
+NO_RETRY = Policy(retries=0)
+
+# URL prefix -> Policy, longest prefix first; matched against the URL before
+# routing, so a stand-in gets the policy of the API it stands in for
+_policies = []
+_policies_lock = threading.Lock()
+_default_policy = Policy()
+
+
+def set_policy(prefix, policy):
+    with _policies_lock:
+        _policies[:] = sorted([(p, x) for p, x in _policies if p != prefix] + [(prefix, policy)],
+                              key=lambda r: -len(r[0]))
+
+
+def policy_for(url):
+    for prefix, policy in _policies:
+        if url.startswith(prefix):
+            return policy
+    return _default_policy
+
+
+# GitHub's secondary rate limits allow roughly one content-creating request
+# per second. POSTs to GitHub, SendGrid and Cloud Build (a second PR, email
+# or build) fall back to the default and only retry 429s; these APIs' POSTs
+# are reads, acks or inserts BigQuery deduplicates by insertId.
+set_policy("https://api.github.com", Policy(rate=1.0, burst=5, methods={"POST", "PATCH", "PUT", "DELETE"}))
+for _prefix in ("https://pubsub.googleapis.com", "https://monitoring.googleapis.com",
+                "https://text-bison.googleapis.com", "https://bigquery.googleapis.com"):
+    set_policy(_prefix, Policy(idempotent=True))
+
+
+class ConnectionPool:
+    # Up to max_per_host idle keep-alive connections per (scheme, host, port).
+    # Connections are checked out for one request/response and returned
+    # afterwards; a connection that errors is dropped instead of reused.
+    # Every request follows the Policy of its URL (policy_for) unless one is
+    # passed in.
+    def __init__(self, max_per_host=10, timeout=30, sleep=time.sleep):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.sleep = sleep
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "connections_opened": 0, "connections_reused": 0, "retries": 0,
+                      "throttled_s": 0.0}
+
+    def _checkout(self, scheme, netloc, timeout):
+        key = (scheme, netloc)
+        with self.lock:
+            q = self.idle.setdefault(key, queue.LifoQueue())
+        try:
+            conn = q.get_nowait()
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            with self.lock:
+                self.stats["connections_reused"] += 1
+            return key, conn
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            with self.lock:
+                self.stats["connections_opened"] += 1
+            return key, cls(netloc, timeout=timeout)
+
+    def _checkin(self, key, conn):
+        q = self.idle[key]
+        if q.qsize() < self.max_per_host:
+            q.put(conn)
+        else:
+            conn.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=None, policy=None):
+        # Returns (status, headers, body bytes); raises HttpError for >= 400
+        # once the policy gives up
+        policy = policy or policy_for(url)
+        attempt = 0
+        while True:
+            if policy.limited(method):
+                self._wait(policy.bucket.reserve())
+            try:
+                return self._send(method, url, body, headers, timeout)
+            except (HttpError, OSError, http.client.HTTPException) as e:
+                attempt += 1
+                delay = policy.retry_delay(attempt, method, e)
+                if delay is None:
+                    raise
+            with self.lock:
+                self.stats["retries"] += 1
+            self.sleep(delay)
+
+    def _wait(self, seconds):
+        if seconds > 0:
+            with self.lock:
+                self.stats["throttled_s"] += seconds
+            self.sleep(seconds)
+
+    def _send(self, method, url, body, headers, timeout):
+        _notify(method, url)
+        parts = urllib.parse.urlsplit(resolve(url))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        if isinstance(body, str):
+            body = body.encode()
+        key, conn = self._checkout(parts.scheme, parts.netloc, timeout or self.timeout)
+        with self.lock:
+            self.stats["requests"] += 1
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            resp = conn.getresponse()
+            data = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._checkin(key, conn)
+        if resp.status >= 400:
+            raise HttpError(resp.status, data, url, dict(resp.getheaders()))
+        return resp.status, dict(resp.getheaders()), data
+
+    def close(self):
+        with self.lock:
+            queues, self.idle = list(self.idle.values()), {}
+        for q in queues:
+            while not q.empty():
+                q.get_nowait().close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool():
+    # Process-wide pool so every helper in an agent process reuses the same
+    # keep-alive connections across workflow cycles
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ConnectionPool()
+        return _shared
+
+
+class AsyncExecutor:
+    # awaitable request() for tool calls on an event loop, with the same
+    # per-API policies as ConnectionPool; throttling and backoff are asyncio
+    # sleeps, so a rate-limited API holds no thread. Requests go over one
+    # httpx.AsyncClient (HTTP/2 where the server negotiates it and h2 is
+    # installed) when httpx is available, otherwise over the shared pool on
+    # worker threads.
+    def __init__(self, pool=None, http2=True, max_connections=100):
+        self.pool = pool or shared_pool()
+        self.client = None
+        self.stats = {"requests": 0, "retries": 0, "throttled_s": 0.0}
+        if httpx is not None:
+            limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            try:
+                self.client = httpx.AsyncClient(http2=http2, limits=limits, timeout=self.pool.timeout)
+            except ImportError:
+                # http2=True without the h2 package
+                self.client = httpx.AsyncClient(limits=limits, timeout=self.pool.timeout)
+
+    async def _send(self, method, url, body, headers, timeout):
+        if self.client is None:
+            return await asyncio.to_thread(self.pool.request, method, url, body, headers, timeout, NO_RETRY)
+        _notify(method, url)
+        try:
+            resp = await self.client.request(method, resolve(url), content=body, headers=headers,
+                                             timeout=timeout or self.pool.timeout)
+        except httpx.TimeoutException as e:
+            raise TimeoutError(str(e)) from e
+        except httpx.TransportError as e:
+            raise ConnectionError(str(e)) from e
+        if resp.status_code >= 400:
+            raise HttpError(resp.status_code, resp.content, url, dict(resp.headers))
+        return resp.status_code, dict(resp.headers), resp.content
+
+    async def request(self, method, url, body=None, headers=None, timeout=None, policy=None):
+        policy = policy or policy_for(url)
+        if isinstance(body, str):
+            body = body.encode()
+        attempt = 0
+        while True:
+            if policy.limited(method):
+                wait = policy.bucket.reserve()
+                if wait > 0:
+                    self.stats["throttled_s"] += wait
+                    await asyncio.sleep(wait)
+            self.stats["requests"] += 1
+            try:
+                return await self._send(method, url, body, headers or {}, timeout)
+            except (HttpError, OSError, http.client.HTTPException) as e:
+                attempt += 1
+                delay = policy.retry_delay(attempt, method, e)
+                if delay is None:
+                    raise
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
@@ -0,0 +1,176 @@
+# llm_cache.py
+# Content-addressed prompt/response cache shared by generate_patch and generate_risk_patch
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from http_pool import shared_pool
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    return _WS.sub(" ", prompt or "").strip()
+
+
+class PromptCache:
+    # Two tiers: an in-memory LRU of max_entries responses in front of an
+    # on-disk directory capped at max_bytes (oldest files evicted first).
+    # Entries expire ttl seconds after they were stored. The disk tier can be
+    # shared by several agents pointing at the same directory.
+    def __init__(self, directory, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=24 * 3600,
+                 normalize=normalize_prompt):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.normalize = normalize
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                      "memory_evictions": 0, "disk_evictions": 0, "expired": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, prompt, model, params=None):
+        material = json.dumps(
+            {"model": model, "params": params or {}, "prompt": self.normalize(prompt)},
+            sort_keys=True, separators=(",", ":"),
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry["expires"] > now:
+                    self.memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry["response"]
+                del self.memory[key]
+                self.stats["expired"] += 1
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        with self.lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry["expires"] <= now:
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                self._unlink(key)
+                return None
+            self.stats["disk_hits"] += 1
+            self._remember(key, entry)
+            return entry["response"]
+
+    def put(self, key, response, now=None):
+        now = time.time() if now is None else now
+        entry = {"expires": now + self.ttl, "response": response}
+        # Write-then-rename so concurrent readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._path(key))
+        with self.lock:
+            self._remember(key, entry)
+        self._evict_disk()
+
+    def get_or_call(self, prompt, model, params, call, cacheable=None):
+        # A response cacheable(response) rejects is returned but not stored,
+        # so the next call asks again
+        key = self.key(prompt, model, params)
+        response = self.get(key)
+        if response is None:
+            response = call()
+            if response is not None and (cacheable is None or cacheable(response)):
+                self.put(key, response)
+        return response
+
+    def _remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    def _unlink(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        files = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, name in sorted(files):
+            self._unlink(name[:-len(".json")])
+            with self.lock:
+                self.stats["disk_evictions"] += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+def has_prediction(response):
+    # Whether a predict response holds non-empty content; an empty or blocked
+    # prediction is not worth caching
+    return bool(((response or {}).get("predictions") or [{}])[0].get("content"))
+
+
+def cached_predict(cache, url, prompt, parameters=None, headers=None, timeout=60, key=None, pool=None):
+    # POST a single-instance text-bison :predict through the cache and return
+    # the raw predict response ({"predictions": [...]}). `key`, when given,
+    # is what the cache keys on instead of the prompt. Only responses with
+    # content are cached. Misses go through the shared pool, so they get
+    # text-bison's Policy and count against loop budgets like any other
+    # request.
+    model = url.rsplit("/models/", 1)[-1].split(":")[0]
+
+    def call():
+        body = {"instances": [{"prompt": prompt}]}
+        if parameters:
+            body["parameters"] = parameters
+        _, _, data = (pool or shared_pool()).request(
+            "POST", url, body=json.dumps(body),
+            headers={"Content-Type": "application/json", **(headers or {})}, timeout=timeout)
+        return json.loads(data)
+
+    return cache.get_or_call(prompt if key is None else key, model, parameters, call, has_prediction)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def prompt_cache(name, factory):
+    # Process-wide cache per name, so its memory tier survives across workflow
+    # cycles and is shared by agents in one process ('llm')
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = factory()
+        return cache
@@ -0,0 +1,597 @@
+# local_runtime.py
+# Runs all six agent workflows in one process on asyncio, and deploys them idempotently by definition hash
+#
+#   python local_runtime.py run [--standins] [--cycles N] [--time-scale S] [agent ...]
+#       Loads the Tool / Step / Workflow definitions of every agent module and
+#       runs their workflows side by side: run steps execute on worker
+#       threads, tool calls go through one AsyncExecutor (keep-alive pool,
+#       per-API retries and rate limits) and "wait Ns" steps are asyncio
+#       sleeps. With LOOP_SCHEDULER=adaptive one loop_scheduler paces every
+#       loop instead: adaptive intervals, wake-ups from upstream agents and
+#       API budgets. --standins points all Google / GitHub / SendGrid URLs at
+#       the local stand-ins. --time-scale also scales the waits inside run
+#       steps (${TIME_SCALE}).
+#   python local_runtime.py deploy [--force] [--state PATH]
+#       Creates or updates the agents on AI Platform in parallel, skipping
+#       every agent whose definition (and the .env values it references) is
+#       unchanged since the last deploy.
+
+import argparse
+import asyncio
+import builtins
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import runpy
+import secrets
+import sys
+import tempfile
+import textwrap
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from http_pool import AsyncExecutor, HttpError, clear_routes, route, shared_pool
+from loop_scheduler import LOOPS, current_loop, from_env, parse_intervals
+from step_templates import StepResult, Template, compile_condition, compile_path, substitute_env
+from tracing import tracer
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+AGENT_MODULES = [
+    "error_analyzer.py",
+    "fix_generator.py",
+    "risk_mitigation_agent.py",
+    "build_and_test_agent.py",
+    "deploy_agent.py",
+    "reporter_agent.py",
+]
+
+DEFAULT_STATE = os.path.join(ROOT, ".agents-deployed.json")
+
+_ENV_REF = re.compile(r"\$\{(\w+)\}")
+_WAIT = re.compile(r"^\s*wait\s+(\d+(?:\.\d+)?)s\s*$")
+
+
+# --- ADK definitions ---------------------------------------------------------
+# Local stand-ins for google.cloud.aiplatform.agent, installed while the agent
+# modules are loaded. Each keeps the keyword arguments it was built with, so a
+# definition can be hashed and replayed against the real ADK on deploy.
+
+class _Definition:
+    def __init__(self, **fields):
+        self.fields = fields
+        self.__dict__.update(fields)
+
+    def to_dict(self):
+        return {k: _plain(v) for k, v in self.fields.items()}
+
+
+class HttpRequestToolConfig(_Definition):
+    def __init__(self, method="GET", url="", headers=None, body=None, **extra):
+        super().__init__(method=method, url=url, headers=headers or {}, body=body, **extra)
+
+
+class Tool(_Definition):
+    def __init__(self, name, description="", http_request=None, **extra):
+        super().__init__(name=name, description=description, http_request=http_request, **extra)
+
+
+class Step(_Definition):
+    def __init__(self, name, tool_name=None, run=None, when=None, arguments=None, **extra):
+        super().__init__(name=name, tool_name=tool_name, run=run, when=when, arguments=arguments or {}, **extra)
+
+
+class Workflow(_Definition):
+    def __init__(self, display_name, steps, repeat_step_name=None, **extra):
+        super().__init__(display_name=display_name, steps=list(steps), repeat_step_name=repeat_step_name, **extra)
+
+
+class Parameter(_Definition):
+    pass
+
+
+class AgentDefinition(_Definition):
+    # What create_agent returns while loading: the agent as its module defined it
+    def __init__(self, display_name, description="", tools=(), workflow=None, source=None, **extra):
+        super().__init__(display_name=display_name, description=description, tools=list(tools),
+                         workflow=workflow, **extra)
+        self.source = source
+
+    @property
+    def name(self):
+        return f"local/{self.display_name}"
+
+
+def _plain(value):
+    if isinstance(value, _Definition):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    return value
+
+
+@contextlib.contextmanager
+def _local_adk(loaded, source):
+    # Temporarily provide google.cloud.aiplatform(.agent) backed by the
+    # classes above; create_agent records the definition instead of calling
+    # the API
+    class AgentClient:
+        def create_agent(self, display_name, description="", tools=(), workflow=None, **extra):
+            agent = AgentDefinition(display_name, description, tools, workflow, source=source[0], **extra)
+            loaded.append(agent)
+            return agent
+
+    agent_mod = types.ModuleType("google.cloud.aiplatform.agent")
+    for cls in (Tool, HttpRequestToolConfig, Step, Workflow, Parameter, AgentClient):
+        setattr(agent_mod, cls.__name__, cls)
+    aiplatform = types.ModuleType("google.cloud.aiplatform")
+    aiplatform.init = lambda **kwargs: None
+    aiplatform.agent = agent_mod
+    names = ["google", "google.cloud", "google.cloud.aiplatform", "google.cloud.aiplatform.agent"]
+    saved = {name: sys.modules.get(name) for name in names}
+    google = saved["google"] or types.ModuleType("google")
+    cloud = saved["google.cloud"] or types.ModuleType("google.cloud")
+    saved_attrs = (getattr(google, "cloud", None), getattr(cloud, "aiplatform", None))
+    google.cloud, cloud.aiplatform = cloud, aiplatform
+    sys.modules.update({"google": google, "google.cloud": cloud,
+                        "google.cloud.aiplatform": aiplatform, "google.cloud.aiplatform.agent": agent_mod})
+    try:
+        yield
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        if saved["google"] is not None:
+            google.cloud = saved_attrs[0]
+        if saved["google.cloud"] is not None:
+            cloud.aiplatform = saved_attrs[1]
+
+
+def load_definitions(modules=AGENT_MODULES, root=ROOT):
+    # [AgentDefinition] for every agent module, loaded without touching the API
+    loaded, source = [], [None]
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    with _local_adk(loaded, source):
+        for module in modules:
+            source[0] = module
+            with contextlib.redirect_stdout(io.StringIO()):
+                runpy.run_path(os.path.join(root, module), run_name="__agent__")
+    return loaded
+
+
+def load_env(path=os.path.join(ROOT, ".env"), environ=os.environ):
+    # KEY=VALUE lines of .env, overridden by the process environment
+    env = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#") and "=" in line:
+                    key, value = line.split("=", 1)
+                    env[key.strip()] = value.strip().strip('"')
+    env.update(environ)
+    return env
+
+
+# --- compilation -------------------------------------------------------------
+
+def compile_agent(agent):
+    # Every template and `when` of an agent compiled once, with references
+    # checked against its steps and tools. Returns (tools, conditions,
+    # arguments): tools {name: (method, url, {header: template}, body)},
+    # conditions {step: predicate}, arguments {step: {name: template}}.
+    # Raises ValueError naming the agent and the offending tool or step.
+    steps = {step.name for step in agent.workflow.steps}
+    tools, conditions, arguments = {}, {}, {}
+    for tool in agent.tools:
+        cfg = tool.http_request
+        try:
+            tools[tool.name] = (cfg.method, Template(cfg.url, steps),
+                                {k: Template(v, steps) for k, v in cfg.headers.items()},
+                                Template(cfg.body.strip(), steps, json_body=True) if cfg.body else None)
+        except ValueError as e:
+            raise ValueError(f"{agent.display_name}: tool {tool.name}: {e}") from None
+    for step in agent.workflow.steps:
+        try:
+            if step.tool_name and step.tool_name not in tools:
+                raise ValueError(f"unknown tool {step.tool_name!r}")
+            if step.when:
+                conditions[step.name] = compile_condition(step.when, steps)[0]
+            arguments[step.name] = {k: Template(v, steps) if isinstance(v, str) else v
+                                    for k, v in step.arguments.items()}
+        except ValueError as e:
+            raise ValueError(f"{agent.display_name}: step {step.name}: {e}") from None
+    repeat = agent.workflow.repeat_step_name
+    if repeat and repeat not in steps:
+        raise ValueError(f"{agent.display_name}: unknown repeat_step_name {repeat!r}")
+    return tools, conditions, arguments
+
+
+# --- workflow execution ------------------------------------------------------
+
+class AgentRunner:
+    # One agent's workflow: steps in order, a false `when` skips its step, and
+    # after the last step the loop restarts at repeat_step_name with that
+    # step's and every later step's results cleared. A failing step is logged
+    # and counts as having returned None. With TRACE_EXPORT set, every cycle
+    # is a trace: a span per cycle, per executed step and per tool call.
+    #
+    # With a scheduler (loop_scheduler), wait steps do not sleep: after every
+    # cycle the runner reports whether it was active (its LOOPS entry) and
+    # waits as long as the scheduler says. The interval bounds come from
+    # LOOP_INTERVALS, else LOOPS, and a wait step's seconds are the maximum.
+    def __init__(self, agent, env, executor=None, time_scale=1.0, log=print, scheduler=None):
+        self.agent = agent
+        self.env = env
+        self.executor = executor or AsyncExecutor()
+        self.time_scale = time_scale
+        self.log = log
+        self.steps = agent.workflow.steps
+        names = [step.name for step in self.steps]
+        self.repeat = names.index(agent.workflow.repeat_step_name) if agent.workflow.repeat_step_name else 0
+        self.tools, self.conditions, self.arguments = compile_agent(agent)
+        self.code = {step.name: self._compile(step) for step in self.steps if step.run}
+        self.stats = {"cycles": 0, "steps": 0, "skipped": 0, "errors": 0, "tool_calls": 0}
+        self.tracer = tracer(agent.display_name, env.get("TRACE_EXPORT"))
+        self.scheduler = scheduler
+        self.loop = (agent.source or agent.display_name).rsplit(".", 1)[0]
+        if scheduler is not None:
+            self._schedule(env)
+
+    def _schedule(self, env):
+        spec = LOOPS.get(self.loop, {})
+        low, high = spec.get("interval", (1, 60))
+        waits = [code for code in self.code.values() if isinstance(code, float)]
+        if waits:
+            high = max(waits)
+        low, high = parse_intervals(env.get("LOOP_INTERVALS")).get(self.loop, (low, high))
+        steps = [step.name for step in self.steps]
+        try:
+            self.active = compile_condition(spec["active"], steps)[0] if "active" in spec else None
+            self.wake = compile_condition(spec["wake"], steps)[0] if "wake" in spec else None
+            self.detected = compile_path(spec["detected"], steps)[0] if "detected" in spec else None
+        except ValueError as e:
+            raise ValueError(f"{self.agent.display_name}: loop schedule: {e}") from None
+        self.scheduler.add(self.loop, low, high, spec.get("wakes", ()))
+
+    def _compile(self, step):
+        source = substitute_env(textwrap.dedent(step.run).strip("\n"), self.env)
+        wait = _WAIT.match(source)
+        if wait:
+            return float(wait.group(1))
+        body = textwrap.indent(source, "    ")
+        return compile(f"def __step__():\n{body}\n    return None\n", f"<{self.agent.display_name}:{step.name}>", "exec")
+
+    def _run_code(self, code, results):
+        namespace = {"__builtins__": builtins, "__name__": "__step__"}
+        namespace.update(results)
+        exec(code, namespace)
+        return namespace["__step__"]()
+
+    async def _call_tool(self, step, results, span):
+        method, url, headers, body = self.tools[step.tool_name]
+        arguments = {k: v.render(self.env, None, results) if isinstance(v, Template) else v
+                     for k, v in self.arguments[step.name].items()}
+        url = url.render(self.env, arguments, results)
+        headers = {k: v.render(self.env, arguments, results) for k, v in headers.items()}
+        body = body.render(self.env, arguments, results) if body else None
+        self.stats["tool_calls"] += 1
+        trace, parent = span
+        name = f"{method} {step.tool_name}"
+        attributes = {"http.method": method, "http.url": url.split("?", 1)[0]}
+        start = time.time()
+        try:
+            status, _, data = await self.executor.request(method, url, body=body or None, headers=headers)
+        except HttpError as e:
+            self.tracer.record(name, start, time.time(), trace, parent,
+                               dict(attributes, **{"http.status_code": e.status}), str(e))
+            return StepResult(status=e.status, responseBody=e.body.decode(errors="replace"), error=str(e))
+        except Exception as e:
+            self.tracer.record(name, start, time.time(), trace, parent, attributes,
+                               f"{type(e).__name__}: {e}")
+            raise
+        self.tracer.record(name, start, time.time(), trace, parent,
+                           dict(attributes, **{"http.status_code": status}))
+        return StepResult(responseBody=data.decode(errors="replace"), status=status)
+
+    async def run_step(self, step, results, cycle=(None, None)):
+        # cycle: (trace id, cycle span id) the step's span belongs to
+        check = self.conditions.get(step.name)
+        if check is not None and not check(results):
+            self.stats["skipped"] += 1
+            return StepResult(skipped=True)
+        self.stats["steps"] += 1
+        trace, span_id, start = cycle[0], secrets.token_hex(8), time.time()
+        kind = "tool" if step.tool_name else "wait" if isinstance(self.code[step.name], float) else "run"
+        try:
+            if kind == "tool":
+                outcome = await self._call_tool(step, results, (trace, span_id))
+            elif kind == "wait":
+                if self.scheduler is None:
+                    await asyncio.sleep(self.code[step.name] * self.time_scale)
+                outcome = StepResult()
+            else:
+                outcome = StepResult(result=await asyncio.to_thread(self._run_code, self.code[step.name], results))
+        except Exception as e:
+            outcome = StepResult(error=f"{type(e).__name__}: {e}")
+        if kind != "wait":
+            self.tracer.record(step.name, start, time.time(), trace, cycle[1], {"step.kind": kind},
+                               outcome.error, span_id)
+        if outcome.error:
+            self.stats["errors"] += 1
+            self.log(f"[{self.agent.display_name}] {step.name}: {outcome.error}")
+        return outcome
+
+    def _active(self, results):
+        # A cycle is active when its LOOPS condition holds, or, without one,
+        # when any run step returned something
+        if self.active is not None:
+            return self.active(results)
+        return any(not r.skipped and r.result is not None for r in results.values()
+                   if isinstance(r, StepResult))
+
+    async def run(self, cycles=None):
+        current_loop.set(self.loop)
+        results, i = {}, 0
+        cycle, start = (secrets.token_hex(16), secrets.token_hex(8)), time.time()
+        while True:
+            step = self.steps[i]
+            results[step.name] = await self.run_step(step, results, cycle)
+            i += 1
+            if i < len(self.steps):
+                continue
+            self.stats["cycles"] += 1
+            self.tracer.record("cycle", start, time.time(), cycle[0], None,
+                               {"cycle": self.stats["cycles"]}, span_id=cycle[1])
+            self.tracer.flush()
+            cycle, start = (secrets.token_hex(16), secrets.token_hex(8)), time.time()
+            if cycles is not None and self.stats["cycles"] >= cycles:
+                return self.stats
+            if self.scheduler is not None:
+                active = self._active(results)
+                if self.detected is not None:
+                    self.scheduler.detected(*(self.detected(results) or ()))
+                self.scheduler.done(self.loop, active, self.wake(results) if self.wake else None)
+                await self.scheduler.wait(self.loop, self.time_scale)
+            i = self.repeat
+            results = {s.name: results[s.name] for s in self.steps[:self.repeat]}
+
+
+async def run_agents(agents, env, cycles=None, time_scale=1.0, executor=None, log=print):
+    # Every agent's workflow as one task on this loop, all tool calls through
+    # one executor; returns their stats. Run steps scale their own waits by
+    # ${TIME_SCALE}, so it follows time_scale too.
+    env = dict(env, TIME_SCALE=str(time_scale))
+    own = executor is None
+    executor = executor or AsyncExecutor()
+    scheduler = scheduler_for(env, time_scale)
+    runners = [AgentRunner(agent, env, executor, time_scale, log, scheduler) for agent in agents]
+    try:
+        stats = await asyncio.gather(*(runner.run(cycles) for runner in runners))
+    finally:
+        if scheduler is not None:
+            scheduler.detach()
+            log(f"loop scheduler {json.dumps(scheduler.stats())}")
+        if own:
+            await executor.aclose()
+    return {runner.agent.display_name: s for runner, s in zip(runners, stats)}
+
+
+def scheduler_for(env, time_scale=1.0):
+    # The LOOP_SCHEDULER=adaptive scheduler charging every request, on a clock
+    # in workflow seconds (wall clock / time_scale), or None
+    scheduler = from_env(env, clock=lambda: time.monotonic() / time_scale)
+    return scheduler.attach() if scheduler is not None else None
+
+
+def start_standins(env):
+    # Start every stand-in, route the public API hosts to them and return
+    # (standins, env overrides). Cloud Monitoring starts without series, so
+    # the Risk Mitigation Agent finds nothing to do until memory is fed in.
+    # With EVENT_LOG set, RTDB is served from that event log database.
+    from local_standins import (FakeBigQuery, FakeCloudBuild, FakeGitHub, FakeGKE, FakeMonitoring,
+                                FakePubSub, FakeRTDB, FakeSendGrid, FakeTextBison, LogRTDB)
+    standins = {
+        "https://pubsub.googleapis.com": FakePubSub(),
+        "https://text-bison.googleapis.com": FakeTextBison(),
+        "https://api.github.com": FakeGitHub(),
+        "https://cloudbuild.googleapis.com": FakeCloudBuild(),
+        "https://container.googleapis.com": FakeGKE(),
+        "https://api.sendgrid.com": FakeSendGrid(),
+        "https://bigquery.googleapis.com": FakeBigQuery(),
+        "https://monitoring.googleapis.com": FakeMonitoring(),
+    }
+    log_path = env.get("EVENT_LOG", "")
+    if log_path and not log_path.startswith("${"):
+        from event_log import event_log
+        rtdb = LogRTDB(event_log(log_path)).start()
+    else:
+        rtdb = FakeRTDB().start()
+    for prefix, standin in standins.items():
+        route(prefix, standin.start().url)
+    standins["rtdb"] = rtdb
+    # A repository for the Fix Generator and Build & Test Agent to fetch
+    standins["https://api.github.com"].commit(env.get("ORG", "org"), env.get("REPO", "repo"),
+                                              {"app.py": b"print('ok')\n"})
+    scratch = tempfile.mkdtemp(prefix="agents-local-")
+    overrides = {
+        "FIREBASE_DB_URL": rtdb.url,
+        "ACCESS_TOKEN": "local",
+        "LLM_CACHE_DIR": os.path.join(scratch, "llm"),
+        "REPO_CACHE_DIR": os.path.join(scratch, "repos"),
+        "FEED_CURSOR_DIR": os.path.join(scratch, "cursors"),
+    }
+    return standins, overrides
+
+
+def stop_standins(standins):
+    clear_routes()
+    for standin in standins.values():
+        standin.stop()
+
+
+# --- deploy ------------------------------------------------------------------
+
+def definition_hash(agent, env):
+    # sha256 over the agent definition and the values of every ${VAR} it
+    # references, so a changed .env value redeploys exactly the agents using it
+    spec = agent.to_dict()
+    text = json.dumps(spec, sort_keys=True)
+    spec["env"] = {name: env.get(name) for name in sorted(set(_ENV_REF.findall(text)))}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def missing_env(agents, env):
+    # {VAR: [agent display names]} for ${VAR} references that neither env
+    # nor a step argument provides
+    missing = {}
+    for agent in agents:
+        arguments = {k for step in agent.workflow.steps for k in step.arguments}
+        for name in sorted(set(_ENV_REF.findall(json.dumps(agent.to_dict())))):
+            if name not in env and name not in arguments:
+                missing.setdefault(name, []).append(agent.display_name)
+    return missing
+
+
+def _adk_object(value, adk):
+    # Rebuild a local definition with the real ADK classes
+    if isinstance(value, _Definition) and not isinstance(value, AgentDefinition):
+        cls = getattr(adk, type(value).__name__)
+        return cls(**{k: _adk_object(v, adk) for k, v in value.fields.items()})
+    if isinstance(value, list):
+        return [_adk_object(v, adk) for v in value]
+    return value
+
+
+def _load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(path, state):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def deploy(agents, client, adk, env, state_path=DEFAULT_STATE, force=False, max_workers=6):
+    # Create or update every changed agent in parallel. An agent deployed
+    # before is updated in place, or deleted and created again by its
+    # recorded name where the client cannot update; never created twice.
+    # Returns [(display_name, "created" | "updated" | "replaced" |
+    # "unchanged" | "failed", detail)].
+    state = _load_state(state_path)
+    deleted = set()
+
+    def one(agent):
+        digest = definition_hash(agent, env)
+        known = state.get(agent.display_name)
+        if known and known.get("hash") == digest and not force:
+            return agent.display_name, "unchanged", known
+        fields = {k: _adk_object(v, adk) for k, v in agent.fields.items()}
+        try:
+            if known and known.get("name") and hasattr(client, "update_agent"):
+                deployed = client.update_agent(name=known["name"], **fields)
+                action = "updated"
+            elif known and known.get("name"):
+                if not hasattr(client, "delete_agent"):
+                    return agent.display_name, "failed", (f"{known['name']} is deployed and the client can "
+                                                          "neither update nor delete it")
+                client.delete_agent(name=known["name"])
+                # Gone now: if the create fails, the next deploy creates it
+                deleted.add(agent.display_name)
+                deployed = client.create_agent(**fields)
+                action = "replaced"
+            else:
+                deployed = client.create_agent(**fields)
+                action = "created"
+        except Exception as e:
+            return agent.display_name, "failed", f"{type(e).__name__}: {e}"
+        return agent.display_name, action, {"hash": digest, "name": deployed.name, "source": agent.source,
+                                            "deployed": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = list(executor.map(one, agents))
+    changed = {name: detail for name, action, detail in outcomes if action in ("created", "updated", "replaced")}
+    if changed or deleted:
+        _save_state(state_path, {**{k: v for k, v in state.items() if k not in deleted}, **changed})
+    return outcomes
+
+
+# --- CLI ---------------------------------------------------------------------
+
+def select_agents(agents, names):
+    if not names:
+        return agents
+    wanted = {n.lower() for n in names}
+    return [a for a in agents if a.display_name.lower() in wanted or
+            a.source.lower().rsplit(".", 1)[0] in wanted]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local agent runtime and incremental deploy")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="run the agent workflows in this process")
+    p.add_argument("agents", nargs="*", help="display names or module names (default: all)")
+    p.add_argument("--standins", action="store_true", help="route every API to local stand-ins")
+    p.add_argument("--cycles", type=int, default=None, help="stop each agent after N workflow cycles")
+    p.add_argument("--time-scale", type=float, default=1.0, help="multiplier for wait steps")
+    p = sub.add_parser("deploy", help="create or update changed agents on AI Platform")
+    p.add_argument("agents", nargs="*")
+    p.add_argument("--state", default=DEFAULT_STATE)
+    p.add_argument("--force", action="store_true", help="redeploy unchanged agents too")
+    args = parser.parse_args()
+
+    env = load_env()
+    agents = select_agents(load_definitions(), args.agents)
+    try:
+        for agent in agents:
+            compile_agent(agent)
+    except ValueError as e:
+        sys.exit(f"error: {e}")
+    for name, users in missing_env(agents, env).items():
+        print(f"warning: ${{{name}}} is not set (used by {', '.join(users)})", file=sys.stderr)
+    if args.command == "run":
+        standins = {}
+        if args.standins:
+            standins, overrides = start_standins(env)
+            env.update(overrides)
+        started = time.perf_counter()
+        try:
+            stats = asyncio.run(run_agents(agents, env, args.cycles, args.time_scale))
+        except KeyboardInterrupt:
+            stats = {}
+        finally:
+            if standins:
+                stop_standins(standins)
+        for name, s in stats.items():
+            print(f"{name:<24} {s}")
+        print(f"{len(agents)} agents, {time.perf_counter() - started:.1f}s, pool {shared_pool().stats}")
+        return
+
+    from google.cloud import aiplatform
+    from google.cloud.aiplatform import agent as adk
+    aiplatform.init(project=env.get("PROJECT_ID"), location=env.get("AI_REGION", "us-central1"))
+    outcomes = deploy(agents, adk.AgentClient(), adk, env, args.state, args.force)
+    for name, action, detail in outcomes:
+        print(f"{action:<9} {name}" + (f": {detail}" if action == "failed" else ""))
+    if any(action == "failed" for _, action, _ in outcomes):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
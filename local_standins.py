@@ -0,0 +1,944 @@
+# local_standins.py
+# Local HTTP stand-ins for the Google / GitHub / SendGrid APIs used by the agents
+
+import copy
+import hashlib
+import io
+import json
+import queue
+import random
+import sys
+import threading
+import time
+import types
+import urllib.parse
+import zipfile
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rtdb_bulk import push_id
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out and hang up (timeout tests) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandIn:
+    # Base stand-in: runs a threaded HTTP server on 127.0.0.1 with an ephemeral
+    # port, counts requests and can inject a fixed latency per request, errors
+    # (inject() / error_rate) and a rate limit (rate_limit()).
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, port=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.faults = []
+        self.limit = None
+        self.recent = deque()
+        self.rejected = {}
+        self.lock = threading.Lock()
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; with Nagle on, the
+            # body waits for the client's delayed ACK (~40ms per request)
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with standin.lock:
+                    standin.calls += 1
+                delay = standin.delay(self.command, self.path)
+                if delay:
+                    time.sleep(delay)
+                fault = standin.fault(self.command, self.path)
+                if fault:
+                    self.send_response(fault[0])
+                    for name, value in fault[1].items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                # handle() returns (status, payload) or (status, payload, extra_headers);
+                # a generator payload is streamed chunk by chunk until it ends
+                status, payload, *extra = standin.handle(self.command, self.path, body, self.headers)
+                if isinstance(payload, types.GeneratorType):
+                    self.send_response(status)
+                    for name, value in (extra[0] if extra else {}).items():
+                        self.send_header(name, value)
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.close_connection = True
+                    for chunk in payload:
+                        self.wfile.write(chunk)
+                        self.wfile.flush()
+                    return
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                headers = {"Content-Type": "application/json", **(extra[0] if extra else {})}
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+        self.server = _QuietServer(("127.0.0.1", port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def delay(self, method, path):
+        return self.latency
+
+    def inject(self, status, times=1, retry_after=None, method=None, path=None):
+        # The next `times` requests matching method / path prefix fail with
+        # `status` (and Retry-After) without reaching handle()
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+        with self.lock:
+            self.faults.append([status, times, headers, method, path])
+
+    def rate_limit(self, count, per, method=None, status=429):
+        # At most `count` matching requests per `per` seconds; the rest get
+        # `status` with Retry-After until the window has room again
+        with self.lock:
+            self.limit = (count, per, method, status)
+
+    def fault(self, method, path):
+        # (status, headers) to fail this request with, or None
+        with self.lock:
+            for fault in self.faults:
+                status, times, headers, m, p = fault
+                if (m is None or m == method) and (p is None or path.startswith(p)):
+                    fault[1] -= 1
+                    if fault[1] <= 0:
+                        self.faults.remove(fault)
+                    self.rejected[status] = self.rejected.get(status, 0) + 1
+                    return status, headers
+            if self.limit and (self.limit[2] is None or self.limit[2] == method):
+                count, per, _, status = self.limit
+                now = time.monotonic()
+                while self.recent and self.recent[0] <= now - per:
+                    self.recent.popleft()
+                if len(self.recent) >= count:
+                    self.rejected[status] = self.rejected.get(status, 0) + 1
+                    return status, {"Retry-After": str(max(int(self.recent[0] + per - now + 0.999), 1))}
+                self.recent.append(now)
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.rejected[503] = self.rejected.get(503, 0) + 1
+                return 503, {}
+        return None
+
+    def handle(self, method, path, body, headers):
+        return 404, {"error": {"code": 404, "message": f"{method} {path} not found"}}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakePubSub(StandIn):
+    # Minimal Pub/Sub subscription: POST .../subscriptions/{sub}:pull, :acknowledge
+    # and :modifyAckDeadline (counted; a 0s deadline requeues the messages). Pulled messages stay outstanding until
+    # acked. Messages published to a named subscription are pulled only from it; the rest from any.
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.backlog = deque()
+        self.subscriptions = {}
+        self.outstanding = {}
+        self.acked = 0
+        self.pulls = 0
+        self.ack_calls = 0
+        self.deadline_calls = 0
+        self._next_id = 0
+
+    def publish(self, data, attributes=None, subscription=None):
+        now = time.time()
+        with self.lock:
+            self._next_id += 1
+            msg_id = str(self._next_id)
+            backlog = self.backlog if subscription is None else self.subscriptions.setdefault(subscription, deque())
+            backlog.append({
+                "messageId": msg_id,
+                "data": json.dumps(data) if not isinstance(data, str) else data,
+                "attributes": attributes or {},
+                "publishTime": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)) + f".{int(now % 1 * 1000):03d}Z",
+            })
+            return msg_id
+
+    def pending(self, subscription):
+        # Messages of a named subscription not yet acked (queued or pulled)
+        with self.lock:
+            return len(self.subscriptions.get(subscription, ())) + \
+                sum(1 for sub, _ in self.outstanding.values() if sub == subscription)
+
+    def handle(self, method, path, body, headers):
+        req = json.loads(body or b"{}")
+        subscription = urllib.parse.urlsplit(path).path.rsplit("/", 1)[-1].split(":", 1)[0]
+        if method == "POST" and path.endswith(":pull"):
+            with self.lock:
+                self.pulls += 1
+                received = []
+                for backlog in (self.subscriptions.get(subscription, deque()), self.backlog):
+                    while backlog and len(received) < int(req.get("maxMessages", 1)):
+                        msg = backlog.popleft()
+                        ack_id = f"ack-{msg['messageId']}"
+                        self.outstanding[ack_id] = (subscription, msg)
+                        received.append({"ackId": ack_id, "message": msg})
+            return 200, {"receivedMessages": received} if received else {}
+        if method == "POST" and path.endswith(":acknowledge"):
+            with self.lock:
+                self.ack_calls += 1
+                for ack_id in req.get("ackIds", []):
+                    if self.outstanding.pop(ack_id, None) is not None:
+                        self.acked += 1
+            return 200, {}
+        if method == "POST" and path.endswith(":modifyAckDeadline"):
+            with self.lock:
+                self.deadline_calls += 1
+                if int(req.get("ackDeadlineSeconds", 1)) == 0:
+                    for ack_id in reversed(req.get("ackIds", [])):
+                        sub, msg = self.outstanding.pop(ack_id, (None, None))
+                        if msg is not None:
+                            backlog = self.subscriptions[sub] if sub in self.subscriptions else self.backlog
+                            backlog.appendleft(msg)
+            return 200, {}
+        return super().handle(method, path, body, headers)
+
+
+class FakeRTDB(StandIn):
+    # In-memory Firebase Realtime Database REST API: GET/PUT/PATCH/POST/DELETE on
+    # "/path.json", multi-location PATCH and orderBy="timestamp" with limitToLast.
+    # path_latency overrides the injected latency for top-level paths.
+    def __init__(self, latency=0.0, path_latency=None, port=0):
+        super().__init__(latency, port=port)
+        self.path_latency = path_latency or {}
+        self.root = {}
+        self.writes = 0
+        self.subscribers = []
+        self.closed = threading.Event()
+
+    def delay(self, method, path):
+        top = urllib.parse.urlsplit(path).path.strip("/").split("/")[0]
+        return self.path_latency.get(top[:-len(".json")] if top.endswith(".json") else top, self.latency)
+
+    def _split(self, path):
+        path = urllib.parse.urlsplit(path)
+        keys = [k for k in path.path[:-len(".json")].split("/") if k] if path.path.endswith(".json") else None
+        return keys, urllib.parse.parse_qs(path.query)
+
+    def get(self, keys):
+        node = self.root
+        for key in keys:
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return node
+
+    def set(self, keys, value):
+        if not keys:
+            self.root = value if isinstance(value, dict) else {}
+            return
+        node = self.root
+        for key in keys[:-1]:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            node = node[key]
+        if value is None:
+            node.pop(keys[-1], None)
+        else:
+            node[keys[-1]] = value
+        self._notify(keys, value)
+
+    def patch(self, keys, value):
+        # Multi-location update: every "a/b/c" child of `value` written under keys
+        for rel, child in value.items():
+            self.set(keys + [k for k in rel.split("/") if k], child)
+
+    def _notify(self, keys, value):
+        # Fan a write out to the streaming listeners whose path it touches
+        for prefix, q in list(self.subscribers):
+            if keys[:len(prefix)] == prefix:
+                q.put(("put", "/" + "/".join(keys[len(prefix):]), value))
+            elif prefix[:len(keys)] == keys:
+                sub = value
+                for key in prefix[len(keys):]:
+                    sub = sub.get(key) if isinstance(sub, dict) else None
+                q.put(("put", "/", sub))
+
+    def _stream(self, keys):
+        q = queue.Queue()
+        with self.lock:
+            snapshot = self.get(keys)
+            self.subscribers.append((keys, q))
+        try:
+            yield f"event: put\ndata: {json.dumps({'path': '/', 'data': snapshot})}\n\n".encode()
+            while not self.closed.is_set():
+                try:
+                    event, path, data = q.get(timeout=0.2)
+                except queue.Empty:
+                    yield b"event: keep-alive\ndata: null\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps({'path': path, 'data': data})}\n\n".encode()
+        finally:
+            self.subscribers.remove((keys, q))
+
+    def stop(self):
+        self.closed.set()
+        super().stop()
+
+    def handle(self, method, path, body, headers):
+        keys, query = self._split(path)
+        if keys is None:
+            return super().handle(method, path, body, headers)
+        value = json.loads(body) if body else None
+        if method == "GET" and "text/event-stream" in (headers.get("Accept") or ""):
+            return 200, self._stream(keys), {"Content-Type": "text/event-stream"}
+        with self.lock:
+            if method == "GET":
+                node = self.get(keys)
+                if isinstance(node, dict) and "orderBy" in query:
+                    field = json.loads(query["orderBy"][0])
+                    items = sorted(node.items(), key=lambda kv: str((kv[1] or {}).get(field, "")))
+                    if "startAt" in query:
+                        start = json.loads(query["startAt"][0])
+                        items = [kv for kv in items if str((kv[1] or {}).get(field, "")) >= str(start)]
+                    if "limitToLast" in query:
+                        items = items[-int(query["limitToLast"][0]):]
+                    node = dict(items)
+                return 200, node
+            self.writes += 1
+            if method == "PUT":
+                self.set(keys, value)
+                return 200, value
+            if method == "PATCH":
+                self.patch(keys, value or {})
+                return 200, value
+            if method == "POST":
+                name = push_id()
+                self.set(keys + [name], value)
+                return 200, {"name": name}
+            if method == "DELETE":
+                self.set(keys, None)
+                return 200, None
+        return super().handle(method, path, body, headers)
+
+
+class LogRTDB(FakeRTDB):
+    # The same REST subset served from an event_log.EventLog: writes to the
+    # handoff collections in `topics` ({path: record depth}) are appended as
+    # record versions, orderBy="timestamp" reads use the log's indexes, and
+    # streaming listeners are notified as before. Other paths (cursors,
+    # scheduler metrics) stay in memory.
+    TOPICS = {"errors": 2, "fingerprints": 2, "pr-requests": 1, "builds": 1, "deploys": 1,
+              "risk-mitigations": 1}
+
+    def __init__(self, log, topics=None, latency=0.0, port=0):
+        super().__init__(latency, port=port)
+        self.log = log
+        self.topics = dict(self.TOPICS if topics is None else topics)
+
+    def _tree(self, type_, rest):
+        # Current records under rest as the nested dict RTDB would return
+        depth = self.topics[type_]
+        if len(rest) >= depth:
+            node = self.log.get(type_, "/".join(rest[:depth]))
+            for key in rest[depth:]:
+                node = node.get(key) if isinstance(node, dict) else None
+            return node
+        out = {}
+        for key, record in self.log.records(type_, "/".join(rest) or None).items():
+            node = out
+            parts = key.split("/")[len(rest):]
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = record
+        return out or None
+
+    def get(self, keys):
+        if keys and keys[0] in self.topics:
+            return self._tree(keys[0], keys[1:])
+        node = super().get(keys)
+        if not keys:
+            node = dict(node or {}, **{t: v for t in self.topics if (v := self._tree(t, []))})
+        return node
+
+    def _records(self, type_, rest, value, pending=None):
+        # (key, record) pairs a write of `value` at rest produces, on top of
+        # the records of a multi-location update still being built (`pending`,
+        # {(type, key): record})
+        pending = pending or {}
+        depth = self.topics[type_]
+        if len(rest) >= depth:
+            key = "/".join(rest[:depth])
+            if len(rest) == depth:
+                return [(key, value)]
+            if (type_, key) in pending:
+                record = copy.deepcopy(pending[(type_, key)]) or {}
+            else:
+                record = self.log.get(type_, key) or {}
+            node = record
+            for part in rest[depth:-1]:
+                if not isinstance(node.get(part), dict):
+                    node[part] = {}
+                node = node[part]
+            if value is None:
+                node.pop(rest[-1], None)
+            else:
+                node[rest[-1]] = value
+            return [(key, record)]
+        # A PUT above record level replaces every record below it
+        prefix = "/".join(rest)
+        out = {key: None for key in self.log.records(type_, prefix or None)}
+        out.update({key: None for t, key in pending if t == type_ and (not prefix or key.startswith(prefix + "/"))})
+        pending = [(rest, value)]
+        while pending:
+            parts, node = pending.pop()
+            if len(parts) == depth:
+                out["/".join(parts)] = node
+            elif isinstance(node, dict):
+                pending.extend((parts + [k], v) for k, v in node.items())
+        return list(out.items())
+
+    def set(self, keys, value):
+        if not keys:
+            for type_ in self.topics:
+                self.set([type_], (value or {}).get(type_) if isinstance(value, dict) else None)
+            return super().set(keys, {k: v for k, v in (value or {}).items() if k not in self.topics}
+                               if isinstance(value, dict) else value)
+        if keys[0] not in self.topics:
+            return super().set(keys, value)
+        records = self._records(keys[0], keys[1:], value)
+        self.log.append_many([(keys[0], key, record) for key, record in records])
+        self._notify(keys, value)
+
+    def patch(self, keys, value):
+        # Every record a multi-location update touches is appended in one
+        # transaction, so readers see all of it or none of it, as on RTDB
+        writes = [(keys + [k for k in rel.split("/") if k], child) for rel, child in value.items()]
+        pending = {}
+        for path, child in writes:
+            if path and path[0] in self.topics:
+                for key, record in self._records(path[0], path[1:], child, pending):
+                    pending[(path[0], key)] = record
+        self.log.append_many([(type_, key, record) for (type_, key), record in pending.items()])
+        for path, child in writes:
+            if path and path[0] in self.topics:
+                self._notify(path, child)
+            else:
+                self.set(path, child)
+
+    def handle(self, method, path, body, headers):
+        keys, query = self._split(path)
+        if method == "GET" and keys and len(keys) == 1 and self.topics.get(keys[0]) == 1 and \
+                "orderBy" in query and json.loads(query["orderBy"][0]) == "timestamp":
+            # Answered from the (type, ts) index instead of sorting every
+            # child; RTDB only orders direct children, so depth 1 only
+            limit = int(query["limitToLast"][0]) if "limitToLast" in query else None
+            start = json.loads(query["startAt"][0]) if "startAt" in query else None
+            return 200, dict(self.log.query(keys[0], since=start, limit=limit, last=limit is not None)) or None
+        return super().handle(method, path, body, headers)
+
+
+class FakeTextBison(StandIn):
+    # text-bison :predict stand-in; returns a deterministic patch per prompt:
+    # a unified diff inserting a comment at the top of app.py, or whatever
+    # patch(prompt) returns when given.
+    def __init__(self, latency=0.0, patch=None):
+        super().__init__(latency)
+        self.patch = patch
+        self.predicts = 0
+
+    def content(self, prompt):
+        if self.patch is not None:
+            return self.patch(prompt)
+        note = " ".join((prompt or "").split())[:80]
+        return f"```diff\n--- a/app.py\n+++ b/app.py\n@@ -0,0 +1 @@\n+# fix for: {note}\n```\n"
+
+    def handle(self, method, path, body, headers):
+        if method == "POST" and path.endswith(":predict"):
+            req = json.loads(body or b"{}")
+            with self.lock:
+                self.predicts += 1
+            return 200, {"predictions": [{"content": self.content(inst.get("prompt", ""))}
+                                         for inst in req.get("instances", [])]}
+        return super().handle(method, path, body, headers)
+
+
+class FakeGitHub(StandIn):
+    # GitHub REST stand-in: commits/{ref} and open pulls with ETag /
+    # If-None-Match, and zipball archives of in-memory repositories.
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.repos = {}
+        self.bytes_sent = 0
+        self.not_modified = 0
+        self.created_pulls = []
+
+    def commit(self, org, repo, files, ref="main"):
+        # files maps path -> bytes; replaces the tree and moves ref to a new sha
+        digest = hashlib.sha1()
+        for path in sorted(files):
+            digest.update(path.encode() + b"\0" + files[path])
+        sha = digest.hexdigest()
+        state = self.repos.setdefault((org, repo), {"refs": {}, "trees": {}, "pulls": {}, "opened": {}})
+        with self.lock:
+            state["trees"][sha] = dict(files)
+            state["refs"][ref] = sha
+        return sha
+
+    def open_pull(self, org, repo, number, ref):
+        # PR `number` tracks the head of branch `ref`
+        with self.lock:
+            self.repos[(org, repo)]["pulls"][number] = ref
+            self.repos[(org, repo)]["opened"][number] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    def close_pull(self, org, repo, number):
+        with self.lock:
+            self.repos[(org, repo)]["pulls"].pop(number, None)
+
+    def _zipball(self, org, repo, sha, files):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            for path, data in files.items():
+                zf.writestr(f"{org}-{repo}-{sha[:7]}/{path}", data)
+        return buf.getvalue()
+
+    def handle(self, method, path, body, headers):
+        parts = urllib.parse.urlsplit(path).path.strip("/").split("/")
+        if method == "POST" and len(parts) == 4 and parts[0] == "repos" and parts[3] == "pulls":
+            req = json.loads(body or b"{}")
+            state = self.repos.get((parts[1], parts[2]))
+            with self.lock:
+                if any(p["head"] == req.get("head") for p in self.created_pulls):
+                    return 422, {"message": "Validation Failed", "errors": [{"message": "A pull request already exists"}]}
+                self.created_pulls.append(req)
+                number = len(self.created_pulls)
+                base = state and state["refs"].get(req.get("base", "main"))
+                if base:
+                    # The PR branch: the base tree under a new commit
+                    sha = hashlib.sha1(f"{base}/{req.get('head')}".encode()).hexdigest()
+                    state["trees"][sha] = state["trees"][base]
+                    state["refs"][req["head"]] = sha
+            if base:
+                self.open_pull(parts[1], parts[2], number, req["head"])
+            return 201, {"number": number, "head": {"ref": req.get("head")}, "title": req.get("title")}
+        if method == "GET" and len(parts) == 4 and parts[0] == "repos" and parts[3] == "pulls":
+            state = self.repos.get((parts[1], parts[2]))
+            if not state:
+                return 404, {"message": "Not Found"}
+            with self.lock:
+                pulls = [{"number": n, "state": "open", "head": {"ref": ref, "sha": state["refs"][ref]},
+                          "created_at": state["opened"].get(n)}
+                         for n, ref in sorted(state["pulls"].items())]
+            payload = json.dumps(pulls).encode()
+            etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+            if headers.get("If-None-Match") == etag:
+                with self.lock:
+                    self.not_modified += 1
+                return 304, b"", {"ETag": etag}
+            return 200, payload, {"ETag": etag}
+        if method == "GET" and len(parts) == 5 and parts[0] == "repos" and parts[3] in ("commits", "zipball"):
+            state = self.repos.get((parts[1], parts[2]))
+            ref = parts[4]
+            sha = state and (state["refs"].get(ref) or (ref if ref in state["trees"] else None))
+            if not sha:
+                return 404, {"message": "Not Found"}
+            etag = f'"{sha}"'
+            if parts[3] == "commits":
+                if headers.get("If-None-Match") == etag:
+                    with self.lock:
+                        self.not_modified += 1
+                    return 304, b"", {"ETag": etag}
+                if headers.get("Accept") == "application/vnd.github.sha":
+                    payload = sha.encode()
+                else:
+                    payload = json.dumps({"sha": sha}).encode()
+                return 200, payload, {"ETag": etag}
+            data = self._zipball(parts[1], parts[2], sha, state["trees"][sha])
+            with self.lock:
+                self.bytes_sent += len(data)
+            return 200, data, {"Content-Type": "application/zip"}
+        return super().handle(method, path, body, headers)
+
+
+class FakeCloudBuild(StandIn):
+    # Cloud Build v1 builds create / get / cancel. A build waits QUEUED for
+    # one of `runners` workers, runs WORKING for `duration` seconds and ends
+    # SUCCESS (FAILURE for shas in `failing`). Statuses advance on a clock
+    # thread; with a FakePubSub as `notify`, every change is published the way
+    # Cloud Build publishes to the cloud-builds topic.
+    def __init__(self, duration=1.0, runners=2, notify=None, latency=0.0):
+        super().__init__(latency)
+        self.duration = duration
+        self.runners = runners
+        self.notify = notify
+        self.failing = set()
+        self.builds = {}
+        self.order = []
+        self.created = 0
+        self.gets = 0
+        self.cancels = 0
+        self.runner_seconds = 0.0
+        self._ticking = threading.Event()
+
+    def _set(self, build, status, now):
+        build["status"] = status
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now))
+        if status == "WORKING":
+            build["startTime"], build["_started"] = stamp, now
+        elif status in ("SUCCESS", "FAILURE", "CANCELLED"):
+            build["finishTime"], build["_finished"] = stamp, now
+            if "_started" in build:
+                self.runner_seconds += now - build["_started"]
+        if self.notify is not None:
+            public = {k: v for k, v in build.items() if not k.startswith("_")}
+            self.notify.publish(public, {"buildId": build["id"], "status": status})
+
+    def advance(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            working = [b for b in self.order if self.builds[b]["status"] == "WORKING"]
+            for build_id in working:
+                build = self.builds[build_id]
+                if now - build["_started"] >= self.duration:
+                    sha = build["source"]["repoSource"].get("commitSha")
+                    self._set(build, "FAILURE" if sha in self.failing else "SUCCESS", now)
+            free = self.runners - sum(self.builds[b]["status"] == "WORKING" for b in self.order)
+            for build_id in self.order:
+                if free <= 0:
+                    break
+                if self.builds[build_id]["status"] == "QUEUED":
+                    self._set(self.builds[build_id], "WORKING", now)
+                    free -= 1
+
+    def _tick(self):
+        while not self._ticking.wait(0.02):
+            self.advance()
+
+    def start(self):
+        threading.Thread(target=self._tick, daemon=True).start()
+        return super().start()
+
+    def stop(self):
+        self._ticking.set()
+        super().stop()
+
+    def handle(self, method, path, body, headers):
+        parts = urllib.parse.urlsplit(path).path.strip("/").split("/")
+        if len(parts) == 4 and parts[3] == "builds" and method == "POST":
+            req = json.loads(body or b"{}")
+            with self.lock:
+                self.created += 1
+                build_id = f"build-{self.created:05d}"
+                build = dict(req, id=build_id, projectId=parts[2], status="QUEUED",
+                             createTime=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                             logUrl=f"{self.url}/logs/{build_id}")
+                self.builds[build_id] = build
+                self.order.append(build_id)
+                public = {k: v for k, v in build.items() if not k.startswith("_")}
+            self.advance()
+            return 200, {"name": f"operations/build/{parts[2]}/{build_id}", "metadata": {"build": public}}
+        if len(parts) == 5 and parts[3] == "builds":
+            build_id, _, action = parts[4].partition(":")
+            with self.lock:
+                build = self.builds.get(build_id)
+                if build is None:
+                    return 404, {"error": {"code": 404, "message": f"build {build_id} not found"}}
+                if method == "POST" and action == "cancel":
+                    self.cancels += 1
+                    if build["status"] in ("QUEUED", "WORKING"):
+                        self._set(build, "CANCELLED", time.time())
+                elif method == "GET" and not action:
+                    self.gets += 1
+                else:
+                    return super().handle(method, path, body, headers)
+                return 200, {k: v for k, v in build.items() if not k.startswith("_")}
+        return super().handle(method, path, body, headers)
+
+
+class FakeGKE(StandIn):
+    # Deployments under .../namespaces/{ns}/deployments/{name}. GET returns the
+    # deployment, PATCH merges a container image change into its pod template;
+    # an actual image change is a rollout. New pods become ready one by one,
+    # pod_ready seconds apart, on a clock thread; pods of `bad_images` never
+    # do, and the Progressing condition turns ProgressDeadlineExceeded after
+    # progress_deadline seconds. Live pods of `noisy_images` log errors at the
+    # given rate per second (see error_count). GET .../deployments?watch=1
+    # &fieldSelector=metadata.name={name} streams Kubernetes watch events.
+    def __init__(self, latency=0.0, clock=time.time, replicas=3, pod_ready=0.2, progress_deadline=2.0):
+        super().__init__(latency)
+        self.clock = clock
+        self.replicas = replicas
+        self.pod_ready = pod_ready
+        self.progress_deadline = progress_deadline
+        self.bad_images = set()
+        self.noisy_images = {}
+        self.deployments = {}
+        self.rollouts = []
+        self.errors = []
+        self.resource_version = 0
+        self.watchers = []
+        self._progress = {}
+        self._closed = threading.Event()
+
+    def _deployment(self, name):
+        if name not in self.deployments:
+            self.deployments[name] = {
+                "metadata": {"name": name, "generation": 1, "resourceVersion": "0"},
+                "spec": {"replicas": self.replicas,
+                         "template": {"spec": {"containers": [{"name": name, "image": ""}]}}},
+                "status": {"observedGeneration": 1, "replicas": self.replicas, "updatedReplicas": self.replicas,
+                           "readyReplicas": self.replicas, "availableReplicas": self.replicas,
+                           "conditions": [{"type": "Progressing", "status": "True",
+                                           "reason": "NewReplicaSetAvailable"}]},
+            }
+        return self.deployments[name]
+
+    def _changed(self, name):
+        # Bump resourceVersion and notify watchers; caller holds the lock
+        self.resource_version += 1
+        deployment = self.deployments[name]
+        deployment["metadata"]["resourceVersion"] = str(self.resource_version)
+        event = json.dumps({"type": "MODIFIED", "object": self._public(deployment)})
+        for watched, q in self.watchers:
+            if watched == name:
+                q.put(event)
+
+    def image(self, name):
+        return self._deployment(name)["spec"]["template"]["spec"]["containers"][0].get("image")
+
+    def error_count(self, name, since):
+        with self.lock:
+            return sum(1 for t, n in self.errors if n == name and t >= since)
+
+    def advance(self, now=None):
+        now = self.clock() if now is None else now
+        with self.lock:
+            for name, progress in list(self._progress.items()):
+                deployment = self.deployments[name]
+                status = deployment["status"]
+                ready = 0 if progress["image"] in self.bad_images else \
+                    min(int((now - progress["started"]) / self.pod_ready), self.replicas)
+                if ready != progress["ready"]:
+                    progress["ready"] = ready
+                    # maxSurge 1, maxUnavailable 0: one surge pod at a time,
+                    # old pods keep serving until replaced
+                    status["updatedReplicas"] = min(ready + 1, self.replicas)
+                    if ready == self.replicas:
+                        status["replicas"] = self.replicas
+                        status["conditions"] = [{"type": "Progressing", "status": "True",
+                                                 "reason": "NewReplicaSetAvailable"}]
+                        del self._progress[name]
+                    self._changed(name)
+                elif ready == 0 and not progress["expired"] and now - progress["started"] >= self.progress_deadline:
+                    progress["expired"] = True
+                    status["conditions"] = [{"type": "Progressing", "status": "False",
+                                             "reason": "ProgressDeadlineExceeded"}]
+                    self._changed(name)
+            for name, deployment in self.deployments.items():
+                rate = self.noisy_images.get(self.image(name))
+                if rate and name not in self._progress:
+                    last = deployment.setdefault("_errors_at", now)
+                    count = int((now - last) * rate)
+                    if count:
+                        self.errors.extend([(now, name)] * count)
+                        deployment["_errors_at"] = last + count / rate
+
+    def _tick(self):
+        while not self._closed.wait(0.02):
+            self.advance()
+
+    def start(self):
+        threading.Thread(target=self._tick, daemon=True).start()
+        return super().start()
+
+    def stop(self):
+        self._closed.set()
+        super().stop()
+
+    def _watch(self, name, resource_version, timeout):
+        q = queue.Queue()
+        with self.lock:
+            deployment = self._deployment(name)
+            if int(deployment["metadata"]["resourceVersion"]) > resource_version:
+                q.put(json.dumps({"type": "MODIFIED", "object": self._public(deployment)}))
+            self.watchers.append((name, q))
+        deadline = time.monotonic() + timeout
+        try:
+            while not self._closed.is_set() and time.monotonic() < deadline:
+                try:
+                    yield (q.get(timeout=0.1) + "\n").encode()
+                except queue.Empty:
+                    continue
+        finally:
+            with self.lock:
+                self.watchers.remove((name, q))
+
+    def _public(self, deployment):
+        return {k: v for k, v in deployment.items() if not k.startswith("_")}
+
+    def handle(self, method, path, body, headers):
+        split = urllib.parse.urlsplit(path)
+        parts = split.path.strip("/").split("/")
+        query = urllib.parse.parse_qs(split.query)
+        if method == "GET" and parts[-1] == "deployments" and query.get("watch", [""])[0] in ("1", "true"):
+            selector = query.get("fieldSelector", [""])[0]
+            name = selector.split("=", 1)[1] if selector.startswith("metadata.name=") else None
+            if not name:
+                return 400, {"kind": "Status", "message": "watch needs fieldSelector=metadata.name=..."}
+            return 200, self._watch(name, int(query.get("resourceVersion", ["0"])[0] or 0),
+                                    float(query.get("timeoutSeconds", ["300"])[0])), \
+                {"Content-Type": "application/json"}
+        if len(parts) >= 2 and parts[-2] == "deployments":
+            name = parts[-1]
+            with self.lock:
+                deployment = self._deployment(name)
+                if method == "PATCH":
+                    containers = json.loads(body)["spec"]["template"]["spec"]["containers"]
+                    current = {c["name"]: c for c in deployment["spec"]["template"]["spec"]["containers"]}
+                    changed = False
+                    for container in containers:
+                        old = current.setdefault(container["name"], {"name": container["name"]})
+                        changed |= old.get("image") != container.get("image")
+                        old.update(container)
+                    deployment["spec"]["template"]["spec"]["containers"] = list(current.values())
+                    if changed:
+                        now = self.clock()
+                        image = containers[0].get("image")
+                        deployment["metadata"]["generation"] += 1
+                        deployment["status"].update(observedGeneration=deployment["metadata"]["generation"],
+                                                    updatedReplicas=1, replicas=self.replicas + 1)
+                        deployment["status"]["conditions"] = [{"type": "Progressing", "status": "True",
+                                                               "reason": "ReplicaSetUpdated"}]
+                        self._progress[name] = {"image": image, "started": now, "ready": 0, "expired": False}
+                        deployment.pop("_errors_at", None)
+                        self.rollouts.append((now, name, image))
+                        self._changed(name)
+                elif method != "GET":
+                    return super().handle(method, path, body, headers)
+                return 200, self._public(deployment)
+        return super().handle(method, path, body, headers)
+
+
+class FakeSendGrid(StandIn):
+    # POST /v3/mail/send; keeps the sent payloads
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.sent = []
+
+    def handle(self, method, path, body, headers):
+        if method == "POST" and path == "/v3/mail/send":
+            with self.lock:
+                self.sent.append(json.loads(body))
+            return 202, b""
+        return super().handle(method, path, body, headers)
+
+
+class FakeBigQuery(StandIn):
+    # tabledata.insertAll with insertId dedupe and the per-request row/byte limits
+    MAX_ROWS = 50000
+    MAX_BYTES = 10 * 1024 * 1024
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.rows = {}
+        self.insert_calls = 0
+
+    def handle(self, method, path, body, headers):
+        if method == "POST" and path.endswith("/insertAll"):
+            req = json.loads(body)
+            if len(req.get("rows", [])) > self.MAX_ROWS or len(body) > self.MAX_BYTES:
+                return 400, {"error": {"code": 400, "message": "Request too large"}}
+            with self.lock:
+                self.insert_calls += 1
+                for i, row in enumerate(req.get("rows", [])):
+                    self.rows.setdefault(row.get("insertId") or f"{self.insert_calls}-{i}", row["json"])
+            return 200, {"kind": "bigquery#tableDataInsertAllResponse"}
+        return super().handle(method, path, body, headers)
+
+
+class FakeMonitoring(StandIn):
+    # Cloud Monitoring timeSeries:query stand-in for container memory.
+    # set_memory() / grow() change a container's usage at the clock's current
+    # time; used_bytes queries return one point per `step` seconds over the
+    # last hour, limit_bytes queries every container's limit. The clock may
+    # run faster than real time (trace replays) as long as it stays behind it.
+    def __init__(self, latency=0.0, clock=time.time, step=60, memory_limit=256 * 2 ** 20, namespace="default"):
+        super().__init__(latency)
+        self.clock = clock
+        self.step = step
+        self.memory_limit = memory_limit
+        self.namespace = namespace
+        self.memory = {}
+        self.limits = {}
+        self.queries = 0
+
+    def set_memory(self, pod, container, used, now=None):
+        now = self.clock() if now is None else now
+        with self.lock:
+            self.memory.setdefault((pod, container), []).append((now, float(used)))
+
+    def grow(self, pod, container, delta, now=None):
+        now = self.clock() if now is None else now
+        with self.lock:
+            changes = self.memory.setdefault((pod, container), [])
+            changes.append((now, (changes[-1][1] if changes else 0.0) + delta))
+
+    def _series(self, key, points):
+        pod, container = key
+        return {
+            "resource": {"type": "k8s_container", "labels": {
+                "namespace_name": self.namespace, "pod_name": pod, "container_name": container}},
+            "metric": {"labels": {}},
+            "points": [{"interval": {"endTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))},
+                        "value": {"int64Value": str(int(v))}} for t, v in points],
+        }
+
+    def handle(self, method, path, body, headers):
+        if method == "POST" and path.endswith("timeSeries:query"):
+            query = json.loads(body or b"{}").get("query", "")
+            now = self.clock()
+            with self.lock:
+                self.queries += 1
+                if "limit_bytes" in query:
+                    series = [self._series(key, [(now, self.limits.get(key, self.memory_limit))]) for key in self.memory]
+                else:
+                    series = []
+                    for key, changes in self.memory.items():
+                        t = max(changes[0][0], now - 3600) // self.step * self.step + self.step
+                        points, i, value = [], 0, None
+                        while t <= now:
+                            while i < len(changes) and changes[i][0] <= t:
+                                value = changes[i][1]
+                                i += 1
+                            if value is not None:
+                                points.append((t, value))
+                            t += self.step
+                        series.append(self._series(key, points[::-1]))
+            return 200, {"timeSeries": series}
+        return super().handle(method, path, body, headers)
@@ -0,0 +1,334 @@
+# log_parser.py
+# Streaming reassembly of multi-line Python / Java / Go exceptions from interleaved pod log lines
+#
+# Log lines arrive one at a time, interleaved across pods and containers
+# (and across Pub/Sub messages). Each (namespace, pod, container) stream has
+# a small state machine:
+#   Python  "Traceback (most recent call last):", indented File / source /
+#           caret lines, then the "Type: message" line; a chained exception
+#           ("During handling of ..." / "The above exception ...") continues
+#           the same event and becomes its cause
+#   Java    a "pkg.SomeException: message" line followed by "\tat ..." frames,
+#           "Caused by: ...", "Suppressed: ..." and "... N more"
+#   Go      "panic: ..." / "fatal error: ...", goroutine headers, function and
+#           "\t/path/file.go:N +0x.." lines, "exit status N"
+# An event ends at the first line that cannot continue it, or after the
+# stream has been quiet for idle_timeout seconds (flush()). Buffers are
+# bounded: at most max_lines lines (the rest are counted) and max_frames
+# frames per event, max_line characters per line and max_streams streams
+# (least recently active evicted first), so memory stays constant whatever
+# the log rate. CRI-formatted lines ("<ts> stderr F <text>") are unwrapped
+# and partial ("P") lines joined. Entries fed with a key (the Pub/Sub
+# messageId) are fed once: a redelivered entry is dropped, and its tag joins
+# the open event of its stream so the new ack ID is held back with it.
+#
+# Events are dicts: stream {namespace, pod, container}, service (the pod's
+# app label, else its name without the controller suffix), language, exception,
+# message, cause, frames [{file, line, function}] innermost first (as
+# source_index.parse_frames), text, timestamp (of the first line), lines,
+# truncated and tags (what the caller passed with each line, e.g. Pub/Sub
+# message and ack IDs).
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_CRI = re.compile(r"^(\S+) (stdout|stderr) ([FP]) ?(.*)$")
+
+_PY_START = re.compile(r"^Traceback \(most recent call last\):\s*$")
+_PY_FRAME = re.compile(r'^\s+File "([^"]+)", line (\d+), in (\S+)')
+_PY_EXCEPTION = re.compile(r"^([A-Za-z_][\w.]*)(?::\s?(.*))?$")
+_PY_CHAIN = re.compile(r"^(During handling of the above exception|The above exception was the direct cause)")
+
+_JAVA_HEADER = re.compile(r"^(?:Exception in thread \"[^\"]*\" )?((?:[\w$]+\.)+[\w$]*(?:Exception|Error|Throwable))"
+                          r"(?::\s?(.*))?$")
+_JAVA_FRAME = re.compile(r"^\s+at ([\w$.<>/]+)\.([\w$<>]+)\(([^:)]+)(?::(\d+))?\)")
+_JAVA_MORE = re.compile(r"^\s+\.\.\. \d+ (?:more|common frames omitted)")
+_JAVA_CAUSE = re.compile(r"^\s*(Caused by|Suppressed): ((?:[\w$]+\.)*[\w$]+)(?::\s?(.*))?$")
+
+_GO_START = re.compile(r"^(panic|fatal error): (.*)$")
+_GO_GOROUTINE = re.compile(r"^goroutine \d+ \[")
+_GO_FILE = re.compile(r"^\t(\S+\.go):(\d+)")
+# "net/http.(*conn).serve(0xc000..)" -> "net/http.(*conn).serve"
+_GO_CALL = re.compile(r"^created by |\([^()]*\)$| in goroutine \d+$")
+_GO_OTHER = re.compile(r"^(\[signal |exit status \d+|\s*panic: |\t)")
+
+
+# Deployment pods are <name>-<replicaset hash>-<5 chars>, StatefulSet pods <name>-<ordinal>
+_POD_SUFFIX = re.compile(r"-[bcdfghjklmnpqrstvwxz2-9]{6,10}-[bcdfghjklmnpqrstvwxz2-9]{5}$|-\d+$")
+
+
+def service_of(pod):
+    return _POD_SUFFIX.sub("", pod or "") or pod
+
+
+class _Stream:
+    __slots__ = ("key", "partial", "language", "state", "lines", "dropped", "frames", "exception", "message",
+                 "cause", "timestamp", "tags", "header", "last_seen", "func", "goroutines", "service")
+
+    def __init__(self, key):
+        self.key = key
+        self.service = None
+        self.partial = ""
+        self.header = None
+        self.last_seen = 0.0
+        self.reset()
+
+    def reset(self):
+        self.language = self.state = self.exception = self.message = self.cause = self.timestamp = None
+        self.func = None
+        self.lines, self.frames, self.tags = [], [], []
+        self.dropped = self.goroutines = 0
+
+
+class LogReassembler:
+    def __init__(self, idle_timeout=1.0, max_lines=256, max_frames=64, max_line=2000, max_streams=10000,
+                 max_keys=100000, clock=time.monotonic):
+        self.idle_timeout = idle_timeout
+        self.max_lines = max_lines
+        self.max_frames = max_frames
+        self.max_line = max_line
+        self.max_streams = max_streams
+        self.max_keys = max_keys
+        self.clock = clock
+        self.streams = OrderedDict()
+        self.keys = OrderedDict()
+        self.stats = {"lines": 0, "events": 0, "truncated": 0, "evicted": 0, "duplicates": 0}
+        self._held = set()
+
+    # --- input ---------------------------------------------------------------
+
+    def feed(self, stream, text, timestamp=None, tag=None, now=None, service=None, key=None):
+        # One log entry (possibly several lines) of `stream`, a (namespace,
+        # pod, container) tuple; returns the events it completed. An entry
+        # whose `key` was fed before (the last max_keys) is a redelivery.
+        now = self.clock() if now is None else now
+        if key is not None and self._seen(key):
+            self.stats["duplicates"] += 1
+            s = self.streams.get(stream)
+            if s is not None and s.language is not None and tag is not None and tag not in s.tags:
+                s.tags.append(tag)
+            return []
+        out = []
+        s = self.streams.get(stream)
+        if s is None:
+            s = self.streams[stream] = _Stream(stream)
+            if len(self.streams) > self.max_streams:
+                _, evicted = self.streams.popitem(last=False)
+                self.stats["evicted"] += 1
+                self._finish(evicted, out)
+        else:
+            self.streams.move_to_end(stream)
+        s.last_seen = now
+        s.service = service or s.service
+        for line in text.split("\n"):
+            match = _CRI.match(line)
+            if match:
+                if match.group(3) == "P":
+                    s.partial = (s.partial + match.group(4))[:self.max_line]
+                    continue
+                line, s.partial = s.partial + match.group(4), ""
+            self.stats["lines"] += 1
+            self._line(s, line.rstrip("\r")[:self.max_line], timestamp, tag, out)
+        return out
+
+    def feed_entry(self, entry, timestamp=None, tag=None, now=None, key=None):
+        # A Cloud Logging LogEntry (textPayload, resource.labels) or the pod
+        # log payload {"podName", "container", "log"}
+        labels = (entry.get("resource") or {}).get("labels") or {}
+        stream = (labels.get("namespace_name") or entry.get("namespace") or "default",
+                  labels.get("pod_name") or entry.get("podName") or "unknown",
+                  labels.get("container_name") or entry.get("container") or "")
+        text = entry.get("textPayload")
+        if text is None:
+            text = entry.get("log", "")
+        service = (entry.get("labels") or {}).get("k8s-pod/app") or \
+            ((entry.get("metadata") or {}).get("labels") or {}).get("app")
+        return self.feed(stream, str(text), timestamp or entry.get("timestamp"), tag, now, service, key)
+
+    def _seen(self, key):
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        self.keys[key] = None
+        if len(self.keys) > self.max_keys:
+            self.keys.popitem(last=False)
+        return False
+
+    def flush(self, now=None, force=False):
+        # Events of streams quiet for idle_timeout (all open events with
+        # force); quiet streams without an open event are dropped
+        now = self.clock() if now is None else now
+        out = []
+        for key in list(self.streams):
+            s = self.streams[key]
+            if not force and now - s.last_seen < self.idle_timeout:
+                # Streams are kept in order of activity, so the rest are newer
+                break
+            self._finish(s, out)
+            del self.streams[key]
+        return out
+
+    def pending(self):
+        # Streams with an event (or a possible Java header) still open
+        return sum(1 for s in self.streams.values() if s.language is not None or s.header is not None)
+
+    # --- acknowledgement ------------------------------------------------------
+
+    def pending_tags(self):
+        held = set()
+        for s in self.streams.values():
+            held.update(s.tags)
+            if s.header:
+                held.add(s.header[2])
+        held.discard(None)
+        return held
+
+    def ackable(self, tags):
+        # Of these tags and those held back earlier, the ones no open event
+        # still needs, so their messages can be acknowledged
+        self._held.update(t for t in tags if t is not None)
+        pending = self.pending_tags()
+        ready = self._held - pending
+        self._held &= pending
+        return ready
+
+    # --- state machine ---------------------------------------------------------
+
+    def _line(self, s, line, timestamp, tag, out):
+        if s.language is not None:
+            if self._continues(s, line):
+                self._add(s, line, tag)
+                return
+            self._finish(s, out)
+        if _PY_START.match(line):
+            self._start(s, "python", "frames", line, timestamp, tag)
+        elif (match := _GO_START.match(line)) is not None:
+            self._start(s, "go", "header", line, timestamp, tag)
+            s.exception, s.message = match.group(1), match.group(2)
+        elif s.header is not None and (match := _JAVA_FRAME.match(line)) is not None:
+            header, header_ts, header_tag, exception, message = s.header
+            self._start(s, "java", "frames", header, header_ts, header_tag)
+            s.exception, s.message = exception, message
+            self._add(s, line, tag)
+            self._java_frame(s, match)
+        else:
+            match = _JAVA_HEADER.match(line)
+            s.header = (line, timestamp, tag, match.group(1), match.group(2)) if match else None
+            return
+        s.header = None
+
+    def _start(self, s, language, state, line, timestamp, tag):
+        s.reset()
+        s.language, s.state, s.timestamp = language, state, timestamp
+        self._add(s, line, tag)
+
+    def _add(self, s, line, tag):
+        if len(s.lines) < self.max_lines:
+            s.lines.append(line)
+        else:
+            s.dropped += 1
+        if tag is not None and (not s.tags or s.tags[-1] != tag):
+            s.tags.append(tag)
+
+    def _frame(self, s, path, line, function):
+        if len(s.frames) < self.max_frames:
+            s.frames.append({"file": path, "line": int(line) if line else None, "function": function})
+
+    def _java_frame(self, s, match):
+        cls, method, path, line = match.groups()
+        self._frame(s, path, line, f"{cls.rsplit('.', 1)[-1]}.{method}")
+
+    def _continues(self, s, line):
+        if s.language == "python":
+            if s.state == "frames":
+                if line[:1] in (" ", "\t"):
+                    match = _PY_FRAME.match(line)
+                    if match:
+                        # Printed outermost first; prepend to keep innermost first
+                        if len(s.frames) >= self.max_frames:
+                            s.frames.pop()
+                        s.frames.insert(0, {"file": match.group(1), "line": int(match.group(2)),
+                                            "function": match.group(3)})
+                    return True
+                match = _PY_EXCEPTION.match(line)
+                if match is None:
+                    return False
+                s.exception, s.message, s.state = match.group(1), match.group(2), "after"
+                return True
+            # After the exception line only a chained traceback continues
+            if not line.strip() or _PY_CHAIN.match(line):
+                return True
+            if _PY_START.match(line):
+                s.cause, s.frames, s.state = s.exception, [], "frames"
+                return True
+            return False
+        if s.language == "java":
+            match = _JAVA_FRAME.match(line)
+            if match:
+                if s.cause is None:
+                    self._java_frame(s, match)
+                return True
+            match = _JAVA_CAUSE.match(line)
+            if match:
+                if match.group(1) == "Caused by":
+                    s.cause = match.group(2)
+                return True
+            return bool(_JAVA_MORE.match(line))
+        # Go: frames of the panicking (first) goroutine only
+        if not line.strip():
+            return True
+        if _GO_GOROUTINE.match(line):
+            s.goroutines += 1
+            return True
+        match = _GO_FILE.match(line)
+        if match:
+            if s.goroutines == 1 and s.func is not None:
+                self._frame(s, match.group(1), match.group(2), s.func)
+            s.func = None
+            return True
+        if _GO_OTHER.match(line):
+            return True
+        if s.goroutines and (line.endswith(")") or line.startswith("created by ")):
+            s.func = _GO_CALL.sub("", line)
+            return True
+        return False
+
+    def _finish(self, s, out):
+        if s.language is None:
+            s.header = None
+            return
+        if s.dropped:
+            self.stats["truncated"] += 1
+        text = "\n".join(s.lines + ([f"... {s.dropped} more lines"] if s.dropped else []))
+        out.append({
+            "stream": dict(zip(("namespace", "pod", "container"), s.key)),
+            "service": s.service or service_of(s.key[1]),
+            "language": s.language,
+            "exception": s.exception,
+            "message": s.message,
+            "cause": s.cause,
+            "frames": s.frames,
+            "text": text,
+            "timestamp": s.timestamp,
+            "lines": len(s.lines) + s.dropped,
+            "truncated": bool(s.dropped),
+            "tags": s.tags,
+        })
+        self.stats["events"] += 1
+        s.reset()
+
+
+_reassemblers = {}
+_reassemblers_lock = threading.Lock()
+
+
+def log_reassembler(name, factory):
+    # Process-wide reassembler per name, so open events survive across
+    # workflow cycles; factory() builds it on first use
+    with _reassemblers_lock:
+        reassembler = _reassemblers.get(name)
+        if reassembler is None:
+            reassembler = _reassemblers[name] = factory()
+        return reassembler
@@ -0,0 +1,279 @@
+# loop_scheduler.py
+# One adaptive scheduler pacing every agent's workflow loop, with wake-ups from upstream agents and API budgets
+#
+# Each agent loop reports the end of every cycle with done(name, active). An
+# active cycle (the step named in its LOOPS entry produced work) goes round
+# again at once and resets the loop's interval to its minimum; an idle cycle
+# waits the current interval, which then grows by `backoff` up to the
+# maximum. A quiet pipeline so polls at its slowest rate and a busy one at
+# its fastest. A cycle that produced work for the loops downstream of it
+# (a new error for the Fix Generator, a PR for Build & Test, a build for
+# Deploy) wakes them, so they start their next cycle right away instead of
+# sleeping out a long idle interval.
+#
+# Every HTTP request (tool calls and helper requests alike, see
+# http_pool.add_listener) is charged to a global budget, to the budget of its
+# API (URL host), both in requests per hour, and to the loop whose cycle made
+# it (current_loop). A loop whose APIs are over budget does not start its
+# next cycle until the budget has refilled; requests already under way are
+# not held up, and the per-API rate limits in http_pool still apply to them.
+#
+# The clock is injectable, so the same scheduler runs the agents
+# (local_runtime) and the simulated-clock harness (benchmarks.py
+# loop-scheduler), which measures API calls per hour and detection latency.
+
+import asyncio
+import contextvars
+import threading
+import time
+import urllib.parse
+from collections import deque
+
+import http_pool
+from tracing import percentiles
+
+# Name of the loop whose cycle is running in this task / worker thread
+current_loop = contextvars.ContextVar("current_loop", default=None)
+
+# Per loop (agent module name): interval bounds in seconds (an agent's own
+# "wait Ns" step, where it has one, is the maximum instead), the `when`
+# expression that makes a cycle active, the one that wakes the loops in
+# `wakes` (default: the active one) and the path of a list of detection
+# latencies in seconds to record
+LOOPS = {
+    "error_analyzer": {"interval": (5, 60), "active": "analyze_error.result != null",
+                       "wake": "analyze_error.result.error_payload != null", "wakes": ("fix_generator",),
+                       "detected": "analyze_error.result.detect_s"},
+    "fix_generator": {"interval": (1, 30), "active": "schedule_fixes.result != null",
+                      "wakes": ("build_and_test_agent",)},
+    "risk_mitigation_agent": {"interval": (30, 600), "active": "analyze_metrics.result != null"},
+    "build_and_test_agent": {"interval": (1, 60), "active": "track_builds.result != null",
+                             "wakes": ("deploy_agent",)},
+    "deploy_agent": {"interval": (1, 30), "active": "roll_out.result != null", "wakes": ("reporter_agent",)},
+    "reporter_agent": {"interval": (15, 60), "active": "fetch_events.result != null"},
+}
+
+
+def parse_intervals(text):
+    # "error_analyzer=5-60,fix_generator=1-30" -> {"error_analyzer": (5.0, 60.0), ...}
+    out = {}
+    for item in (text or "").split(","):
+        name, sep, value = item.strip().partition("=")
+        if sep:
+            low, _, high = value.partition("-")
+            out[name.strip()] = (float(low), float(high or low))
+    return out
+
+
+def parse_budgets(text):
+    # "api.github.com=4000,text-bison.googleapis.com=600" -> {host: requests per hour}
+    out = {}
+    for item in (text or "").split(","):
+        name, sep, value = item.strip().partition("=")
+        if sep:
+            out[name.strip()] = float(value)
+    return out
+
+
+def api_of(url):
+    return urllib.parse.urlsplit(url).netloc or url
+
+
+class Budget:
+    # `per_hour` requests an hour, in bursts of up to a minute's worth.
+    # charge() may take it below zero; delay() is how long until it is back
+    # at zero. Not locked; LoopScheduler holds its lock around both.
+    def __init__(self, per_hour, now):
+        self.rate = per_hour / 3600.0
+        self.burst = max(per_hour / 60.0, 1.0)
+        self.tokens = self.burst
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def charge(self, now, n=1):
+        self._refill(now)
+        self.tokens -= n
+
+    def delay(self, now):
+        self._refill(now)
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _Loop:
+    __slots__ = ("name", "min_interval", "max_interval", "interval", "wakes", "next_at", "pending", "apis",
+                 "event", "aio", "stats")
+
+    def __init__(self, name, min_interval, max_interval, wakes, now):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.interval = min_interval
+        self.wakes = tuple(wakes)
+        self.next_at = now
+        self.pending = False
+        self.apis = set()
+        self.event = self.aio = None
+        self.stats = {"cycles": 0, "active": 0, "idle": 0, "woken": 0, "calls": 0, "slept_s": 0.0,
+                      "budget_s": 0.0}
+
+
+class LoopScheduler:
+    # budget: requests per hour across all APIs (0: unlimited); api_budgets:
+    # {host: requests per hour}; backoff: interval growth per idle cycle
+    def __init__(self, budget=0, api_budgets=None, backoff=2.0, clock=time.monotonic):
+        self.clock = clock
+        self.backoff = backoff
+        self.loops = {}
+        self.started = clock()
+        self.budget = Budget(budget, self.started) if budget else None
+        self.api_budgets = {api: Budget(n, self.started) for api, n in (api_budgets or {}).items() if n}
+        self.calls = {}
+        self.latencies = deque(maxlen=10000)
+        self.lock = threading.Lock()
+
+    def add(self, name, min_interval, max_interval, wakes=()):
+        with self.lock:
+            if name not in self.loops:
+                self.loops[name] = _Loop(name, min_interval, max_interval, wakes, self.clock())
+            return self.loops[name]
+
+    # --- pacing ----------------------------------------------------------------
+
+    def done(self, name, active, wake=None):
+        # End of a cycle of `name`; wakes its downstream loops if `wake` (by
+        # default when active). Returns the seconds until its next cycle.
+        now = self.clock()
+        with self.lock:
+            loop = self.loops[name]
+            loop.stats["cycles"] += 1
+            loop.stats["active" if active else "idle"] += 1
+            if active or loop.pending:
+                # Work found, or woken while this cycle ran: go again at once
+                delay, loop.interval, loop.pending = 0.0, loop.min_interval, False
+            else:
+                delay = loop.interval
+                loop.interval = min(loop.interval * self.backoff, loop.max_interval)
+            throttle = self._budget_delay(loop, now)
+            loop.stats["budget_s"] += max(throttle - delay, 0.0)
+            loop.next_at = now + max(delay, throttle)
+            woken = loop.wakes if (active if wake is None else wake) else ()
+        for downstream in woken:
+            self.wake(downstream)
+        return loop.next_at - now
+
+    def wake(self, name):
+        # Start `name`'s next cycle now (budget permitting) and reset its
+        # interval; a loop in the middle of a cycle goes round again after it
+        now = self.clock()
+        with self.lock:
+            loop = self.loops.get(name)
+            if loop is None:
+                return False
+            loop.stats["woken"] += 1
+            loop.interval = loop.min_interval
+            if loop.next_at <= now:
+                loop.pending = True
+                return True
+            loop.next_at = now + self._budget_delay(loop, now)
+            event, aio = loop.event, loop.aio
+        if event is not None:
+            aio.call_soon_threadsafe(event.set)
+        return True
+
+    def next_at(self, name):
+        with self.lock:
+            return self.loops[name].next_at
+
+    async def wait(self, name, scale=1.0):
+        # Sleep until the next cycle of `name` is due or it is woken; `scale`
+        # turns scheduler seconds into event-loop seconds
+        loop = self.loops[name]
+        with self.lock:
+            if loop.event is None:
+                loop.event, loop.aio = asyncio.Event(), asyncio.get_running_loop()
+        started = self.clock()
+        while True:
+            remaining = self.next_at(name) - self.clock()
+            if remaining <= 0:
+                break
+            loop.event.clear()
+            try:
+                await asyncio.wait_for(loop.event.wait(), remaining * scale)
+            except asyncio.TimeoutError:
+                pass
+        with self.lock:
+            loop.stats["slept_s"] += self.clock() - started
+
+    # --- budgets ----------------------------------------------------------------
+
+    def _budget_delay(self, loop, now):
+        # caller holds the lock
+        delays = [self.budget.delay(now)] if self.budget else []
+        delays.extend(self.api_budgets[api].delay(now) for api in loop.apis if api in self.api_budgets)
+        return max(delays, default=0.0)
+
+    def charge(self, api, name=None, n=1):
+        # n requests to `api` made by loop `name` (None: outside any loop)
+        now = self.clock()
+        with self.lock:
+            self.calls[api] = self.calls.get(api, 0) + n
+            if self.budget:
+                self.budget.charge(now, n)
+            if api in self.api_budgets:
+                self.api_budgets[api].charge(now, n)
+            loop = self.loops.get(name)
+            if loop is not None:
+                loop.stats["calls"] += n
+                loop.apis.add(api)
+
+    def _listener(self, method, url):
+        self.charge(api_of(url), current_loop.get())
+
+    def attach(self):
+        # Charge every request http_pool sends from now on
+        http_pool.add_listener(self._listener)
+        return self
+
+    def detach(self):
+        http_pool.remove_listener(self._listener)
+
+    # --- measurements -------------------------------------------------------------
+
+    def detected(self, *seconds):
+        # Detection latency of incidents: failure -> first cycle that saw it
+        with self.lock:
+            self.latencies.extend(seconds)
+
+    def stats(self):
+        # Calls per hour overall, per API and per loop since the scheduler
+        # started, loop counters and current intervals, detection latency
+        now = self.clock()
+        hours = max(now - self.started, 1e-9) / 3600.0
+        with self.lock:
+            total = sum(self.calls.values())
+            return {
+                "elapsed_s": round(now - self.started, 3),
+                "calls": total,
+                "calls_per_hour": round(total / hours, 1),
+                "apis": {api: {"calls": n, "per_hour": round(n / hours, 1)} for api, n in sorted(self.calls.items())},
+                "loops": {name: dict(loop.stats, slept_s=round(loop.stats["slept_s"], 3),
+                                     budget_s=round(loop.stats["budget_s"], 3),
+                                     calls_per_hour=round(loop.stats["calls"] / hours, 1),
+                                     interval=loop.interval)
+                          for name, loop in self.loops.items()},
+                "detection_s": percentiles(self.latencies),
+            }
+
+
+def from_env(env, clock=time.monotonic):
+    # The scheduler LOOP_SCHEDULER=adaptive asks for, else None (every loop
+    # keeps its own fixed wait step)
+    if env.get("LOOP_SCHEDULER", "fixed") != "adaptive":
+        return None
+    return LoopScheduler(budget=float(env.get("LOOP_BUDGET") or 0),
+                         api_budgets=parse_budgets(env.get("LOOP_API_BUDGETS")),
+                         backoff=float(env.get("LOOP_BACKOFF") or 2.0), clock=clock)
+
@@ -0,0 +1,151 @@
+# memory_trends.py
+# Vectorized memory-trend analysis across every pod/container series for the Risk Mitigation Agent
+
+import re
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+_QUANTITY = re.compile(r"^(\d+(?:\.\d+)?)([KMGTE]i?|[kmgte])?$")
+_UNITS = {
+    None: 1, "k": 1e3, "K": 1e3, "M": 1e6, "G": 1e9, "T": 1e12, "E": 1e18,
+    "Ki": 2 ** 10, "Mi": 2 ** 20, "Gi": 2 ** 30, "Ti": 2 ** 40, "Ei": 2 ** 60,
+}
+
+
+def parse_quantity(quantity):
+    # Kubernetes memory quantity ("256Mi", "1G", "134217728") -> bytes
+    m = _QUANTITY.match(str(quantity).strip())
+    if not m:
+        raise ValueError(f"unsupported quantity: {quantity!r}")
+    return float(m.group(1)) * _UNITS[m.group(2)]
+
+
+def _epoch(ts):
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+
+def _point_value(value):
+    if "doubleValue" in value:
+        return float(value["doubleValue"])
+    return float(value.get("int64Value", "nan"))
+
+
+def series_matrix(response, step=60):
+    # Cloud Monitoring response -> (labels, times, values). Accepts both the
+    # timeSeries list format ({"timeSeries": [{"resource", "metric", "points"}]})
+    # and the MQL query format ({"timeSeriesData": [{"labelValues", "pointData"}]}).
+    # Points are snapped to a common `step`-second grid; missing points are NaN.
+    labels, rows = [], []
+    for ts in response.get("timeSeries", []):
+        labels.append({**ts.get("resource", {}).get("labels", {}), **ts.get("metric", {}).get("labels", {})})
+        rows.append([(_epoch(p["interval"]["endTime"]), _point_value(p["value"])) for p in ts.get("points", [])])
+    keys = [d["key"] for d in response.get("timeSeriesDescriptor", {}).get("labelDescriptors", [])]
+    for ts in response.get("timeSeriesData", []):
+        values = [next(iter(v.values()), None) for v in ts.get("labelValues", [])]
+        # "resource.pod_name" -> "pod_name", matching the list format's label keys
+        labels.append({k.rsplit(".", 1)[-1]: v for k, v in zip(keys, values)} if keys else {"labelValues": values})
+        rows.append([(_epoch(p["timeInterval"]["endTime"]), _point_value(p["values"][0])) for p in ts.get("pointData", [])])
+    stamps = sorted({int(t // step) for row in rows for t, _ in row})
+    if not stamps:
+        return labels, np.empty(0), np.empty((len(rows), 0))
+    first = stamps[0]
+    times = (np.arange(stamps[-1] - first + 1) + first) * float(step)
+    values = np.full((len(rows), len(times)), np.nan)
+    for i, row in enumerate(rows):
+        if row:
+            cols = np.array([int(t // step) - first for t, _ in row])
+            values[i, cols] = [v for _, v in row]
+    return labels, times, values
+
+
+def limits_for(labels, limit_labels, limit_times, limit_values, default):
+    # Per-series memory limits aligned with `labels`, from a limit_bytes
+    # series_matrix() result; series without a matching limit get `default`
+    latest = {}
+    for lab, row in zip(limit_labels, limit_values):
+        seen = row[~np.isnan(row)]
+        if len(seen):
+            latest[(lab.get("pod_name"), lab.get("container_name"))] = seen[-1]
+    return np.array([latest.get((lab.get("pod_name"), lab.get("container_name")), default) for lab in labels])
+
+
+def analyze(times, values, limits, horizon=24 * 3600, min_points=5):
+    # One vectorized pass over a (series x points) matrix. NaNs are missing
+    # points. limits is a scalar or per-series array of memory limits in bytes.
+    # Returns a dict of per-series arrays:
+    #   slope        least-squares growth in bytes/s
+    #   robust_slope median of half-window differences in bytes/s (ignores
+    #                one-off spikes and GC drops)
+    #   r2           goodness of the least-squares fit
+    #   current      last observed value
+    #   growth       current / first observed value
+    #   tto          projected seconds until the limit (inf if not growing)
+    #   leak         robust growth that reaches the limit within `horizon`
+    values = np.asarray(values, dtype=float)
+    t = np.asarray(times, dtype=float) - (times[0] if len(times) else 0.0)
+    n_series, n_points = values.shape
+    mask = ~np.isnan(values)
+    count = mask.sum(axis=1)
+    y = np.where(mask, values, 0.0)
+    tw = np.where(mask, t, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_mean = tw.sum(axis=1) / count
+        y_mean = y.sum(axis=1) / count
+        dt = np.where(mask, t - t_mean[:, None], 0.0)
+        dy = np.where(mask, values - y_mean[:, None], 0.0)
+        sxx = (dt * dt).sum(axis=1)
+        sxy = (dt * dy).sum(axis=1)
+        syy = (dy * dy).sum(axis=1)
+        slope = sxy / sxx
+        r2 = np.where(syy > 0, sxy * sxy / (sxx * syy), 0.0)
+
+        # Pairwise slopes at a fixed lag of half the window, then the median:
+        # a linear-time relative of the Theil-Sen estimator
+        lag = max(n_points // 2, 1)
+        robust = np.full(n_series, np.nan)
+        if n_points > lag:
+            pair = (values[:, lag:] - values[:, :-lag]) / (t[lag:] - t[:-lag])
+            with warnings.catch_warnings():
+                # all-NaN rows (too few points) stay NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                robust = np.nanmedian(pair, axis=1)
+
+    idx = np.arange(n_series)
+    last_col = np.where(mask.any(axis=1), n_points - 1 - np.argmax(mask[:, ::-1], axis=1), 0)
+    first_col = np.argmax(mask, axis=1)
+    current = np.where(count > 0, values[idx, last_col] if n_points else np.nan, np.nan)
+    first = np.where(count > 0, values[idx, first_col] if n_points else np.nan, np.nan)
+    limits = np.broadcast_to(np.asarray(limits, dtype=float), (n_series,))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        growth = current / first
+        headroom = np.maximum(limits - current, 0.0)
+        tto = np.where(robust > 0, headroom / robust, np.inf)
+    enough = count >= min_points
+    leak = enough & (robust > 0) & (slope > 0) & (tto <= horizon)
+    return {
+        "slope": slope, "robust_slope": robust, "r2": r2, "current": current,
+        "growth": growth, "tto": np.where(enough, tto, np.inf), "leak": leak,
+    }
+
+
+def anomalies(labels, result, limit=None):
+    # Leaking series as plain dicts, soonest time-to-OOM first
+    order = np.argsort(result["tto"])
+    out = []
+    for i in order[result["leak"][order]]:
+        out.append({
+            "labels": labels[i],
+            "current": float(result["current"][i]),
+            "slope": float(result["slope"][i]),
+            "robust_slope": float(result["robust_slope"][i]),
+            "r2": float(result["r2"][i]),
+            "growth": float(result["growth"][i]),
+            "tto": float(result["tto"][i]),
+        })
+        if limit and len(out) >= limit:
+            break
+    return out
@@ -0,0 +1,189 @@
+# metric_windows.py
+# Per-series ring buffers of memory samples with running trend statistics for the Risk Mitigation Agent
+
+import math
+import threading
+
+import numpy as np
+
+
+class MetricWindows:
+    # Trailing `capacity` x `step`-second window for up to `max_series` series,
+    # stored as (series x capacity) arrays indexed by grid slot
+    # (timestamp // step) % capacity. The only dict maps a series key to its row.
+    #
+    # Running sums (n, sum t, sum y, sum t*t, sum t*y, sum y*y) are kept per
+    # series and updated as points enter and leave the window, so least-squares
+    # slopes are available without rescanning. Times are relative to `origin`;
+    # the sums are recomputed from the buffer every `capacity` ingests to stop
+    # floating-point drift.
+    def __init__(self, capacity=60, step=60, max_series=4096):
+        self.capacity = capacity
+        self.step = step
+        self.rows = {}
+        self.labels = []
+        self.origin = None
+        self.values = np.full((max_series, capacity), np.nan)
+        self.stamps = np.full((max_series, capacity), -1, dtype=np.int64)
+        self.last_seen = np.full(max_series, -1, dtype=np.int64)
+        self.sums = np.zeros((max_series, 6))
+        self.ingests = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _row(self, labels):
+        key = tuple(sorted(labels.items()))
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.labels)
+            if row == self.values.shape[0]:
+                self._grow()
+            self.rows[key] = row
+            self.labels.append(labels)
+        return row
+
+    def _grow(self):
+        n = self.values.shape[0]
+        self.values = np.vstack([self.values, np.full((n, self.capacity), np.nan)])
+        self.stamps = np.vstack([self.stamps, np.full((n, self.capacity), -1, dtype=np.int64)])
+        self.last_seen = np.concatenate([self.last_seen, np.full(n, -1, dtype=np.int64)])
+        self.sums = np.vstack([self.sums, np.zeros((n, 6))])
+
+    @staticmethod
+    def _terms(t, y):
+        return np.stack([np.ones_like(t), t, y, t * t, t * y, y * y], axis=-1)
+
+    def span_seconds(self, now, overlap=2):
+        # How far back the next query has to reach: from the newest point
+        # already buffered, less `overlap` steps for samples that land late,
+        # capped at the window length (everything when nothing is buffered)
+        full = self.capacity * self.step
+        n = len(self.labels)
+        if not n or (self.last_seen[:n] < 0).all():
+            return full
+        newest = int(self.last_seen[:n].max()) * self.step
+        return int(min(full, max(self.step, now - newest + overlap * self.step)))
+
+    def span_minutes(self, now):
+        return max(1, math.ceil(self.span_seconds(now) / 60))
+
+    def ingest(self, labels, times, values):
+        # Add a series_matrix() result (labels, grid times in epoch seconds,
+        # series x points values). Points already in the window, or older
+        # than it, are skipped; a late point whose slot is still empty is
+        # merged in, so an overlapping query fills the gaps it left.
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if not len(times):
+            return 0
+        with self.lock:
+            if self.origin is None:
+                self.origin = float(times[0])
+            rows = np.array([self._row(lab) for lab in labels], dtype=np.int64)
+            grid = (times // self.step).astype(np.int64)
+            added = 0
+            for j, g in enumerate(grid):
+                col = values[:, j]
+                slot = g % self.capacity
+                fresh = (~np.isnan(col) & (self.stamps[rows, slot] != g) &
+                         (g > self.last_seen[rows] - self.capacity))
+                if not fresh.any():
+                    continue
+                r = rows[fresh]
+                # Evict whatever occupied the slot (one full window ago)
+                old = self.stamps[r, slot] >= 0
+                if old.any():
+                    ro = r[old]
+                    t_old = self.stamps[ro, slot] * self.step - self.origin
+                    self.sums[ro] -= self._terms(t_old.astype(float), self.values[ro, slot])
+                t_new = np.full(len(r), g * self.step - self.origin, dtype=float)
+                self.values[r, slot] = col[fresh]
+                self.stamps[r, slot] = g
+                self.sums[r] += self._terms(t_new, col[fresh])
+                self.last_seen[r] = np.maximum(self.last_seen[r], g)
+                added += int(fresh.sum())
+            self._expire(int(grid[-1]))
+            self.ingests += 1
+            if self.ingests % self.capacity == 0:
+                self._recompute()
+            return added
+
+    def _expire(self, newest):
+        # Drop points that fell out of the window without being overwritten
+        # (series that stopped reporting)
+        n = len(self.labels)
+        stale = (self.stamps[:n] >= 0) & (self.stamps[:n] <= newest - self.capacity)
+        if stale.any():
+            r, c = np.nonzero(stale)
+            t = self.stamps[r, c] * self.step - self.origin
+            np.subtract.at(self.sums, r, self._terms(t.astype(float), self.values[r, c]))
+            self.values[r, c] = np.nan
+            self.stamps[r, c] = -1
+
+    def _recompute(self):
+        n = len(self.labels)
+        valid = self.stamps[:n] >= 0
+        t = np.where(valid, self.stamps[:n] * self.step - self.origin, 0.0)
+        y = np.where(valid, self.values[:n], 0.0)
+        w = valid.astype(float)
+        self.sums[:n] = np.stack([w.sum(1), (w * t).sum(1), y.sum(1), (w * t * t).sum(1),
+                                  (t * y).sum(1), (y * y).sum(1)], axis=1)
+
+    def trend(self):
+        # Running least-squares statistics per series: count, slope (bytes/s), r2
+        n = len(self.labels)
+        c, st, sy, stt, sty, syy = self.sums[:n].T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sxx = c * stt - st * st
+            sxy = c * sty - st * sy
+            syy_c = c * syy - sy * sy
+            slope = np.where(sxx > 0, sxy / sxx, np.nan)
+            r2 = np.where((sxx > 0) & (syy_c > 0), sxy * sxy / (sxx * syy_c), 0.0)
+        return {"count": c.astype(int), "slope": slope, "r2": r2}
+
+    def latest(self):
+        # Most recent buffered value per series (NaN for series with none)
+        n = len(self.labels)
+        seen = self.last_seen[:n]
+        slot = np.where(seen >= 0, seen % self.capacity, 0)
+        current = self.values[np.arange(n), slot]
+        return np.where((seen >= 0) & (self.stamps[np.arange(n), slot] == seen), current, np.nan)
+
+    def candidates(self, limits, horizon, min_points=5, slack=4.0):
+        # Rows whose running slope would reach `limits` within `slack` x
+        # `horizon`: the only series worth a full memory_trends.analyze() pass
+        trend = self.trend()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tto = (np.asarray(limits, dtype=float) - self.latest()) / trend["slope"]
+        keep = (trend["count"] >= min_points) & (trend["slope"] > 0) & (tto <= slack * horizon)
+        return np.nonzero(keep)[0]
+
+    def matrix(self, rows=None):
+        # (labels, times, values) for the trailing window in time order, in the
+        # same shape series_matrix() returns, for the selected rows
+        n = len(self.labels)
+        rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.int64)
+        if not n or not (self.last_seen[:n] >= 0).any():
+            return [self.labels[i] for i in rows], np.empty(0), np.empty((len(rows), 0))
+        newest = int(self.last_seen[:n].max())
+        grid = np.arange(newest - self.capacity + 1, newest + 1)
+        slots = grid % self.capacity
+        values = self.values[rows][:, slots]
+        values = np.where(self.stamps[rows][:, slots] == grid, values, np.nan)
+        return [self.labels[i] for i in rows], grid * float(self.step), values
+
+
+_windows = {}
+_windows_lock = threading.Lock()
+
+
+def metric_windows(name, capacity=60, step=60):
+    # Process-wide windows per name, so buffered points survive across
+    # workflow cycles; a fresh process starts with one full-window query
+    with _windows_lock:
+        windows = _windows.get(name)
+        if windows is None:
+            windows = _windows[name] = MetricWindows(capacity, step)
+        return windows
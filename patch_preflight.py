@@ -0,0 +1,354 @@
+# patch_preflight.py
+# Local pre-flight checks of LLM-generated patches against the cached workspace, before a PR and a Cloud Build
+#
+# A candidate is the unified diff inside the LLM response (a ```diff fence or
+# the first "--- " line onwards). It is applied in memory to the workspace
+# files it touches, with every context and removed line verified, and the
+# result then goes through checks in a process pool, each with its own
+# timeout:
+#   apply    the diff applies cleanly (in this process)
+#   python   changed .py files compile
+#   yaml     changed .yaml / .yml files parse; Kubernetes manifests (any
+#            document with apiVersion or kind) need apiVersion, kind and
+#            metadata.name
+#   tests    test files for the changed modules (test_<module>.py,
+#            <module>_test.py) and changed test files pass, run with pytest
+#            (unittest without it) in a hard-linked copy of the workspace,
+#            once the checks above passed
+# A patch that fails any check never reaches GitHub, which saves the remote
+# build it would have cost.
+
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from importlib.util import find_spec
+
+try:
+    import yaml
+except ImportError:  # manifests are then reported as skipped
+    yaml = None
+
+_FENCE = re.compile(r"```(?:diff|patch)?[ \t]*\n(.*?)```", re.S)
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+TIMEOUTS = {"python": 10.0, "yaml": 10.0, "tests": 60.0}
+
+
+class PatchError(ValueError):
+    pass
+
+
+def extract_diff(text):
+    # The unified diff in an LLM response, or None
+    text = text or ""
+    for block in _FENCE.findall(text):
+        if re.search(r"^--- ", block, re.M) and re.search(r"^\+\+\+ ", block, re.M):
+            return block
+    start = re.search(r"^--- ", text, re.M)
+    return text[start.start():] if start else None
+
+
+def _path(header):
+    # "--- a/app.py\t2024-..." -> "app.py"; /dev/null -> None
+    name = header[4:].split("\t", 1)[0].strip()
+    if name == "/dev/null":
+        return None
+    return name[2:] if name[:2] in ("a/", "b/") else name
+
+
+def parse_diff(diff):
+    # [(old path, new path, [(old_start, old_len, new_len, [lines])])]
+    files, lines, i = [], diff.splitlines(), 0
+    while i < len(lines):
+        if not (lines[i].startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ ")):
+            i += 1
+            continue
+        old, new, hunks = _path(lines[i]), _path(lines[i + 1]), []
+        i += 2
+        while i < len(lines):
+            match = _HUNK.match(lines[i])
+            if not match:
+                break
+            old_start, old_len = int(match.group(1)), int(match.group(2) or 1)
+            new_len = int(match.group(4) or 1)
+            i += 1
+            body, seen_old, seen_new = [], 0, 0
+            while i < len(lines) and (seen_old < old_len or seen_new < new_len):
+                line = lines[i]
+                if line.startswith("\\"):
+                    i += 1
+                    continue
+                kind = line[:1] or " "
+                if kind not in " +-":
+                    break
+                seen_old += kind != "+"
+                seen_new += kind != "-"
+                body.append(line or " ")
+                i += 1
+            if seen_old != old_len or seen_new != new_len:
+                raise PatchError(f"truncated hunk in {new or old}")
+            hunks.append((old_start, old_len, new_len, body))
+        if not hunks:
+            raise PatchError(f"no hunks for {new or old}")
+        files.append((old, new, hunks))
+    if not files:
+        raise PatchError("no file changes in diff")
+    return files
+
+
+def apply_diff(root, diff):
+    # {path: new text, or None for a deleted file}; raises PatchError when a
+    # context or removed line does not match the workspace
+    changes = {}
+    for old, new, hunks in parse_diff(diff):
+        target = new or old
+        if old is None:
+            source = []
+        else:
+            full = os.path.normpath(os.path.join(root, old))
+            if not full.startswith(os.path.abspath(root) + os.sep) or not os.path.isfile(full):
+                raise PatchError(f"{old} does not exist")
+            with open(full, encoding="utf-8", errors="surrogateescape") as f:
+                source = f.read().splitlines(keepends=True)
+        out, pos = [], 0
+        for old_start, old_len, _, body in hunks:
+            start = old_start - 1 if old_len else old_start
+            if start < pos or start > len(source):
+                raise PatchError(f"hunk at line {old_start} of {target} is out of range")
+            out.extend(source[pos:start])
+            pos = start
+            for line in body:
+                kind, text = line[0], line[1:]
+                if kind == "+":
+                    out.append(text + "\n")
+                    continue
+                if pos >= len(source) or source[pos].rstrip("\r\n") != text:
+                    raise PatchError(f"{target} line {pos + 1} does not match the patch context")
+                if kind == " ":
+                    out.append(source[pos])
+                pos += 1
+        out.extend(source[pos:])
+        if new is None:
+            changes[old] = None
+        else:
+            if os.path.normpath(new).startswith(("..", "/")):
+                raise PatchError(f"unsafe path {new}")
+            changes[new] = "".join(out)
+            if old and old != new:
+                changes[old] = None
+    return changes
+
+
+# --- checks (run in pool processes) -------------------------------------------
+
+def check_python(files):
+    failures = []
+    for path, text in files.items():
+        try:
+            compile(text, path, "exec")
+        except SyntaxError as e:
+            failures.append(f"{path}:{e.lineno}: {e.msg}")
+    return failures
+
+
+def check_yaml(files):
+    if yaml is None:
+        return None
+    failures = []
+    for path, text in files.items():
+        try:
+            documents = [d for d in yaml.safe_load_all(text) if d is not None]
+        except yaml.YAMLError as e:
+            failures.append(f"{path}: {str(e).splitlines()[0]}")
+            continue
+        for n, doc in enumerate(documents):
+            if isinstance(doc, dict) and ("apiVersion" in doc or "kind" in doc):
+                missing = [k for k in ("apiVersion", "kind") if not doc.get(k)]
+                if not (doc.get("metadata") or {}).get("name"):
+                    missing.append("metadata.name")
+                if missing:
+                    failures.append(f"{path} document {n + 1}: missing {', '.join(missing)}")
+    return failures
+
+
+# The only variables a patch's tests see: the agent's environment holds API
+# tokens and keys, and a generated patch is untrusted code
+TEST_ENV = ("PATH", "HOME", "PYTHONPATH", "LANG")
+
+
+def run_tests(root, tests, timeout):
+    if find_spec("pytest") is not None:
+        command = [sys.executable, "-m", "pytest", "-q", "-x", "-p", "no:cacheprovider", *tests]
+    else:
+        command = [sys.executable, "-m", "unittest", *(t[:-3].replace(os.sep, ".") for t in tests)]
+    try:
+        done = subprocess.run(command, cwd=root, capture_output=True, text=True, timeout=timeout,
+                              env=dict({k: os.environ[k] for k in TEST_ENV if k in os.environ},
+                                       PYTHONDONTWRITEBYTECODE="1"))
+    except subprocess.TimeoutExpired:
+        return [f"tests did not finish within {timeout:.0f}s"]
+    if done.returncode == 0:
+        return []
+    return [line for line in (done.stdout + done.stderr).strip().splitlines()[-5:]]
+
+
+# --- driver ------------------------------------------------------------------
+
+def _is_test(path):
+    name = os.path.basename(path)
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+
+def targeted_tests(root, changes):
+    # Test files covering the changed modules, plus changed test files
+    wanted = set()
+    for path in changes:
+        if path.endswith(".py") and not _is_test(path):
+            module = os.path.basename(path)[:-3]
+            wanted |= {f"test_{module}.py", f"{module}_test.py"}
+    tests = {p for p, text in changes.items() if text is not None and _is_test(p)}
+    if wanted:
+        for dirpath, dirnames, names in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in names:
+                if name in wanted:
+                    tests.add(os.path.relpath(os.path.join(dirpath, name), root))
+    return sorted(p for p in tests if changes.get(p, "") is not None)
+
+
+def stage(root, changes, dest):
+    # Hard-linked copy of the workspace with the changed files written out
+    # (unlinked first: workspace files share read-only blobs)
+    def link(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+    shutil.copytree(root, dest, copy_function=link, dirs_exist_ok=True)
+    for path, text in changes.items():
+        full = os.path.join(dest, path)
+        if os.path.lexists(full):
+            os.unlink(full)
+        if text is not None:
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            with open(full, "w", encoding="utf-8", errors="surrogateescape") as f:
+                f.write(text)
+    return dest
+
+
+def _context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class Preflight:
+    # check(workspace, llm_text) -> {"ok", "files", "checks": {name: {status,
+    # seconds, detail}}, "seconds"}; statuses are passed, failed, timeout and
+    # skipped. The compile and manifest checks of one patch run in parallel
+    # on the process pool, the targeted tests only once both passed.
+    def __init__(self, max_workers=2, timeouts=None, run_tests=True):
+        self.timeouts = dict(TIMEOUTS, **(timeouts or {}))
+        self.run_tests = run_tests
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=_context())
+        self.stats = {"checked": 0, "passed": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    def check(self, workspace, text):
+        started = time.perf_counter()
+        report = {"ok": False, "files": [], "checks": {}}
+        diff = extract_diff(text)
+        t = time.perf_counter()
+        try:
+            if diff is None:
+                raise PatchError("no unified diff in the response")
+            changes = apply_diff(workspace, diff)
+            report["checks"]["apply"] = {"status": "passed", "seconds": round(time.perf_counter() - t, 3)}
+        except PatchError as e:
+            report["checks"]["apply"] = {"status": "failed", "seconds": round(time.perf_counter() - t, 3),
+                                         "detail": [str(e)]}
+            return self._done(report, started)
+        report["files"] = sorted(changes)
+        live = {p: text for p, text in changes.items() if text is not None}
+        python = {p: s for p, s in live.items() if p.endswith(".py")}
+        manifests = {p: s for p, s in live.items() if p.endswith((".yaml", ".yml"))}
+        jobs = {}
+        if python:
+            jobs["python"] = self.pool.submit(check_python, python)
+        if manifests:
+            jobs["yaml"] = self.pool.submit(check_yaml, manifests)
+        self._collect(report, jobs, started)
+        tests = targeted_tests(workspace, changes) if self.run_tests else []
+        if tests and any(c["status"] not in ("passed", "skipped") for c in report["checks"].values()):
+            # The test run is the expensive check; a patch that already
+            # failed does not pay for it
+            report["checks"]["tests"] = {"status": "skipped", "seconds": 0.0, "files": tests,
+                                         "detail": ["an earlier check failed"]}
+        elif tests:
+            scratch = tempfile.mkdtemp(prefix="preflight-")
+            try:
+                stage(workspace, changes, os.path.join(scratch, "ws"))
+                future = self.pool.submit(run_tests, os.path.join(scratch, "ws"), tests, self.timeouts["tests"])
+                self._collect(report, {"tests": future}, time.perf_counter())
+                report["checks"]["tests"]["files"] = tests
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+        report["ok"] = all(c["status"] in ("passed", "skipped") for c in report["checks"].values())
+        return self._done(report, started)
+
+    def _collect(self, report, jobs, started):
+        # Jobs run concurrently, so each gets its own timeout from `started`;
+        # the test run enforces its timeout itself (killing pytest) and the
+        # few seconds on top cover getting it to a pool process
+        for name, future in jobs.items():
+            slack = 5.0 if name == "tests" else 0.0
+            try:
+                failures = future.result(timeout=max(self.timeouts[name] + slack - (time.perf_counter() - started), 0.1))
+            except FutureTimeout:
+                future.cancel()
+                report["checks"][name] = {"status": "timeout", "seconds": round(time.perf_counter() - started, 3)}
+                continue
+            except Exception as e:
+                failures = [f"{type(e).__name__}: {e}"]
+            entry = {"status": "skipped" if failures is None else "failed" if failures else "passed",
+                     "seconds": round(time.perf_counter() - started, 3)}
+            if failures:
+                entry["detail"] = failures
+            report["checks"][name] = entry
+
+    def _done(self, report, started):
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        with self.lock:
+            self.stats["checked"] += 1
+            self.stats["passed" if report["ok"] else "failed"] += 1
+        return report
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def summary(report):
+    # One line naming the failed checks, for PR records and trace spans
+    failed = [f"{name}: {'; '.join(c.get('detail') or [c['status']])}"
+              for name, c in report["checks"].items() if c["status"] not in ("passed", "skipped")]
+    return " | ".join(failed)[:500]
+
+
+_preflights = {}
+_preflights_lock = threading.Lock()
+
+
+def preflight(name, factory):
+    # Process-wide checker (and its process pool) per name
+    with _preflights_lock:
+        checker = _preflights.get(name)
+        if checker is None:
+            checker = _preflights[name] = factory()
+        return checker
@@ -0,0 +1,489 @@
+# pipeline_replay.py
+# Replays incident traces through all six agent workflows against the local stand-ins and measures the pipeline
+#
+#   python pipeline_replay.py run [--trace FILE | --scenario NAME] [--speed X] [--latency S] [--output FILE]
+#       Starts every stand-in (local_runtime.start_standins), runs the agents
+#       in this process and feeds the trace in at `speed` times real time:
+#       pod failures are published on pod-errors-sub, memory growth goes to
+#       the Cloud Monitoring stand-in. Prints (and writes) one JSON result:
+#       events/s, queue depth per pipeline stage over time, API calls per
+#       incident, per-hop / MTTR latency percentiles from the incident spans
+#       and the agents' step latencies.
+#   python pipeline_replay.py synth --scenario NAME [options] > trace.jsonl
+#   python pipeline_replay.py compare BASE.json NEW.json
+#
+# Traces are JSON lines ordered by "t" (seconds from the start of the trace):
+#   {"t": 1.5, "kind": "error", "service": "demo", "pod": "demo-0", "error": "Traceback ..."}
+#   {"t": 1.5, "kind": "log", "service": "demo", "pod": "demo-0", "container": "app", "line": "..."}
+#   {"t": 60, "kind": "memory", "service": "demo", "pod": "demo-0", "bytes": 83886080}
+#   {"t": 90, "kind": "leak", "service": "demo", "pod": "demo-0", "bytes": 1000000}
+# "log" is one pod log line (a Cloud Logging entry on pod-errors-sub, which
+# the Error Analyzer reassembles into exceptions), "memory" sets a container's usage, "leak" adds to it (one demo_app /leak
+# call is about 1 MB). Agents keep process-wide state (feeds, trackers,
+# schedulers), so run one replay per process.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from http_pool import AsyncExecutor
+from tracing import HOPS, flush_all, read_spans, report, spans_in
+
+SCENARIOS = ["error-burst", "logs", "leak", "mixed"]
+
+# Stand-in names for --api-latency and the per-API call counts
+APIS = {
+    "pubsub": "https://pubsub.googleapis.com",
+    "text-bison": "https://text-bison.googleapis.com",
+    "github": "https://api.github.com",
+    "cloudbuild": "https://cloudbuild.googleapis.com",
+    "gke": "https://container.googleapis.com",
+    "sendgrid": "https://api.sendgrid.com",
+    "bigquery": "https://bigquery.googleapis.com",
+    "monitoring": "https://monitoring.googleapis.com",
+    "rtdb": "rtdb",
+}
+
+# Waits and windows shortened so an incident can cross the pipeline in
+# seconds; --env overrides any of them
+REPLAY_ENV = {
+    "SERVICE": "demo",
+    "SERVICE_NAME": "demo",
+    "PROJECT": "local",
+    "PROJECT_ID": "local",
+    "DEPLOY_MIN_INTERVAL": "2",
+    "ROLLOUT_DEADLINE": "10",
+    "ROLLOUT_BAKE": "1",
+    "DIGEST_WINDOW": "5",
+}
+
+_SUBSCRIPTION = "pod-errors-sub"
+_FINISHED = ("SUCCESS", "FAILURE", "CANCELLED")
+
+
+# --- traces ------------------------------------------------------------------
+
+def _frames(name):
+    return (f'Traceback (most recent call last):\n'
+            f'  File "/usr/local/lib/python3.11/site-packages/flask/app.py", line 1484, in full_dispatch_request\n'
+            f'  File "/app/app.py", line {14 + len(name)}, in {name}\n')
+
+
+def error_burst_trace(bursts=3, burst_size=40, distinct=4, gap=300.0, spread=10.0, services=("demo",), seed=7):
+    # `bursts` bursts of `burst_size` pod failures, `gap` seconds apart and
+    # spread over `spread` seconds each. Every burst brings `distinct` new
+    # error signatures (the incidents); the rest of the burst repeats them.
+    rng = random.Random(seed)
+    events = []
+    for b in range(bursts):
+        signatures = []
+        for d in range(distinct):
+            k = b * distinct + d
+            handler = "handle_" + "".join(chr(97 + (k // 26 ** i) % 26) for i in range(3))
+            signatures.append(_frames(handler) + f"RuntimeError: Triggered failure for demo in {handler}")
+        for i in range(burst_size):
+            service = services[i % len(services)]
+            events.append({"t": round(b * gap + rng.random() * spread, 3), "kind": "error", "service": service,
+                           "pod": f"{service}-{rng.randrange(5)}", "error": signatures[i % distinct]})
+    return sorted(events, key=lambda e: e["t"])
+
+
+def log_trace(errors, interval=0.002, chatter=3, seed=7):
+    # The failures of an error trace as the pods' log lines: each traceback
+    # line by line, `interval` seconds apart, then `chatter` access log
+    # lines, so the lines of failures on different pods interleave
+    rng = random.Random(seed)
+    events = []
+    for error in errors:
+        lines = error["error"].split("\n") + \
+            [f'10.0.0.{rng.randrange(255)} - - "GET / HTTP/1.1" 200 -' for _ in range(chatter)]
+        for i, line in enumerate(lines):
+            events.append({"t": round(error["t"] + i * interval, 4), "kind": "log", "service": error["service"],
+                           "pod": error["pod"], "container": error["service"], "line": line})
+    return sorted(events, key=lambda e: e["t"])
+
+
+def leak_trace(pods=2, minutes=60, baseline=80e6, calls_per_minute=2.0, leak_bytes=1e6, services=("demo",), seed=7):
+    # Containers at `baseline` bytes, one of them hit on /leak
+    # calls_per_minute times a minute (`leak_bytes` each) for `minutes`
+    rng = random.Random(seed)
+    events = []
+    for p in range(pods):
+        service = services[p % len(services)]
+        events.append({"t": 0.0, "kind": "memory", "service": service, "pod": f"{service}-{p}",
+                       "bytes": baseline + rng.random() * 5e6})
+    t, end = 0.0, minutes * 60.0
+    while True:
+        t += rng.expovariate(calls_per_minute / 60.0)
+        if t >= end:
+            break
+        events.append({"t": round(t, 3), "kind": "leak", "service": services[0], "pod": f"{services[0]}-0",
+                       "bytes": leak_bytes})
+    return events
+
+
+def synthetic_trace(scenario, **options):
+    if scenario == "error-burst":
+        return error_burst_trace(**options.get("errors", {}))
+    if scenario == "logs":
+        return log_trace(error_burst_trace(**options.get("errors", {})), **options.get("logs", {}))
+    if scenario == "leak":
+        return leak_trace(**options.get("leak", {}))
+    if scenario == "mixed":
+        # Leak growth over the whole replay, failure bursts in its second half
+        leak = leak_trace(**options.get("leak", {}))
+        offset = leak[-1]["t"] / 2 if leak else 0.0
+        errors = [dict(e, t=e["t"] + offset) for e in error_burst_trace(**options.get("errors", {}))]
+        return sorted(leak + errors, key=lambda e: e["t"])
+    raise ValueError(f"unknown scenario {scenario!r} (expected one of {', '.join(SCENARIOS)})")
+
+
+def load_trace(path):
+    with open(path) as f:
+        return sorted((json.loads(line) for line in f if line.strip()), key=lambda e: e["t"])
+
+
+def pod_failure(event):
+    # The Pub/Sub payload the cluster's log sink publishes for a failed pod
+    return {"podName": event.get("pod") or event["service"], "error": event["error"],
+            "metadata": {"labels": {"app": event["service"]}}}
+
+
+def log_entry(event):
+    # The Cloud Logging entry the log sink publishes for one pod log line
+    return {"textPayload": event["line"], "labels": {"k8s-pod/app": event["service"]},
+            "resource": {"type": "k8s_container", "labels": {
+                "namespace_name": "default", "pod_name": event.get("pod") or event["service"],
+                "container_name": event.get("container") or event["service"]}}}
+
+
+# --- measurement -------------------------------------------------------------
+
+class _HopProgress:
+    # Tails the incident spans file: incidents done / failed per hop
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.done = {hop: set() for hop in HOPS}
+        self.failed = {hop: set() for hop in HOPS}
+
+    def update(self):
+        flush_all()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        for line in data[:end].decode().splitlines():
+            if not line.strip():
+                continue
+            for _, span in spans_in(line):
+                hop, incident = span["attributes"].get("incident.hop"), span["attributes"].get("incident.id")
+                if hop in self.done:
+                    failed = span.get("status", {}).get("code") == 2
+                    (self.failed if failed else self.done)[hop].add(incident)
+
+    def depths(self):
+        # Incidents past the previous hop but not (successfully or not) past this one
+        return {hop: len(self.done[before] - self.done[hop] - self.failed[hop])
+                for before, hop in zip(HOPS, HOPS[1:])}
+
+
+class Replay:
+    # One run of `trace` through `agents` (local_runtime definitions) with
+    # every API on the stand-ins. latency: seconds added to every stand-in
+    # request; api_latency: per stand-in name (APIS) overrides.
+    def __init__(self, trace, agents, env, speed=1.0, time_scale=0.02, latency=0.0, api_latency=None,
+                 build_seconds=1.0, build_runners=2, sample=0.5, settle=5.0, timeout=300.0, log=None):
+        self.trace = trace
+        self.agents = agents
+        self.env = env
+        self.speed = speed
+        self.time_scale = time_scale
+        self.latency = latency
+        self.api_latency = api_latency or {}
+        self.build_seconds = build_seconds
+        self.build_runners = build_runners
+        self.sample = sample
+        self.settle = settle
+        self.timeout = timeout
+        self.log = log or (lambda message: None)
+        self.duration = max((e["t"] for e in trace), default=0.0)
+
+    def _setup(self, standins):
+        for name, key in APIS.items():
+            standins[key].latency = self.api_latency.get(name, self.latency)
+        build = standins[APIS["cloudbuild"]]
+        build.duration, build.runners = self.build_seconds, self.build_runners
+        # Metric time runs `speed` times faster than the wall clock, starting
+        # one trace length in the past so it never gets ahead of it
+        origin = time.time() - self.duration
+
+        def clock():
+            return min(origin + (time.time() - self.started) * self.speed, time.time())
+        standins[APIS["monitoring"]].clock = clock
+
+    def _feed(self, event, standins):
+        if event["kind"] == "error":
+            attributes = {"correlationId": event["correlationId"]} if event.get("correlationId") else None
+            standins[APIS["pubsub"]].publish(pod_failure(event), attributes, subscription=_SUBSCRIPTION)
+            self.published["error"] += 1
+            return
+        if event["kind"] == "log":
+            standins[APIS["pubsub"]].publish(log_entry(event), subscription=_SUBSCRIPTION)
+            self.published["log"] = self.published.get("log", 0) + 1
+            return
+        monitoring = standins[APIS["monitoring"]]
+        pod, container = event.get("pod") or event["service"], event["service"]
+        if event["kind"] == "memory":
+            monitoring.set_memory(pod, container, event["bytes"])
+        elif event["kind"] == "leak":
+            monitoring.grow(pod, container, event["bytes"])
+        else:
+            raise ValueError(f"unknown trace event kind {event['kind']!r}")
+        self.published[event["kind"]] = self.published.get(event["kind"], 0) + 1
+
+    async def _publish(self, standins):
+        for event in self.trace:
+            delay = self.started + event["t"] / self.speed - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._feed(event, standins)
+        self.replayed = time.time() - self.started
+
+    def _depths(self, standins, progress):
+        progress.update()
+        builds = standins[APIS["cloudbuild"]]
+        with builds.lock:
+            building = sum(1 for b in builds.builds.values() if b["status"] not in _FINISHED)
+        return {"pubsub": standins[APIS["pubsub"]].pending(_SUBSCRIPTION), **progress.depths(),
+                "cloud_build": building}
+
+    async def _main(self, standins, runners, progress):
+        self.started = time.time()
+        agents = asyncio.gather(*(runner.run() for runner in runners))
+        publish = asyncio.ensure_future(self._publish(standins))
+        quiet_since, github = None, standins[APIS["github"]]
+        try:
+            while True:
+                await asyncio.sleep(self.sample)
+                now = time.time() - self.started
+                depths = self._depths(standins, progress)
+                self.timeline.append([round(now, 2), depths])
+                if self.drained is None and publish.done() and depths["pubsub"] == 0:
+                    self.drained = now
+                if self.first_risk_pr is None and any(
+                        p.get("head", "").startswith("risk-mitigation/") for p in list(github.created_pulls)):
+                    self.first_risk_pr = now
+                if agents.done():
+                    agents.result()
+                    break
+                if not publish.done() or any(depths.values()):
+                    quiet_since = None
+                elif quiet_since is None:
+                    quiet_since = now
+                if quiet_since is not None and now - quiet_since >= self.settle:
+                    break
+                if now >= self.timeout:
+                    self.timed_out = True
+                    break
+        finally:
+            for task in (agents, publish):
+                task.cancel()
+            await asyncio.gather(agents, publish, return_exceptions=True)
+            await runners[0].executor.aclose()
+
+    def run(self):
+        from local_runtime import AgentRunner, scheduler_for, start_standins, stop_standins
+
+        self.published, self.timeline = {"error": 0}, []
+        self.replayed = self.drained = self.first_risk_pr = None
+        self.timed_out = False
+        scratch = tempfile.mkdtemp(prefix="agents-replay-")
+        standins, overrides = start_standins(self.env)
+        env = dict(self.env, **overrides, TRACE_EXPORT=os.path.join(scratch, "spans.jsonl"))
+        self.scheduler = None
+        try:
+            self._setup(standins)
+            executor = AsyncExecutor()
+            self.scheduler = scheduler_for(env, self.time_scale)
+            runners = [AgentRunner(agent, env, executor, self.time_scale, self.log, self.scheduler)
+                       for agent in self.agents]
+            progress = _HopProgress(env["TRACE_EXPORT"])
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self._main(standins, runners, progress))
+            finally:
+                # Run steps still blocked in a feed poll finish on their own;
+                # closing the loop does not wait for them
+                loop.close()
+            elapsed = time.time() - self.started
+            progress.update()
+            return self._result(standins, runners, progress, env["TRACE_EXPORT"], elapsed)
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.detach()
+            stop_standins(standins)
+
+    def _result(self, standins, runners, progress, spans_path, elapsed):
+        spans = report(read_spans([spans_path])) if os.path.exists(spans_path) else report([])
+        github = standins[APIS["github"]]
+        risk_prs = sum(1 for p in github.created_pulls if p.get("head", "").startswith("risk-mitigation/"))
+        incidents = len(progress.done["detect"]) + risk_prs
+        calls = {name: standins[key].calls for name, key in APIS.items()}
+        stages = list(self.timeline[0][1]) if self.timeline else []
+        depth = {}
+        for stage in stages:
+            values = [d[stage] for _, d in self.timeline]
+            depth[stage] = {"max": max(values), "mean": round(sum(values) / len(values), 2)}
+        events = sum(self.published.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "timed_out": self.timed_out,
+            "trace": {"events": events, **self.published, "duration_s": self.duration, "speed": self.speed},
+            "throughput": {
+                "events_per_s": round(events / self.replayed, 2) if self.replayed else None,
+                "pod_failures_ingested_per_s": round(self.published["error"] / self.drained, 2)
+                if self.drained and self.published["error"] else None,
+                "incidents_resolved_per_s": round(len(progress.done["deploy"]) / elapsed, 3),
+            },
+            "incidents": {
+                "detected": len(progress.done["detect"]),
+                **{hop: len(progress.done[hop]) for hop in HOPS[1:]},
+                "failed": {hop: len(progress.failed[hop]) for hop in HOPS if progress.failed[hop]},
+                "risk_prs": risk_prs,
+                "first_risk_pr_s": round(self.first_risk_pr, 2) if self.first_risk_pr is not None else None,
+            },
+            "queue_depth": depth,
+            "queue_depth_timeline": self.timeline,
+            "api_calls": calls,
+            "api_calls_per_incident": {name: round(n / incidents, 2) for name, n in calls.items()} if incidents else {},
+            "latency_s": {k: spans[k] for k in ("hops_s", "mttr_s", "failure_to_report_s")},
+            "steps_s": spans["steps_s"],
+            "agents": {runner.agent.display_name: runner.stats for runner in runners},
+            "loop_scheduler": self.scheduler.stats() if self.scheduler is not None else None,
+        }
+
+
+def _flatten(result, prefix=""):
+    # {"a.b.p50": number} of every numeric leaf, for compare()
+    out = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            out.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[f"{prefix}{key}"] = value
+    return out
+
+
+def compare(base, new):
+    # {metric: [base, new, relative change]} for the numeric metrics of two
+    # results (the timeline and per-step latencies left out)
+    a, b = (_flatten({k: v for k, v in r.items() if k not in ("queue_depth_timeline", "steps_s")})
+            for r in (base, new))
+    return {key: [a.get(key), b.get(key),
+                  round((b[key] - a[key]) / a[key], 3) if a.get(key) and key in b else None]
+            for key in sorted(set(a) | set(b))}
+
+
+def add_arguments(p):
+    # Options shared with `benchmarks.py pipeline`
+    source = p.add_mutually_exclusive_group()
+    source.add_argument("--trace", help="JSON-lines trace to replay (recorded or from `synth`)")
+    source.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    p.add_argument("--speed", type=float, default=60.0, help="trace seconds per wall-clock second")
+    p.add_argument("--time-scale", type=float, default=0.02, help="multiplier for the agents' wait steps")
+    p.add_argument("--latency", type=float, default=0.0, help="seconds added to every stand-in request")
+    p.add_argument("--api-latency", action="append", default=[], metavar="API=SECONDS",
+                   help=f"per stand-in latency ({', '.join(APIS)})")
+    p.add_argument("--build-seconds", type=float, default=1.0)
+    p.add_argument("--build-runners", type=int, default=2)
+    p.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="override an agent setting")
+    p.add_argument("--agents", nargs="*", default=[], help="display or module names (default: all)")
+    p.add_argument("--settle", type=float, default=5.0, help="seconds of empty queues that end the run")
+    p.add_argument("--timeout", type=float, default=300.0)
+    p.add_argument("--sample", type=float, default=0.5, help="queue depth sampling interval")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--output", help="also write the JSON result here")
+    p.add_argument("--verbose", action="store_true", help="log failing agent steps to stderr")
+
+
+def _pairs(values, convert=str):
+    out = {}
+    for item in values:
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"expected NAME=VALUE, got {item!r}")
+        out[name] = convert(value)
+    return out
+
+
+def replay(args):
+    from local_runtime import compile_agent, load_definitions, load_env, select_agents
+
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(
+        args.scenario, errors={"seed": args.seed}, leak={"seed": args.seed})
+    api_latency = _pairs(args.api_latency, float)
+    unknown = set(api_latency) - set(APIS)
+    if unknown:
+        raise SystemExit(f"unknown API {', '.join(sorted(unknown))} (expected {', '.join(APIS)})")
+    env = dict(load_env(), **REPLAY_ENV)
+    env.update(_pairs(args.env))
+    agents = select_agents(load_definitions(), args.agents)
+    for agent in agents:
+        compile_agent(agent)
+    log = (lambda message: print(message, file=sys.stderr)) if args.verbose else None
+    result = Replay(trace, agents, env, speed=args.speed, time_scale=args.time_scale, latency=args.latency,
+                    api_latency=api_latency, build_seconds=args.build_seconds, build_runners=args.build_runners,
+                    sample=args.sample, settle=args.settle, timeout=args.timeout, log=log).run()
+    result["config"] = {"trace": args.trace or args.scenario, "speed": args.speed, "time_scale": args.time_scale,
+                        "latency": args.latency, "api_latency": api_latency, "build_seconds": args.build_seconds,
+                        "build_runners": args.build_runners, "seed": args.seed}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay incident traces through the agent pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add_arguments(sub.add_parser("run", help="replay a trace and measure the pipeline"))
+    p = sub.add_parser("synth", help="write a synthetic trace as JSON lines")
+    p.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    p.add_argument("--bursts", type=int, default=3)
+    p.add_argument("--burst-size", type=int, default=40)
+    p.add_argument("--distinct", type=int, default=4, help="new error signatures per burst")
+    p.add_argument("--gap", type=float, default=300.0, help="seconds between bursts")
+    p.add_argument("--minutes", type=int, default=60, help="length of the leak")
+    p.add_argument("--leak-rate", type=float, default=2.0, help="/leak calls per minute")
+    p.add_argument("--seed", type=int, default=7)
+    p = sub.add_parser("compare", help="metric-by-metric change between two run results")
+    p.add_argument("base")
+    p.add_argument("new")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        result = replay(args)
+    elif args.command == "synth":
+        errors = {"bursts": args.bursts, "burst_size": args.burst_size, "distinct": args.distinct,
+                  "gap": args.gap, "seed": args.seed}
+        leak = {"minutes": args.minutes, "calls_per_minute": args.leak_rate, "seed": args.seed}
+        for event in synthetic_trace(args.scenario, errors=errors, leak=leak):
+            print(json.dumps(event))
+        return
+    else:
+        with open(args.base) as a, open(args.new) as b:
+            result = compare(json.load(a), json.load(b))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
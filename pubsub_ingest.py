@@ -0,0 +1,64 @@
+# pubsub_ingest.py
+# Batched, streaming Pub/Sub pull loop used by the Error Analyzer
+
+import json
+import time
+
+from http_pool import shared_pool
+
+# Pub/Sub caps a single pull at 1000 messages and a single acknowledge at 2500 ackIds
+MAX_PULL_MESSAGES = 1000
+MAX_ACK_IDS = 2500
+
+
+def _post(url, payload, headers=None, timeout=30):
+    # Through the shared pool, so pulls and acks get Pub/Sub's Policy and
+    # count against loop budgets
+    _, _, data = shared_pool().request("POST", url, body=json.dumps(payload),
+                                       headers={"Content-Type": "application/json", **(headers or {})},
+                                       timeout=timeout)
+    return json.loads(data or b"{}")
+
+
+class PubSubPuller:
+    # subscription_url is the full ".../subscriptions/{name}" resource URL.
+    # Pulls up to max_messages per call, loops straight back while the
+    # subscription has a backlog and only sleeps idle_wait once it is empty.
+    def __init__(self, subscription_url, max_messages=100, idle_wait=60.0, headers=None):
+        self.subscription_url = subscription_url
+        self.max_messages = min(max_messages, MAX_PULL_MESSAGES)
+        self.idle_wait = idle_wait
+        self.headers = headers or {}
+        self.pulled = 0
+        self.pull_calls = 0
+        self.ack_calls = 0
+
+    def pull(self):
+        self.pull_calls += 1
+        resp = _post(f"{self.subscription_url}:pull", {"maxMessages": self.max_messages}, self.headers)
+        msgs = resp.get("receivedMessages", [])
+        self.pulled += len(msgs)
+        return msgs
+
+    def ack(self, ack_ids):
+        for i in range(0, len(ack_ids), MAX_ACK_IDS):
+            self.ack_calls += 1
+            _post(f"{self.subscription_url}:acknowledge", {"ackIds": ack_ids[i:i + MAX_ACK_IDS]}, self.headers)
+
+    def nack(self, ack_ids):
+        # Hand these messages back for immediate redelivery (ack deadline 0)
+        for i in range(0, len(ack_ids), MAX_ACK_IDS):
+            self.ack_calls += 1
+            _post(f"{self.subscription_url}:modifyAckDeadline",
+                  {"ackIds": ack_ids[i:i + MAX_ACK_IDS], "ackDeadlineSeconds": 0}, self.headers)
+
+    def run(self, handler, should_stop=lambda: False, sleep=time.sleep):
+        # handler receives the whole receivedMessages list; the batch is acked
+        # in one call once the handler returns without raising.
+        while not should_stop():
+            msgs = self.pull()
+            if not msgs:
+                sleep(self.idle_wait)
+                continue
+            handler(msgs)
+            self.ack([m["ackId"] for m in msgs])
@@ -0,0 +1,186 @@
+# repo_snapshot.py
+# Incremental, content-addressed repository snapshot cache used by the Fix Generator
+
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
+import stat
+import tempfile
+import time
+import urllib.parse
+import zipfile
+
+from http_pool import HttpError, shared_pool
+
+GITHUB_API = "https://api.github.com"
+
+
+class Workspace:
+    def __init__(self, org, repo, sha, path, fetched):
+        self.org = org
+        self.repo = repo
+        self.sha = sha
+        self.path = path
+        # True when this call had to download the archive
+        self.fetched = fetched
+
+    def files(self):
+        for dirpath, _, names in os.walk(self.path):
+            for name in names:
+                full = os.path.join(dirpath, name)
+                yield os.path.relpath(full, self.path)
+
+    def open_mmap(self, relpath):
+        # Read-only memory map of a workspace file (empty files map to b"")
+        with open(os.path.join(self.path, relpath), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class RepoSnapshotCache:
+    # Layout under root:
+    #   refs.json                      {"org/repo@ref": {"sha": ..., "etag": ...}}
+    #   objects/ab/cdef...             file blobs keyed by sha256 of their contents
+    #   workspaces/org/repo/<sha>/     read-only trees of hard links into objects/
+    # A ref is re-resolved with If-None-Match on every call; the archive is only
+    # downloaded when the commit sha has moved to one we have not unpacked yet.
+    # Blobs shared between commits are stored once. Requests go through the
+    # shared pool (keep-alive, GitHub's Policy, loop budgets).
+    def __init__(self, root, token=None, api_url=GITHUB_API, timeout=120, pool=None):
+        self.root = root
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.pool = pool
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.stats = {"requests": 0, "not_modified": 0, "archives": 0, "bytes_transferred": 0}
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "workspaces"), exist_ok=True)
+        self._refs_path = os.path.join(root, "refs.json")
+        try:
+            with open(self._refs_path) as f:
+                self.refs = json.load(f)
+        except (OSError, ValueError):
+            self.refs = {}
+
+    def _get(self, url, headers):
+        # (status, body, headers with lower-case names); 304 is returned as
+        # is, redirects (zipballs are served from codeload.github.com) are
+        # followed, without the token once they leave the API host
+        headers = {**self.headers, **headers}
+        for _ in range(5):
+            self.stats["requests"] += 1
+            status, resp_headers, data = (self.pool or shared_pool()).request(
+                "GET", url, headers=headers, timeout=self.timeout)
+            resp_headers = {k.lower(): v for k, v in resp_headers.items()}
+            if status in (301, 302, 303, 307, 308) and "location" in resp_headers:
+                target = urllib.parse.urljoin(url, resp_headers["location"])
+                if urllib.parse.urlsplit(target).netloc != urllib.parse.urlsplit(url).netloc:
+                    headers = {k: v for k, v in headers.items() if k != "Authorization"}
+                url = target
+                continue
+            self.stats["bytes_transferred"] += len(data)
+            return status, data, resp_headers
+        raise HttpError(status, data, url, resp_headers)
+
+    def resolve(self, org, repo, ref="main"):
+        key = f"{org}/{repo}@{ref}"
+        known = self.refs.get(key)
+        headers = {"Accept": "application/vnd.github.sha"}
+        if known and known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        status, data, resp_headers = self._get(f"{self.api_url}/repos/{org}/{repo}/commits/{ref}", headers)
+        if status == 304:
+            self.stats["not_modified"] += 1
+            return known["sha"]
+        sha = data.decode().strip()
+        if sha.startswith("{"):
+            sha = json.loads(sha)["sha"]
+        self.refs[key] = {"sha": sha, "etag": resp_headers.get("etag")}
+        self._save_refs()
+        return sha
+
+    def _save_refs(self):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.refs, f)
+        os.replace(tmp, self._refs_path)
+
+    def workspace(self, org, repo, ref="main"):
+        sha = self.resolve(org, repo, ref)
+        path = os.path.join(self.root, "workspaces", org, repo, sha)
+        if os.path.isdir(path):
+            return Workspace(org, repo, sha, path, fetched=False)
+        status, data, _ = self._get(f"{self.api_url}/repos/{org}/{repo}/zipball/{sha}", {})
+        self.stats["archives"] += 1
+        self._unpack(data, path)
+        return Workspace(org, repo, sha, path, fetched=True)
+
+    def _store_blob(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        blob = os.path.join(self.root, "objects", digest[:2], digest[2:])
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(blob))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, blob)
+        return blob
+
+    def _unpack(self, archive, path):
+        # Unpack into a temp dir next to the final path and rename it into
+        # place, so a half-built workspace is never visible.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging = tempfile.mkdtemp(dir=os.path.dirname(path))
+        try:
+            with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+                for info in zf.infolist():
+                    # zipballs wrap everything in a single "{org}-{repo}-{sha}/" directory
+                    rel = info.filename.split("/", 1)[1] if "/" in info.filename else ""
+                    if not rel or info.is_dir():
+                        continue
+                    target = os.path.normpath(os.path.join(staging, rel))
+                    if not target.startswith(staging + os.sep):
+                        raise ValueError(f"unsafe path in archive: {info.filename}")
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    blob = self._store_blob(zf.read(info))
+                    try:
+                        os.link(blob, target)
+                    except OSError:
+                        shutil.copyfile(blob, target)
+                        os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.rename(staging, path)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            # Another worker may have unpacked the same sha first
+            if not os.path.isdir(path):
+                raise
+
+    def prune(self, keep=3):
+        # Drop all but the newest `keep` workspaces per repo; blobs no longer
+        # linked from any workspace (link count 1) are removed as well.
+        base = os.path.join(self.root, "workspaces")
+        for org in os.listdir(base):
+            for repo in os.listdir(os.path.join(base, org)):
+                repo_dir = os.path.join(base, org, repo)
+                shas = sorted(os.listdir(repo_dir), key=lambda s: os.stat(os.path.join(repo_dir, s)).st_mtime)
+                for sha in shas[:-keep] if keep else shas:
+                    shutil.rmtree(os.path.join(repo_dir, sha), ignore_errors=True)
+        objects = os.path.join(self.root, "objects")
+        for dirpath, _, names in os.walk(objects):
+            for name in names:
+                blob = os.path.join(dirpath, name)
+                if os.stat(blob).st_nlink <= 1:
+                    os.remove(blob)
+
+
+def timed_workspace(cache, org, repo, ref="main"):
+    # (workspace, seconds, bytes transferred) for one workspace() call
+    before = cache.stats["bytes_transferred"]
+    start = time.perf_counter()
+    ws = cache.workspace(org, repo, ref)
+    return ws, time.perf_counter() - start, cache.stats["bytes_transferred"] - before
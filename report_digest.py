@@ -0,0 +1,248 @@
+# report_digest.py
+# Windowed digest emails and batched BigQuery streaming inserts for the Reporter
+
+import hashlib
+import json
+import threading
+import time
+
+from http_pool import HttpError, shared_pool
+
+# Reporter event type -> RTDB path it is fed from
+REPORTER_SOURCES = {
+    "errors": "errors",
+    "pr_requests": "pr-requests",
+    "builds": "builds",
+    "deploys": "deploys",
+    "risk_mitigations": "risk-mitigations",
+}
+
+# BigQuery insertAll: 50,000 rows and 10 MB per request; 500 rows is the
+# recommended batch size, and we keep headroom under the byte limit
+BQ_MAX_ROWS = 500
+BQ_MAX_BYTES = 9 * 1024 * 1024
+
+
+def insert_id(event_type, key):
+    # Stable per event, so a retried batch is deduplicated by BigQuery
+    return hashlib.sha1(f"{event_type}/{key}".encode()).hexdigest()
+
+
+def bq_batches(events, max_rows=BQ_MAX_ROWS, max_bytes=BQ_MAX_BYTES):
+    # events are {"type", "key", "data"} dicts; returns insertAll request bodies
+    batches, rows, size = [], [], 0
+    for event in events:
+        row = {"insertId": insert_id(event["type"], event["key"]),
+               "json": dict(event["data"], eventType=event["type"])}
+        row_size = len(json.dumps(row)) + 1
+        if rows and (len(rows) >= max_rows or size + row_size > max_bytes):
+            batches.append({"rows": rows, "skipInvalidRows": True})
+            rows, size = [], 0
+        rows.append(row)
+        size += row_size
+    if rows:
+        batches.append({"rows": rows, "skipInvalidRows": True})
+    return batches
+
+
+def _insert(pool, url, batch, headers=None):
+    # POST one insertAll batch; returns the indexes of the rows it rejected
+    _, _, body = pool.request("POST", url, body=json.dumps(batch),
+                              headers={"Content-Type": "application/json", **(headers or {})})
+    errors = json.loads(body or b"{}").get("insertErrors", [])
+    return {error.get("index") for error in errors}
+
+
+def insert_all(url, batches, headers=None, pool=None):
+    # POST each batch; returns (rows inserted, rows rejected)
+    pool = pool or shared_pool()
+    inserted = rejected = 0
+    for batch in batches:
+        errors = _insert(pool, url, batch, headers)
+        rejected += len(errors)
+        inserted += len(batch["rows"]) - len(errors)
+    return inserted, rejected
+
+
+class RemediationLog:
+    # Streams Reporter events into BigQuery and tracks which are stored.
+    # Events of a failed insertAll request or of rows BigQuery rejected
+    # (insertErrors) stay queued and go out again with the next write();
+    # insertId dedupes the rows a failed request did store. An event's feed
+    # key may only be committed once its digest was sent and its row stored:
+    # sent() takes the keys of a sent digest, and ready() hands back the keys
+    # for which both hold.
+    def __init__(self, url, headers=None, pool=None):
+        self.url = url
+        self.headers = headers or {}
+        self.pool = pool
+        self.queued = []
+        self.stored = set()
+        self.digested = set()
+        self.stats = {"requests": 0, "inserted": 0, "rejected": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    def write(self, events):
+        # Stream `events` and the queued ones; returns this write's counts
+        with self.lock:
+            events, self.queued = self.queued + list(events), []
+        pool = self.pool or shared_pool()
+        counts = {"requests": 0, "inserted": 0, "rejected": 0, "failed": 0}
+        retry, stored, start = [], [], 0
+        batches = bq_batches(events)
+        try:
+            for batch in batches:
+                rows, start = events[start:start + len(batch["rows"])], start + len(batch["rows"])
+                counts["requests"] += 1
+                try:
+                    errors = _insert(pool, self.url, batch, self.headers)
+                except HttpError:
+                    counts["failed"] += len(rows)
+                    retry += rows
+                    continue
+                counts["rejected"] += len(errors)
+                counts["inserted"] += len(rows) - len(errors)
+                for i, event in enumerate(rows):
+                    (retry if i in errors else stored).append(event)
+        finally:
+            # Whatever was not stored, an unexpected error's rest included
+            retry += events[start:]
+            with self.lock:
+                self.queued = retry + self.queued
+                self.stored.update((event["type"], event["key"]) for event in stored)
+                for name, count in counts.items():
+                    self.stats[name] += count
+        return dict(counts, queued=len(retry))
+
+    def sent(self, keys):
+        # [type, key] pairs of events whose digest was sent
+        with self.lock:
+            self.digested.update(tuple(key) for key in keys)
+
+    def ready(self):
+        # [type, key] pairs whose digest was sent and whose row is stored
+        with self.lock:
+            ready = self.digested & self.stored
+            self.digested -= ready
+            self.stored -= ready
+        return sorted(ready)
+
+
+class DigestWindow:
+    # Collects events for `seconds` and hands them back grouped by service and
+    # event type once the window has elapsed.
+    def __init__(self, seconds=900):
+        self.seconds = seconds
+        self.events = []
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def extend(self, events, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            if events and self.opened is None:
+                self.opened = now
+            self.events.extend(events)
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return self.opened is not None and now - self.opened >= self.seconds
+
+    def peek(self, now=None):
+        # (window start, window end, {service: {type: [records]}}, events)
+        # without closing the window; discard(events) closes it once the
+        # digest has been sent, so a failed send goes out again next cycle
+        now = time.time() if now is None else now
+        with self.lock:
+            events, opened = list(self.events), self.opened
+        groups = {}
+        for event in events:
+            service = event["data"].get("service", "unknown")
+            groups.setdefault(service, {}).setdefault(event["type"], []).append(event["data"])
+        return opened, now, groups, events
+
+    def discard(self, count, now=None):
+        # Drop the first `count` events (a sent peek()); events added since
+        # open the next window
+        now = time.time() if now is None else now
+        with self.lock:
+            del self.events[:count]
+            self.opened = now if self.events else None
+
+    def drain(self, now=None):
+        # peek() and discard() in one, for callers that cannot fail
+        opened, now, groups, events = self.peek(now)
+        self.discard(len(events), now)
+        return opened, now, groups
+
+
+def _summary(record):
+    for field in ("errorMessage", "status", "title", "message"):
+        if record.get(field):
+            return str(record[field]).splitlines()[0][:200]
+    return ""
+
+
+def digest_email(groups, start, end, to="oncall@company.com", sender="noreply@company.com"):
+    # SendGrid v3 mail/send payload summarizing a window
+    def fmt(t):
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+
+    total = sum(len(records) for types in groups.values() for records in types.values())
+    lines = [f"Remediation digest {fmt(start)} - {fmt(end)}: {total} events across {len(groups)} services", ""]
+    for service in sorted(groups):
+        lines.append(service)
+        for event_type in sorted(groups[service]):
+            records = sorted(groups[service][event_type], key=lambda r: r.get("timestamp", ""))
+            latest = records[-1]
+            lines.append(f"  {event_type}: {len(records)} (latest {latest.get('timestamp', '')}: {_summary(latest)})")
+        lines.append("")
+    # Each patch rejected locally is a PR and a Cloud Build that never ran
+    rejected = sum(1 for types in groups.values() for r in types.get("pr_requests", [])
+                   if r.get("status") == "PREFLIGHT_FAILED")
+    if rejected:
+        lines.append(f"Pre-flight rejected {rejected} patches ({rejected} remote builds avoided)")
+    return {
+        "personalizations": [{"to": [{"email": to}]}],
+        "from": {"email": sender},
+        "subject": f"Remediation Digest: {total} events across {len(groups)} services",
+        "content": [{"type": "text/plain", "value": "\n".join(lines)}],
+    }
+
+
+def digest_incidents(groups):
+    # {correlationId: rollout timestamp} of incidents whose fix a healthy
+    # rollout in this window deployed, for the report hop
+    incidents = {}
+    for types in groups.values():
+        for record in types.get("deploys", []):
+            if record.get("status") == "ROLLED_OUT" and record.get("health", "HEALTHY") == "HEALTHY":
+                for incident in record.get("correlations") or {}:
+                    incidents[incident] = record.get("timestamp")
+    return incidents
+
+
+_windows = {}
+_windows_lock = threading.Lock()
+
+
+def digest_window(name, seconds):
+    # Process-wide window per name, so it survives across workflow cycles
+    with _windows_lock:
+        window = _windows.get(name)
+        if window is None:
+            window = _windows[name] = DigestWindow(seconds)
+        return window
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def remediation_log(name, factory):
+    # Process-wide log per name; factory() builds it on first use
+    with _logs_lock:
+        log = _logs.get(name)
+        if log is None:
+            log = _logs[name] = factory()
+        return log
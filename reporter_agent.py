@@ -10,21 +10,7 @@ from google.cloud.aiplatform.agent import (
 aiplatform.init(project="YOUR_PROJECT_ID", location="us-central1")
 client = AgentClient()
 
-# Tool: fetch_events - fetch latest events from remediation-related RTDB paths
-tools_fetch = []
-for path in ["errors", "pr-requests", "builds", "deploys", "risk-mitigations"]:
-    tools_fetch.append(
-        Tool(
-            name=f"fetch_{path}",
-            description=f"Fetch latest {path} entry",
-            http_request=HttpRequestToolConfig(
-                method="GET",
-                url=f"${{FIREBASE_DB_URL}}/{path}.json?orderBy=\"timestamp\"&limitToLast=1"
-            )
-        )
-    )
-
-# Tool: send_email
+# Tool: send_email - one digest email per window
 send_email = Tool(
     name="send_email",
     description="Send remediation report via SendGrid API",
@@ -36,76 +22,121 @@ send_email = Tool(
     )
 )
 
-# Tool: log_bq
-log_bq = Tool(
-    name="log_bq",
-    description="Append event to BigQuery remediation_log table",
-    http_request=HttpRequestToolConfig(
-        method="POST",
-        url="https://bigquery.googleapis.com/bigquery/v2/projects/${PROJECT}/datasets/${DATASET}/tables/remediation_log/insertAll",
-        headers={"Authorization":"Bearer ${ACCESS_TOKEN}", "Content-Type":"application/json"},
-        body="${bq_payload}"
+# Steps: fetch all, stream to BigQuery, build digest, send email, wait, loop
+steps = []
+# fetch_events - drain every new record from the remediation-related RTDB
+# paths. Each path is followed through its own change feed (catch-up from a
+# persisted cursor, then server-sent events), so nothing written between
+# cycles is skipped. The cursors only move once the digest holding an event
+# has been sent (commit_digest), so a restart rebuilds the open window.
+steps.append(
+    Step(
+        name="fetch_events",
+        run="""
+from report_digest import REPORTER_SOURCES
+from rtdb_stream import change_feed
+events = []
+for key, path in REPORTER_SOURCES.items():
+    depth = 2 if path == 'errors' else 1
+    feed = change_feed('${FIREBASE_DB_URL}', path, depth=depth, cursor_path=f'${FEED_CURSOR_DIR}/reporter-{path}.json',
+                       autocommit=False)
+    events += [{'type': key, 'key': event['key'], 'data': event['data']} for event in feed.poll(max_events=10000)]
+return {'events': events} if events else None
+"""
     )
 )
 
-# Steps: fetch all, build payloads, send email, log to BigQuery, wait, loop
-steps = []
-# fetch steps
-for path in ["errors", "pr_requests", "builds", "deploys", "risk_mitigations"]:
-    steps.append(
-        Step(
-            name=f"fetch_{path}",
-            tool_name=f"fetch_{path}"
-        )
+# log_bq - stream every new event into BigQuery remediation_log, packed into
+# insertAll requests within the row/byte limits; insertId dedupes retries.
+# Events of a failed request or of rejected rows stay queued in the
+# process-wide log and are sent again next cycle.
+steps.append(
+    Step(
+        name="log_bq",
+        run="""
+from report_digest import RemediationLog, remediation_log
+log = remediation_log('reporter', lambda: RemediationLog(
+    "https://bigquery.googleapis.com/bigquery/v2/projects/${PROJECT}/datasets/${DATASET}/tables/remediation_log/insertAll",
+    headers={"Authorization": "Bearer ${ACCESS_TOKEN}"}))
+events = fetch_events.result['events'] if fetch_events.result else []
+if not events and not log.queued:
+    return None
+return log.write(events)
+"""
     )
+)
 
-# build payloads
-data_sources = {"errors": "fetch_errors", "pr_requests": "fetch_pr-requests", "builds": "fetch_builds", "deploys": "fetch_deploys", "risk_mitigations": "fetch_risk-mitigations"}
-build_payload = Step(
-    name="build_payloads",
-    run="""
+# build_digest - collect events into a DIGEST_WINDOW-second window and, once
+# it has elapsed, build one email grouped by service and event type. The
+# window stays open until the email is sent, so a failed send is retried.
+steps.append(
+    Step(
+        name="build_digest",
+        run="""
 import json
-data = {}
-# collect each event
-for key, step_name in %s.items():
-    resp = json.loads(globals()[step_name].responseBody or '{}')
-    item = list(resp.values())[0] if resp else None
-    if item:
-        data[key] = item
-# choose the newest by timestamp across types
-all_items = [v for v in data.values()]
-if not all_items:
+from report_digest import digest_email, digest_incidents, digest_window
+window = digest_window('reporter', int('${DIGEST_WINDOW}') * float('${TIME_SCALE}'))
+if fetch_events.result:
+    window.extend(fetch_events.result['events'])
+if not window.due():
     return None
-newest = max(all_items, key=lambda x: x['timestamp'])
-# construct email payload and bq payload
-email = {
-  "personalizations": [{"to":[{"email":"oncall@company.com"}]}],
-  "from": {"email":"noreply@company.com"},
-  "subject": f"Remediation Update: {newest.get('service','')} - {newest.get('timestamp','')}",
-  "content": [{"type":"text/plain","value":json.dumps(newest, indent=2)}]
-}
-bq = {"rows":[{"json":newest}]}
-return {"email_payload": json.dumps(email), "bq_payload": json.dumps(bq)}
-""" % data_sources
+start, end, groups, events = window.peek()
+return {"email_payload": json.dumps(digest_email(groups, start, end)), "incidents": digest_incidents(groups),
+        "count": len(events), "keys": [[event['type'], event['key']] for event in events]}
+"""
+    )
 )
 
 # send email
-steps.append(build_payload)
 steps.append(
     Step(
         name="send_email",
         tool_name="send_email",
-        when="build_payloads.result != null",
-        arguments={"email_payload": "{{build_payloads.result.email_payload}}"}
+        when="build_digest.result != null",
+        arguments={"email_payload": "{{build_digest.result.email_payload}}"}
     )
 )
-# log to BigQuery
+# trace_report - the report hop of every incident resolved in this digest
+# (rollout recorded -> email sent)
 steps.append(
     Step(
-        name="log_bq",
-        tool_name="log_bq",
-        when="build_payloads.result != null",
-        arguments={"bq_payload": "{{build_payloads.result.bq_payload}}"}
+        name="trace_report",
+        when="send_email.status != null",
+        run="""
+from tracing import tracer
+trace = tracer('reporter', '${TRACE_EXPORT}')
+for incident, deployed in build_digest.result['incidents'].items():
+    trace.hop(incident, 'report', start=deployed, error=getattr(send_email, 'error', None))
+return None
+"""
+    )
+)
+# commit_digest - once SendGrid accepted the email, close the window; move
+# each feed's cursor past the events whose digest was sent and whose row is in
+# BigQuery, so an event BigQuery has not stored yet is fetched again after a
+# restart
+steps.append(
+    Step(
+        name="commit_digest",
+        run="""
+from report_digest import REPORTER_SOURCES, digest_window, remediation_log
+from rtdb_stream import change_feed
+log = remediation_log('reporter', None)
+if not send_email.skipped and not send_email.error:
+    digest_window('reporter', int('${DIGEST_WINDOW}') * float('${TIME_SCALE}')).discard(build_digest.result['count'])
+    log.sent(build_digest.result['keys'])
+if log_bq.error:
+    return None
+ready = log.ready()
+if not ready:
+    return None
+for key, path in REPORTER_SOURCES.items():
+    depth = 2 if path == 'errors' else 1
+    feed = change_feed('${FIREBASE_DB_URL}', path, depth=depth, cursor_path=f'${FEED_CURSOR_DIR}/reporter-{path}.json',
+                       autocommit=False)
+    feed.ack([k for t, k in ready if t == key])
+return {'committed': len(ready)}
+"""
     )
 )
 # wait and loop
@@ -114,13 +145,13 @@ steps.append(Step(name="wait", run="wait 60s"))
 demo_wf = Workflow(
     display_name="Reporter Workflow",
     steps=steps,
-    repeat_step_name="fetch_errors"
+    repeat_step_name="fetch_events"
 )
 
 agent = client.create_agent(
     display_name="Reporter Agent",
     description="Aggregates remediation events, emails updates, and logs to BigQuery.",
-    tools=tools_fetch + [send_email, log_bq],
+    tools=[send_email],
     workflow=demo_wf
 )
 print(f"Created agent: {agent.name}")
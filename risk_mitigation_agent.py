@@ -10,35 +10,33 @@ from google.cloud.aiplatform.agent import (
 aiplatform.init(project="YOUR_PROJECT_ID", location="us-central1")
 client = AgentClient()
 
-# Tool: fetch_metrics - query recent pod metrics from Cloud Monitoring API
+# Tool: fetch_metrics - query recent memory usage of every container in the namespace from Cloud Monitoring API
 fetch_metrics = Tool(
     name="fetch_metrics",
-    description="Fetch the last hour of memory usage for a given service from Cloud Monitoring.",
+    description="Fetch memory usage for every pod/container in the namespace since the last buffered point from Cloud Monitoring.",
     http_request=HttpRequestToolConfig(
         method="POST",
         url="https://monitoring.googleapis.com/v3/projects/${PROJECT_ID}/timeSeries:query",
         headers={"Content-Type": "application/json"},
         body="""
 {
-  "query": "fetch k8s_container.memory.usage_bytes | filter (resource.labels.pod_name = \"{service}\") | every 60s for 1h"
+  "query": "fetch k8s_container | metric 'kubernetes.io/container/memory/used_bytes' | filter resource.namespace_name == '${NAMESPACE}' | every 60s | within {{metric_span.result.minutes}}m"
 }
 """
     )
 )
 
-# Tool: generate_risk_patch - use LLM to propose mitigation (e.g., bump memory limits)
-generate_risk_patch = Tool(
-    name="generate_risk_patch",
-    description="Generate a Kubernetes resource patch or code stub to mitigate memory trend issues.",
+# Tool: fetch_limits - current container memory limits, to project time-to-OOM
+fetch_limits = Tool(
+    name="fetch_limits",
+    description="Fetch the memory limit of every pod/container in the namespace from Cloud Monitoring.",
     http_request=HttpRequestToolConfig(
         method="POST",
-        url="https://text-bison.googleapis.com/v1/projects/${PROJECT_ID}/locations/global/models/text-bison:predict",
+        url="https://monitoring.googleapis.com/v3/projects/${PROJECT_ID}/timeSeries:query",
         headers={"Content-Type": "application/json"},
         body="""
 {
-  "instances": [{
-    "prompt": "Memory usage for service {service} has grown from {start} to {end} bytes over the last hour. Propose a minimal Kubernetes resource limit update or config change to mitigate this risk."
-  }]
+  "query": "fetch k8s_container | metric 'kubernetes.io/container/memory/limit_bytes' | filter resource.namespace_name == '${NAMESPACE}' | every 60s | within 5m"
 }
 """
     )
@@ -60,48 +58,101 @@ tools_create_pr = Tool(
   "title": "Risk Mitigation: {service} memory limit bump",
   "head": "risk-mitigation/{service}/{timestamp}",
   "base": "main",
-  "body": "{{generate_risk_patch.response.predictions[0].content}}"
+  "body": "{{generate_risk_patch.result.predictions[0].content}}"
 }
 """
     )
 )
 
 # Step definitions
+# metric_span - how many minutes fetch_metrics has to cover: the full hour on
+# the first cycle, afterwards only what arrived since the newest buffered point
+step_span = Step(
+    name="metric_span",
+    run="""
+import time
+from metric_windows import metric_windows
+return {'minutes': metric_windows('memory').span_minutes(time.time())}
+"""
+)
+
 step_fetch = Step(
     name="fetch_metrics",
-    tool_name="fetch_metrics",
-    arguments={"service": "${SERVICE_NAME}"}
+    tool_name="fetch_metrics"
 )
 
+step_limits = Step(
+    name="fetch_limits",
+    tool_name="fetch_limits"
+)
+
+# analyze_metrics - new points go into the per-series ring buffers, whose
+# running least-squares slopes screen out series nowhere near OOM; robust
+# slopes and projected time-to-OOM are computed only for the rest, and the
+# leak closest to OOM is mitigated
 step_analyze = Step(
     name="analyze_metrics",
     run="""
-import json, time
-metrics = json.loads(fetch_metrics.responseBody).get('timeSeries', [])
-# Extract first and last values
-if not metrics or not metrics[0]['points']:
+import time
+import numpy as np
+from memory_trends import analyze, anomalies, limits_for, parse_quantity, series_matrix
+from metric_windows import metric_windows
+windows = metric_windows('memory')
+windows.ingest(*series_matrix(fetch_metrics.response or {}))
+limit_labels, limit_times, limit_values = series_matrix(fetch_limits.response or {})
+limits = limits_for(windows.labels, limit_labels, limit_times, limit_values, parse_quantity('${DEFAULT_MEMORY_LIMIT}'))
+rows = windows.candidates(limits, int('${OOM_HORIZON}'))
+if not len(rows):
     return None
-series = metrics[0]['points']
-start = series[-1]['value']['doubleValue']
-end = series[0]['value']['doubleValue']
-if end / start < 1.2:
+labels, times, values = windows.matrix(rows)
+leaks = anomalies(labels, analyze(times, values, limits[rows], horizon=int('${OOM_HORIZON}')), limit=1)
+if not leaks:
     return None
+leak = leaks[0]
+series = values[labels.index(leak['labels'])]
+seen = series[~np.isnan(series)]
 ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-return {'service': '${SERVICE_NAME}', 'start': start, 'end': end, 'timestamp': ts}
+return {
+    'service': leak['labels'].get('container_name') or '${SERVICE_NAME}',
+    'pod': leak['labels'].get('pod_name'),
+    'start': float(seen[0]),
+    'end': float(seen[-1]),
+    'leak_rate': leak['slope'],
+    'tto': leak['tto'],
+    'timestamp': ts
+}
 """
 )
 
+# generate_risk_patch - use LLM to propose mitigation (e.g., bump memory limits).
+# Shares the process-wide prompt cache with the Fix Generator. The key is the
+# service and the order of magnitude (powers of two) of its memory, leak rate
+# and time to OOM, so repeated anomalies of about the same size reuse the
+# response while a much larger leak gets a patch of its own.
 step_patch = Step(
     name="generate_risk_patch",
-    tool_name="generate_risk_patch",
     when="analyze_metrics.result != null",
-    arguments={"service": "{{analyze_metrics.result.service}}", "start": "{{analyze_metrics.result.start}}", "end": "{{analyze_metrics.result.end}}"}
+    run="""
+import math
+from llm_cache import PromptCache, cached_predict, prompt_cache
+anomaly = analyze_metrics.result
+prompt = f"Memory usage for service {anomaly['service']} has grown from {anomaly['start']} to {anomaly['end']} bytes over the last hour (about {anomaly['leak_rate']:.0f} bytes/s, projected to reach its memory limit in {anomaly['tto'] / 3600:.1f}h). Propose a minimal Kubernetes resource limit update or config change to mitigate this risk."
+magnitudes = [int(math.log2(max(anomaly[field], 1.0))) for field in ('end', 'leak_rate', 'tto')]
+cache = prompt_cache('llm', lambda: PromptCache('${LLM_CACHE_DIR}'))
+return cached_predict(
+    cache,
+    "https://text-bison.googleapis.com/v1/projects/${PROJECT_ID}/locations/global/models/text-bison:predict",
+    prompt,
+    headers={"Authorization": "Bearer ${ACCESS_TOKEN}"},
+    key=f"risk {anomaly['service']} " + " ".join(map(str, magnitudes))
+)
+"""
 )
 
 step_pr = Step(
     name="create_pr",
     tool_name="create_pr",
-    when="generate_risk_patch.response.predictions[0].content != null",
+    when="generate_risk_patch.result.predictions[0].content != null",
     arguments={"service": "{{analyze_metrics.result.service}}", "timestamp": "{{analyze_metrics.result.timestamp}}"}
 )
 
@@ -117,21 +168,21 @@ import json
 
 step_wait = Step(
     name="wait",
-    run="wait 600s"
+    run="wait ${RISK_INTERVAL}s"
 )
 
 # Workflow
 demo_wf = Workflow(
     display_name="Risk Mitigation Workflow",
-    steps=[step_fetch, step_analyze, step_patch, step_pr, step_notify, step_wait],
-    repeat_step_name="fetch_metrics"
+    steps=[step_span, step_fetch, step_limits, step_analyze, step_patch, step_pr, step_notify, step_wait],
+    repeat_step_name="metric_span"
 )
 
 # Create Agent
 agent = client.create_agent(
     display_name="Risk Mitigation Agent",
     description="Monitors pod metrics for trends and creates PRs to mitigate risks.",
-    tools=[fetch_metrics, generate_risk_patch, create_pr],
+    tools=[fetch_metrics, fetch_limits, tools_create_pr],
     workflow=demo_wf
 )
 print(f"Created agent: {agent.name}")
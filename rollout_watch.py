@@ -0,0 +1,337 @@
+# rollout_watch.py
+# Health-gated rollouts with automatic rollback to the last known-good image for the Deploy Agent
+
+import contextvars
+import http.client
+import json
+import os
+import queue
+import re
+import socket
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from deploy_scheduler import patch_deployment
+from error_fingerprint import occurrences
+from http_pool import resolve, shared_pool
+
+
+def rollout_state(deployment):
+    # ("complete" | "progressing" | "failed", reason), following the checks
+    # kubectl rollout status makes
+    meta = deployment.get("metadata", {})
+    spec = deployment.get("spec", {})
+    status = deployment.get("status", {})
+    if status.get("observedGeneration", 0) < meta.get("generation", 0):
+        return "progressing", "waiting for the controller to observe the update"
+    for condition in status.get("conditions", []):
+        if condition.get("type") == "Progressing" and condition.get("reason") == "ProgressDeadlineExceeded":
+            return "failed", "ProgressDeadlineExceeded"
+    want = spec.get("replicas", 1)
+    updated = status.get("updatedReplicas", 0)
+    if updated < want:
+        return "progressing", f"{updated} of {want} updated replicas"
+    if status.get("replicas", 0) > updated:
+        return "progressing", f"{status['replicas'] - updated} old replicas pending termination"
+    if status.get("availableReplicas", 0) < updated:
+        return "progressing", f"{status.get('availableReplicas', 0)} of {updated} updated replicas available"
+    return "complete", ""
+
+
+def _image(deployment, service):
+    containers = deployment.get("spec", {}).get("template", {}).get("spec", {}).get("containers", [])
+    for container in containers:
+        if container.get("name") == service:
+            return container.get("image")
+    return containers[0].get("image") if containers else None
+
+
+class DeploymentWatch:
+    # Kubernetes watch on one deployment (?watch=1&fieldSelector=metadata.name=
+    # ...&resourceVersion=...). A reader thread follows the newline-delimited
+    # event stream and reconnects from the last resourceVersion when the
+    # server ends it; next() hands out the latest deployment objects.
+    def __init__(self, collection_url, name, resource_version, headers=None, timeout=300):
+        self.collection_url = collection_url.rstrip("/")
+        self.name = name
+        self.resource_version = str(resource_version or "0")
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.updates = queue.Queue()
+        self._stop = threading.Event()
+        self._sock = None
+        # In the caller's context, so its requests count for the caller's
+        # agent loop (loop_scheduler.current_loop)
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,),
+                                        name=f"watch:{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        # Shutting the socket down wakes the reader blocked in readline();
+        # closing the response from this thread would wait on its buffer lock
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def next(self, timeout):
+        # Newest deployment seen within `timeout` seconds (None if no event)
+        try:
+            latest = self.updates.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        while True:
+            try:
+                latest = self.updates.get_nowait()
+            except queue.Empty:
+                return latest
+
+    def _stream_once(self):
+        query = urllib.parse.urlencode({
+            "watch": "1", "fieldSelector": f"metadata.name={self.name}",
+            "resourceVersion": self.resource_version, "timeoutSeconds": str(self.timeout),
+        })
+        url = urllib.parse.urlsplit(resolve(f"{self.collection_url}?{query}"))
+        cls = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        conn = cls(url.netloc, timeout=self.timeout + 30)
+        try:
+            conn.request("GET", f"{url.path}?{url.query}", headers=self.headers)
+            self._sock = conn.sock
+            if self._stop.is_set():
+                return
+            resp = conn.getresponse()
+            if resp.status != 200:
+                raise ConnectionError(f"watch HTTP {resp.status}")
+            while not self._stop.is_set():
+                line = resp.readline()
+                if not line:
+                    return
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event.get("type") == "ERROR":
+                    # 410 Gone: resourceVersion too old; start from the current state
+                    self.resource_version = "0"
+                    return
+                obj = event.get("object", {})
+                self.resource_version = obj.get("metadata", {}).get("resourceVersion", self.resource_version)
+                self.updates.put(obj)
+        finally:
+            self._sock = None
+            conn.close()
+
+    def _run(self):
+        backoff = 0.5
+        while not self._stop.is_set():
+            try:
+                self._stream_once()
+                backoff = 0.5
+            except Exception:
+                if self._stop.is_set():
+                    break
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+def service_matches(key, service):
+    # Whether a service key of /errors and /fingerprints belongs to the
+    # deployment `service`: the Error Analyzer keys errors by the pod's app
+    # label, which is the deployment name, and falls back to the pod name
+    # ({service}-{pod-template-hash}-{suffix}) for pods without one
+    return key == service or re.fullmatch(rf"{re.escape(service)}-[a-z0-9]{{1,10}}-[a-z0-9]{{5}}", key) is not None
+
+
+class FingerprintErrorCounter:
+    # Error occurrences per service since a rollout started, for
+    # RolloutWatcher's error_count(service, since): how much the occurrence
+    # counters under /fingerprints (all analyzer shards) grew since the first
+    # call for that rollout. /errors only gets the first occurrence of a
+    # fingerprint per TTL window, so a bad revision that re-raises an error
+    # already known would not show there. A counter that went down started a
+    # new window, and all of it is new. /fingerprints is read at most once
+    # per `refresh` seconds, except for a new rollout's baseline.
+    def __init__(self, db_url, headers=None, pool=None, refresh=1.0, window=3600, clock=time.time):
+        self.url = f"{db_url.rstrip('/')}/fingerprints.json"
+        self.headers = headers or {}
+        self.pool = pool
+        self.refresh = refresh
+        self.window = window
+        self.clock = clock
+        self.baselines = {}
+        self._counts = None
+        self._fetched = None
+        self._lock = threading.Lock()
+
+    def _occurrences(self, fresh=False):
+        now = self.clock()
+        with self._lock:
+            if not fresh and self._counts is not None and now - self._fetched < self.refresh:
+                return self._counts
+        _, _, body = (self.pool or shared_pool()).request("GET", self.url, headers=self.headers)
+        counts = occurrences(json.loads(body or b"null"))
+        with self._lock:
+            self._counts, self._fetched = counts, now
+        return counts
+
+    def __call__(self, service, since):
+        with self._lock:
+            base = self.baselines.get((service, since))
+        counts = self._occurrences(fresh=base is None)
+        counts = {key: count for key, count in counts.items() if service_matches(key[0], service)}
+        with self._lock:
+            if base is None:
+                base = self.baselines[(service, since)] = counts
+                cutoff = self.clock() - self.window
+                for key in [key for key in self.baselines if key[1] < cutoff]:
+                    del self.baselines[key]
+        return sum(count - base.get(key, 0) if count >= base.get(key, 0) else count
+                   for key, count in counts.items())
+
+
+class RolloutWatcher:
+    # roll_out(service, image) patches the deployment and follows it over a
+    # watch until it is healthy or has failed:
+    #   healthy  the rollout completed within `deadline` seconds and stayed
+    #            under max_errors new errors (error_count(service, since))
+    #            for `bake` more seconds
+    #   failed   ProgressDeadlineExceeded, the deadline passed, or the error
+    #            threshold was exceeded at any point
+    # A failed rollout is rolled back to the service's last known-good image
+    # (the last healthy rollout, or the image running before the first one).
+    # Every rollout appends a metrics dict with deploy_latency (patch to
+    # healthy) and, for rollbacks, detect_latency and rollback_latency
+    # (failure detected to rollback complete). With state_path the
+    # known-good images are kept in that JSON file, so a restarted agent
+    # can still roll back.
+    def __init__(self, deployments_url, headers=None, deadline=300.0, bake=60.0, max_errors=5,
+                 error_count=None, check_interval=1.0, pool=None, clock=time.time, state_path=None):
+        self.deployments_url = deployments_url.rstrip("/")
+        self.headers = headers or {}
+        self.deadline = deadline
+        self.bake = bake
+        self.max_errors = max_errors
+        self.error_count = error_count
+        self.check_interval = check_interval
+        self.pool = pool or shared_pool()
+        self.clock = clock
+        self.state_path = state_path
+        self.known_good = self._load()
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path) as f:
+                return dict(json.load(f).get("known_good", {}))
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _save(self):
+        # caller holds the lock
+        if not self.state_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"known_good": self.known_good}, f, sort_keys=True)
+        os.replace(tmp, self.state_path)
+
+    def _remember(self, service, image):
+        with self._lock:
+            if self.known_good.get(service) != image:
+                self.known_good[service] = image
+                self._save()
+
+    def stop(self):
+        if hasattr(self.error_count, "stop"):
+            self.error_count.stop()
+
+    def _get(self, service):
+        _, _, body = self.pool.request("GET", f"{self.deployments_url}/{service}", headers=self.headers)
+        return json.loads(body)
+
+    def _follow(self, service, deployment, started, deadline, bake, errors_since):
+        # Returns (outcome, reason, ready_at)
+        watch = DeploymentWatch(self.deployments_url, service,
+                                deployment.get("metadata", {}).get("resourceVersion"), self.headers,
+                                timeout=max(int(deadline + bake - started) + 5, 30)).start()
+        ready_at = None
+        try:
+            while True:
+                state, reason = rollout_state(deployment)
+                now = self.clock()
+                if state == "failed":
+                    return "failed", reason, ready_at
+                if self.error_count is not None and errors_since is not None:
+                    errors = self.error_count(service, errors_since)
+                    if errors > self.max_errors:
+                        return "failed", f"{errors} new errors since rollout", ready_at
+                if state == "complete" and ready_at is None:
+                    ready_at = now
+                if ready_at is not None and now - ready_at >= bake:
+                    return "healthy", "", ready_at
+                if ready_at is None and now >= deadline:
+                    return "failed", f"not ready after {self.deadline:.0f}s ({reason})", ready_at
+                wait = self.check_interval
+                wait = min(wait, (deadline - now) if ready_at is None else (ready_at + bake - now))
+                update = watch.next(max(wait, 0.0))
+                if update is not None and update.get("metadata", {}).get("generation", 0) >= \
+                        deployment.get("metadata", {}).get("generation", 0):
+                    deployment = update
+        finally:
+            watch.close()
+
+    def roll_out(self, service, image):
+        current = self._get(service)
+        previous = _image(current, service)
+        if previous and previous != image and service not in self.known_good \
+                and rollout_state(current)[0] == "complete":
+            self._remember(service, previous)
+        started = self.clock()
+        deployment = patch_deployment(f"{self.deployments_url}/{service}", service, image, self.headers, self.pool)
+        outcome, reason, ready_at = self._follow(service, deployment, started, started + self.deadline,
+                                                 self.bake, started)
+        result = {"service": service, "image": image, "health": "HEALTHY", "reason": reason,
+                  "deploy_latency": round(ready_at - started, 3) if ready_at is not None else None}
+        if outcome == "healthy":
+            self._remember(service, image)
+        else:
+            detected = self.clock()
+            result["detect_latency"] = round(detected - started, 3)
+            good = self.known_good.get(service)
+            if not good or good == image:
+                result["health"] = "FAILED_NO_ROLLBACK"
+            else:
+                back = patch_deployment(f"{self.deployments_url}/{service}", service, good, self.headers, self.pool)
+                outcome, _, back_ready = self._follow(service, back, detected, detected + self.deadline, 0.0, None)
+                result["health"] = "ROLLED_BACK" if outcome == "healthy" else "ROLLBACK_FAILED"
+                result["rolled_back_to"] = good
+                result["rollback_latency"] = round(back_ready - detected, 3) if back_ready is not None else None
+        with self._lock:
+            self.metrics.append(dict(result, started=started))
+        return result
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def rollout_watcher(name, factory):
+    # Process-wide watcher per name, so known-good images and metrics
+    # survive across workflow cycles
+    with _watchers_lock:
+        watcher = _watchers.get(name)
+        if watcher is None:
+            watcher = _watchers[name] = factory()
+        return watcher
@@ -0,0 +1,188 @@
+# rtdb_bulk.py
+# Batched multi-location writes to Firebase RTDB for the Error Analyzer
+
+import json
+import random
+import threading
+import time
+
+from http_pool import shared_pool
+
+# Firebase push-ID alphabet: IDs sort lexicographically in creation order
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+_push_lock = threading.Lock()
+_last_push_ms = 0
+_last_rand = [0] * 12
+
+
+def push_id(now_ms=None):
+    # 8 chars of millisecond timestamp + 12 random chars; the random part is
+    # incremented for IDs generated in the same millisecond, so IDs never
+    # collide and stay ordered even within a single second.
+    global _last_push_ms
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    with _push_lock:
+        if now_ms == _last_push_ms:
+            i = 11
+            while i >= 0 and _last_rand[i] == 63:
+                _last_rand[i] = 0
+                i -= 1
+            _last_rand[i] += 1
+        else:
+            _last_push_ms = now_ms
+            for i in range(12):
+                _last_rand[i] = random.randrange(64)
+        rand = "".join(PUSH_CHARS[c] for c in _last_rand)
+    ts = []
+    for _ in range(8):
+        ts.append(PUSH_CHARS[now_ms % 64])
+        now_ms //= 64
+    return "".join(reversed(ts)) + rand
+
+
+class BulkWriter:
+    # Buffers RTDB updates ({path: value}, paths relative to the database
+    # root, None deletes) and writes them as one multi-location PATCH on
+    # "{db_url}/.json" once flush_size updates are buffered or the oldest has
+    # waited flush_interval seconds, whichever comes first. Later updates of a
+    # path replace earlier ones, so a counter bumped in every batch is written
+    # once per flush.
+    #
+    # add() can carry acks (e.g. Pub/Sub ack IDs) that are only handed back
+    # with the write that made its updates durable, so a source is never
+    # acknowledged before its records are stored. Either flush() writes due
+    # updates itself, or take() hands the due batch to a caller that writes
+    # it (the Error Analyzer's write_error tool step) and reports the outcome
+    # with done(); a failed batch goes back in front of newer updates. Until
+    # then its updates stay visible to overlay(), so readers of the database
+    # see what is buffered as if it were written.
+    def __init__(self, db_url, flush_size=500, flush_interval=1.0, headers=None, pool=None,
+                 clock=time.monotonic):
+        self.url = f"{db_url.rstrip('/')}/.json"
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.headers = headers or {}
+        self.pool = pool
+        self.clock = clock
+        self.pending = {}
+        self.acks = []
+        self.oldest = None
+        self.inflight = {}
+        self.batches = 0
+        self.lock = threading.Lock()
+        self.stats = {"added": 0, "round_trips": 0, "written": 0, "retried": 0}
+
+    def add(self, updates, acks=()):
+        with self.lock:
+            if self.oldest is None and (updates or acks):
+                self.oldest = self.clock()
+            self.pending.update(updates)
+            self.acks.extend(acks)
+            self.stats["added"] += len(updates)
+
+    def append(self, root, service, record, acks=()):
+        # Buffer `record` under a new push ID at {root}/{service}; returns its path
+        path = f"{root}/{service}/{push_id()}"
+        self.add({path: record}, acks)
+        return path
+
+    def due(self):
+        with self.lock:
+            return self._due()
+
+    def _due(self):
+        # caller holds the lock
+        if self.oldest is None:
+            return False
+        return len(self.pending) >= self.flush_size or self.clock() - self.oldest >= self.flush_interval
+
+    def take(self, force=False):
+        # The buffered batch if it is due (or anything is buffered, with
+        # force): {"id", "updates", "acks"}, None otherwise. It stays in
+        # flight until done().
+        with self.lock:
+            if self.oldest is None or not (force or self._due()):
+                return None
+            self.batches += 1
+            batch = {"id": self.batches, "updates": self.pending, "acks": self.acks}
+            self.inflight[batch["id"]] = batch
+            self.pending, self.acks, self.oldest = {}, [], None
+            return batch
+
+    def done(self, batch_id, ok=True):
+        # Outcome of a taken batch; a failed one is due again right away
+        with self.lock:
+            batch = self.inflight.pop(batch_id, None)
+            if batch is None:
+                return None
+            if ok:
+                if batch["updates"]:
+                    self.stats["round_trips"] += 1
+                self.stats["written"] += len(batch["updates"])
+                return batch
+            self.stats["retried"] += 1
+            self.pending = {**batch["updates"], **self.pending}
+            self.acks = batch["acks"] + self.acks
+            self.oldest = self.clock() - self.flush_interval
+            return batch
+
+    def flush(self, force=True):
+        # Write the buffered batch now (only if due, without force) and return
+        # its acks; on failure the batch is kept for the next flush and the
+        # error raised
+        batch = self.take(force)
+        if batch is None:
+            return []
+        try:
+            if batch["updates"]:
+                (self.pool or shared_pool()).request(
+                    "PATCH", self.url, body=json.dumps(batch["updates"]),
+                    headers={"Content-Type": "application/json", **self.headers})
+        except Exception:
+            self.done(batch["id"], ok=False)
+            raise
+        self.done(batch["id"])
+        return batch["acks"]
+
+    def overlay(self, root, tree):
+        # `tree` (as read from {root}.json) with the buffered and in-flight
+        # updates under root applied, oldest first
+        prefix = root.strip("/") + "/"
+        with self.lock:
+            layers = [b["updates"] for _, b in sorted(self.inflight.items())] + [self.pending]
+            updates = [(path[len(prefix):].split("/"), value) for layer in layers
+                       for path, value in layer.items() if path.startswith(prefix)]
+        if not updates:
+            return tree
+        tree = json.loads(json.dumps(tree or {}))
+        for keys, value in updates:
+            node = tree
+            for key in keys[:-1]:
+                if not isinstance(node.get(key), dict):
+                    node[key] = {}
+                node = node[key]
+            if value is None:
+                node.pop(keys[-1], None)
+            else:
+                node[keys[-1]] = value
+        return tree
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def bulk_writer(name, factory):
+    # Process-wide writer per name; factory() builds it on first use
+    with _writers_lock:
+        writer = _writers.get(name)
+        if writer is None:
+            writer = _writers[name] = factory()
+        return writer
@@ -0,0 +1,294 @@
+# rtdb_stream.py
+# Change-feed consumer for Firebase RTDB paths: catch-up from a persisted cursor, then server-sent events
+
+import contextvars
+import http.client
+import json
+import os
+import queue
+import tempfile
+import threading
+import urllib.parse
+
+from http_pool import resolve, shared_pool
+
+
+def _children(parts, data, depth):
+    # Flatten a value written at `parts` (relative to the feed path) into the
+    # (key, record) pairs it contains at `depth` levels below the feed path.
+    if data is None:
+        return
+    if len(parts) == depth:
+        yield "/".join(parts), data
+    elif len(parts) < depth and isinstance(data, dict):
+        for key, value in data.items():
+            yield from _children(parts + [key], value, depth)
+
+
+def _order(value):
+    # Sort key for order_by values; records without one sort first
+    return (value is not None, value if value is not None else 0)
+
+
+def _prune(keys, max_keys, floor):
+    # Keep `keys` ({key: order_by value}) at most max_keys long by dropping
+    # the oldest half; returns the new floor, the lowest value still kept.
+    # Every key at or above the floor stays, so the floor alone says "old".
+    # Keys without a value are never dropped: they sort below any floor, so
+    # only the key itself tells whether such a record was seen.
+    if len(keys) <= max_keys:
+        return floor
+    values = sorted((v for v in keys.values() if v is not None), key=_order)
+    if not values:
+        return floor
+    cut = values[len(values) // 2]
+    for key in [k for k, v in keys.items() if v is not None and _order(v) < _order(cut)]:
+        del keys[key]
+    return cut
+
+
+class ChangeFeed:
+    # Turns every new child under {db_url}/{path} into an event. Records live
+    # `depth` levels down (/builds/{id} is 1, /errors/{service}/{id} is 2).
+    # A child is new when its key has not been emitted before: order_by
+    # values (publish times, first log line times) are not write order, so a
+    # record written late with an older value is still delivered. To bound
+    # memory only the newest max_keys keys are remembered (by order_by
+    # value); children below the oldest of those (the floor) count as old.
+    #
+    # On start the feed catches up from the persisted cursor with a plain read,
+    # then follows the RTDB streaming endpoint (text/event-stream) and
+    # reconnects with backoff, catching up again, when the stream drops.
+    # Events handed out by poll() are committed to the cursor on the next
+    # poll(), so a crash mid-processing replays them (at-least-once). With
+    # autocommit=False only ack(keys) commits, for consumers that finish
+    # events out of order or long after they were polled; an emitted key
+    # keeps its value until it is committed, so a late ack still reaches the
+    # cursor after the key was pruned from the emitted set.
+    def __init__(self, db_url, path, depth=1, order_by="timestamp", cursor_path=None,
+                 auth=None, max_backoff=30.0, max_keys=10000, autocommit=True):
+        self.db_url = db_url.rstrip("/")
+        self.path = path.strip("/")
+        self.depth = depth
+        self.order_by = order_by
+        self.cursor_path = cursor_path
+        self.auth = auth
+        self.max_backoff = max_backoff
+        self.max_keys = max_keys
+        self.autocommit = autocommit
+        self.events = queue.Queue()
+        self.stats = {"catchups": 0, "connects": 0, "sse_events": 0, "emitted": 0}
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._uncommitted = []
+        self._response = None
+        # Committed keys {key: order_by value} and the floor below which
+        # children are old
+        self.cursor = {"floor": None, "keys": {}}
+        if cursor_path and os.path.exists(cursor_path):
+            with open(cursor_path) as f:
+                saved = json.load(f)
+            if "value" in saved:
+                # Cursors from before keys were tracked: the keys at the newest value
+                saved = {"floor": saved["value"], "keys": dict.fromkeys(saved["keys"], saved["value"])}
+            self.cursor = saved
+        # Everything emitted this session, committed or not, and the emitted
+        # keys not committed yet
+        self._floor = self.cursor["floor"]
+        self._emitted = dict(self.cursor["keys"])
+        self._pending = {}
+
+    def _url(self, query=None):
+        query = dict(query or {})
+        if self.auth:
+            query["auth"] = self.auth
+        qs = urllib.parse.urlencode(query)
+        return f"{self.db_url}/{self.path}.json" + (f"?{qs}" if qs else "")
+
+    # --- consumer side -------------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            # In the caller's context, so catch-up reads count for the caller's
+            # agent loop (loop_scheduler.current_loop)
+            self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,),
+                                            name=f"feed:{self.path}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        resp = self._response
+        if resp is not None:
+            try:
+                resp.close()
+            except Exception:
+                pass
+
+    def poll(self, max_events=100, timeout=0.0):
+        # Up to max_events new events, waiting up to `timeout` seconds for the
+        # first one. Commits the events returned by the previous call unless
+        # autocommit is off.
+        if self.autocommit:
+            self.commit()
+        events = []
+        try:
+            events.append(self.events.get(timeout=timeout) if timeout else self.events.get_nowait())
+            while len(events) < max_events:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        if self.autocommit:
+            with self._lock:
+                self._uncommitted = list(events)
+        return events
+
+    def commit(self):
+        with self._lock:
+            done, self._uncommitted = self._uncommitted, []
+            for event in done:
+                self._pending.pop(event["key"], None)
+        self._save({event["key"]: self._value(event["data"]) for event in done})
+
+    def ack(self, keys):
+        # Commit these emitted keys (autocommit=False)
+        with self._lock:
+            done = {key: self._pending.pop(key) for key in keys if key in self._pending}
+        self._save(done)
+
+    def _save(self, keys):
+        if not keys:
+            return
+        self.cursor["keys"].update(keys)
+        self.cursor["floor"] = _prune(self.cursor["keys"], self.max_keys, self.cursor["floor"])
+        if self.cursor_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cursor_path)), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.cursor_path)), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.cursor, f)
+            os.replace(tmp, self.cursor_path)
+
+    # --- producer side -------------------------------------------------------
+
+    def _value(self, record):
+        return record.get(self.order_by) if isinstance(record, dict) else None
+
+    def _offer(self, key, record):
+        # Emit a child unless it was emitted before or is below the floor
+        value = self._value(record)
+        with self._lock:
+            if key in self._emitted:
+                return False
+            if value is not None and self._floor is not None and _order(value) < _order(self._floor):
+                return False
+            self._emitted[key] = self._pending[key] = value
+            self._floor = _prune(self._emitted, self.max_keys, self._floor)
+        self.stats["emitted"] += 1
+        self.events.put({"path": self.path, "key": key, "data": record})
+        return True
+
+    def catch_up(self):
+        self.stats["catchups"] += 1
+        query = {}
+        if self.depth == 1:
+            # RTDB can only order direct children; deeper feeds filter locally
+            query["orderBy"] = json.dumps(self.order_by)
+            if self._floor is not None:
+                query["startAt"] = json.dumps(self._floor)
+        _, _, body = shared_pool().request("GET", self._url(query))
+        children = list(_children([], json.loads(body or b"null"), self.depth))
+        children.sort(key=lambda kv: _order(self._value(kv[1])))
+        for key, record in children:
+            self._offer(key, record)
+
+    def _handle_sse(self, event, data):
+        self.stats["sse_events"] += 1
+        if event in ("keep-alive", ""):
+            return
+        if event in ("cancel", "auth_revoked"):
+            raise ConnectionError(f"stream {event}: {data}")
+        payload = json.loads(data)
+        parts = [p for p in payload["path"].split("/") if p]
+        if event == "put":
+            writes = [(parts, payload["data"])]
+        elif event == "patch":
+            writes = [(parts + [p for p in rel.split("/") if p], value)
+                      for rel, value in (payload["data"] or {}).items()]
+        else:
+            return
+        children = []
+        for write_parts, value in writes:
+            if len(write_parts) > self.depth:
+                # A field inside an existing record changed; not a new child
+                continue
+            children.extend(_children(write_parts, value, self.depth))
+        children.sort(key=lambda kv: _order(self._value(kv[1])))
+        for key, record in children:
+            self._offer(key, record)
+
+    def _stream_once(self):
+        url = urllib.parse.urlsplit(resolve(self._url()))
+        for _ in range(3):
+            cls = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+            conn = cls(url.netloc, timeout=90)
+            conn.request("GET", url.path + (f"?{url.query}" if url.query else ""),
+                         headers={"Accept": "text/event-stream"})
+            resp = conn.getresponse()
+            if resp.status in (301, 302, 307) and resp.getheader("Location"):
+                # RTDB redirects streams to the shard that owns the data
+                url = urllib.parse.urlsplit(resp.getheader("Location"))
+                conn.close()
+                continue
+            break
+        if resp.status != 200:
+            conn.close()
+            raise ConnectionError(f"stream HTTP {resp.status}")
+        self.stats["connects"] += 1
+        self._response = resp
+        event, data = "", []
+        try:
+            while not self._stop.is_set():
+                line = resp.readline()
+                if not line:
+                    raise ConnectionError("stream closed")
+                line = line.decode().rstrip("\r\n")
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line:
+                    self._handle_sse(event, "\n".join(data))
+                    event, data = "", []
+        finally:
+            self._response = None
+            conn.close()
+
+    def _run(self):
+        backoff = 0.5
+        while not self._stop.is_set():
+            try:
+                self.catch_up()
+                backoff = 0.5
+                self._stream_once()
+            except Exception:
+                if self._stop.is_set():
+                    break
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def change_feed(db_url, path, depth=1, order_by="timestamp", cursor_path=None, auth=None, autocommit=True):
+    # Process-wide, started feed per (db_url, path, cursor_path), so a workflow
+    # step can call this every cycle and keep consuming the same stream
+    key = (db_url, path, cursor_path)
+    with _feeds_lock:
+        feed = _feeds.get(key)
+        if feed is None:
+            feed = _feeds[key] = ChangeFeed(db_url, path, depth, order_by, cursor_path, auth,
+                                            autocommit=autocommit).start()
+        return feed
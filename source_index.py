@@ -0,0 +1,224 @@
+# source_index.py
+# Source index over a repo snapshot workspace: resolves stack frames to small code excerpts for fix prompts
+
+import ast
+import bisect
+import json
+import os
+import re
+import tempfile
+
+# Files we index; everything else in the snapshot is ignored
+SOURCE_SUFFIXES = (".py", ".java", ".kt", ".go", ".js", ".ts")
+
+_PY_FRAME = re.compile(r'File "([^"]+)", line (\d+), in (\S+)')
+_JAVA_FRAME = re.compile(r"at ([\w$.]+)\.([\w$<>]+)\(([\w$.-]+):(\d+)\)")
+_GO_FRAME = re.compile(r"^\s*(\S+\.go):(\d+)", re.M)
+_GO_FUNC = re.compile(r"^([\w./*()-]+)\(.*\)$", re.M)
+# Frames from installed packages and the runtime never resolve into the repo
+_THIRD_PARTY = re.compile(r"(site|dist)-packages/|/lib/python\d|/usr/local/go/|^<")
+
+# Definition lines for the regex-indexed languages
+_DEF_PATTERNS = {
+    ".go": re.compile(rb"^func\s+(?:\([^)]*\)\s*)?(\w+)", re.M),
+    ".java": re.compile(rb"^\s*(?:(?:public|private|protected|static|final|synchronized|abstract)\s+)+[\w<>\[\],\s]+?\s(\w+)\s*\(", re.M),
+    ".kt": re.compile(rb"^\s*(?:\w+\s+)*fun\s+(?:<[^>]*>\s*)?(\w+)", re.M),
+    ".js": re.compile(rb"^\s*(?:export\s+)?(?:async\s+)?function\s*\*?\s*(\w+)", re.M),
+    ".ts": re.compile(rb"^\s*(?:export\s+)?(?:async\s+)?function\s*\*?\s*(\w+)", re.M),
+}
+
+
+def parse_frames(trace):
+    # Frames as {"file", "line", "function"} dicts, innermost first
+    frames = [
+        {"file": f, "line": int(n), "function": fn}
+        for f, n, fn in _PY_FRAME.findall(trace or "")
+    ][::-1]
+    frames += [
+        {"file": src, "line": int(n), "function": f"{cls}.{meth}"}
+        for cls, meth, src, n in _JAVA_FRAME.findall(trace or "")
+    ]
+    funcs = _GO_FUNC.findall(trace or "")
+    for i, (f, n) in enumerate(_GO_FRAME.findall(trace or "")):
+        frames.append({"file": f, "line": int(n), "function": funcs[i] if i < len(funcs) else ""})
+    return frames
+
+
+def _line_offsets(data):
+    offsets = [0]
+    pos = data.find(b"\n")
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = data.find(b"\n", pos + 1)
+    return offsets
+
+
+def _index_python(data, offsets):
+    try:
+        tree = ast.parse(data)
+    except (SyntaxError, ValueError):
+        return []
+    entries = []
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = f"{prefix}{child.name}"
+                start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                entries.append([start, child.end_lineno, name])
+                visit(child, f"{name}.")
+
+    visit(tree, "")
+    return entries
+
+
+def _index_regex(data, offsets, pattern):
+    starts = []
+    for m in pattern.finditer(data):
+        line = bisect.bisect_right(offsets, m.start())
+        starts.append((line, m.group(1).decode(errors="replace")))
+    entries = []
+    for i, (line, name) in enumerate(starts):
+        end = starts[i + 1][0] - 1 if i + 1 < len(starts) else len(offsets)
+        entries.append([line, end, name])
+    return entries
+
+
+class SourceIndex:
+    # blobs: blob key -> {"lines": n, "defs": [[start_line, end_line, name, byte_start, byte_end], ...]}
+    # paths: workspace-relative path -> blob key
+    # Blob keys are (device, inode, size): repo_snapshot workspaces hard-link
+    # unchanged files to the same blob, so after a snapshot moves only files
+    # whose content changed get re-parsed.
+    def __init__(self, state_path=None):
+        self.state_path = state_path
+        self.blobs = {}
+        self.paths = {}
+        self.root = None
+        self._by_name = {}
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                self.blobs = json.load(f).get("blobs", {})
+
+    @classmethod
+    def for_workspace(cls, root, state_path=None):
+        index = cls(state_path)
+        index.update(root)
+        return index
+
+    def update(self, root):
+        self.root = root
+        stats = {"parsed": 0, "reused": 0, "removed": 0}
+        paths = {}
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                if not name.endswith(SOURCE_SUFFIXES):
+                    continue
+                full = os.path.join(dirpath, name)
+                st = os.stat(full)
+                key = f"{st.st_dev}:{st.st_ino}:{st.st_size}"
+                paths[os.path.relpath(full, root)] = key
+                if key in self.blobs:
+                    stats["reused"] += 1
+                    continue
+                with open(full, "rb") as f:
+                    data = f.read()
+                self.blobs[key] = self._index_file(name, data)
+                stats["parsed"] += 1
+        live = set(paths.values())
+        for key in [k for k in self.blobs if k not in live]:
+            del self.blobs[key]
+            stats["removed"] += 1
+        self.paths = paths
+        self._by_name = {}
+        for path in paths:
+            self._by_name.setdefault(os.path.basename(path), []).append(path)
+        if self.state_path:
+            self.save()
+        return stats
+
+    def _index_file(self, name, data):
+        offsets = _line_offsets(data)
+        suffix = os.path.splitext(name)[1]
+        if suffix == ".py":
+            defs = _index_python(data, offsets)
+        else:
+            defs = _index_regex(data, offsets, _DEF_PATTERNS[suffix])
+        for entry in defs:
+            start, end = entry[0], min(entry[1], len(offsets))
+            entry.append(offsets[start - 1])
+            entry.append(offsets[end] if end < len(offsets) else len(data))
+        defs.sort()
+        return {"lines": len(offsets), "defs": defs}
+
+    def save(self):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.state_path)), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"blobs": self.blobs}, f)
+        os.replace(tmp, self.state_path)
+
+    def resolve_path(self, frame_file):
+        # Stack trace paths are absolute inside the container (/app/app.py);
+        # pick the workspace path sharing the longest path suffix.
+        frame_parts = frame_file.replace("\\", "/").split("/")
+        best, best_len = None, 0
+        for path in self._by_name.get(frame_parts[-1], ()):
+            parts = path.split(os.sep)
+            n = 0
+            while n < min(len(parts), len(frame_parts)) and parts[-1 - n] == frame_parts[-1 - n]:
+                n += 1
+            if n > best_len:
+                best, best_len = path, n
+        return best
+
+    def lookup(self, frame_file, line):
+        # (path, innermost definition containing line or None)
+        if _THIRD_PARTY.search(frame_file):
+            return None, None
+        path = self.resolve_path(frame_file)
+        if path is None or not 0 < line <= self.blobs[self.paths[path]]["lines"]:
+            return None, None
+        defs = self.blobs[self.paths[path]]["defs"]
+        i = bisect.bisect_right(defs, [line, float("inf")])
+        best = None
+        for entry in reversed(defs[:i]):
+            if entry[0] <= line <= entry[1] and (best is None or entry[0] > best[0]):
+                best = entry
+        return path, best
+
+    def excerpt(self, frame_file, line, max_lines=40):
+        path, entry = self.lookup(frame_file, line)
+        if path is None:
+            return None
+        with open(os.path.join(self.root, path), "rb") as f:
+            if entry is not None and entry[1] - entry[0] < max_lines:
+                f.seek(entry[3])
+                start, text = entry[0], f.read(entry[4] - entry[3])
+            else:
+                # No enclosing definition or a very long one: window around the line
+                start = max(1, line - max_lines // 2)
+                lines = f.read().splitlines(keepends=True)[start - 1:start - 1 + max_lines]
+                text = b"".join(lines)
+        body = text.decode(errors="replace").rstrip("\n").split("\n")
+        numbered = "\n".join(
+            f"{start + i}{'>' if start + i == line else ' '} {src}" for i, src in enumerate(body)
+        )
+        name = entry[2] if entry is not None else "<module>"
+        return f"# {path}:{line} in {name}\n{numbered}"
+
+    def context(self, frames, token_budget=1500, max_lines=40):
+        # Excerpts for the innermost resolvable frames that fit the budget.
+        # Tokens are approximated as 4 characters each.
+        parts, used, seen = [], 0, set()
+        for frame in frames:
+            path, entry = self.lookup(frame["file"], frame["line"])
+            if path is None or (path, entry and entry[0]) in seen:
+                continue
+            seen.add((path, entry and entry[0]))
+            text = self.excerpt(frame["file"], frame["line"], max_lines)
+            cost = len(text) // 4 + 1
+            if used + cost > token_budget:
+                continue
+            parts.append(text)
+            used += cost
+        return "\n\n".join(parts)
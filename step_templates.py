@@ -0,0 +1,262 @@
+# step_templates.py
+# Compiled ${VAR} / {{step.path}} / {argument} templates and `when` expressions for workflow steps
+#
+# Templates and conditions are parsed once, when the agent is loaded, into
+# closures over the step results; references to unknown steps fail at load
+# time instead of rendering as empty strings mid-workflow. A step's response
+# body is parsed at most once (StepResult.response) however many templates,
+# conditions and run blocks read it.
+
+import ast
+import json
+import operator
+import re
+
+_PLACEHOLDER = re.compile(r"\$\{(\w+)\}|\{\{\s*([^{}]+?)\s*\}\}|(?<!\{)\{(\w+)\}(?!\})")
+_UNSET = object()
+
+# Names with a fixed meaning in expressions, unless a step has the same name
+CONSTANTS = {"null": None, "true": True, "false": False, "None": None, "True": True, "False": False}
+
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: b is not None and a in b,
+    ast.NotIn: lambda a, b: b is None or a not in b,
+}
+_METHODS = {"values", "keys", "items"}
+
+
+class StepResult:
+    # What later steps see under a step's name: .result for run steps,
+    # .responseBody / .status for tool steps. .response is the parsed body,
+    # decoded on first use and cached (None for an empty or non-JSON body).
+    def __init__(self, result=None, responseBody=None, status=None, error=None, skipped=False, response=_UNSET):
+        self.result = result
+        self.responseBody = responseBody
+        self.status = status
+        self.error = error
+        self.skipped = skipped
+        self._response = response
+
+    @property
+    def response(self):
+        if self._response is _UNSET:
+            try:
+                self._response = json.loads(self.responseBody) if self.responseBody else None
+            except ValueError:
+                self._response = None
+        return self._response
+
+
+def _step(name):
+    return lambda results: results.get(name)
+
+
+def _attr(inner, name):
+    def get(results):
+        value = inner(results)
+        if value is None:
+            return None
+        if isinstance(value, dict):
+            return value.get(name)
+        if isinstance(value, StepResult):
+            return getattr(value, name, None)
+        return None
+    return get
+
+
+def _index(inner, key):
+    def get(results):
+        value = inner(results)
+        if isinstance(value, (list, tuple)):
+            return value[key] if isinstance(key, int) and -len(value) <= key < len(value) else None
+        if isinstance(value, dict):
+            return value.get(key)
+        return None
+    return get
+
+
+def _method(inner, name):
+    def get(results):
+        value = inner(results)
+        return list(getattr(value, name)()) if isinstance(value, dict) else None
+    return get
+
+
+def _constant(value):
+    return lambda results: value
+
+
+def _compare(op, left, right):
+    def check(results):
+        a, b = left(results), right(results)
+        try:
+            return op(a, b)
+        except TypeError:
+            # Ordering against null / mismatched types is simply false
+            return False
+    return check
+
+
+class _Compiler:
+    # ast -> closure for the small expression language steps use: paths
+    # (step.attr.key[0].values()), literals, comparisons, and / or / not
+    def __init__(self, steps, source):
+        self.steps = steps
+        self.source = source
+        self.refs = set()
+
+    def fail(self, node, why):
+        raise ValueError(f"{why} in {self.source!r}")
+
+    def path(self, node, parsed=False):
+        # parsed: a further access follows, so .responseBody means the
+        # parsed body rather than its text
+        if isinstance(node, ast.Name):
+            if node.id in CONSTANTS and (self.steps is None or node.id not in self.steps):
+                return _constant(CONSTANTS[node.id])
+            if self.steps is not None and node.id not in self.steps:
+                self.fail(node, f"unknown step {node.id!r}")
+            self.refs.add(node.id)
+            return _step(node.id)
+        if isinstance(node, ast.Attribute):
+            name = "response" if parsed and node.attr == "responseBody" else node.attr
+            return _attr(self.path(node.value, True), name)
+        if isinstance(node, ast.Subscript):
+            key = node.slice
+            if isinstance(key, ast.UnaryOp) and isinstance(key.op, ast.USub) and isinstance(key.operand, ast.Constant):
+                return _index(self.path(node.value, True), -key.operand.value)
+            if not isinstance(key, ast.Constant) or not isinstance(key.value, (int, str)):
+                self.fail(node, "only constant subscripts are supported")
+            return _index(self.path(node.value, True), key.value)
+        if isinstance(node, ast.Call):
+            func = node.func
+            if not isinstance(func, ast.Attribute) or func.attr not in _METHODS or node.args or node.keywords:
+                self.fail(node, "only .values() / .keys() / .items() calls are supported")
+            return _method(self.path(func.value, True), func.attr)
+        self.fail(node, f"unsupported {type(node).__name__}")
+
+    def expr(self, node):
+        if isinstance(node, ast.BoolOp):
+            parts = [self.expr(v) for v in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda results: all(p(results) for p in parts)
+            return lambda results: any(p(results) for p in parts)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            inner = self.expr(node.operand)
+            return lambda results: not inner(results)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+            return _constant(-node.operand.value)
+        if isinstance(node, ast.Compare):
+            checks, left = [], self.expr(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                if type(op) not in _COMPARE:
+                    self.fail(node, f"unsupported operator {type(op).__name__}")
+                right = self.expr(comparator)
+                checks.append(_compare(_COMPARE[type(op)], left, right))
+                left = right
+            if len(checks) == 1:
+                return checks[0]
+            return lambda results: all(c(results) for c in checks)
+        if isinstance(node, ast.Constant):
+            return _constant(node.value)
+        return self.path(node)
+
+
+def _parse(source):
+    try:
+        return ast.parse(source.strip(), mode="eval").body
+    except SyntaxError as e:
+        raise ValueError(f"cannot parse {source!r}: {e.msg}") from None
+
+
+def compile_path(source, steps=None):
+    # "step.result.predictions[0].content" -> fn(results) -> value or None.
+    # steps (a set of step names) turns unknown references into ValueError.
+    compiler = _Compiler(steps, source)
+    return compiler.path(_parse(source)), compiler.refs
+
+
+def compile_condition(source, steps=None):
+    # `when` expression -> fn(results) -> bool
+    compiler = _Compiler(steps, source)
+    fn = compiler.expr(_parse(source))
+    return (lambda results: bool(fn(results))), compiler.refs
+
+
+def _in_json_string(text, pos):
+    # Whether text[pos] sits inside a double-quoted JSON string
+    inside, i = False, 0
+    while i < pos:
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text[i] == '"':
+            inside = not inside
+        i += 1
+    return inside
+
+
+def _text(value, quoted):
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    value = "" if value is None else str(value)
+    return json.dumps(value)[1:-1] if quoted else value
+
+
+class Template:
+    # A string with ${NAME} (step argument, else env, else left as is),
+    # {{step.path}} and {argument} (left as is when no such argument)
+    # placeholders. With json_body, values that land inside a JSON string
+    # literal are escaped.
+    def __init__(self, text, steps=None, json_body=False):
+        self.text = text or ""
+        self.parts = []
+        self.refs = set()
+        last = 0
+        for match in _PLACEHOLDER.finditer(self.text):
+            if match.start() > last:
+                self.parts.append(self.text[last:match.start()])
+            quoted = json_body and _in_json_string(self.text, match.start())
+            env_name, path, argument = match.groups()
+            if path is not None:
+                fn, refs = compile_path(path, steps)
+                self.refs |= refs
+                self.parts.append(("path", fn, quoted, match.group(0)))
+            elif env_name is not None:
+                self.parts.append(("env", env_name, quoted, match.group(0)))
+            else:
+                self.parts.append(("argument", argument, quoted, match.group(0)))
+            last = match.end()
+        if last < len(self.text):
+            self.parts.append(self.text[last:])
+        self.static = all(isinstance(p, str) for p in self.parts)
+
+    def render(self, env, arguments=None, results=None):
+        if self.static:
+            return self.text
+        out = []
+        for part in self.parts:
+            if isinstance(part, str):
+                out.append(part)
+                continue
+            kind, key, quoted, raw = part
+            if kind == "path":
+                out.append(_text(key(results or {}), quoted))
+            elif arguments and key in arguments:
+                out.append(_text(arguments[key], quoted))
+            elif kind == "env" and key in env:
+                out.append(_text(env[key], quoted))
+            else:
+                out.append(raw)
+        return "".join(out)
+
+
+def substitute_env(text, env):
+    # ${NAME} -> env value everywhere in text (run blocks), unknown names kept
+    return re.sub(r"\$\{(\w+)\}", lambda m: str(env[m.group(1)]) if m.group(1) in env else m.group(0), text)
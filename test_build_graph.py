@@ -0,0 +1,146 @@
+# test_build_graph.py
+# Checks for the Cloud Build step graph: validation, critical path and cache flags
+#
+# Run with `python -m pytest -q test_build_graph.py`.
+
+import pytest
+
+from build_graph import (DEFAULT_DURATIONS, DEFAULT_TEST_COMMAND, build_request, build_steps, cache_tag,
+                         critical_path, dependencies, serial_length, validate)
+
+
+def step(step_id, wait_for=None):
+    out = {"id": step_id, "name": "busybox"}
+    if wait_for is not None:
+        out["waitFor"] = wait_for
+    return out
+
+
+# --- validate ------------------------------------------------------------------
+
+def test_validate_rejects_cycle():
+    steps = [step("a", ["c"]), step("b", ["a"]), step("c", ["b"])]
+    with pytest.raises(ValueError, match="cycle"):
+        validate(steps)
+
+
+def test_validate_rejects_self_wait():
+    with pytest.raises(ValueError, match="cycle: a -> a"):
+        validate([step("a", ["a"])])
+
+
+def test_validate_rejects_unknown_and_duplicate_ids():
+    with pytest.raises(ValueError, match="unknown steps"):
+        validate([step("a", ["-"]), step("b", ["missing"])])
+    with pytest.raises(ValueError, match="duplicate"):
+        validate([step("a", ["-"]), step("a", ["-"])])
+
+
+def test_validate_accepts_generated_graphs():
+    for cache in ("docker", "kaniko"):
+        validate(build_steps("proj", "svc", "pull/7/head", cache=cache))
+
+
+def test_build_steps_rejects_unknown_cache_mode():
+    with pytest.raises(ValueError, match="unknown cache mode"):
+        build_steps("proj", "svc", cache="none")
+
+
+# --- dependencies / critical path ---------------------------------------------
+
+def test_dependencies_follow_cloud_build_rules():
+    steps = [step("a"), step("b", ["-"]), step("c")]
+    assert dependencies(steps) == {"a": [], "b": [], "c": ["a", "b"]}
+
+
+def test_critical_path_docker():
+    seconds, path = critical_path(build_steps("proj", "svc", cache="docker"))
+    # pull-cache -> build -> push -> deploy outlasts test -> deploy
+    assert path == ["pull-cache", "build", "push", "deploy"]
+    assert seconds == sum(DEFAULT_DURATIONS[s] for s in path)
+
+
+def test_critical_path_kaniko():
+    seconds, path = critical_path(build_steps("proj", "svc", cache="kaniko"))
+    # kaniko pushes in the build step, so the 60s test outlasts the 45s build
+    assert path == ["test", "deploy"]
+    assert seconds == DEFAULT_DURATIONS["test"] + DEFAULT_DURATIONS["deploy"]
+
+
+def test_critical_path_uses_measured_durations():
+    steps = build_steps("proj", "svc", cache="kaniko")
+    seconds, path = critical_path(steps, {"build": 300})
+    assert path == ["build", "deploy"]
+    assert seconds == 300 + DEFAULT_DURATIONS["deploy"]
+    assert serial_length(steps, {"build": 300}) == 60 + 300 + 40
+    assert seconds < serial_length(steps, {"build": 300})
+
+
+def test_critical_path_without_wait_for_is_serial():
+    steps = [step("test"), step("build"), step("deploy")]
+    seconds, path = critical_path(steps)
+    assert path == ["test", "build", "deploy"]
+    assert seconds == serial_length(steps)
+
+
+# --- cache flags -----------------------------------------------------------------
+
+def test_cache_tag_is_a_valid_tag():
+    assert cache_tag("pull/7/head") == "cache-pull-7-head"
+    assert cache_tag("main") == "cache-main"
+    assert len(cache_tag("x" * 500)) <= 128  # registry tag limit
+
+
+def test_docker_cache_flags():
+    steps = {s["id"]: s for s in build_steps("proj", "svc", "pull/7/head", cache="docker")}
+    image = "gcr.io/proj/svc"
+    pulls = steps["pull-cache"]["args"][-1]
+    assert f"docker pull {image}:cache-pull-7-head || true" in pulls
+    assert f"docker pull {image}:cache-main || true" in pulls
+    args = steps["build"]["args"]
+    assert "DOCKER_BUILDKIT=1" in steps["build"]["env"]
+    assert args[args.index("--build-arg") + 1] == "BUILDKIT_INLINE_CACHE=1"
+    cache_from = [args[i + 1] for i, a in enumerate(args) if a == "--cache-from"]
+    assert cache_from == [f"{image}:cache-pull-7-head", f"{image}:cache-main"]
+    assert f"{image}:cache-pull-7-head" in args and f"{image}:$BUILD_ID" in args
+    assert steps["build"]["waitFor"] == ["pull-cache"]
+    assert steps["test"]["waitFor"] == ["-"]
+    assert steps["deploy"]["waitFor"] == ["push", "test"]
+
+
+def test_docker_cache_on_base_ref_pulls_once():
+    steps = {s["id"]: s for s in build_steps("proj", "svc", "main", cache="docker")}
+    args = steps["build"]["args"]
+    assert args.count("--cache-from") == 1
+    assert steps["pull-cache"]["args"][-1] == "docker pull gcr.io/proj/svc:cache-main || true"
+
+
+def test_kaniko_cache_flags():
+    steps = {s["id"]: s for s in build_steps("proj", "svc", "pull/7/head", cache="kaniko")}
+    assert "pull-cache" not in steps and "push" not in steps
+    args = steps["build"]["args"]
+    assert "--cache=true" in args
+    assert "--cache-repo=gcr.io/proj/svc/cache" in args
+    assert "--destination=gcr.io/proj/svc:cache-pull-7-head" in args
+    assert steps["deploy"]["waitFor"] == ["build", "test"]
+    # the executor builds /workspace unless told otherwise; dir does not change that
+    assert "--context=dir:///workspace" in args
+    assert "--dockerfile=/workspace/Dockerfile" in args
+    steps = {s["id"]: s for s in build_steps("proj", "svc", context="demo_app", cache="kaniko")}
+    assert "--context=dir:///workspace/demo_app" in steps["build"]["args"]
+    assert "--dockerfile=/workspace/demo_app/Dockerfile" in steps["build"]["args"]
+
+
+def test_test_command_runs_in_the_context():
+    steps = {s["id"]: s for s in build_steps("proj", "svc", context="demo_app", test_command="python -m pytest -q")}
+    assert steps["test"]["dir"] == "demo_app"
+    assert steps["test"]["args"][-1] == "pip install -q -r requirements.txt && python -m pytest -q"
+    default = {s["id"]: s for s in build_steps("proj", "svc")}["test"]["args"][-1]
+    assert default.endswith(DEFAULT_TEST_COMMAND)
+
+
+def test_build_request_tags_ref_cache():
+    body = build_request("proj", "repo", "abc123", "svc", "pull/7/head")
+    assert body["tags"] == ["cache-pull-7-head"]
+    assert body["source"]["repoSource"]["commitSha"] == "abc123"
+    assert [s["id"] for s in body["steps"]] == ["test", "pull-cache", "build", "push", "deploy"]
@@ -0,0 +1,94 @@
+# test_build_tracker.py
+# Checks for the Build & Test tracker: shared notification subscriptions and state saved when a trigger fails
+#
+# Run with `python -m pytest -q test_build_tracker.py`.
+
+import json
+import time
+
+import pytest
+
+from build_tracker import BuildTracker
+from http_pool import ConnectionPool, HttpError
+from local_standins import FakeCloudBuild, FakePubSub
+from pubsub_ingest import PubSubPuller
+
+
+class Heads:
+    def __init__(self, heads):
+        self.current = heads
+
+    def heads(self):
+        return dict(self.current)
+
+
+class CloudBuild:
+    # builds.create stand-in that fails from the `fail_after`-th call on
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.created = 0
+
+    def request(self, method, url, body=None, headers=None):
+        if self.fail_after is not None and self.created >= self.fail_after:
+            raise HttpError(503, b"", url)
+        self.created += 1
+        return 200, {}, json.dumps({"metadata": {"build": {"id": f"b{self.created}", "status": "QUEUED"}}}).encode()
+
+
+def request(ref, sha):
+    return {"source": {"repoSource": {"commitSha": sha}}, "steps": []}
+
+
+def test_trackers_sharing_a_subscription_each_get_their_builds():
+    with FakePubSub() as pubsub, FakeCloudBuild(duration=0.05, runners=4, notify=pubsub) as cloudbuild:
+        pool = ConnectionPool()
+        trackers = {}
+        for service in ("api", "web"):
+            puller = PubSubPuller(f"{pubsub.url}/v1/projects/p/subscriptions/cloud-builds", idle_wait=0.01)
+            trackers[service] = BuildTracker(f"{cloudbuild.url}/v1/projects/p/builds", request,
+                                             Heads({"main": f"{service}-1"}), notifications=puller, pool=pool,
+                                             max_interval=3600, head_interval=3600)
+        for tracker in trackers.values():
+            tracker.check_heads()
+        deadline = time.monotonic() + 10
+        while any(t.inflight for t in trackers.values()) and time.monotonic() < deadline:
+            for tracker in trackers.values():
+                tracker.drain_notifications()
+        for service, tracker in trackers.items():
+            assert [(e["sha"], e["status"]) for e in tracker.poll()] == [(f"{service}-1", "SUCCESS")]
+            assert tracker.stats["status_polls"] == 0
+        # every notification ended up acked by the tracker owning its build
+        assert pubsub.pending("cloud-builds") == 0 and not pubsub.backlog and not pubsub.outstanding
+
+
+def test_unclaimed_notifications_are_acked_after_foreign_ttl():
+    now = [0.0]
+    with FakePubSub() as pubsub:
+        puller = PubSubPuller(f"{pubsub.url}/v1/projects/p/subscriptions/cloud-builds", idle_wait=0.01)
+        tracker = BuildTracker("http://cloudbuild/builds", request, Heads({}), notifications=puller,
+                               foreign_ttl=60, pool=CloudBuild(), clock=lambda: now[0])
+        pubsub.publish({"id": "other"}, {"buildId": "other", "status": "SUCCESS"})
+        tracker.drain_notifications()
+        assert pubsub.acked == 0 and len(pubsub.backlog) == 1
+        now[0] = 61.0
+        tracker.drain_notifications()
+        assert pubsub.acked == 1 and not pubsub.backlog
+        assert tracker.stats["nacked"] == 1 and tracker.stats["notifications"] == 0
+
+
+def test_started_builds_are_saved_when_a_trigger_fails(tmp_path):
+    state = str(tmp_path / "tracker.json")
+    heads = Heads({"main": "a1", "pull/7/head": "b1"})
+    tracker = BuildTracker("http://cloudbuild/builds", request, heads, state_path=state,
+                           pool=CloudBuild(fail_after=1))
+    with pytest.raises(HttpError):
+        tracker.check_heads()
+    with open(state) as f:
+        saved = json.load(f)
+    # refs are triggered in order: main went through, the PR head failed
+    assert saved["built"] == {"main": "a1"}
+    assert list(saved["inflight"]) == ["b1"]
+    # a restarted tracker only triggers the ref that failed
+    again = BuildTracker("http://cloudbuild/builds", request, heads, state_path=state, pool=CloudBuild())
+    assert again.check_heads() == ["b1"]
+    assert again.built == {"main": "a1", "pull/7/head": "b1"}
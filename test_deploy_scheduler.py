@@ -0,0 +1,177 @@
+# test_deploy_scheduler.py
+# Simulated-clock checks for Deploy Agent rollout coalescing, ordering, spacing and retries
+#
+# Run with `python -m pytest -q test_deploy_scheduler.py`.
+
+import random
+
+from deploy_scheduler import DeployScheduler, build_order
+
+
+class Sim:
+    # A DeployScheduler on a simulated clock whose rollouts are recorded (and
+    # fail for the builds listed in `failing`) instead of patching anything
+    def __init__(self, min_interval=300.0, retry_interval=30.0, failing=()):
+        self.now = 0.0
+        self.rollouts = []
+        self.failing = set(failing)
+        self.scheduler = DeployScheduler(self.rollout, min_interval=min_interval, max_concurrency=2,
+                                         retry_interval=retry_interval, clock=lambda: self.now)
+
+    def rollout(self, service, build):
+        if build["id"] in self.failing:
+            self.failing.discard(build["id"])
+            raise RuntimeError("patch failed")
+        self.rollouts.append((self.now, service, build["id"]))
+
+    def offer(self, t, service, build_id, correlation=None):
+        self.now = max(self.now, t)
+        build = {"id": build_id, "timestamp": t}
+        if correlation:
+            build["correlationId"] = correlation
+        return self.scheduler.offer(service, build, key=build_id)
+
+    def run_until(self, t):
+        results = []
+        while True:
+            wait = self.scheduler.next_due()
+            if wait is None or self.now + wait > t:
+                break
+            self.now += wait
+            results += self.scheduler.dispatch()
+        self.now = max(self.now, t)
+        return results
+
+
+def test_newer_builds_coalesce_into_one_rollout():
+    sim = Sim()
+    sim.offer(0, "svc", "b1")
+    sim.scheduler.dispatch()
+    assert sim.offer(10, "svc", "b2")
+    assert sim.offer(20, "svc", "b3")
+    assert sim.offer(30, "svc", "b4")
+    results = sim.run_until(1000)
+    assert [r[2] for r in sim.rollouts] == ["b1", "b4"]
+    assert sim.rollouts[1][0] == 300.0
+    assert [r["coalesced"] for r in results] == [2]
+    assert sim.scheduler.stats == {"offered": 4, "coalesced": 2, "stale": 0, "rollouts": 2, "failures": 0}
+
+
+def test_older_build_is_dropped_without_counting_as_coalesced():
+    sim = Sim()
+    sim.offer(0, "svc", "b1")
+    sim.scheduler.dispatch()
+    assert sim.offer(50, "svc", "b3")
+    # b2 finished before b3 but is only offered after it
+    sim.now = 60
+    assert not sim.scheduler.offer("svc", {"id": "b2", "timestamp": 40, "correlationId": "inc-2"}, key="b2")
+    results = sim.run_until(1000)
+    assert [r[2] for r in sim.rollouts] == ["b1", "b3"]
+    assert results[0]["coalesced"] == 0
+    # the dropped build's incident and feed key go with the rollout covering it
+    assert results[0]["correlations"] == {"inc-2": 40}
+    assert results[0]["keys"] == ["b3", "b2"]
+    assert sim.scheduler.settled() == []
+    assert sim.scheduler.stats["coalesced"] == 0
+    assert sim.scheduler.stats["stale"] == 1
+
+
+def test_late_older_build_does_not_roll_back():
+    sim = Sim()
+    sim.offer(0, "svc", "b2")
+    sim.scheduler.dispatch()
+    sim.now = 1000
+    assert not sim.scheduler.offer("svc", {"id": "b1", "timestamp": -10}, key="b1")
+    assert sim.run_until(5000) == []
+    assert sim.rollouts == [(0.0, "svc", "b2")]
+    assert sim.scheduler.stats["stale"] == 1
+    # nothing left to roll out for it: its key can be committed now
+    assert sim.scheduler.settled() == ["b1"]
+    assert sim.scheduler.settled() == []
+
+
+def test_builds_are_ordered_by_finish_time_as_numbers():
+    early = {"finishTime": "2026-01-01T10:00:10Z", "timestamp": "2026-01-01T10:05:00Z"}
+    later = {"finishTime": "2026-01-01T10:00:10.5Z", "timestamp": "2026-01-01T10:01:00Z"}
+    # as text "10Z" sorts after "10.5Z", and the tracker saw `later` first
+    assert build_order(later) > build_order(early)
+    assert build_order({"timestamp": "2026-01-01T10:00:00Z"}) < build_order(early)
+    assert build_order({}) == float("-inf")
+    sim = Sim()
+    sim.scheduler.offer("svc", dict(later, id="later"))
+    assert not sim.scheduler.offer("svc", dict(early, id="early"))
+    sim.run_until(0)
+    assert sim.rollouts == [(0.0, "svc", "later")]
+
+
+def test_failed_rollout_superseded_by_newer_build():
+    sim = Sim(failing={"b1"})
+    sim.offer(0, "svc", "b1", "inc-1")
+    first = sim.scheduler.dispatch()
+    assert first[0]["status"] == "FAILED"
+    sim.offer(5, "svc", "b2", "inc-2")
+    results = sim.run_until(1000)
+    # b2 is rolled out once retry_interval has passed and covers b1
+    assert sim.rollouts == [(30.0, "svc", "b2")]
+    assert results[0]["coalesced"] == 1
+    assert set(results[0]["correlations"]) == {"inc-1", "inc-2"}
+    assert results[0]["keys"] == ["b1", "b2"]
+    assert sim.scheduler.stats["coalesced"] == 1
+    assert sim.scheduler.stats["failures"] == 1
+
+
+def test_failed_rollout_is_retried():
+    sim = Sim(failing={"b1"})
+    sim.offer(0, "svc", "b1")
+    results = sim.run_until(1000)
+    assert [r["status"] for r in results] == ["FAILED", "ROLLED_OUT"]
+    assert sim.rollouts == [(30.0, "svc", "b1")]
+    # the key is only reported by the rollout that succeeded
+    assert results[1]["keys"] == ["b1"]
+
+
+def test_random_simulation_counts_every_build_once():
+    # Bursts of builds for a few services, sometimes offered out of order: every
+    # offer ends up rolled out, coalesced or stale, exactly once, each service
+    # only ever moves forward, and rollouts respect min_interval
+    rng = random.Random(7)
+    sim = Sim(min_interval=300.0)
+    offers = []
+    for s in range(3):
+        t = 0.0
+        for i in range(60):
+            t += rng.choice([rng.uniform(10, 120), rng.uniform(300, 1800)])
+            offers.append((t, f"svc-{s}", f"{s}-{i:03d}"))
+    offers.sort()
+    # swap some neighbours so older builds occasionally arrive late
+    for i in range(0, len(offers) - 1, 7):
+        (t1, s1, b1), (t2, s2, b2) = offers[i], offers[i + 1]
+        offers[i], offers[i + 1] = (t1, s2, b2), (t2, s1, b1)
+    finish = {b: float(b.split("-")[1]) for _, _, b in offers}
+    committed = []
+    for arrival, service, build_id in offers:
+        results = sim.run_until(arrival)
+        committed += [k for r in results if r["status"] == "ROLLED_OUT" for k in r["keys"]]
+        sim.now = arrival
+        sim.scheduler.offer(service, {"id": build_id, "timestamp": finish[build_id]}, key=build_id)
+        committed += sim.scheduler.settled()
+    results = sim.run_until(10 ** 6)
+    committed += [k for r in results if r["status"] == "ROLLED_OUT" for k in r["keys"]]
+    # every build's feed key is committed exactly once
+    assert sorted(committed) == sorted(b for _, _, b in offers)
+
+    stats = sim.scheduler.stats
+    assert stats["offered"] == len(offers)
+    assert stats["rollouts"] == len(sim.rollouts)
+    assert stats["rollouts"] + stats["coalesced"] + stats["stale"] == len(offers)
+    assert stats["stale"] > 0 and stats["coalesced"] > 0
+    by_service = {}
+    for t, service, build_id in sim.rollouts:
+        by_service.setdefault(service, []).append((t, finish[build_id]))
+    for service, rollouts in by_service.items():
+        times = [t for t, _ in rollouts]
+        assert all(b - a >= 300.0 for a, b in zip(times, times[1:]))
+        ordered = [f for _, f in rollouts]
+        assert ordered == sorted(ordered)
+        latest = max(finish[b] for _, s, b in offers if s == service)
+        assert ordered[-1] == latest
@@ -0,0 +1,63 @@
+# test_llm_cache.py
+# Checks for the shared prompt cache: keys, what gets cached, expiry and the process-wide accessor
+#
+# Run with `python -m pytest -q test_llm_cache.py`.
+
+from error_fingerprint import normalize
+from http_pool import clear_routes, route
+from llm_cache import PromptCache, cached_predict, has_prediction, prompt_cache
+from local_standins import FakeTextBison
+
+PREDICT = "https://text-bison.googleapis.com/v1/projects/demo/locations/global/models/text-bison:predict"
+
+
+def test_empty_predictions_are_not_cached(tmp_path):
+    replies = iter(["", "patch"])
+    with FakeTextBison(patch=lambda prompt: next(replies)) as llm:
+        route("https://text-bison.googleapis.com", llm.url)
+        try:
+            cache = PromptCache(str(tmp_path))
+            assert not has_prediction(cached_predict(cache, PREDICT, "Error: a"))
+            assert has_prediction(cached_predict(cache, PREDICT, "Error: a"))
+            assert cached_predict(cache, PREDICT, "Error: a")["predictions"][0]["content"] == "patch"
+            assert llm.predicts == 2
+        finally:
+            clear_routes()
+    assert not has_prediction({})
+    assert not has_prediction({"predictions": []})
+
+
+def test_key_normalizes_the_message_but_not_the_code(tmp_path):
+    # What the Fix Generator keys on: commit, normalized message, code as sent
+    cache = PromptCache(str(tmp_path))
+
+    def key(sha, message, code):
+        return cache.key(f"fix {sha}\nError: {normalize(message)}\nRelevant code:\n{code}", "text-bison")
+
+    first = 'File "/app/app.py", line 15, in handler\nKeyError: 4711'
+    again = 'File "/srv/app.py", line 15, in handler\nKeyError: 42'
+    assert key("a1", first, "x = d[k]") == key("a1", again, "x = d[k]")
+    assert key("a1", first, "x = d[k]") != key("b2", first, "x = d[k]")
+    assert key("a1", first, "x = d[k]") != key("a1", first, "x = d.get(k)")
+
+
+def test_entries_expire(tmp_path):
+    cache = PromptCache(str(tmp_path), ttl=10)
+    key = cache.key("Error: a", "text-bison")
+    cache.put(key, {"predictions": [{"content": "p"}]}, now=0)
+    assert cache.get(key, now=5) is not None
+    assert cache.get(key, now=10) is None
+    # the disk tier expires too
+    assert PromptCache(str(tmp_path), ttl=10).get(key, now=10) is None
+    assert cache.stats["expired"] >= 1
+
+
+def test_agents_share_one_cache(tmp_path):
+    made = []
+
+    def factory():
+        made.append(PromptCache(str(tmp_path)))
+        return made[-1]
+
+    assert prompt_cache("test-shared", factory) is prompt_cache("test-shared", factory)
+    assert len(made) == 1
@@ -0,0 +1,104 @@
+# test_loop_scheduler.py
+# Checks that helper requests are charged to the loop scheduler and that per-API budgets throttle loops
+#
+# Run with `python -m pytest -q test_loop_scheduler.py`.
+
+import pytest
+
+from http_pool import clear_routes, route
+from llm_cache import PromptCache, cached_predict
+from local_standins import FakeGitHub, FakePubSub, FakeTextBison
+from loop_scheduler import LoopScheduler, current_loop, parse_budgets
+from pubsub_ingest import PubSubPuller
+from repo_snapshot import RepoSnapshotCache
+
+PREDICT = "https://text-bison.googleapis.com/v1/projects/demo/locations/global/models/text-bison:predict"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def scheduler(clock):
+    scheduler = LoopScheduler(api_budgets=parse_budgets("text-bison.googleapis.com=60"), clock=clock)
+    scheduler.add("fix_generator", 1, 30)
+    scheduler.add("reporter_agent", 15, 60)
+    scheduler.attach()
+    yield scheduler
+    scheduler.detach()
+    clear_routes()
+
+
+def in_loop(name, call, *args, **kwargs):
+    token = current_loop.set(name)
+    try:
+        return call(*args, **kwargs)
+    finally:
+        current_loop.reset(token)
+
+
+def test_text_bison_budget_throttles_the_loop_that_spends_it(scheduler, clock, tmp_path):
+    with FakeTextBison() as llm:
+        route("https://text-bison.googleapis.com", llm.url)
+        cache = PromptCache(str(tmp_path))
+        in_loop("fix_generator", cached_predict, cache, PREDICT, "Error: a")
+        in_loop("fix_generator", cached_predict, cache, PREDICT, "Error: b")
+        # a cache hit sends nothing and costs nothing
+        in_loop("fix_generator", cached_predict, cache, PREDICT, "Error: a")
+        assert llm.predicts == 2
+    stats = scheduler.stats()
+    assert stats["apis"]["text-bison.googleapis.com"]["calls"] == 2
+    assert stats["loops"]["fix_generator"]["calls"] == 2
+    # 60 an hour allows a burst of one; the second predict puts the loop a
+    # minute in debt, so even an active cycle waits for the budget
+    assert scheduler.done("fix_generator", active=True) == pytest.approx(60.0)
+    assert scheduler.stats()["loops"]["fix_generator"]["budget_s"] == pytest.approx(60.0)
+    # loops that never called text-bison are not held back
+    assert scheduler.done("reporter_agent", active=True) == 0.0
+    clock.now = 60.0
+    assert scheduler.done("fix_generator", active=True) == pytest.approx(0.0)
+
+
+def test_without_budget_predicts_do_not_throttle(clock, tmp_path):
+    scheduler = LoopScheduler(clock=clock)
+    scheduler.add("fix_generator", 1, 30)
+    scheduler.attach()
+    try:
+        with FakeTextBison() as llm:
+            route("https://text-bison.googleapis.com", llm.url)
+            cache = PromptCache(str(tmp_path))
+            for i in range(5):
+                in_loop("fix_generator", cached_predict, cache, PREDICT, f"Error: {i}")
+        assert scheduler.stats()["apis"]["text-bison.googleapis.com"]["calls"] == 5
+        assert scheduler.done("fix_generator", active=True) == 0.0
+    finally:
+        scheduler.detach()
+        clear_routes()
+
+
+def test_pubsub_and_repo_snapshot_requests_are_charged(scheduler, tmp_path):
+    with FakePubSub() as pubsub, FakeGitHub() as github:
+        route("https://pubsub.googleapis.com", pubsub.url)
+        route("https://api.github.com", github.url)
+        github.commit("org", "repo", {"app.py": b"print('ok')\n"})
+        pubsub.publish({"podName": "demo", "error": "RuntimeError: boom"})
+        puller = PubSubPuller("https://pubsub.googleapis.com/v1/projects/demo/subscriptions/pod-errors-sub")
+        msgs = in_loop("build_and_test_agent", puller.pull)
+        in_loop("build_and_test_agent", puller.ack, [m["ackId"] for m in msgs])
+        snapshots = RepoSnapshotCache(str(tmp_path), token="t")
+        in_loop("fix_generator", snapshots.workspace, "org", "repo")
+    apis = scheduler.stats()["apis"]
+    assert apis["pubsub.googleapis.com"]["calls"] == 2
+    # commits/main, then the zipball
+    assert apis["api.github.com"]["calls"] == 2
+    assert scheduler.stats()["loops"]["fix_generator"]["calls"] == 2
@@ -0,0 +1,97 @@
+# test_memory_trends.py
+# Detection and false-positive bounds for the Risk Mitigation leak analysis on seeded synthetic memory curves
+#
+# Run with `python -m pytest -q test_memory_trends.py`.
+
+import numpy as np
+import pytest
+
+from memory_trends import analyze, anomalies, parse_quantity, series_matrix
+
+LIMIT = parse_quantity("256Mi")
+HOUR = 3600
+
+
+def curves(seed, n=2000, points=60, leak_fraction=0.1, tto=(1, 20), noise=3e6, spikes=0.02, missing=0.03):
+    # The memory-trends benchmark's generator: an hour of 60s points; leaking
+    # pods grow the way demo_app's /leak does (1 MB per call, calls arriving
+    # at random) and would hit LIMIT in `tto` hours, the rest are flat with
+    # noise, spikes and missing points. Returns (times, values, leaking, tto
+    # in seconds, leak rate in bytes/s).
+    rng = np.random.default_rng(seed)
+    times = np.arange(points) * 60.0
+    leaking = rng.random(n) < leak_fraction
+    base = rng.uniform(60e6, 140e6, (n, 1))
+    hours = rng.uniform(tto[0] * HOUR, tto[1] * HOUR, n)
+    rate = np.where(leaking, (LIMIT - base[:, 0]) / hours, 0.0)
+    calls = rng.poisson(np.repeat((rate * 60 / 1e6)[:, None], points, axis=1)).cumsum(axis=1)
+    values = base + calls * 1e6 + rng.normal(0, noise, (n, points))
+    values += (rng.random((n, points)) < spikes) * rng.uniform(10e6, 40e6, (n, points))
+    values[rng.random((n, points)) < missing] = np.nan
+    return times, values, leaking, np.where(leaking, hours, np.inf), rate
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4, 5])
+def test_detection_and_false_positive_bounds(seed):
+    times, values, leaking, tto, rate = curves(seed)
+    result = analyze(times, values, LIMIT, horizon=24 * HOUR)
+    flagged = result["leak"]
+    # leaks that reach the limit within 10h are nearly all caught
+    urgent = leaking & (tto <= 10 * HOUR)
+    assert (flagged & urgent).sum() >= 0.95 * urgent.sum()
+    assert (flagged & leaking).sum() >= 0.85 * leaking.sum()
+    # at most 0.5% of the flat pods are flagged, well under the old
+    # first-vs-last rule on the same curves
+    false_positives = int((flagged & ~leaking).sum())
+    assert false_positives <= 0.005 * (~leaking).sum()
+    with np.errstate(invalid="ignore"):
+        naive = values[:, -1] / values[:, 0] >= 1.2
+    assert false_positives < int((naive & ~leaking).sum())
+    # leak rates are estimated within 30% (median)
+    error = np.abs(result["robust_slope"][urgent] - rate[urgent]) / rate[urgent]
+    assert np.nanmedian(error) <= 0.3
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_flat_pods_are_rarely_flagged(seed):
+    times, values, leaking, _, _ = curves(seed, leak_fraction=0.0)
+    assert not leaking.any()
+    assert analyze(times, values, LIMIT)["leak"].sum() <= 0.002 * len(values)
+
+
+def test_slow_growth_beyond_the_horizon_is_not_a_leak():
+    times, values, leaking, _, _ = curves(7, leak_fraction=1.0, tto=(72, 96))
+    result = analyze(times, values, LIMIT, horizon=24 * HOUR)
+    assert result["leak"].sum() <= 0.05 * len(values)
+
+
+def test_anomalies_are_ranked_by_time_to_oom():
+    times, values, leaking, tto, _ = curves(11, n=200, leak_fraction=0.2)
+    labels = [{"pod_name": f"pod-{i}", "container_name": "app"} for i in range(len(values))]
+    found = anomalies(labels, analyze(times, values, LIMIT), limit=5)
+    assert len(found) == 5
+    assert [a["tto"] for a in found] == sorted(a["tto"] for a in found)
+    assert all(leaking[int(a["labels"]["pod_name"].split("-")[1])] for a in found)
+
+
+def test_too_few_points_are_not_analyzed():
+    times = np.arange(4) * 60.0
+    values = np.array([[100e6, 150e6, 200e6, 250e6]])
+    assert not analyze(times, values, LIMIT)["leak"].any()
+
+
+def test_series_matrix_aligns_points_and_labels():
+    response = {"timeSeries": [
+        {"resource": {"labels": {"pod_name": "a"}}, "metric": {"labels": {}},
+         "points": [{"interval": {"endTime": "2026-01-01T00:01:00Z"}, "value": {"int64Value": "2"}},
+                    {"interval": {"endTime": "2026-01-01T00:00:00Z"}, "value": {"doubleValue": 1.0}}]},
+        {"resource": {"labels": {"pod_name": "b"}}, "metric": {"labels": {}},
+         "points": [{"interval": {"endTime": "2026-01-01T00:02:00Z"}, "value": {"int64Value": "5"}}]},
+    ]}
+    labels, times, values = series_matrix(response)
+    assert [lab["pod_name"] for lab in labels] == ["a", "b"]
+    assert list(times - times[0]) == [0.0, 60.0, 120.0]
+    assert values[0, :2].tolist() == [1.0, 2.0] and np.isnan(values[0, 2])
+    assert np.isnan(values[1, :2]).all() and values[1, 2] == 5.0
+    assert parse_quantity("256Mi") == 256 * 2 ** 20
+    assert parse_quantity("1G") == 1e9
@@ -0,0 +1,107 @@
+# test_repo_snapshot.py
+# Checks for the Fix Generator's repo snapshot cache: conditional resolves, shared blobs, redirects and pruning
+#
+# Run with `python -m pytest -q test_repo_snapshot.py`.
+
+import io
+import os
+import zipfile
+
+import pytest
+
+from http_pool import ConnectionPool
+from local_standins import FakeGitHub, StandIn
+from repo_snapshot import RepoSnapshotCache
+
+
+class CodeLoad(StandIn):
+    # Serves the archives GitHub redirects zipball requests to
+    def __init__(self, github):
+        super().__init__()
+        self.github = github
+        self.auth = []
+
+    def handle(self, method, path, body, headers):
+        self.auth.append(headers.get("Authorization"))
+        return FakeGitHub.handle(self.github, method, path, body, {})
+
+
+class RedirectingGitHub(FakeGitHub):
+    # zipball requests answer 302 to codeload, as api.github.com does
+    def __init__(self):
+        super().__init__()
+        self.codeload = None
+
+    def handle(self, method, path, body, headers):
+        if "/zipball/" in path and self.codeload is not None:
+            return 302, b"", {"Location": f"{self.codeload.url}{path}"}
+        return super().handle(method, path, body, headers)
+
+
+def read(ws, name):
+    with open(os.path.join(ws.path, name), "rb") as f:
+        return f.read()
+
+
+def test_resolve_is_conditional_and_blobs_are_shared(tmp_path):
+    with FakeGitHub() as github:
+        github.commit("org", "repo", {"app.py": b"v1", "lib/util.py": b"shared"})
+        cache = RepoSnapshotCache(str(tmp_path), api_url=github.url, pool=ConnectionPool())
+        cold = cache.workspace("org", "repo")
+        assert cold.fetched
+        assert sorted(cold.files()) == ["app.py", os.path.join("lib", "util.py")]
+        warm = cache.workspace("org", "repo")
+        assert not warm.fetched and warm.sha == cold.sha
+        assert github.not_modified == 1
+        assert cache.stats["archives"] == 1
+        github.commit("org", "repo", {"app.py": b"v2", "lib/util.py": b"shared"})
+        changed = cache.workspace("org", "repo")
+        assert changed.fetched and changed.sha != cold.sha
+        assert read(changed, "app.py") == b"v2" and read(cold, "app.py") == b"v1"
+        # unchanged files are one blob linked into both workspaces
+        assert os.stat(os.path.join(changed.path, "lib", "util.py")).st_ino == \
+            os.stat(os.path.join(cold.path, "lib", "util.py")).st_ino
+        # a restarted cache still knows the ref and sends If-None-Match
+        again = RepoSnapshotCache(str(tmp_path), api_url=github.url, pool=ConnectionPool())
+        assert not again.workspace("org", "repo").fetched
+        assert github.not_modified == 2
+
+
+def test_redirected_archive_is_fetched_without_the_token(tmp_path):
+    with RedirectingGitHub() as github, CodeLoad(github) as codeload:
+        github.codeload = codeload
+        github.commit("org", "repo", {"app.py": b"v1"})
+        cache = RepoSnapshotCache(str(tmp_path), token="secret", api_url=github.url, pool=ConnectionPool())
+        ws = cache.workspace("org", "repo")
+        assert read(ws, "app.py") == b"v1"
+        assert codeload.auth == [None]
+        # commits/main, the redirect, the archive
+        assert cache.stats["requests"] == 3
+
+
+def test_unsafe_archive_paths_are_rejected(tmp_path):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("org-repo-abc/../../escape.py", b"x")
+    cache = RepoSnapshotCache(str(tmp_path / "cache"))
+    target = str(tmp_path / "cache" / "workspaces" / "org" / "repo" / "abc")
+    with pytest.raises(ValueError):
+        cache._unpack(buf.getvalue(), target)
+    assert not os.path.exists(target)
+    assert not os.path.exists(tmp_path / "cache" / "workspaces" / "escape.py")
+
+
+def test_prune_keeps_the_newest_workspaces_and_their_blobs(tmp_path):
+    with FakeGitHub() as github:
+        cache = RepoSnapshotCache(str(tmp_path), api_url=github.url, pool=ConnectionPool())
+        spaces = []
+        for i in range(4):
+            github.commit("org", "repo", {"app.py": f"v{i}".encode(), "common.py": b"same"})
+            spaces.append(cache.workspace("org", "repo"))
+            os.utime(spaces[-1].path, (i, i))
+        cache.prune(keep=2)
+        assert [os.path.isdir(ws.path) for ws in spaces] == [False, False, True, True]
+        blobs = [os.path.join(d, n) for d, _, names in os.walk(tmp_path / "objects") for n in names]
+        # v2, v3 and the shared file
+        assert len(blobs) == 3
+        assert read(spaces[3], "common.py") == b"same"
@@ -0,0 +1,82 @@
+# test_report_digest.py
+# Checks for the Reporter's BigQuery log: batching, retries of failed and rejected rows, and commit gating
+#
+# Run with `python -m pytest -q test_report_digest.py`.
+
+import json
+
+from http_pool import ConnectionPool, HttpError
+from local_standins import FakeBigQuery
+from report_digest import RemediationLog, bq_batches
+
+
+class BigQuery:
+    # insertAll stand-in that fails whole requests or rejects given rows
+    def __init__(self):
+        self.down = False
+        self.reject = set()
+        self.rows = {}
+
+    def request(self, method, url, body=None, headers=None):
+        if self.down:
+            raise HttpError(503, b"", url)
+        rows = json.loads(body)["rows"]
+        errors = [{"index": i, "errors": [{"reason": "invalid"}]} for i, row in enumerate(rows)
+                  if row["json"]["n"] in self.reject]
+        for i, row in enumerate(rows):
+            if row["json"]["n"] not in self.reject:
+                self.rows[row["insertId"]] = row["json"]
+        return 200, {}, json.dumps({"insertErrors": errors} if errors else {}).encode()
+
+
+def events(kind, numbers):
+    return [{"type": kind, "key": f"k{n}", "data": {"n": n, "service": "svc"}} for n in numbers]
+
+
+def test_batches_respect_row_and_byte_limits():
+    batches = bq_batches(events("errors", range(25)), max_rows=10, max_bytes=10 ** 6)
+    assert [len(b["rows"]) for b in batches] == [10, 10, 5]
+    batches = bq_batches(events("errors", range(25)), max_rows=500, max_bytes=300)
+    assert all(len(json.dumps(b["rows"])) <= 300 for b in batches)
+    assert sum(len(b["rows"]) for b in batches) == 25
+
+
+def test_failed_and_rejected_rows_are_retried():
+    bq = BigQuery()
+    log = RemediationLog("http://bq/insertAll", pool=bq)
+    bq.reject = {1}
+    assert log.write(events("errors", [0, 1, 2])) == {"requests": 1, "inserted": 2, "rejected": 1, "failed": 0,
+                                                       "queued": 1}
+    bq.down = True
+    assert log.write(events("builds", [3]))["queued"] == 2
+    bq.down, bq.reject = False, set()
+    assert log.write([]) == {"requests": 1, "inserted": 2, "rejected": 0, "failed": 0, "queued": 0}
+    assert sorted(row["n"] for row in bq.rows.values()) == [0, 1, 2, 3]
+    assert log.stats == {"requests": 3, "inserted": 4, "rejected": 1, "failed": 2}
+
+
+def test_keys_are_ready_once_sent_and_stored():
+    bq = BigQuery()
+    log = RemediationLog("http://bq/insertAll", pool=bq)
+    bq.reject = {1}
+    log.write(events("errors", [0, 1]))
+    # stored but not in a sent digest yet
+    assert log.ready() == []
+    log.sent([["errors", "k0"], ["errors", "k1"]])
+    assert log.ready() == [("errors", "k0")]
+    bq.reject = set()
+    log.write([])
+    assert log.ready() == [("errors", "k1")]
+    assert log.ready() == []
+
+
+def test_rows_land_in_bigquery_once():
+    with FakeBigQuery() as bq:
+        log = RemediationLog(f"{bq.url}/bigquery/v2/projects/p/datasets/d/tables/t/insertAll",
+                             pool=ConnectionPool())
+        batch = events("deploys", range(1200))
+        log.write(batch)
+        # a retry of the same events is deduplicated by insertId
+        log.write(batch[:100])
+        assert bq.insert_calls == 4
+        assert len(bq.rows) == 1200
@@ -0,0 +1,108 @@
+# test_rollout_watch.py
+# Checks for the Deploy Agent's health gate: error occurrences from /fingerprints and rollbacks on the GKE stand-in
+#
+# Run with `python -m pytest -q test_rollout_watch.py`.
+
+import threading
+
+from local_standins import FakeGKE, FakeRTDB
+from rollout_watch import FingerprintErrorCounter, RolloutWatcher, service_matches
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_service_keys_match_the_deployment_or_its_pods():
+    assert service_matches("demo", "demo")
+    assert service_matches("demo-7c9f4b6d8-x2k9q", "demo")
+    assert not service_matches("demo-api", "demo")
+    assert not service_matches("demo-api-7c9f4b6d8-x2k9q", "demo")
+    assert not service_matches("demo", "demo-api")
+
+
+def test_counter_counts_repeats_of_known_errors():
+    clock = Clock()
+    with FakeRTDB() as rtdb:
+        rtdb.set(["fingerprints"], {
+            "demo": {"known": {"a": {"count": 5}, "b": {"count": 2}}, "old": {"a": {"count": 9}}},
+            "other": {"known": {"a": {"count": 1}}},
+        })
+        count = FingerprintErrorCounter(rtdb.url, refresh=0.0, clock=clock)
+        assert count("demo", 100.0) == 0
+        # the same error again, on both analyzer shards: /errors gets nothing new
+        rtdb.set(["fingerprints", "demo", "known", "a", "count"], 8)
+        rtdb.set(["fingerprints", "demo", "known", "b", "count"], 3)
+        assert count("demo", 100.0) == 4
+        # a new fingerprint, one logged under a pod name, and another service
+        rtdb.set(["fingerprints", "demo", "new", "a"], {"count": 2})
+        rtdb.set(["fingerprints", "demo-7c9f4b6d8-x2k9q", "new", "a"], {"count": 1})
+        rtdb.set(["fingerprints", "other", "known", "a", "count"], 50)
+        assert count("demo", 100.0) == 7
+        # a window that expired and started over counts in full
+        rtdb.set(["fingerprints", "demo", "old", "a", "count"], 1)
+        assert count("demo", 100.0) == 8
+        # a later rollout starts from the current counts
+        assert count("demo", 200.0) == 0
+        assert count("other", 200.0) == 0
+
+
+def test_counter_reads_at_most_once_per_refresh():
+    clock = Clock()
+    with FakeRTDB() as rtdb:
+        rtdb.set(["fingerprints", "demo", "known", "a"], {"count": 1})
+        count = FingerprintErrorCounter(rtdb.url, refresh=5.0, clock=clock)
+        assert count("demo", 0.0) == 0
+        rtdb.set(["fingerprints", "demo", "known", "a", "count"], 4)
+        assert count("demo", 0.0) == 0
+        clock.now = 5.0
+        assert count("demo", 0.0) == 3
+
+
+def test_bad_revision_repeating_a_known_error_is_rolled_back():
+    # The noisy image only raises an error that was seen before the rollout,
+    # so the Error Analyzer would only bump its occurrence counter
+    with FakeGKE(replicas=2, pod_ready=0.05, progress_deadline=1.0) as gke, FakeRTDB() as rtdb:
+        gke.noisy_images["gcr.io/p/demo:noisy"] = 50.0
+        rtdb.set(["fingerprints", "demo", "known", "a"], {"count": 100})
+        stop = threading.Event()
+
+        def analyzer():
+            while not stop.wait(0.02):
+                with gke.lock:
+                    seen = sum(1 for _, name in gke.errors if name == "demo")
+                rtdb.set(["fingerprints", "demo", "known", "a", "count"], 100 + seen)
+
+        thread = threading.Thread(target=analyzer, daemon=True)
+        thread.start()
+        try:
+            watcher = RolloutWatcher(f"{gke.url}/v1/namespaces/default/deployments", deadline=2.0, bake=0.5,
+                                     max_errors=3, check_interval=0.05,
+                                     error_count=FingerprintErrorCounter(rtdb.url, refresh=0.0))
+            assert watcher.roll_out("demo", "gcr.io/p/demo:good")["health"] == "HEALTHY"
+            result = watcher.roll_out("demo", "gcr.io/p/demo:noisy")
+        finally:
+            stop.set()
+            thread.join()
+        assert result["health"] == "ROLLED_BACK"
+        assert result["rolled_back_to"] == "gcr.io/p/demo:good"
+        assert "errors since rollout" in result["reason"]
+        assert gke.image("demo") == "gcr.io/p/demo:good"
+
+
+def test_crashlooping_revision_is_rolled_back_after_restart(tmp_path):
+    with FakeGKE(replicas=2, pod_ready=0.05, progress_deadline=0.5) as gke:
+        gke.bad_images.add("gcr.io/p/demo:crashloop")
+        base = f"{gke.url}/v1/namespaces/default/deployments"
+        state_path = str(tmp_path / "known-good.json")
+        watcher = RolloutWatcher(base, deadline=1.0, bake=0.1, check_interval=0.05, state_path=state_path)
+        assert watcher.roll_out("demo", "gcr.io/p/demo:good")["health"] == "HEALTHY"
+        restarted = RolloutWatcher(base, deadline=1.0, bake=0.1, check_interval=0.05, state_path=state_path)
+        result = restarted.roll_out("demo", "gcr.io/p/demo:crashloop")
+        assert result["health"] == "ROLLED_BACK"
+        assert result["reason"] == "ProgressDeadlineExceeded"
+        assert gke.image("demo") == "gcr.io/p/demo:good"
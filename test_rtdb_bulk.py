@@ -0,0 +1,103 @@
+# test_rtdb_bulk.py
+# Checks for the Error Analyzer's batched RTDB writer: flush triggers, acks after writes, retries and overlays
+#
+# Run with `python -m pytest -q test_rtdb_bulk.py`.
+
+import pytest
+
+from http_pool import ConnectionPool, HttpError
+from local_standins import FakeRTDB
+from rtdb_bulk import BulkWriter, push_id
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_push_ids_are_unique_and_ordered_within_a_millisecond():
+    ids = [push_id(1_700_000_000_000) for _ in range(1000)]
+    assert len(set(ids)) == 1000
+    assert ids == sorted(ids)
+
+
+def test_flush_size_and_interval():
+    clock = Clock()
+    writer = BulkWriter("http://rtdb", flush_size=3, flush_interval=1.0, clock=clock)
+    assert writer.take() is None
+    writer.add({"errors/a/1": 1, "errors/a/2": 2})
+    assert not writer.due()
+    writer.add({"errors/a/3": 3})
+    assert writer.due()
+    assert sorted(writer.take()["updates"]) == ["errors/a/1", "errors/a/2", "errors/a/3"]
+    writer.add({"errors/a/4": 4})
+    clock.now = 0.9
+    assert writer.take() is None
+    clock.now = 1.0
+    assert writer.take()["updates"] == {"errors/a/4": 4}
+
+
+def test_acks_are_released_with_the_write_that_stored_them():
+    writer = BulkWriter("http://rtdb", flush_size=10, clock=Clock())
+    writer.add({"errors/a/1": 1}, acks=["ack-1"])
+    first = writer.take(force=True)
+    writer.add({"errors/a/2": 2}, acks=["ack-2"])
+    # the first write failed: its batch goes back ahead of the newer one
+    assert writer.done(first["id"], ok=False)["acks"] == ["ack-1"]
+    assert writer.due()
+    second = writer.take()
+    assert second["acks"] == ["ack-1", "ack-2"]
+    assert writer.done(second["id"])["acks"] == ["ack-1", "ack-2"]
+    assert writer.stats == {"added": 2, "round_trips": 1, "written": 2, "retried": 1}
+
+
+def test_retried_batch_does_not_overwrite_newer_values():
+    writer = BulkWriter("http://rtdb", clock=Clock())
+    writer.add({"fingerprints/svc/fp/a": {"count": 1}})
+    batch = writer.take(force=True)
+    writer.add({"fingerprints/svc/fp/a": {"count": 2}})
+    writer.done(batch["id"], ok=False)
+    assert writer.take()["updates"] == {"fingerprints/svc/fp/a": {"count": 2}}
+
+
+def test_overlay_shows_buffered_and_inflight_updates():
+    writer = BulkWriter("http://rtdb", clock=Clock())
+    stored = {"svc": {"old": {"a": {"count": 5}}, "gone": {"a": {"count": 1}}}}
+    writer.add({"fingerprints/svc/old/a": {"count": 6}, "fingerprints/svc/gone/a": None})
+    writer.take(force=True)
+    writer.add({"fingerprints/svc/new/a": {"count": 1}, "errors/svc/1": {"x": 1}})
+    tree = writer.overlay("fingerprints", stored)
+    assert tree == {"svc": {"old": {"a": {"count": 6}}, "gone": {}, "new": {"a": {"count": 1}}}}
+    # the stored tree is not modified
+    assert stored["svc"]["old"]["a"]["count"] == 5
+    assert writer.overlay("fingerprints", None)["svc"]["new"] == {"a": {"count": 1}}
+
+
+def test_flush_writes_one_multi_location_patch():
+    with FakeRTDB() as rtdb:
+        writer = BulkWriter(rtdb.url, flush_size=100, pool=ConnectionPool(), clock=Clock())
+        paths = [writer.append("errors", f"svc-{i % 2}", {"n": i}, acks=[i]) for i in range(50)]
+        assert writer.flush(force=False) == []
+        assert sorted(writer.flush()) == list(range(50))
+        assert rtdb.calls == 1
+        errors = rtdb.get(["errors"])
+        assert sum(len(v) for v in errors.values()) == 50
+        service, key = paths[7].split("/")[1:]
+        assert errors[service][key] == {"n": 7}
+
+
+def test_failed_flush_keeps_the_batch():
+    class Down:
+        def request(self, method, url, body=None, headers=None):
+            raise HttpError(503, b"", url)
+
+    writer = BulkWriter("http://rtdb", pool=Down(), clock=Clock())
+    writer.add({"errors/a/1": 1}, acks=["x"])
+    with pytest.raises(HttpError):
+        writer.flush()
+    assert writer.due()
+    assert writer.stats["retried"] == 1
+    assert writer.take()["acks"] == ["x"]
@@ -0,0 +1,55 @@
+# test_rtdb_stream.py
+# Checks for the RTDB change feed: records without an order_by value and late acks after pruning
+#
+# Run with `python -m pytest -q test_rtdb_stream.py`.
+
+from local_standins import FakeRTDB
+from rtdb_stream import ChangeFeed, _prune
+
+
+def keys(feed):
+    return [event["key"] for event in feed.poll(max_events=1000)]
+
+
+def test_prune_keeps_keys_without_a_value():
+    seen = {"a": None, "b": 1, "c": 2, "d": 3, "e": 4}
+    assert _prune(seen, 4, None) == 3
+    assert seen == {"a": None, "d": 3, "e": 4}
+
+
+def test_records_without_a_value_are_emitted_once():
+    with FakeRTDB() as db:
+        feed = ChangeFeed(db.url, "errors", depth=2, max_keys=4)
+        db.set(["errors", "svc", "untimed"], {"message": "boom"})
+        for i in range(10):
+            db.set(["errors", "svc", f"e{i}"], {"timestamp": i})
+        feed.catch_up()
+        assert sorted(keys(feed)) == sorted(["svc/untimed"] + [f"svc/e{i}" for i in range(10)])
+        # later catch-ups (stream reconnects) find nothing new
+        feed.catch_up()
+        feed.catch_up()
+        assert keys(feed) == []
+        db.set(["errors", "svc", "untimed-2"], {"message": "again"})
+        feed.catch_up()
+        assert keys(feed) == ["svc/untimed-2"]
+
+
+def test_late_ack_of_a_pruned_key_reaches_the_cursor(tmp_path):
+    cursor = str(tmp_path / "builds.json")
+    with FakeRTDB() as db:
+        for i in range(10):
+            db.set(["builds", f"b{i}"], {"timestamp": i})
+        feed = ChangeFeed(db.url, "builds", cursor_path=cursor, max_keys=4, autocommit=False)
+        feed.catch_up()
+        assert keys(feed) == [f"b{i}" for i in range(10)]
+        # b0 is long gone from the emitted set when its rollout finishes
+        assert "b0" not in feed._emitted
+        feed.ack(["b0"])
+        assert feed.cursor["keys"] == {"b0": 0}
+        # a restarted feed replays everything but b0
+        again = ChangeFeed(db.url, "builds", cursor_path=cursor, max_keys=4, autocommit=False)
+        again.catch_up()
+        assert keys(again) == [f"b{i}" for i in range(1, 10)]
+        # acking twice or acking unknown keys changes nothing
+        feed.ack(["b0", "nope"])
+        assert feed.cursor["keys"] == {"b0": 0}
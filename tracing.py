@@ -0,0 +1,299 @@
+# tracing.py
+# Incident correlation IDs, OpenTelemetry-JSON spans and per-hop latency / MTTR reports
+#
+# An incident gets its correlation ID when the Error Analyzer ingests the pod
+# failure; the ID travels in the error record, the fix PR's branch and title,
+# the build and the deploy. Every agent records the hop it completes as a
+# span of the incident's trace (trace id derived from the correlation ID):
+#   detect  pod failure published -> error record built (Error Analyzer)
+#   fix     error recorded        -> PR opened          (Fix Generator)
+#   build   PR opened             -> build finished     (Build & Test)
+#   deploy  build finished        -> rollout done       (Deploy)
+#   report  rollout recorded      -> digest email sent  (Reporter)
+# The local runtime adds a span per workflow cycle, step and tool call.
+# Spans are exported in OTLP/JSON, one ExportTraceServiceRequest per line of
+# a file, or POSTed to a collector's /v1/traces.
+#
+# Usage: python tracing.py report <spans.jsonl> [...]
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from http_pool import shared_pool
+
+HOPS = ["detect", "fix", "build", "deploy", "report"]
+
+_CORRELATION = re.compile(r"inc-[0-9a-f]{16}")
+
+
+def correlation_id(seed=None):
+    # "inc-" + 16 hex; deterministic for a seed (the Pub/Sub messageId), so a
+    # redelivered failure keeps its ID
+    if seed is None:
+        return f"inc-{secrets.token_hex(8)}"
+    return "inc-" + hashlib.sha256(str(seed).encode()).hexdigest()[:16]
+
+
+def correlation_in(text):
+    # The correlation ID inside a branch name, PR title or ref, or None
+    match = _CORRELATION.search(text or "")
+    return match.group(0) if match else None
+
+
+def trace_id(correlation):
+    return hashlib.sha256(correlation.encode()).hexdigest()[:32]
+
+
+def epoch(value):
+    # Seconds since the epoch from a number or an ISO-8601 / RFC 3339 string
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _value(attribute):
+    value = attribute["value"]
+    for kind in ("stringValue", "boolValue", "doubleValue"):
+        if kind in value:
+            return value[kind]
+    return int(value["intValue"]) if "intValue" in value else None
+
+
+class FileExporter:
+    # Appends one OTLP/JSON request per export as a line of `path`
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, request):
+        line = json.dumps(request, separators=(",", ":")) + "\n"
+        with self.lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+class CollectorExporter:
+    # POSTs OTLP/JSON to an OpenTelemetry collector (http://host:4318/v1/traces)
+    def __init__(self, url, headers=None, pool=None):
+        self.url = url
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.pool = pool or shared_pool()
+
+    def export(self, request):
+        self.pool.request("POST", self.url, body=json.dumps(request), headers=self.headers)
+
+
+def exporter_for(target):
+    # "" or an unsubstituted ${TRACE_EXPORT} -> None (tracing off), http(s)
+    # URL -> collector, else a file path
+    if not target or target.startswith("${"):
+        return None
+    if target.startswith(("http://", "https://")):
+        return CollectorExporter(target)
+    return FileExporter(target)
+
+
+class Tracer:
+    # Buffers finished spans of one service and exports them in batches of
+    # up to `batch` spans, or every `interval` seconds, and at exit. Without
+    # an exporter every call is a no-op.
+    def __init__(self, service, exporter, batch=256, interval=5.0):
+        self.service = service
+        self.exporter = exporter
+        self.batch = batch
+        self.interval = interval
+        self.pending = []
+        self.exported = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        if exporter is not None:
+            atexit.register(self.flush)
+
+    def record(self, name, start, end, trace=None, parent=None, attributes=None, error=None, span_id=None):
+        # One finished span (times in epoch seconds); returns its span id
+        if self.exporter is None:
+            return None
+        span_id = span_id or secrets.token_hex(8)
+        span = {
+            "traceId": trace or secrets.token_hex(16),
+            "spanId": span_id,
+            "name": name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(start * 1e9)),
+            "endTimeUnixNano": str(int(max(end, start) * 1e9)),
+            "attributes": [_attribute(k, v) for k, v in (attributes or {}).items() if v is not None],
+            "status": {"code": 2, "message": str(error)} if error else {"code": 1},
+        }
+        if parent:
+            span["parentSpanId"] = parent
+        with self.lock:
+            self.pending.append(span)
+            due = len(self.pending) >= self.batch or time.monotonic() - self.last_flush >= self.interval
+        if due:
+            self.flush()
+        return span_id
+
+    def hop(self, correlation, hop, start, end=None, attributes=None, error=None):
+        # An incident hop: a span in the correlation ID's trace
+        if not correlation or epoch(start) is None:
+            return None
+        return self.record(hop, epoch(start), epoch(end) if end is not None else time.time(),
+                           trace=trace_id(correlation),
+                           attributes={"incident.id": correlation, "incident.hop": hop, **(attributes or {})},
+                           error=error)
+
+    @contextmanager
+    def span(self, name, attributes=None, trace=None):
+        # Times the block; spans opened inside it on the same thread become
+        # its children. Yields the attributes dict, which the block may add
+        # to; an exception marks the span failed and is re-raised.
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+        trace = trace or (parent[0] if parent else secrets.token_hex(16))
+        span_id = secrets.token_hex(8)
+        attributes = dict(attributes or {})
+        start, error = time.time(), None
+        stack.append((trace, span_id))
+        try:
+            yield attributes
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            self.record(name, start, time.time(), trace, parent[1] if parent else None, attributes,
+                        error or attributes.pop("error", None), span_id)
+
+    def flush(self):
+        with self.lock:
+            spans, self.pending = self.pending, []
+            self.last_flush = time.monotonic()
+        if not spans or self.exporter is None:
+            return
+        self.exporter.export({"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service)]},
+            "scopeSpans": [{"scope": {"name": "agents-assemble"}, "spans": spans}],
+        }]})
+        self.exported += len(spans)
+
+
+_tracers = {}
+_tracers_lock = threading.Lock()
+
+
+def tracer(service, target=None):
+    # Process-wide tracer per service; target is a file path or collector
+    # URL (TRACE_EXPORT), empty to disable
+    with _tracers_lock:
+        t = _tracers.get(service)
+        if t is None:
+            t = _tracers[service] = Tracer(service, exporter_for(target))
+        return t
+
+
+def flush_all():
+    # Export every tracer's buffered spans now
+    with _tracers_lock:
+        tracers = list(_tracers.values())
+    for t in tracers:
+        t.flush()
+
+
+# --- reports -----------------------------------------------------------------
+
+def spans_in(line):
+    # [(service, span dict with decoded attributes)] of one OTLP/JSON line
+    spans = []
+    for resource in json.loads(line).get("resourceSpans", []):
+        attrs = {a["key"]: _value(a) for a in resource.get("resource", {}).get("attributes", [])}
+        for scope in resource.get("scopeSpans", []):
+            for span in scope.get("spans", []):
+                spans.append((attrs.get("service.name"), dict(
+                    span, attributes={a["key"]: _value(a) for a in span.get("attributes", [])})))
+    return spans
+
+
+def read_spans(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield from spans_in(line)
+
+
+def percentiles(values, points=(50, 95, 99)):
+    # Nearest-rank percentiles plus count and max
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    out = {"count": len(values)}
+    for p in points:
+        out[f"p{p}"] = round(values[min(len(values) - 1, max(0, -(-p * len(values) // 100) - 1))], 3)
+    out["max"] = round(values[-1], 3)
+    return out
+
+
+def report(spans):
+    # p50/p95/p99 per incident hop and per agent step, end-to-end MTTR
+    # (failure published -> rollout done) and time to the report email
+    hops, failed, steps, incidents = {}, {}, {}, {}
+    for service, span in spans:
+        start, end = int(span["startTimeUnixNano"]) / 1e9, int(span["endTimeUnixNano"]) / 1e9
+        seconds = end - start
+        hop = span["attributes"].get("incident.hop")
+        if hop and span.get("status", {}).get("code") == 2:
+            # A failed hop (build failed, rollout rolled back) did not move
+            # the incident forward
+            failed[hop] = failed.get(hop, 0) + 1
+        elif hop:
+            hops.setdefault(hop, []).append(seconds)
+            incident = incidents.setdefault(span["attributes"]["incident.id"], {})
+            seen = incident.get(hop)
+            incident[hop] = (start, end) if seen is None else (min(seen[0], start), max(seen[1], end))
+        else:
+            steps.setdefault(f"{service}/{span['name']}", []).append(seconds)
+    mttr, to_report = [], []
+    for incident in incidents.values():
+        if "detect" in incident and "deploy" in incident:
+            mttr.append(incident["deploy"][1] - incident["detect"][0])
+        if "detect" in incident and "report" in incident:
+            to_report.append(incident["report"][1] - incident["detect"][0])
+    return {
+        "incidents": len(incidents),
+        "hops_s": {hop: dict(percentiles(hops.get(hop, [])), failed=failed.get(hop, 0))
+                   for hop in HOPS if hop in hops or hop in failed},
+        "mttr_s": percentiles(mttr),
+        "failure_to_report_s": percentiles(to_report),
+        "steps_s": {name: percentiles(values) for name, values in sorted(steps.items())},
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "report":
+        sys.exit("usage: python tracing.py report <spans.jsonl> [...]")
+    print(json.dumps(report(read_spans(sys.argv[2:])), indent=2))